@@ -4,44 +4,51 @@ import re
 import os
 from os import path
 import json
+import sqlite3
 import pandas as pd
 import requests
 import newspaper
-from newspaper import Article
 from bs4 import BeautifulSoup
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 import multiprocessing
-import openai
-import boto3
+import asyncio
 import logging
 import logging.handlers
 from datetime import datetime
-from signal import signal, SIGINT
-import time
+from functools import partial
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from utils_bedrock import handler, LOGGING_CONFIG
-from utils_bedrock import check_brackets_balance, correct_brackets
+from utils import LOGGING_CONFIG, URL, worker_initializer
+from utils import check_brackets_balance, correct_brackets
+from utils import expand_input_files, ResultWriter
+from prompts import get_prompt_template, PROMPT_LANGUAGES, MULTILINGUAL_PROMPT
+from llm_backends import make_backend
+from llm_dispatcher import AsyncDispatcher, DEFAULT_TIMEOUT
+from run_control import RunControl, CHECK_INTERVAL
+from gazetteer import ID_SEPARATOR
+from text_normalisation import normalise_text, normalise_column, DEFAULT_PROFILE, PROFILES
+from structured_output import question_keys, answer_tool, parse_answers, validate_answers, reask_messages
+from structured_output import REASK_MAX_TOKENS, MAX_REASKS
+from schema import apply_schema, ARTICLE_SCHEMA, RESULT_SCHEMA, DATE_FORMAT
+from sharding import check_shard, filter_shard, READ_CHUNK_SIZE
+from transport import make_transport, total_stats, TIMEOUT_ERRORS, CONNECTION_ERRORS
+from result_stats import ResultStats
 
 # Configure logging
 # logging.basicConfig(level=logging.INFO)
 logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
-# Timeout in seconds
-CONNECT_TIMEOUT = 5
-READ_TIMEOUT = 60 # 120
-
-# User agent for HTTP requests
-USER_AGENT = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
-
 # Output folder results
 OUTPUT_FOLDER_PATH = "output"
 
+# Default number of URLs per chunk of the chunked content extraction
+CHUNK_SIZE = 500
+
 # Override SSL verification settings
 old_merge_environment_settings = requests.Session.merge_environment_settings
 os.environ['REQUESTS_CA_BUNDLE'] = 'C:/Users/ahryhorz/dev/certificates/cacert.pem' # 'cacert.pem' #'NRCAN-Root-2019-B64.cer'
@@ -50,78 +57,158 @@ os.environ['AWS_CA_BUNDLE'] = 'C:/Users/ahryhorz/dev/certificates/cacert.pem'
 os.environ['SSL_CERT_FILE'] = 'C:/Users/ahryhorz/dev/certificates/cacert.pem'
 os.environ['SSL_CERTIFICATE'] = 'C:/Users/ahryhorz/dev/certificates/cacert.pem'
 
-# Set OpenAI API key
-# client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY")) # for openai=1.3.0
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# Names of the columns with the answers to the seven questions
+ANSWER_COLUMNS = ["is_happened", "flood_cause_en", "date", "location", "death", "evacuation", "country"]
 
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-aws_session_token = os.getenv('AWS_SESSION_TOKEN')
-aws_region = os.getenv('AWS_REGION')
+# Normalised answers that mean the model could not answer the question
+UNKNOWN_ANSWERS = {"unknown", "inconnu", "inconnue", "na", "n/a", "nan", "none", ""}
+UNKNOWN_PREFIXES = ("cannot be determined", "not specified", "not mentioned", "non spécifié", "non mentionné")
 
-# Initialize the boto3 session and Bedrock client
-session = boto3.Session(
-    region_name=aws_region,
-    aws_access_key_id=aws_access_key_id,
-    aws_secret_access_key=aws_secret_access_key,
-    aws_session_token=aws_session_token
-)
-
-bedrock_client = session.client('bedrock-runtime')
+# Default minimal confidence of an answer before the article is sent to the next model of the cascade
+CASCADE_MIN_CONFIDENCE = 0.7
 
 class ContentExtractor:
-    def __init__(self, solution = "bedrock", model="mistral.mistral-7b-instruct-v0:2", temp=0.8, max_tokens=512):
+    def __init__(self, solution = "bedrock", model="mistral.mistral-7b-instruct-v0:2", temp=0.8, max_tokens=512,
+                 cascade_models=None, cascade_min_confidence=CASCADE_MIN_CONFIDENCE, backend_options=None,
+                 gazetteer=None, ask_country=True, text_profile=DEFAULT_PROFILE, structured_output=False,
+                 max_reasks=MAX_REASKS, transport_options=None, multilingual_prompt=False, stats_store=None,
+                 keep_characters=False):
         # Set OpenAI parameters
         self.solution = solution
         self.model = model
         self.temp = temp
         self.max_tokens = max_tokens
+
+        # Models of the cascade, from the cheapest to the most capable one.
+        # Without a cascade, the single configured model is the only tier.
+        self.models = list(cascade_models) if cascade_models else [model]
+        self.model = self.models[0]
+        self.cascade_min_confidence = cascade_min_confidence
+
+        # Optional gazetteer: the locations are normalised offline, and the country can be derived instead of asked
+        if not ask_country and gazetteer is None:
+            raise ValueError("The country question can only be left out of the prompt with a gazetteer index.")
+        self.gazetteer = gazetteer
+        self.ask_country = ask_country
+
+        # Text profile of the content sent to the models: 'compact' saves prompt tokens
+        if text_profile not in PROFILES:
+            raise ValueError(f"Unknown text profile '{text_profile}'. The supported profiles are: {', '.join(PROFILES)}.")
+        self.text_profile = text_profile
+
+        # Structured output: the models answer with a tool call, and only the missing or invalid answers are asked again
+        self.structured_output = structured_output
+        self.max_reasks = max_reasks
+
+        # Articles in a language without its own prompt are sent to the English prompt for any language
+        self.multilingual_prompt = multilingual_prompt
+
+        # With the language routing, the content keeps the characters of every script until its language is known:
+        # only the articles sent to the multilingual prompt keep them (see filter_text)
+        self.keep_characters = keep_characters
+
+        # Optional statistics database, updated as the results rows are written
+        self.stats_store = stats_store
         
         # Download stopwords and punkt if not already present
-        nltk.download('stopwords', quiet=True)
-        nltk.download('punkt', quiet=True)
+        for resource, resource_path in (('stopwords', 'corpora/stopwords'), ('punkt', 'tokenizers/punkt')):
+            try:
+                nltk.data.find(resource_path)
+            except LookupError:
+                nltk.download(resource, quiet=True)
         
         # Get the set of English stopwords
         self.stop_words = set(stopwords.words('english'))
 
-        # Delete when the permanenet AWS credentials are received
-        if (self.solution == "bedrock"):
-            # print(f"Welcome to AWS Bedrock. The URLs will be processed using {model} model.")
-            try:
-                bedrock_client.invoke_model(
-                    body='{"prompt": "Hello, Bedrock!"}',
-                    modelId=model)
-                print(f"Welcome to AWS Bedrock. The URLs will be processed using {model} model.")
-            except boto3.exceptions.Boto3Error as e:
-                # An exception was raised, so the credentials are invalid for Bedrock
-                raise ValueError(f"Error: Invalid AWS credentials for Bedrock: {str(e)}.")
-            
-        elif (self.solution == "openai"):
-            print(f"Welcome to OpenAI. The URLs will be processed using {model} model.")
-        
-        elif (self.solution == ""):
+        # HTTP transport of the page downloads: keep-alive connections per publisher, DNS cache, compression and HTTP/2
+        self.transport = make_transport(**(transport_options or {}))
+
+        # Create the LLM backend: connection pool, concurrency and rate limits are configured per backend
+        self.backend = None
+        if (self.solution == ""):
             print("The solution wasn't provided. If you don't use the Extractor mode, please interupt the program and modify the config file.")
         else:
-            print("Ooooo... the solution you requested doesn't exist. Please check you config file.")
+            self.backend = make_backend(self.solution, **(backend_options or {}))
+
+            for tier_model in self.models:
+                self.backend.check(tier_model)
 
     def read_data(self, fn, url_col_name="LinkURI", pub_date_col_name="PublishedDate"):
-        """Reads data from a CSV file.
+        """Reads data from a CSV file, or from all the CSV files of a directory or a glob pattern.
 
         Args:
-            fn (str): File name.
+            fn (str): File name, directory or glob pattern (e.g. data/collection_articles_*.csv).
             url_col_name (str, optional): Name of the column with URLs. Defaults to "LinkURI".
             pub_date_col_name (str, optional): Name of the column with article publication dates. Defaults to "PublishedDate".
 
         Returns:
             pd.DataFrame: Dataframe with read data.
         """
-        try:
-            # Try reading the CSV file with UTF-8 encoding
-            df = pd.read_csv(fn, sep='|', encoding='utf-8')
-        except UnicodeDecodeError:
-            # If UnicodeDecodeError occurs, try reading the file with cp1252 encoding (Windows encoding)
-            df = pd.read_csv(fn, sep='|', encoding='cp1252')
+        frames = []
+        for input_fn in expand_input_files(fn):
+            try:
+                # Try reading the CSV file with UTF-8 encoding
+                df = pd.read_csv(input_fn, sep='|', encoding='utf-8')
+            except UnicodeDecodeError:
+                # If UnicodeDecodeError occurs, try reading the file with cp1252 encoding (Windows encoding)
+                df = pd.read_csv(input_fn, sep='|', encoding='cp1252')
+
+            self.check_input_columns(df, url_col_name, pub_date_col_name)
+            frames.append(df)
+
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        df = self.prepare_input(df, url_col_name, pub_date_col_name)
+
+        # Additional error handling for an empty dataframe
+        if df.empty:
+            raise ValueError("The CSV file is empty. Please provide a valid non-empty CSV file.")
+
+        return df
 
+    def read_shard(self, path, shard, num_shards, url_col_name="LinkURI", pub_date_col_name="PublishedDate",
+                   chunk_size=READ_CHUNK_SIZE):
+        """Reads the rows of one shard of the input files.
+
+        The input files are streamed chunk by chunk, and only the rows whose canonical URL hashes to the shard
+        are kept (see sharding.shard_of), so the whole input is never in memory at once.
+
+        Args:
+            path (str): Input file, directory or glob pattern.
+            shard (int): Shard to read, from 0 to num_shards - 1.
+            num_shards (int): Number of shards.
+            url_col_name (str, optional): Name of the column with URLs. Defaults to "LinkURI".
+            pub_date_col_name (str, optional): Name of the column with article publication dates. Defaults to "PublishedDate".
+            chunk_size (int, optional): Number of rows read at once. Defaults to 50000.
+
+        Returns:
+            pd.DataFrame: Dataframe with the rows of the shard, possibly empty.
+        """
+        check_shard(shard, num_shards)
+
+        def read_file(fn, encoding):
+            frames = []
+            with pd.read_csv(fn, sep='|', encoding=encoding, chunksize=chunk_size) as chunks:
+                for chunk_df in chunks:
+                    self.check_input_columns(chunk_df, url_col_name, pub_date_col_name)
+                    frames.append(filter_shard(chunk_df, shard, num_shards, url_col_name))
+            return frames
+
+        frames, num_files = [], 0
+        for fn in expand_input_files(path):
+            try:
+                frames.extend(read_file(fn, 'utf-8'))
+            except UnicodeDecodeError:
+                # The whole file is read again with cp1252 encoding (Windows encoding)
+                frames.extend(read_file(fn, 'cp1252'))
+            num_files += 1
+
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=[url_col_name, pub_date_col_name])
+        df = self.prepare_input(df, url_col_name, pub_date_col_name)
+        logging.info(f"Shard {shard} of {num_shards}: {df.shape[0]} rows from {num_files} files")
+        return df
+
+    def check_input_columns(self, df, url_col_name, pub_date_col_name):
+        """Checks that the input data has the URL and publication date columns."""
         # Additional error handling for missing URL column
         if url_col_name not in df.columns:
             raise ValueError(f"Column '{url_col_name}' not found in the CSV file. Please check the column name or provide a valid column name.")
@@ -129,20 +216,62 @@ class ContentExtractor:
         if pub_date_col_name not in df.columns:
             raise ValueError(f"Column '{pub_date_col_name}' not found in the CSV file. Please check the column name or provide a valid column name.")
 
+    def prepare_input(self, df, url_col_name, pub_date_col_name):
+        """Renames the URL and publication date columns, removes the duplicates and applies the schema.
+
+        Args:
+            df (pd.DataFrame): Data read from the input files.
+            url_col_name (str): Name of the column with URLs.
+            pub_date_col_name (str): Name of the column with article publication dates.
+
+        Returns:
+            pd.DataFrame: Input data.
+        """
         # Rename the specified URL column to "URL", and article published date column to "PublishedDate"
-        df.rename(columns={url_col_name: "URL"}, inplace=True)
-        df.rename(columns={pub_date_col_name: "PublishedDate"}, inplace=True)
+        df = df.rename(columns={url_col_name: "URL", pub_date_col_name: "PublishedDate"})
         
         # Remove duplicate rows: the column "Alert definition" may contains different values for thesame URL
         # Therefore, we drop off the column and remove duplicates
         if 'Alert_definition' in df.columns:
             df = df.drop(['Alert_definition'], axis=1).drop_duplicates()
 
-        # Additional error handling for an empty dataframe
-        if df.empty:
-            raise ValueError("The CSV file is empty. Please provide a valid non-empty CSV file.")
+        # Compact types: categorical languages, parsed dates, 8-bit article flags and string contents
+        return apply_schema(df, ARTICLE_SCHEMA)
 
-        return df
+    def read_new_data(self, path, seen_index, url_col_name="LinkURI", pub_date_col_name="PublishedDate", id_col_name="Id"):
+        """Reads the alerts of the input files that were not processed yet.
+
+        The input files that were fully ingested and haven't changed since are not read. The alerts of the other
+        files are checked against the seen index by alert Id and canonical URL. The index is not updated here:
+        call seen_index.mark_seen and seen_index.mark_file_ingested once the alerts are processed.
+
+        Args:
+            path (str): Input file, directory or glob pattern.
+            seen_index (SeenIndex): Index of the processed alerts.
+            url_col_name (str, optional): Name of the column with URLs. Defaults to "LinkURI".
+            pub_date_col_name (str, optional): Name of the column with article publication dates. Defaults to "PublishedDate".
+            id_col_name (str, optional): Name of the column with alert Ids. Defaults to "Id".
+
+        Returns:
+            tuple: Dataframe with the new alerts, and the list of the files that were read.
+        """
+        frames, files = [], []
+        for fn in expand_input_files(path):
+            if seen_index.is_file_ingested(fn):
+                logging.info(f"{fn}: already ingested, skipped")
+                continue
+
+            frames.append(self.read_data(fn, url_col_name=url_col_name, pub_date_col_name=pub_date_col_name))
+            files.append(fn)
+
+        if not frames:
+            return pd.DataFrame(), files
+
+        df = pd.concat(frames, ignore_index=True)
+        new_df = seen_index.filter_new(df, id_col_name=id_col_name).reset_index(drop=True)
+        logging.info(f"{new_df.shape[0]} new alerts out of {df.shape[0]} in {len(files)} files")
+
+        return new_df, files
 
     def clean_text(self, text):
         """Cleans text by removing HTML tags and special characters.
@@ -154,16 +283,8 @@ class ContentExtractor:
             str: Cleaned text.
         """
         try:
-            # Remove HTML tags from the text using regular expressions
-            cleaned_text = re.sub(r'<[^>]+>', '', text)
-            
-            # Remove special characters, leaving only alphanumeric characters, commas, periods, and spaces,and French letters with accents
-            cleaned_text = re.sub(r"""[^a-zA-Z0-9éàèùçâêîôûëïü.,!-:;()"'\s]""", '', cleaned_text)
-            
-            # Remove extra whitespaces by splitting and rejoining the text
-            cleaned_text = ' '.join(cleaned_text.split())
-
-            return cleaned_text
+            # Remove HTML tags, special characters and extra whitespaces with the precompiled patterns
+            return normalise_text(text, keep_characters=self.keep_characters)
         except Exception as e:
             # Handle any unexpected errors and provide an error message
             raise ValueError(f"Error occurred while cleaning text: {str(e)}. Please check the input text and try again.")
@@ -194,6 +315,62 @@ class ContentExtractor:
             print(f"An error occurred while removing stopwords: {e}")
             return text  # Return the original text in case of an error
 
+    def compact_content(self, df):
+        """Prepares the content of the articles for the prompts, with the text profile of the extractor.
+
+        Args:
+            df (pd.DataFrame): Articles, with 'New_Content' and 'Language' columns.
+
+        Returns:
+            pd.DataFrame: Articles with their content compacted, or the same articles with the default profile.
+        """
+        if self.text_profile == DEFAULT_PROFILE or df.empty:
+            return df
+        keep = df['Language'].map(self.keeps_characters).astype(bool)
+        if not keep.any():
+            return df.assign(New_Content=normalise_column(df['New_Content'], self.text_profile, df['Language']))
+
+        content = df['New_Content'].astype(object)
+        content[~keep] = normalise_column(content[~keep], self.text_profile, df['Language'][~keep])
+        content[keep] = normalise_column(content[keep], self.text_profile, df['Language'][keep], keep_characters=True)
+        return df.assign(New_Content=content)
+
+    def compact_text(self, text, language):
+        """Prepares the content of a single article for the prompts (see compact_content)."""
+        if self.text_profile == DEFAULT_PROFILE:
+            return text
+        return normalise_text(text, self.text_profile, language, self.keeps_characters(language))
+
+    def keeps_characters(self, language):
+        """Returns whether the content of an article keeps the characters of every script: only the articles
+        sent to the multilingual prompt keep them, when the content is extracted with them."""
+        return self.keep_characters and self.prompt_language(language) == MULTILINGUAL_PROMPT
+
+    def filter_text(self, text, language):
+        """Removes the characters of the other scripts from the content of an article once its language is known,
+        unless it's sent to the multilingual prompt (see keeps_characters)."""
+        if not self.keep_characters or self.keeps_characters(language):
+            return text
+        return normalise_text(text)
+
+    def filter_content(self, df):
+        """Removes the characters of the other scripts from the content of the articles (see filter_text).
+
+        Args:
+            df (pd.DataFrame): Articles, with 'Summary', 'New_Content' and 'Language' columns.
+
+        Returns:
+            pd.DataFrame: Articles with their content filtered.
+        """
+        if not self.keep_characters or df.empty:
+            return df
+        columns = {}
+        for col in ('Summary', 'New_Content'):
+            if col in df.columns:
+                columns[col] = [self.filter_text(text, language) if isinstance(text, str) else text
+                                for text, language in zip(df[col], df['Language'])]
+        return df.assign(**columns)
+
     def extract_url_content(self, url, language='en'):
         """Extracts content from a given URL.
 
@@ -204,8 +381,6 @@ class ContentExtractor:
         Returns:
             tuple: Summary, content, and validity flag (1 if valid body, 0 otherwise).
         """
-        signal(SIGINT, handler)
-        
         summary, content, is_valid = '', '', -1
 
         try:
@@ -215,6 +390,21 @@ class ContentExtractor:
             logging.error(f"An error occurred during the request: {str(e)}")
             return summary, content, is_valid
 
+        return self.parse_response(url, response, language)
+
+    def parse_response(self, url, response, language='en'):
+        """Extracts the content of a downloaded page.
+
+        Args:
+            url (str): URL of the page.
+            response (requests.Response): Response of the request, or any object with the same 'content' and 'text' attributes.
+            language (str, optional): Language of the content. Defaults to 'en'.
+
+        Returns:
+            tuple: Summary, content, and validity flag (1 if valid body, 0 otherwise).
+        """
+        summary, content, is_valid = '', '', -1
+
         try:
             if self.check_for_captcha(response):
                 soup = BeautifulSoup(response.content, features='html.parser')
@@ -233,7 +423,7 @@ class ContentExtractor:
                 content = article.text
                 is_valid = 1 if article.is_valid_body() else 0
    
-            logging.info(f"{url}: content extracted")
+            logging.log(URL, f"{url}: content extracted")
             
             # Process and clean the extracted content
             summary = self.clean_text(summary)
@@ -251,16 +441,15 @@ class ContentExtractor:
             url (str): URL to make a request to.
 
         Returns:
-            requests.Response: Response object.
+            requests.Response: Response object (httpx.Response over HTTP/2).
         """
         try:
-            response = requests.get(url, verify=True, headers=USER_AGENT, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
-        except requests.exceptions.SSLError:
-            response = requests.get(url, verify=False, headers=USER_AGENT, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
-        except requests.exceptions.ReadTimeout:
+            # Keep-alive connections per publisher, DNS cache and compression (see transport.py)
+            response = self.transport.get(url)
+        except TIMEOUT_ERRORS:
             logging.error(f"Access to {url} timed out")
             raise  # Re-raise the exception to be caught in the higher level
-        except requests.exceptions.ConnectionError:
+        except CONNECTION_ERRORS:
             logging.error(f"Access to {url} refused")
             raise  # Re-raise the exception to be caught in the higher level
 
@@ -324,54 +513,237 @@ class ContentExtractor:
         # Strip whitespace and check the length of the content
         return len(content.strip()) >= min_length
 
-    def extract_content(self, df, num_processes=None, out_fn=None):
+    def extract_content(self, df, num_processes=None, out_fn=None, save=True, control=None):
         """Extracts content in parallel from URLs in the dataframe.
 
         Args:
             df (pd.DataFrame): Dataframe containing URLs.
             num_processes (int, optional): Number of processes for parallel extraction. Defaults to None.
             out_fn (str, optional): Output file name to save the results. Defaults to None.
+            save (bool, optional): Whether to save the results to a CSV file. Defaults to True.
+            control (RunControl, optional): Time budget and stop requests of the run. Defaults to None.
 
         Returns:
-            pd.DataFrame: Dataframe with extracted content.
+            pd.DataFrame: Dataframe with extracted content. If the run is stopped, only the rows whose
+                extraction was completed.
         """
-        try:
-            if num_processes is None:
-                num_processes = multiprocessing.cpu_count() - 1
-                
-            with multiprocessing.Pool(processes=num_processes) as pool:
-                results = pool.starmap(self.extract_url_content, zip(df['URL'], df['Language']))  
+        if num_processes is None:
+            num_processes = multiprocessing.cpu_count() - 1
+        control = control or RunControl()
 
-        except KeyboardInterrupt:
-            logging.error('Got ^C while pool mapping, terminating the pool')
+        results, stats_by_process = {}, {}
+        rows = enumerate(zip(df['URL'], df['Language']))
+
+        # Worker processes ignore Ctrl+C and send their logs to the log listener, if any
+        initializer, initargs = worker_initializer()
+        with multiprocessing.Pool(processes=num_processes, initializer=initializer, initargs=initargs) as pool:
+            pending = {}
+            try:
+                while True:
+                    # A few URLs per process are in flight, so that no new URL is dispatched once the run is stopping
+                    while len(pending) < 2 * num_processes and not control.should_stop():
+                        try:
+                            index, args = next(rows)
+                        except StopIteration:
+                            break
+                        pending[index] = pool.apply_async(self.worker_task, ("extract_url_content",) + args)
+
+                    if not pending:
+                        break
+                    if control.grace_expired():
+                        logging.error(f"Grace period expired, {len(pending)} URLs in progress are abandoned")
+                        break
+
+                    next(iter(pending.values())).wait(CHECK_INTERVAL)
+                    for index in [index for index, result in pending.items() if result.ready()]:
+                        results[index], pid, stats_by_process[pid] = pending.pop(index).get()
+
+            except KeyboardInterrupt:
+                logging.error('Got ^C while pool mapping, terminating the pool')
             pool.terminate()
-            logging.error('Pool is terminated')
-            logging.error('Joining pool processes')
-            pool.join()
-            logging.error('Join complete')
 
-        df['Summary'], df['New_Content'], df['Is_Article'] = zip(*results)
+        logging.info(f"Downloads: {total_stats(stats_by_process.values()).summary()}")
+        if len(results) < df.shape[0]:
+            logging.warning(f"Content extracted from {len(results)} of {df.shape[0]} URLs")
+            df = df.iloc[sorted(results)].copy()
+
+        df['Summary'], df['New_Content'], df['Is_Article'] = zip(*[results[index] for index in sorted(results)]) if results else ([], [], [])
+        df = apply_schema(df, ARTICLE_SCHEMA)
+
+        if save:
+            self.save_results(df, out_fn, prefix="extracted_url_content")
+
+        return df
+
+    def extract_chunk(self, chunk_df):
+        """Extracts the content of the URLs of a chunk, in a worker process.
+
+        Args:
+            chunk_df (pd.DataFrame): Chunk of the dataframe containing URLs.
+
+        Returns:
+            pd.DataFrame: Chunk with extracted content.
+        """
+        results = [self.extract_url_content(url, language) for url, language in zip(chunk_df['URL'], chunk_df['Language'])]
+        chunk_df['Summary'], chunk_df['New_Content'], chunk_df['Is_Article'] = zip(*results)
+        return chunk_df
+
+    def worker_task(self, method, *args):
+        """Runs a method of the extractor in a worker process.
+
+        Args:
+            method (str): Name of the method.
+            *args: Arguments of the method.
+
+        Returns:
+            tuple: Result of the method, Id of the process, and download statistics of the process so far.
+        """
+        return getattr(self, method)(*args), os.getpid(), self.transport.stats
+
+    def extract_content_chunks(self, df, num_processes=None, out_fn=None, chunk_size=CHUNK_SIZE, control=None):
+        """Extracts content in parallel from URLs in the dataframe, chunk by chunk, with bounded memory.
+
+        Every worker process extracts a whole chunk. Chunks are written to the output file as soon as they
+        are finished, in their order of completion, and then freed: only the chunks in progress are in memory,
+        whatever the size of the input.
 
+        Args:
+            df (pd.DataFrame): Dataframe containing URLs.
+            num_processes (int, optional): Number of processes for parallel extraction. Defaults to None.
+            out_fn (str, optional): Output file name. Defaults to None, for a file with a timestamp in the output folder.
+            chunk_size (int, optional): Number of URLs per chunk. Defaults to 500.
+            control (RunControl, optional): Time budget and stop requests of the run. Defaults to None.
+
+        Returns:
+            str: Output file name. The rows are not in the order of the input dataframe.
+        """
+        if num_processes is None:
+            num_processes = multiprocessing.cpu_count() - 1
+        control = control or RunControl()
+
+        out_fn = self.output_path(out_fn, prefix="extracted_url_content")
+        # No new chunk is dispatched once the run is stopping
+        chunks = (df.iloc[start:start + chunk_size].copy() for start in range(0, df.shape[0], chunk_size)
+                  if not control.should_stop())
+        header, num_rows, stats_by_process = True, 0, {}
+
+        initializer, initargs = worker_initializer()
+        with multiprocessing.Pool(processes=num_processes, initializer=initializer, initargs=initargs) as pool:
+            try:
+                results = pool.imap_unordered(partial(self.worker_task, "extract_chunk"), chunks)
+                while True:
+                    try:
+                        chunk_df, pid, stats_by_process[pid] = results.next(timeout=CHECK_INTERVAL)
+                    except StopIteration:
+                        break
+                    except multiprocessing.TimeoutError:
+                        if control.grace_expired():
+                            logging.error("Grace period expired, the chunks in progress are abandoned")
+                            break
+                        continue
+
+                    # The file is opened for every chunk, so the rows written so far survive an interruption
+                    chunk_df.to_csv(out_fn, mode='w' if header else 'a', header=header, index=False, sep='|')
+                    header = False
+                    num_rows += chunk_df.shape[0]
+                    logging.info(f"{num_rows} of {df.shape[0]} URLs extracted")
+                    del chunk_df
+
+            except KeyboardInterrupt:
+                logging.error('Got ^C while extracting the chunks, terminating the pool')
+            pool.terminate()
+
+        logging.info(f"Downloads: {total_stats(stats_by_process.values()).summary()}")
+        if num_rows < df.shape[0]:
+            logging.warning(f"{num_rows} of {df.shape[0]} rows were saved to {out_fn}")
+
+        return out_fn
+
+    def read_valid_articles(self, fn, chunk_size=CHUNK_SIZE):
+        """Reads the valid articles of an extracted content file, chunk by chunk.
+
+        Args:
+            fn (str): Extracted content file name.
+            chunk_size (int, optional): Number of rows per chunk. Defaults to 500.
+
+        Returns:
+            pd.DataFrame: Dataframe with valid articles.
+        """
+        # A run stopped before the first chunk has no extracted content file
+        if not os.path.exists(fn):
+            return pd.DataFrame()
+
+        chunks = [self.filter_scraped_data(apply_schema(chunk_df, ARTICLE_SCHEMA))
+                  for chunk_df in pd.read_csv(fn, sep='|', chunksize=chunk_size)]
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+    def output_path(self, out_fn=None, prefix="nlp_results"):
+        """Returns the output file name, or a file name with a timestamp in the output folder.
+
+        Args:
+            out_fn (str, optional): Output file name. Defaults to None.
+            prefix (str, optional): Prefix of the file name with a timestamp. Defaults to "nlp_results".
+
+        Returns:
+            str: Output file name.
+        """
+        if out_fn is None or out_fn == "":
+            if not os.path.exists(OUTPUT_FOLDER_PATH): 
+                os.makedirs(OUTPUT_FOLDER_PATH)
+            
+            # Get the current date and time    
+            current_datetime = datetime.now().strftime('%Y-%m-%d_%H%M%S') 
+            out_fn = f"{prefix}_{current_datetime}.csv"
+            out_fn = os.path.join(OUTPUT_FOLDER_PATH, out_fn)
+
+        return out_fn
+
+    def save_results(self, df, out_fn=None, prefix="nlp_results"):
+        """Saves the results to a CSV file.
+
+        Args:
+            df (pd.DataFrame): Dataframe to save.
+            out_fn (str, optional): Output file name. Defaults to None, for a file with a timestamp in the output folder.
+            prefix (str, optional): Prefix of the file name with a timestamp. Defaults to "nlp_results".
+
+        Returns:
+            str: Output file name, or None if the results couldn't be saved.
+        """
         try:
             logging.info("Saving results ...")
-            if out_fn is not None and out_fn != "":
-                df.to_csv(out_fn, index=False, sep='|')
-            else:
-                if not os.path.exists(OUTPUT_FOLDER_PATH): 
-                    os.makedirs(OUTPUT_FOLDER_PATH)
-                
-                # Get the current date and time    
-                current_datetime = datetime.now().strftime('%Y-%m-%d_%H%M%S') 
-                out_fn = f"extracted_url_content_{current_datetime}.csv"
-                out_fn = os.path.join(OUTPUT_FOLDER_PATH, out_fn)
-                df.to_csv(out_fn, index=False, sep='|')
+            out_fn = self.output_path(out_fn, prefix)
+            df.to_csv(out_fn, index=False, sep='|', date_format=DATE_FORMAT)
             logging.info("Saved.")
+            return out_fn
+
         except Exception as e:
-            logging.error(f"An error occurred: {str(e)}")
-            logging.error("Data aren't saved but returned")
-            pass
+            # Handle exceptions during the saving process
+            logger.error(f"An error occurred while saving results: {str(e)}")
+            logger.error("Data aren't saved but returned")
+            return None
 
-        return df
+    async def aextract_events(self, dispatcher, df, on_result=None):
+        """Dispatches the extraction of every event of the dataframe.
+
+        Args:
+            dispatcher (AsyncDispatcher): Dispatcher of the calls.
+            df (pd.DataFrame): Dataframe with content and URLs.
+            on_result (function, optional): Called with the index and the result of every completed extraction.
+
+        Returns:
+            list: Dataframes with extracted information, in the order of the input dataframe.
+        """
+        # The content of all the articles is compacted at once, before the first call
+        df = self.compact_content(df)
+        try:
+            return await dispatcher.map(
+                self.aextract_single_event,
+                zip(df['New_Content'], df['URL'], df['Language'], df['PublishedDate']),
+                on_result=on_result
+            )
+        finally:
+            # Close the connection pool while the event loop is still running
+            await self.backend.aclose()
 
     def filter_scraped_data(self, df):
         """Filters the dataframe to include only valid articles.
@@ -387,7 +759,7 @@ class ContentExtractor:
             if 'Is_Article' not in df.columns:
                 raise ValueError("Column 'Is_Article' not found in the dataframe. Please check the column name.")
             
-            # Filter the dataframe to include only valid articles
+            # Filter the dataframe to include only valid articles (a comparison of 8-bit integers once the schema is applied)
             df_filtered = df[df["Is_Article"] == 1].reset_index(drop=True)
             
             return df_filtered
@@ -424,6 +796,9 @@ class ContentExtractor:
     def extract_single_event_chatopenai(self, url_content, url, language, publish_date):
         """Extracts information for a single event using OpenAI or AWS Bedrock API.
 
+        When a model cascade is configured, the article is first processed by the cheapest model,
+        and it is sent to the next model only if the answer is not confident enough (see score_answer).
+
         Args:
             url_content (str): Content of the URL.
             url (str): URL of the event.
@@ -434,283 +809,378 @@ class ContentExtractor:
             pd.DataFrame: Dataframe with extracted information.
         """
         try:
-            if (self.solution == "openai"):
-                logger.info(f"OpenAI is extracting information from {url}")
+            # The places of the article are found once, for all the models of the cascade
+            content_countries = self.annotate_places(url_content)
+            for tier, model in enumerate(self.models, start=1):
+                content_df = self.extract_single_event_with_model(url_content, url, language, model)
+                content_df = self.normalise_places(content_df, content_countries)
+                confidence = self.score_answer(content_df)
 
-                # Define system and user messages based on the language
-                system_msg, user_msg = self.prepare_messages(language, url_content)
+                if confidence >= self.cascade_min_confidence or tier == len(self.models):
+                    break
 
-                # Make an OpenAI API call
-                openai_content = self.make_openai_call(system_msg, user_msg)
+                logger.log(URL, f"Answer of {model} for {url} has low confidence ({confidence:.2f}), escalating to the next model")
 
-                # Transform OpenAI response to DataFrame
-                content_df = self.transform_openai_response_to_df(openai_content)
+            return self.add_event_metadata(content_df, url, publish_date, model, tier, confidence)
 
-                # Pause for 60 seconds to avoid API rate limits
-                time.sleep(60)
-            
-            elif (self.solution == "bedrock"):
-                logger.info(f"AWS Bedrock model {self.model} is extracting information from {url}")
+        except Exception as e:
+            # Handle any unexpected errors
+            logger.error(f"An error occurred during extraction: {str(e)}")
+            return pd.DataFrame()  # Return an empty DataFrame in case of an error
+
+    async def aextract_single_event(self, url_content, url, language, publish_date):
+        """Asynchronous version of extract_single_event_chatopenai.
 
-                # Define system and user messages based on the language
-                msg = self.prepare_messages_bedrock(language, url_content)
+        Args:
+            url_content (str): Content of the URL.
+            url (str): URL of the event.
+            language (str): Language of the content ('en' for English, 'fr' for French).
+            publish_date (str): Date of the URL article publication.
 
-                # Make a Bedrock call
-                bedrock_content = self.make_bedrock_call(msg)
+        Returns:
+            pd.DataFrame: Dataframe with extracted information.
+        """
+        try:
+            content_countries = self.annotate_places(url_content)
+            for tier, model in enumerate(self.models, start=1):
+                content_df = await self.aextract_single_event_with_model(url_content, url, language, model)
+                content_df = self.normalise_places(content_df, content_countries)
+                confidence = self.score_answer(content_df)
 
-                # Transform Bedrock response to DataFrame
-                content_df = self.transform_bedrock_response_to_df(bedrock_content)
+                if confidence >= self.cascade_min_confidence or tier == len(self.models):
+                    break
 
-            # Add metadata to the DataFrame
-            content_df["link"] = url
-            content_df["published_date"] = publish_date
+                logger.log(URL, f"Answer of {model} for {url} has low confidence ({confidence:.2f}), escalating to the next model")
 
-            return  content_df # openai_content #
+            return self.add_event_metadata(content_df, url, publish_date, model, tier, confidence)
 
         except Exception as e:
             # Handle any unexpected errors
             logger.error(f"An error occurred during extraction: {str(e)}")
             return pd.DataFrame()  # Return an empty DataFrame in case of an error
 
-    def prepare_messages(self, language, url_content):
-        """Prepare system and user messages based on the language.
+    def annotate_places(self, url_content):
+        """Finds the countries of the places named in an article with the gazetteer, before the model call.
 
         Args:
-            language (str): Language code ('en' or 'fr').
-            url_content (str): Context from the URL.
+            url_content (str): Content of the URL.
 
         Returns:
-            tuple: System message and user message.
+            list: (ISO code, country name) tuples, the country with the most places first. Empty without gazetteer.
         """
-        if language == 'en':
-            system_msg = "You are a helpful assistant. You answer all the questions. Your responses consist of valid JSON syntax, with no other comments, explanations, reasoning, or dialogue that do not consist of valid JSON. Each key is the question number. You do not include the questions themselves. Each value is the corresponding answer. Each key-value pair should be enclosed in curly braces, and each key and value should be enclosed in double-quotes."            # system_msg = "You are a helpful assistant. You answer all the questions. Your responses consist of valid JSON syntax. Do not include any additional comments, explanations, reasoning, or dialogue not consisting of valid JSON. Include the number of question only. Do not include any questions. Each question number and answer should be enclosed in double-quotes. "
-            # system_msg = 'You are a helpful assistant. You answer all the questions. Your responses consist of valid JSON syntax, with no other comments, explanations, reasoning, or dialogue not consisting of valid JSON. You put each answer '
-            quest1 = "1. Did a flood event occur? (Respond with 'Yes' or No' only. If the answer is 'No', mark the following questions as 'NA'.)"
-            quest2 = "2. If a flood event occurred, what caused the flood event? (Specify the cause or mark as Unknown)"
-            # quest3 = "3. If a flood event happened and its cause is known, what is the name of this cause? (Name of the cause only or Unknown)"
-            quest3 = "3. If a flood event occurred, when did it happen? (Specify in YYYY-MM format or mark as Unknown)"
-            quest4 = "4. If a flood event occurred, where did it happen? (Specify all affected places or mark as Unknown)"
-            quest5 = "5. Did any casualties occur if a flood event took place? (Yes or No or mark as Unknown)"
-            quest6 = "6. Did evacuation take place if a flood event occurred? (Yes or No or mark as Unknown)"
-            quest7 = "7. If the locations of the flood-affected areas are known, specify the country they are in? (or mark as Unknown)"
-            
-            user_msg = f"Questions answering: \nContext: {url_content}\n {quest1}\n {quest2}\n {quest3}\n {quest4}\n {quest5}\n {quest6}\n {quest7}"            
-        elif language == 'fr':
-            system_msg = "Vous êtes un assistant fournissant des réponses utiles. Vous répondez à toutes les questions. Vos réponses consistent en une syntaxe JSON valide, sans autres commentaires, explications, raisonnements ou dialogues qui ne sont pas constitués de syntaxe JSON valide. Chaque clé est le numéro de la question. N'incluez pas les questions elles-mêmes. Chaque valeur est la réponse correspondante. Chaque paire clé-valeur doit être enfermée dans des accolades, et chaque clé et valeur doivent être enfermées entre guillemets."
-            quest1 = "1. Est-ce qu'un événement d'inondation s'est produit ? (Oui ou Non seulement. Si la réponse est 'Non', marquez les questions suivantes comme 'NA'.)"
-            quest2 = "2. Si un événement d'inondation s'est produit, quelle en était la cause ? (Spécifiez la cause ou marquez comme Inconnu)"
-            quest3 = "3. Si un événement d'inondation s'est produit, quand s'est-il produit ? (Spécifiez au format AAAA-MM ou marquez comme Inconnu)"
-            quest4 = "4. Si un événement d'inondation s'est produit, où s'est-il produit ? (Spécifiez tous les endroits affectés ou marquez comme Inconnu))"
-            quest5 = "5. Y a-t-il eu des victimes en cas d'inondation? (Oui ou Non ou marquer comme Inconnu)"
-            quest6 = "6. Est-ce qu'une évacuation a eu lieu en cas d'inondation ? (Oui, Non ou marquer comme Inconnu)"
-            quest7 = "7. Si les emplacements des zones touchées par l'inondation sont connus, spécifiez le pays dans lequel ils se trouvent? (ou marquez comme Inconnu)"
-            
-            user_msg = f"Réponses aux questions : \nContexte: {url_content}\n {quest1}\n {quest2}\n {quest3}\n {quest4}\n {quest5}\n {quest6}\n {quest7}"          
-        else:
-            logging.error("The provided mode is not recognized.")
-            raise ValueError("The provided mode is not recognized.")
+        if self.gazetteer is None:
+            return []
+        return self.gazetteer.annotate(url_content)
 
-        return system_msg, user_msg
-    
-    def prepare_messages_bedrock(self, language, url_content):
-        """Prepare system and user messages based on the language.
+    def normalise_places(self, content_df, content_countries=()):
+        """Normalises the location answer into GeoNames places, and derives the country from them.
+
+        Adds the 'location_ids', 'location_names' and 'country_codes' columns. The 'country' answer is replaced
+        by the countries of the locations, or, if no location is known, by the main country of the article.
+        Without gazetteer, the answer is returned unchanged.
 
         Args:
-            language (str): Language code ('en' or 'fr').
-            url_content (str): Context from the URL.
+            content_df (pd.DataFrame): Dataframe with the transformed model answer.
+            content_countries (list, optional): Countries of the article (see annotate_places). Defaults to none.
 
         Returns:
-            list: System message and user message.
-        """
-        if language == 'en':
-            questions = [
-                "1. Did a flood event occur? (Respond with 'Yes' or No' only. If the answer is 'No', mark the following questions as 'NA'.)",
-                "2. If a flood event occurred, what caused the flood event? (Specify the cause or mark as Unknown)",
-                "3. If a flood event occurred, when did it happen? (Specify in YYYY-MM format or mark as Unknown)",
-                "4. If a flood event occurred, where did it happen? (Specify the names all affected places only, separated by commas. or mark as Unknown)",
-                "5. Did any casualties occur if a flood event took place? (Yes or No or mark as Unknown)",
-                "6. Did evacuation take place if a flood event occurred? (Yes or No or mark as Unknown)",
-                "7. If the locations of the flood-affected areas are known, specify the country they are in? (or mark as Unknown)"
-            ]
-
-            user_msg = f"""
-                You are a helpful assistant. You answer all the questions based on the provided content only. Keep the answer concise.
-                Your responses consist of valid JSON syntax, with no other comments, explanations, reasoning, or dialogue that do not consist of valid JSON. 
-                Each key is the question number. You do not include the questions themselves. 
-                Each value is the corresponding answer.
-                Each key-value pair should be enclosed in curly braces, and each key and value should be enclosed in double-quotes.
-
-                Content: {url_content}
-
-                Questions: {questions}
-            """
-
-            msg = [{"role": "user", "content": [{"text": user_msg}]}] 
-
-        elif language == 'fr':
-            system_msg = "Vous êtes un assistant fournissant des réponses utiles. Vous répondez à toutes les questions. Vos réponses consistent en une syntaxe JSON valide, sans autres commentaires, explications, raisonnements ou dialogues qui ne sont pas constitués de syntaxe JSON valide. Chaque clé est le numéro de la question. N'incluez pas les questions elles-mêmes. Chaque valeur est la réponse correspondante. Chaque paire clé-valeur doit être enfermée dans des accolades, et chaque clé et valeur doivent être enfermées entre guillemets."
-            questions = [
-                "1. Est-ce qu'un événement d'inondation s'est produit ? (Oui ou Non seulement. Si la réponse est 'Non', marquez les questions suivantes comme 'NA'.)",
-                "2. Si un événement d'inondation s'est produit, quelle en était la cause ? (Spécifiez la cause ou marquez comme Inconnu)",
-                "3. Si un événement d'inondation s'est produit, quand s'est-il produit ? (Spécifiez au format AAAA-MM ou marquez comme Inconnu)",
-                "4. Si un événement d'inondation s'est produit, où s'est-il produit ? (Spécifiez tous les endroits affectés ou marquez comme Inconnu))",
-                "5. Y a-t-il eu des victimes en cas d'inondation? (Oui ou Non ou marquer comme Inconnu)",
-                "6. Est-ce qu'une évacuation a eu lieu en cas d'inondation ? (Oui, Non ou marquer comme Inconnu)",
-                "7. Si les emplacements des zones touchées par l'inondation sont connus, spécifiez le pays dans lequel ils se trouvent? (ou marquez comme Inconnu)"
-            ]
-
-            user_msg = f"""
-                Vous êtes un assistant fournissant des réponses utiles. Vous répondez à toutes les questions. Gardez la réponse concise.
-                Vos réponses consistent en une syntaxe JSON valide, sans autres commentaires, explications, raisonnements ou dialogues qui ne sont pas constitués de syntaxe JSON valide. 
-                Chaque clé est le numéro de la question. N'incluez pas les questions elles-mêmes. 
-                Chaque valeur est la réponse correspondante.
-                Chaque paire clé-valeur doit être enfermée dans des accolades, et chaque clé et valeur doivent être enfermées entre guillemets.
-                            
-                Le contenu: {url_content}
-
-                Questions: {questions}
-            """
-
-            msg = [{"role": "user", "content": [{"text": user_msg}]}] 
+            pd.DataFrame: Dataframe with the normalised places.
+        """
+        if self.gazetteer is None or content_df.empty or 'location' not in content_df.columns:
+            return content_df
+
+        location = content_df['location'].iloc[0]
+        places = self.gazetteer.normalise_location(location if isinstance(location, str) else '')
+        for col, value in places.items():
+            content_df[col] = value
+
+        # Without flood event, the country stays unknown
+        codes = places['country_codes'].split(ID_SEPARATOR) if places['country_codes'] else []
+        if not codes and self.normalise_answer(content_df['is_happened'].iloc[0]) == 'yes':
+            codes = [code for code, _ in content_countries[:1]]
+
+        if codes:
+            content_df['country'] = ', '.join(self.gazetteer.country_names[code] for code in codes)
+        elif not self.ask_country:
+            content_df['country'] = 'NA' if self.normalise_answer(content_df['is_happened'].iloc[0]) == 'no' else 'Unknown'
+
+        return content_df
+
+    def add_event_metadata(self, content_df, url, publish_date, model, tier, confidence):
+        """Adds the article link and publication date, and the cascade tier that produced the answer.
+
+        Args:
+            content_df (pd.DataFrame): Dataframe with the transformed model answer.
+            url (str): URL of the event.
+            publish_date (str): Date of the URL article publication.
+            model (str): NLP Model Name or Id that produced the answer.
+            tier (int): Tier of the model in the cascade, starting from 1.
+            confidence (float): Confidence of the answer.
+
+        Returns:
+            pd.DataFrame: Dataframe with extracted information.
+        """
+        content_df["link"] = url
+        content_df["published_date"] = publish_date
+
+        # Record which tier of the cascade produced the answer
+        if len(self.models) > 1:
+            content_df["model"] = model
+            content_df["model_tier"] = tier
+            content_df["confidence"] = round(confidence, 2)
+
+        return content_df
+
+    def extract_single_event_with_model(self, url_content, url, language, model):
+        """Extracts information for a single event with the given model.
+
+        Args:
+            url_content (str): Content of the URL.
+            url (str): URL of the event.
+            language (str): Language of the content ('en' for English, 'fr' for French).
+            model (str): NLP Model Name or Id.
+
+        Returns:
+            pd.DataFrame: Dataframe with extracted information.
+        """
+        logger.log(URL, f"{self.solution} model {model} is extracting information from {url}")
+
+        # Define the messages based on the language and the prompt layout of the backend
+        messages = self.prepare_prompt(language, url_content)
+
+        if self.structured_output:
+            template = get_prompt_template(self.prompt_language(language), self.backend.prompt_style, self.ask_country)
+            response = self.make_llm_call(messages, model, tool=answer_tool(template))
+            answers, errors = validate_answers(parse_answers(response), question_keys(template))
+
+            reasked, reask_tokens = [], 0
+            for _ in range(self.max_reasks):
+                # Without the first answer, the others can't be checked: the article is not asked again
+                if not errors or "1" in errors:
+                    break
+                logger.log(URL, f"Asking {model} again for the questions {', '.join(sorted(errors, key=int))} of {url}")
+                reask = reask_messages(template, answers, errors, url_content)
+                reask_response = self.make_llm_call(reask, model, tool=answer_tool(template, sorted(errors, key=int)),
+                                                    max_tokens=REASK_MAX_TOKENS)
+                reasked += [key for key in errors if key not in reasked]
+                reask_tokens += (reask_response.input_tokens or 0) + (reask_response.output_tokens or 0)
+                answers, errors = self.merge_reask(answers, errors, reask_response, template)
+
+            return self.structured_answers_to_df(response, answers, errors, reasked, reask_tokens)
+
+        # Make the model call
+        response = self.make_llm_call(messages, model)
+
+        # Transform the response to DataFrame
+        content_df = self.transform_response_to_df(response.text)
+
+        return content_df
+
+    async def aextract_single_event_with_model(self, url_content, url, language, model):
+        """Asynchronous version of extract_single_event_with_model."""
+        logger.log(URL, f"{self.solution} model {model} is extracting information from {url}")
+
+        messages = self.prepare_prompt(language, url_content)
+
+        if self.structured_output:
+            template = get_prompt_template(self.prompt_language(language), self.backend.prompt_style, self.ask_country)
+            response = await self.amake_llm_call(messages, model, tool=answer_tool(template))
+            answers, errors = validate_answers(parse_answers(response), question_keys(template))
+
+            reasked, reask_tokens = [], 0
+            for _ in range(self.max_reasks):
+                if not errors or "1" in errors:
+                    break
+                logger.log(URL, f"Asking {model} again for the questions {', '.join(sorted(errors, key=int))} of {url}")
+                reask = reask_messages(template, answers, errors, url_content)
+                reask_response = await self.amake_llm_call(reask, model, tool=answer_tool(template, sorted(errors, key=int)),
+                                                           max_tokens=REASK_MAX_TOKENS)
+                reasked += [key for key in errors if key not in reasked]
+                reask_tokens += (reask_response.input_tokens or 0) + (reask_response.output_tokens or 0)
+                answers, errors = self.merge_reask(answers, errors, reask_response, template)
+
+            return self.structured_answers_to_df(response, answers, errors, reasked, reask_tokens)
+
+        response = await self.amake_llm_call(messages, model)
+
+        return self.transform_response_to_df(response.text)
+
+    def merge_reask(self, answers, errors, response, template):
+        """Adds the answers of a follow-up question to the valid answers.
+
+        Args:
+            answers (dict): Valid answers by question number.
+            errors (dict): Errors by question number, the questions that were asked again.
+            response (LLMResponse): Response to the follow-up question.
+            template (PromptTemplate): Prompt template of the first call.
+
+        Returns:
+            tuple: Valid answers and remaining errors (see validate_answers).
+        """
+        new_answers = parse_answers(response) or {}
+        new_answers = {key: value for key, value in new_answers.items() if key in errors}
+        return validate_answers({**answers, **new_answers}, question_keys(template))
+
+    def structured_answers_to_df(self, response, answers, errors, reasked, reask_tokens):
+        """Transforms the validated answers into a dataframe.
+
+        The answers that are still invalid after the follow-up questions are 'Unknown'. Without a valid first
+        answer, the row is transformed as an unstructured response (the raw text ends up in 'is_happened').
+
+        Args:
+            response (LLMResponse): Response to the first call.
+            answers (dict): Valid answers by question number.
+            errors (dict): Remaining errors by question number.
+            reasked (list): Numbers of the questions that were asked again.
+            reask_tokens (int): Input and output tokens of the follow-up questions.
+
+        Returns:
+            pd.DataFrame: Dataframe with the answers, the names of the questions asked again ('reasked_fields')
+                and the tokens spent on them ('reask_tokens').
+        """
+        if "1" in errors:
+            content_df = self.transform_response_to_df(response.text)
         else:
-            logging.error("The provided mode is not recognized.")
-            raise ValueError("The provided mode is not recognized.")
+            keys = sorted({**answers, **errors}, key=int)
+            content_df = pd.DataFrame([[answers.get(key, "Unknown") for key in keys]])
+            content_df = self.check_and_append_columns(content_df, ncol=len(ANSWER_COLUMNS))
+            content_df.columns = ANSWER_COLUMNS
 
-        return msg
+        content_df["reasked_fields"] = ", ".join(ANSWER_COLUMNS[int(key) - 1] for key in reasked)
+        content_df["reask_tokens"] = reask_tokens
+        return content_df
 
-    def make_openai_call(self, system_msg, user_msg):
-        """Make an OpenAI API call based on the chosen model.
+    def normalise_answer(self, answer):
+        """Normalises a single model answer for comparisons.
 
         Args:
-            system_msg (str): System message for OpenAI.
-            user_msg (str): User message for OpenAI.
+            answer (str): Answer to one of the questions.
 
         Returns:
-            str: OpenAI response content.
+            str: 'yes', 'no', 'unknown' or the lowercased answer.
         """
-        try:
-            if self.model in ["gpt-3.5-turbo", "gpt-3.5-turbo-1106"]:
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_msg},
-                        {"role": "user", "content": user_msg}
-                    ],
-                    max_tokens=self.max_tokens,
-                    temperature=self.temp
-                )
-                openai_content = response["choices"][0]["message"]["content"]
-            else:
-                prompt = system_msg + '\n' + user_msg
-                response = openai.Completion.create(
-                    model=self.model,
-                    prompt=prompt,
-                    max_tokens=self.max_tokens,
-                    temperature=self.temp
-                )
-                openai_content = response['choices'][0]['text']
+        answer = str(answer).strip().strip('.!"\' ').lower()
 
-            return openai_content
+        if re.match(r"(yes|oui)\b", answer):
+            return "yes"
+        if re.match(r"(no|non)\b", answer):
+            return "no"
+        if answer in UNKNOWN_ANSWERS or answer.startswith(UNKNOWN_PREFIXES):
+            return "unknown"
 
-        except Exception as e:
-            # Handle any unexpected errors during the OpenAI API call
-            logger.error(f"An error occurred during the OpenAI API call: {str(e)}")
-            raise
-    
-    def make_bedrock_call(self, msg):
-        """Make an AWS Bedrock call based on the chosen model.
+        return answer
+
+    def score_answer(self, content_df):
+        """Scores how confident the answer of a model is.
+
+        The score is 0 when the answer could not be parsed (the raw text ends up in 'is_happened').
+        Otherwise, it is the share of the remaining answers that are known and consistent with 'is_happened':
+        no flood should come with empty answers, and a flood should come with a cause, a date in YYYY-MM format,
+        a location and a country. Unknown casualties or evacuation count as half an answer, as articles often
+        do not report them.
 
         Args:
-            system_msg (str): System message for AWS Bedrock.
-            user_msg (str): User message for AWS Bedrokck.
+            content_df (pd.DataFrame): Dataframe with the transformed model answer.
 
         Returns:
-            str: AWS Bedrock response content.
+            float: Confidence between 0 and 1.
         """
-        try:
-            params = {
-                "modelId": self.model,
-                "messages": msg,
-                "inferenceConfig": {
-                    "temperature": self.temp,
-                    "maxTokens": self.max_tokens}
-                }
+        if content_df.empty or not set(ANSWER_COLUMNS).issubset(content_df.columns):
+            return 0.0
 
-            # Invoke the Bedrock model
-            response = bedrock_client.converse(**params)
+        answers = {col: self.normalise_answer(content_df[col].iloc[0]) for col in ANSWER_COLUMNS}
+        details = ANSWER_COLUMNS[1:]
 
-            # Parse the response           
-            bedrock_content = response["output"]["message"]["content"][0]["text"]
+        if answers["is_happened"] == "no":
+            # All other answers should be empty if no flood occurred
+            consistent = [answers[col] in {"unknown", "no"} for col in details]
+            return sum(consistent) / len(details)
 
-            return bedrock_content
+        if answers["is_happened"] != "yes":
+            return 0.0
 
-        except Exception as e:
-            # Handle any unexpected errors during the OpenAI API call
-            logger.error(f"An error occurred during the AWS Bedrock call: {str(e)}")
-            raise
+        score = 0.0
+        for col in ["flood_cause_en", "location", "country"]:
+            score += answers[col] != "unknown"
+        score += bool(re.match(r"\d{4}-\d{2}", answers["date"]))
+        for col in ["death", "evacuation"]:
+            score += {"yes": 1.0, "no": 1.0, "unknown": 0.5}.get(answers[col], 0.0)
+
+        return score / len(details)
 
-    def transform_openai_response_to_df(self, openai_content):
-        """Transforms OpenAI/AWS Bedrock response into a dataframe.
+    def prompt_language(self, language):
+        """Returns the language of the prompt of an article: its own language, or the multilingual prompt for
+        the other languages when it is enabled."""
+        if self.multilingual_prompt and language not in PROMPT_LANGUAGES:
+            return MULTILINGUAL_PROMPT
+        return language
+
+    def prepare_prompt(self, language, url_content, prompt_style=None):
+        """Prepare the chat messages in the layout expected by the backend.
+
+        The prompt of each language and layout is compiled once: its instructions and questions form
+        a static prefix shared by all the articles, and the article comes last.
 
         Args:
-            openai_content (str): OpenAI/AWS Bedrock response content.
+            language (str): Language code ('en' or 'fr', or any language with the multilingual prompt).
+            url_content (str): Context from the URL.
+            prompt_style (str, optional): 'system' or 'user'. Defaults to the prompt layout of the backend.
 
         Returns:
-            pd.DataFrame: Dataframe with transformed OpenAI/AWS Bedrock content.
+            list: Chat messages.
         """
         try:
-            if self.model in ["gpt-3.5-turbo", "gpt-3.5-turbo-1106"]:
-                # Replace newline characters and leading/trailing spaces
-                openai_content = ''.join(char for char in openai_content if char.isprintable())
-            else:
-                # Process OpenAI response for other models
-                pattern = re.compile(r'Answers(\d+): (.+)')
-                matches = pattern.findall(openai_content)
-                data_dict = {f'Answers{index}': value for index, value in matches}
-                openai_content = json.dumps(data_dict, indent=4)
-                openai_content = re.sub("Answers", "Question", openai_content)
-                openai_content = openai_content.replace('[', '').replace(']', '').replace('\n ', '')
-                openai_content = ''.join(char for char in openai_content if char.isprintable())
-
-            openai_content_dict = json.loads(openai_content)
-            openai_content_df = pd.DataFrame([openai_content_dict])
+            template = get_prompt_template(self.prompt_language(language), prompt_style or self.backend.prompt_style, self.ask_country)
+        except ValueError as e:
+            logging.error(f"The provided language is not supported: {e}")
+            raise
 
-            # Define column names
-            column_names = ["is_happened", "flood_cause_en", "date", "location", "death", "evacuation", "country"]
+        return template.render(url_content)
 
-            # Check and append columns
-            openai_content_df = self.check_and_append_columns(openai_content_df, ncol=len(column_names))
-            openai_content_df.columns = column_names
-        
-            return openai_content_df
+    def make_llm_call(self, messages, model=None, tool=None, max_tokens=None):
+        """Make a call to the configured backend (AWS Bedrock, OpenAI or an OpenAI-compatible server).
 
-        except Exception as e:
-            # Handle any unexpected errors and print a helpful message
-            logger.error(f"An error occurred during transformation: {str(e)}")
+        Args:
+            messages (list): Chat messages.
+            model (str, optional): NLP Model Name or Id. Defaults to the first model of the cascade.
+            tool (dict, optional): Tool the model must call with its answers (see structured_output.py). Defaults to None.
+            max_tokens (int, optional): Maximum tokens of the response. Defaults to the maximum tokens of the extractor.
 
-            # Provide a default structure in case of an error
-            json_string = {'is_happened': openai_content}
-            openai_content_df = pd.DataFrame(json_string)
+        Returns:
+            LLMResponse: Model response with the generated text and token usage.
+        """
+        try:
+            return self.backend.complete(messages, model or self.model, self.temp, max_tokens or self.max_tokens, tool=tool)
 
-            # Define column names
-            column_names = ["is_happened", "flood_cause_en", "date", "location", "death", "evacuation", "country"]
+        except Exception as e:
+            # Handle any unexpected errors during the API call
+            logger.error(f"An error occurred during the {self.solution} call: {str(e)}")
+            raise
 
-            # Check and append columns for default structure
-            openai_content_df = self.check_and_append_columns(openai_content_df, ncol=len(column_names))
-            openai_content_df.columns = column_names
+    async def amake_llm_call(self, messages, model=None, tool=None, max_tokens=None):
+        """Asynchronous version of make_llm_call."""
+        try:
+            return await self.backend.acomplete(messages, model or self.model, self.temp, max_tokens or self.max_tokens,
+                                                tool=tool)
 
-            return openai_content_df
+        except Exception as e:
+            # Handle any unexpected errors during the API call
+            logger.error(f"An error occurred during the {self.solution} call: {str(e)}")
+            raise
 
-    def transform_bedrock_response_to_df(self, content):
-        """Transforms AS Bedrock response into a dataframe.
+    def transform_response_to_df(self, content):
+        """Transforms the model response into a dataframe.
 
         Args:
-            content (str): AWS Bedrock response content.
+            content (str): Model response content.
 
         Returns:
-            pd.DataFrame: Dataframe with transformed AWS Bedrock content.
+            pd.DataFrame: Dataframe with transformed model content.
         """
         try:
+            # Remove newline characters and other non-printable characters
+            content = ''.join(char for char in content if char.isprintable())
+
             is_balanced, unmatched = check_brackets_balance(content)
 
             if not is_balanced:
@@ -734,7 +1204,7 @@ class ContentExtractor:
 
             # Provide a default structure in case of an error
             json_string = {'is_happened': content}
-            content_df = pd.DataFrame(json_string)
+            content_df = pd.DataFrame([json_string])
 
             # Define column names
             column_names = ["is_happened", "flood_cause_en", "date", "location", "death", "evacuation", "country"]
@@ -745,65 +1215,75 @@ class ContentExtractor:
 
             return content_df
 
-    def extract_events_chatopenai(self, df, num_processes=None, out_fn=None): #, model="gpt-3.5-turbo", temp=0.8, max_tokens=150, out_fn=None):
+    def extract_events_chatopenai(self, df, max_concurrency=None, timeout=DEFAULT_TIMEOUT, out_fn=None, save=True, control=None):
         """Extracts information for multiple events using OpenAI or AWS Bedrock API.
 
+        The calls are network-bound, so they are dispatched concurrently from this process with asyncio,
+        over the connection pool of the backend. The articles are dispatched in the order of the dataframe,
+        and every event is written to the output file as soon as it's extracted; the file is rewritten in the
+        order of the dataframe at the end.
+
         Args:
             df (pd.DataFrame): Dataframe with content and URLs.
-            num_processes (int, optional): Number of processes for parallel extraction. Defaults to None.
+            max_concurrency (int, optional): Maximum number of calls in flight. Defaults to the concurrency of the backend.
+            timeout (float, optional): Maximum duration of the extraction of a single event in seconds. Defaults to 300.
             out_fn (str, optional): Output file name to save the results. Defaults to None.
+            save (bool, optional): Whether to save the results to a CSV file. Defaults to True.
+            control (RunControl, optional): Time budget and stop requests of the run. Defaults to None.
 
         Returns:
-            pd.DataFrame: Dataframe with extracted information for multiple events.
+            pd.DataFrame: Dataframe with extracted information for multiple events. If the run is stopped,
+                only the events whose extraction was completed.
         """
+        # Set the default number of concurrent calls if not provided
+        if max_concurrency is None:
+            max_concurrency = self.backend.max_concurrency
+
+        # The first events can be used before the end of the run
+        writer = ResultWriter(self.output_path(out_fn, prefix="nlp_results")) if save else None
+        # The counts of the statistics database follow the rows of the output file
+        stats = ResultStats(self.stats_store) if save and self.stats_store else None
+
+        # Results of the completed extractions, kept if the dispatch is interrupted
+        emitted = {}
+
+        def emit(index, result):
+            if isinstance(result, pd.DataFrame):
+                emitted[index] = result
+            if writer is not None and isinstance(result, pd.DataFrame):
+                try:
+                    writer.write(result)
+                except OSError as e:
+                    logger.error(f"An error occurred while writing the event: {str(e)}")
+            if stats is not None and isinstance(result, pd.DataFrame):
+                try:
+                    stats.add(result, model=self.model)
+                except sqlite3.Error as e:
+                    logger.error(f"An error occurred while counting the event: {str(e)}")
+
+        dispatcher = AsyncDispatcher(max_concurrency=max_concurrency, timeout=timeout, control=control)
         try:
-            # Set the default number of processes if not provided
-            if num_processes is None:
-                num_processes = multiprocessing.cpu_count() - 1
-
-            # Prepare arguments for parallel processing
-            model_args = [self.model] * df.shape[0]
-            temp_args = [self.temp] * df.shape[0]
-            tokens_args = [self.max_tokens] * df.shape[0]
-
-            # Use multiprocessing for parallel extraction
-            with multiprocessing.Pool(processes=num_processes) as pool:
-                results = pool.starmap(
-                    self.extract_single_event_chatopenai,
-                    zip(df['New_Content'], df['URL'], df['Language'], df['PublishedDate'])
-                )
-
-            # Combine results into a single DataFrame
-            results_df = pd.concat(results, axis=0)
-
+            results = asyncio.run(self.aextract_events(dispatcher, df, on_result=emit))
         except KeyboardInterrupt:
-            # Handle KeyboardInterrupt to terminate the pool gracefully
-            logger.error('Got ^C while pool mapping, terminating the pool')
-            pool.terminate()
-            logger.error('Pool is terminated')
-            logger.error('Joining pool processes')
-            pool.join()
-            logger.error('Join complete')
-
-        try:
-            # Save results to a CSV file if an output filename is provided
-            logging.info("Saving results ...")
-            if out_fn is not None and out_fn != "":
-                results_df.to_csv(out_fn, index=False, sep='|')
-            else:
-                if not os.path.exists(OUTPUT_FOLDER_PATH): 
-                    os.makedirs(OUTPUT_FOLDER_PATH)
-                
-                # Get the current date and time    
-                current_datetime = datetime.now().strftime('%Y-%m-%d_%H%M%S') 
-                out_fn = f"nlp_results_{current_datetime}.csv"
-                out_fn = os.path.join(OUTPUT_FOLDER_PATH, out_fn)
-                results_df.to_csv(out_fn, index=False, sep='|')
-            logging.info("Saved.")
-
-        except Exception as e:
-            # Handle exceptions during the saving process
-            logger.error(f"An error occurred while saving results: {str(e)}")
+            # The output file is rewritten with the completed extractions only, in the order of the dataframe
+            logger.error(f'Got ^C while dispatching the calls, only the {len(emitted)} completed extractions are kept')
+            results = [emitted[index] for index in sorted(emitted)]
+        finally:
+            if stats is not None:
+                stats.close()
+
+        # Timed out extractions give an exception instead of a DataFrame, and extractions that were not
+        # dispatched or completed before the run stopped give None
+        results = [r for r in results if isinstance(r, pd.DataFrame)]
+        if control is not None and control.stopped:
+            logging.warning(f"Information extracted from {len(results)} of {df.shape[0]} articles")
+
+        # Combine results into a single DataFrame, with categorical answers
+        results_df = apply_schema(pd.concat(results, axis=0), RESULT_SCHEMA) if results else pd.DataFrame()
+
+        # Save results to a CSV file
+        if save:
+            self.save_results(results_df, writer.out_fn, prefix="nlp_results")
 
         # Return the DataFrame with extracted information
         return results_df
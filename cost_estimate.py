@@ -0,0 +1,232 @@
+# cost_estimate.py
+
+import glob
+import math
+import logging
+import pandas as pd
+
+from llm_backends import message_text
+from pipeline import LLM_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Average number of characters per token of the English and French tokenizers of the supported models
+CHARS_PER_TOKEN = 4
+
+# Tokens added by the chat format around every message (role, separators)
+MESSAGE_TOKENS = 4
+
+# Previous run reports with the latency and the token usage of every call (compare mode results)
+RUN_REPORTS = "output/nlp_models_comparison_long*.csv"
+
+# Previous extracted content files, for the share of valid articles and their length in All mode
+EXTRACTED_REPORTS = "output/extracted_url_content*.csv"
+
+# Default prices in USD per 1000 input and output tokens. Prices change: set them in the [Pricing] section
+MODEL_PRICES = {
+    "mistral.mistral-7b-instruct-v0:2": (0.00015, 0.0002),
+    "mistral.mixtral-8x7b-instruct-v0:1": (0.00045, 0.0007),
+    "mistral.mistral-large-2402-v1:0": (0.004, 0.012),
+    "meta.llama3-8b-instruct-v1:0": (0.0003, 0.0006),
+    "meta.llama3-70b-instruct-v1:0": (0.00265, 0.0035),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+}
+
+def estimate_tokens(text):
+    """Approximates the number of tokens of a text, without the tokenizer of the model.
+
+    Args:
+        text (str): Text.
+
+    Returns:
+        int: Approximate number of tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def prompt_tokens(messages):
+    """Approximates the number of input tokens of chat messages.
+
+    Args:
+        messages (list): Chat messages, as built by ContentExtractor.prepare_prompt.
+
+    Returns:
+        int: Approximate number of input tokens.
+    """
+    return sum(MESSAGE_TOKENS + estimate_tokens(message_text(m["content"])) for m in messages)
+
+def parse_prices(items):
+    """Parses the prices of the [Pricing] section of the config file.
+
+    Args:
+        items (list): (model, 'input price, output price') tuples, in USD per 1000 tokens.
+
+    Returns:
+        dict: (input price, output price) by model, including the default prices.
+    """
+    prices = dict(MODEL_PRICES)
+    for model, value in items:
+        try:
+            input_price, output_price = (float(price) for price in value.split(','))
+        except ValueError:
+            raise ValueError(f"Invalid price '{value}' for the model '{model}'. Use: <input price>, <output price> per 1000 tokens.")
+        prices[model] = (input_price, output_price)
+    return prices
+
+def read_reports(pattern, columns):
+    """Reads the previous run reports that have the given columns.
+
+    Args:
+        pattern (str): Glob pattern of the report files.
+        columns (list): Required columns.
+
+    Returns:
+        pd.DataFrame: Rows of all the matching reports, or an empty dataframe.
+    """
+    reports = []
+    for fn in sorted(glob.glob(pattern)):
+        try:
+            df = pd.read_csv(fn, sep='|')
+        except (pd.errors.ParserError, UnicodeDecodeError, pd.errors.EmptyDataError) as e:
+            logger.warning(f"Skipping the report {fn}: {str(e)}")
+            continue
+        if set(columns).issubset(df.columns):
+            reports.append(df[columns])
+
+    return pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=columns)
+
+def model_statistics(reports_df):
+    """Measures the average latency and output tokens of every model in previous run reports.
+
+    Args:
+        reports_df (pd.DataFrame): Rows of the compare mode results, with 'model', 'status', 'latency'
+            and 'output_tokens' columns.
+
+    Returns:
+        pd.DataFrame: Average 'latency' and 'output_tokens', and number of measured 'calls', indexed by model.
+    """
+    ok_df = reports_df[reports_df["status"] == "ok"] if "status" in reports_df.columns else reports_df
+    grouped = ok_df.groupby("model")
+    return pd.DataFrame({
+        "latency": grouped["latency"].mean(),
+        "output_tokens": grouped["output_tokens"].mean(),
+        "calls": grouped.size(),
+    })
+
+def article_sample(extracted_df):
+    """Returns the valid articles of previous extracted content files, and their share of the URLs.
+
+    In All mode, the content of the input URLs is not extracted yet, so the prompts are estimated from the
+    articles of previous runs.
+
+    Args:
+        extracted_df (pd.DataFrame): Rows of previous extracted content files.
+
+    Returns:
+        tuple: Dataframe of the valid articles, and share of valid articles (None without previous files).
+    """
+    if extracted_df.empty:
+        return extracted_df, None
+    valid_df = extracted_df[extracted_df["Is_Article"] == 1]
+    return valid_df, valid_df.shape[0] / extracted_df.shape[0]
+
+def estimate_run(extractor, articles_df, model_specs, backends, num_calls=None, stats=None, prices=None,
+                 max_concurrency=None):
+    """Estimates the calls, tokens, cost and wall time of every model, without calling the models.
+
+    The input tokens are counted on the prompts that the run would send, built with the prompt layout of each
+    backend. The output tokens and the latency of a model are the averages measured in previous run reports,
+    or max_tokens and a typical latency for a model that was never measured. The wall time is bounded by the
+    concurrency and the rate limit of the backend.
+
+    Args:
+        extractor (ContentExtractor): Content extractor, for the prompts and the maximum tokens.
+        articles_df (pd.DataFrame): Valid articles, with 'New_Content' and 'Language' columns.
+        model_specs (list): (solution, model) tuples.
+        backends (dict): Backends by solution.
+        num_calls (int, optional): Number of calls per model. Defaults to the number of articles in a supported
+            language; in All mode,
+            the articles are a sample of previous runs and the number of calls is estimated separately.
+        stats (pd.DataFrame, optional): Measured averages by model (see model_statistics). Defaults to None.
+        prices (dict, optional): (input price, output price) per 1000 tokens by model. Defaults to MODEL_PRICES.
+        max_concurrency (int, optional): Maximum number of calls in flight per model. Defaults to the concurrency
+            of the backend shared by its models.
+
+    Returns:
+        pd.DataFrame: One row per model with the estimated calls, input and output tokens, cost in USD
+            (NaN without price) and wall time in seconds, and a last 'Total' row.
+    """
+    stats = stats if stats is not None else pd.DataFrame(columns=["latency", "output_tokens", "calls"])
+    prices = prices if prices is not None else MODEL_PRICES
+
+    # The prompts are counted on the content as the models would see it
+    articles_df = extractor.compact_content(articles_df)
+
+    # Input tokens of an average prompt, per prompt layout: the prompts are the same for all the models of a layout
+    tokens_per_call = {}
+    for prompt_style in {backends[solution].prompt_style for solution, _ in model_specs}:
+        counts = []
+        for content, language in zip(articles_df["New_Content"], articles_df["Language"]):
+            try:
+                counts.append(prompt_tokens(extractor.prepare_prompt(language, content, prompt_style=prompt_style)))
+            except ValueError:
+                # Articles in an unsupported language are not sent to the models either
+                continue
+        tokens_per_call[prompt_style] = sum(counts) / len(counts) if counts else 0
+
+    if num_calls is None:
+        num_calls = len(counts) if model_specs else 0
+
+    models_per_solution = pd.Series([solution for solution, _ in model_specs]).value_counts()
+
+    rows = []
+    for solution, model in model_specs:
+        backend = backends[solution]
+        measured = model in stats.index
+
+        input_tokens = round(num_calls * tokens_per_call[backend.prompt_style])
+        output_tokens = round(num_calls * (stats.loc[model, "output_tokens"] if measured else extractor.max_tokens))
+
+        # The models of a backend share its connection pool and its rate limit
+        concurrency = max_concurrency or max(1, backend.max_concurrency // models_per_solution[solution])
+        latency = stats.loc[model, "latency"] if measured else LLM_CALL_SECONDS
+        # Recorded or cached responses have no latency: they say nothing about the duration of a call
+        if not latency > 0:
+            latency = LLM_CALL_SECONDS
+        calls_per_second = concurrency / latency
+        if backend.requests_per_minute:
+            calls_per_second = min(calls_per_second, backend.requests_per_minute / 60 / models_per_solution[solution])
+
+        input_price, output_price = prices.get(model, (float("nan"), float("nan")))
+        rows.append({
+            "solution": solution,
+            "model": model,
+            "calls": num_calls,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": round((input_tokens * input_price + output_tokens * output_price) / 1000, 4),
+            "wall_time_s": round(num_calls / calls_per_second, 1),
+            "measured": measured,
+        })
+
+    estimate_df = pd.DataFrame(rows)
+    if estimate_df.empty:
+        return estimate_df
+
+    # The backends run at the same time, and the models of a backend share its capacity
+    total = estimate_df[["calls", "input_tokens", "output_tokens"]].sum()
+    # The total cost is unknown if the price of a model is unknown
+    total["cost_usd"] = estimate_df["cost_usd"].sum(skipna=False)
+    total["wall_time_s"] = estimate_df.groupby("solution")["wall_time_s"].sum().max()
+    total_row = {"solution": "", "model": "Total", "measured": estimate_df["measured"].all(), **total.to_dict()}
+
+    estimate_df = pd.concat([estimate_df, pd.DataFrame([total_row])], ignore_index=True)
+    return estimate_df.astype({"calls": int, "input_tokens": int, "output_tokens": int})
+
+def format_duration(seconds):
+    """Formats a number of seconds as hours, minutes and seconds, e.g. '2h 05m 10s'."""
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
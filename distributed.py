@@ -0,0 +1,186 @@
+# distributed.py
+
+import os
+import socket
+import time
+import threading
+import logging
+import pandas as pd
+
+from work_queue import open_queue, VISIBILITY_TIMEOUT
+from schema import to_records
+
+logger = logging.getLogger(__name__)
+
+# Default number of input rows per task
+BATCH_SIZE = 50
+
+# Seconds between two checks of the queue when no task is available
+POLL_INTERVAL = 5
+
+def enqueue_data(queue_uri, df, source, batch_size=BATCH_SIZE):
+    """Coordinator: shards the input data into tasks of the work queue.
+
+    Args:
+        queue_uri (str): Work queue URI.
+        df (pd.DataFrame): Input data, as returned by ContentExtractor.read_data.
+        source (str): Name of the input, used in the task keys so that enqueuing the same input twice is a no-op.
+        batch_size (int, optional): Number of rows per task. Defaults to 50.
+
+    Returns:
+        int: Number of added tasks.
+    """
+    queue = open_queue(queue_uri)
+    tasks = (
+        (f"{source}:{start}", to_records(df.iloc[start:start + batch_size]))
+        for start in range(0, df.shape[0], batch_size)
+    )
+    added = queue.put_tasks(tasks)
+    logger.info(f"{added} tasks of {batch_size} rows added to the queue {queue_uri}: {queue.counts()}")
+    queue.close()
+
+    return added
+
+def process_task(extractor, records, mode, num_processes=None, request_timeout=None, control=None):
+    """Runs the fetch and/or NLP stages on the rows of a task.
+
+    Args:
+        extractor (ContentExtractor): Content extractor.
+        records (list): Rows of the task.
+        mode (str): 'extractor', 'nlp' or 'all'.
+        num_processes (int, optional): Number of processes for parallel content extraction. Defaults to None.
+        request_timeout (float, optional): Maximum duration of the extraction of a single event. Defaults to None.
+        control (RunControl, optional): Time budget and stop requests of the worker. Defaults to None.
+
+    Returns:
+        list: Result rows.
+    """
+    df = pd.DataFrame.from_records(records)
+
+    if mode in {'extractor', 'all'}:
+        df = extractor.extract_content(df, num_processes=num_processes, save=False, control=control)
+
+    if mode in {'nlp', 'all'}:
+        df = extractor.filter_scraped_data(df)
+        if df.empty:
+            return []
+        df = extractor.extract_events_chatopenai(df, timeout=request_timeout, save=False, control=control)
+
+    # NaN and timestamps aren't valid JSON
+    return to_records(df)
+
+def run_worker(extractor, queue_uri, mode, num_processes=None, request_timeout=None,
+               visibility_timeout=VISIBILITY_TIMEOUT, wait=False, worker_id=None, control=None):
+    """Worker: leases tasks from the work queue, processes them and stores their results.
+
+    Any number of workers can run on any number of machines. The lease of the current task is extended
+    while it is processed, so that only the tasks of crashed workers are leased again.
+
+    Args:
+        extractor (ContentExtractor): Content extractor.
+        queue_uri (str): Work queue URI.
+        mode (str): 'extractor', 'nlp' or 'all'.
+        num_processes (int, optional): Number of processes for parallel content extraction. Defaults to None.
+        request_timeout (float, optional): Maximum duration of the extraction of a single event. Defaults to None.
+        visibility_timeout (float, optional): Seconds before a task is leased again if its worker stops. Defaults to 900.
+        wait (bool, optional): Whether to wait for new tasks when the queue is finished. Defaults to False.
+        worker_id (str, optional): Identifier of the worker. Defaults to the host name and the process id.
+        control (RunControl, optional): Time budget and stop requests of the worker. When the worker is stopping,
+            it doesn't lease new tasks, and the task it stopped processing is given back to the queue.
+
+    Returns:
+        int: Number of processed tasks.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = open_queue(queue_uri)
+    processed = 0
+
+    while control is None or not control.should_stop():
+        task = queue.lease(worker_id, visibility_timeout)
+
+        if task is None:
+            if queue.is_finished() and not wait:
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        task_id, records = task
+        logger.info(f"Worker {worker_id} leased task {task_id} ({len(records)} rows)")
+
+        heartbeat = LeaseHeartbeat(queue_uri, task_id, worker_id, visibility_timeout)
+        heartbeat.start()
+        try:
+            result = process_task(extractor, records, mode, num_processes=num_processes, request_timeout=request_timeout,
+                                  control=control)
+        except Exception as e:
+            logger.error(f"An error occurred while processing task {task_id}: {str(e)}")
+            queue.fail(task_id, worker_id, e)
+            continue
+        finally:
+            heartbeat.stop()
+
+        if control is not None and control.stopped:
+            # The partial result is dropped: another worker processes the whole task
+            logger.warning(f"Worker {worker_id} stopped while processing task {task_id}, the task is given back to the queue")
+            queue.release(task_id, worker_id)
+            break
+
+        if not queue.complete(task_id, worker_id, result):
+            logger.warning(f"Task {task_id} was already completed by another worker")
+        processed += 1
+
+    logger.info(f"Worker {worker_id} processed {processed} tasks: {queue.counts()}")
+    queue.close()
+
+    return processed
+
+def collect_results(extractor, queue_uri, out_fn=None, prefix="nlp_results"):
+    """Coordinator: combines the results of the completed tasks and saves them.
+
+    Args:
+        extractor (ContentExtractor): Content extractor.
+        queue_uri (str): Work queue URI.
+        out_fn (str, optional): Output file name. Defaults to None.
+        prefix (str, optional): Prefix of the file name with a timestamp. Defaults to "nlp_results".
+
+    Returns:
+        pd.DataFrame: Combined results.
+    """
+    queue = open_queue(queue_uri)
+    counts = queue.counts()
+
+    if not queue.is_finished():
+        logger.warning(f"The queue isn't finished, the results are partial: {counts}")
+    if counts["failed"]:
+        logger.warning(f"{counts['failed']} tasks failed after the maximum number of attempts")
+
+    results_df = pd.DataFrame.from_records([row for rows in queue.results() for row in rows])
+    queue.close()
+
+    extractor.save_results(results_df, out_fn, prefix=prefix)
+
+    return results_df
+
+class LeaseHeartbeat(threading.Thread):
+    """Extends the lease of a task in the background while it is processed."""
+
+    def __init__(self, queue_uri, task_id, worker_id, visibility_timeout):
+        super().__init__(daemon=True)
+        self.queue_uri = queue_uri
+        self.task_id = task_id
+        self.worker_id = worker_id
+        self.visibility_timeout = visibility_timeout
+        self.stopped = threading.Event()
+
+    def run(self):
+        # The thread uses its own connection to the queue
+        queue = open_queue(self.queue_uri)
+        while not self.stopped.wait(self.visibility_timeout / 3):
+            if not queue.extend_lease(self.task_id, self.worker_id, self.visibility_timeout):
+                logger.warning(f"Worker {self.worker_id} lost the lease of task {self.task_id}")
+                break
+        queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,497 @@
+# evaluation.py
+
+import re
+import copy
+import glob
+import json
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+import contextvars
+import configparser
+import unicodedata
+from datetime import datetime
+import pandas as pd
+
+from content_extractor import ContentExtractor, ANSWER_COLUMNS
+from llm_backends import make_backend, recording_key, parse_bool
+from llm_dispatcher import AsyncDispatcher, DEFAULT_TIMEOUT
+from model_comparison import parse_model_specs
+from cost_estimate import parse_prices
+from utils import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Default labelled set: historical flood events, with the links of the articles that report them
+HFE_SAMPLE = "data/hfe_sample_for_npl.csv"
+
+# Link columns of the historical flood events, and the language of their articles
+HFE_LINK_COLUMNS = {"link_1_en": "en", "link_2_en": "en", "link_1_fr": "fr", "link_2_fr": "fr"}
+
+# All the historical flood events are in Canada
+HFE_COUNTRY = "Canada"
+
+# Extracted content files where the content of the labelled articles is looked up
+EXTRACTED_CONTENT = "output/extracted_url_content*.csv"
+
+# Content of the labelled articles fetched by the evaluation, reused by the next evaluations
+EVALUATION_CONTENT = "output/evaluation_content.csv"
+
+# Answers compared after normalisation (yes, no or unknown)
+FLAG_FIELDS = ["is_happened", "death", "evacuation"]
+
+# Answers listing places: one of the labelled places must be in the answer
+PLACE_FIELDS = ["location", "country"]
+
+# Words of at least 4 letters, compared on their first 4 letters ('rains' and 'rainfall' match 'rain')
+STEM_LENGTH = 4
+
+# Default minimal mean accuracy of the recommended setting
+MIN_ACCURACY = 0.8
+
+# Calls of the article being evaluated, collected by the metered backend
+CURRENT_CALLS = contextvars.ContextVar("current_calls", default=None)
+
+def fold(text):
+    """Lowercases a text and removes its accents, for comparisons."""
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+
+def hfe_labels(hfe_df):
+    """Builds the labels of the articles of the historical flood events.
+
+    An article that reports several localities of the same event is labelled once, with all its localities.
+
+    Args:
+        hfe_df (pd.DataFrame): Historical flood events (see data/hfe_sample_for_npl.csv).
+
+    Returns:
+        pd.DataFrame: One row per article: 'link', 'Language', 'PublishedDate' (start date of the event) and the
+            expected answers.
+    """
+    rows = []
+    for col, language in HFE_LINK_COLUMNS.items():
+        if col not in hfe_df.columns:
+            continue
+        for _, event in hfe_df[hfe_df[col].notna()].iterrows():
+            rows.append({
+                "link": event[col],
+                "Language": language,
+                "PublishedDate": event["start_date"],
+                "is_happened": "Yes",
+                "flood_cause_en": event.get("flood_cause"),
+                "date": str(event["start_date"])[:7],
+                "location": event.get("locality"),
+                "death": event.get("death"),
+                "evacuation": event.get("evacuation"),
+                "country": HFE_COUNTRY,
+            })
+
+    labels_df = pd.DataFrame(rows, columns=["link", "Language", "PublishedDate"] + ANSWER_COLUMNS)
+    keys = labels_df["link"].map(canonical_url)
+    locations = labels_df.groupby(keys, sort=False)["location"].agg(lambda s: ", ".join(s.dropna().astype(str).unique()))
+    labels_df["location"] = keys.map(locations)
+    labels_df = labels_df[~keys.duplicated()].copy()
+    labels_df["label_source"] = "hfe"
+    return labels_df.reset_index(drop=True)
+
+def reference_labels(results_df, source):
+    """Uses the results of a previous run, e.g. of the most capable model, as labels.
+
+    Args:
+        results_df (pd.DataFrame): NLP results, with 'link', 'published_date' and the answer columns.
+        source (str): Name of the labels, e.g. the results file.
+
+    Returns:
+        pd.DataFrame: One row per article, with 'link', 'PublishedDate' and the expected answers. The language
+            comes from the extracted content.
+    """
+    labels_df = results_df.drop_duplicates("link")[["link"] + ANSWER_COLUMNS].copy()
+    labels_df["PublishedDate"] = results_df.drop_duplicates("link").get("published_date")
+    labels_df["label_source"] = source
+    return labels_df.reset_index(drop=True)
+
+def attach_content(labels_df, content_df):
+    """Adds the extracted content of the labelled articles.
+
+    Args:
+        labels_df (pd.DataFrame): Labels (see hfe_labels and reference_labels).
+        content_df (pd.DataFrame): Extracted content, with 'URL', 'New_Content', 'Language' and 'Is_Article' columns.
+
+    Returns:
+        tuple: Labelled articles with their 'New_Content' and 'Language', and the labels without valid content.
+    """
+    content_df = content_df[content_df["Is_Article"] == 1].copy()
+    content_df["key"] = content_df["URL"].map(canonical_url)
+    content_df = content_df.drop_duplicates("key").set_index("key")
+
+    keys = labels_df["link"].map(canonical_url)
+    found = keys.isin(content_df.index)
+
+    articles_df = labels_df[found].copy()
+    articles_df["New_Content"] = keys[found].map(content_df["New_Content"]).values
+    language = keys[found].map(content_df["Language"]).values
+    if "Language" in articles_df.columns:
+        articles_df["Language"] = articles_df["Language"].fillna(pd.Series(language, index=articles_df.index))
+    else:
+        articles_df["Language"] = language
+
+    return articles_df.reset_index(drop=True), labels_df[~found].reset_index(drop=True)
+
+def fetch_content(labels_df, out_fn=EVALUATION_CONTENT):
+    """Extracts the content of labelled articles, and adds it to the evaluation content file.
+
+    Args:
+        labels_df (pd.DataFrame): Labels of the articles without content.
+        out_fn (str, optional): Evaluation content file. Defaults to 'output/evaluation_content.csv'.
+
+    Returns:
+        pd.DataFrame: Extracted content.
+    """
+    df = labels_df.rename(columns={"link": "URL"})[["URL", "PublishedDate"]].copy()
+    df["Language"] = labels_df["Language"].fillna("en").values if "Language" in labels_df.columns else "en"
+
+    extracted_df = ContentExtractor(solution="").extract_content(df, save=False)
+    try:
+        extracted_df = pd.concat([pd.read_csv(out_fn, sep='|'), extracted_df], ignore_index=True)
+    except FileNotFoundError:
+        pass
+    extracted_df.drop_duplicates("URL", keep="last").to_csv(out_fn, index=False, sep='|')
+    return extracted_df
+
+def settings_grid(model_specs, temps, max_tokens_values, structured_values=(False,), text_profiles=("default",)):
+    """Returns every combination of the models and the settings to evaluate.
+
+    Args:
+        model_specs (list): (solution, model) tuples.
+        temps (list): Temperatures.
+        max_tokens_values (list): Maximum tokens of the responses.
+        structured_values (list, optional): Structured output settings. Defaults to unstructured output only.
+        text_profiles (list, optional): Text profiles of the content. Defaults to the default profile only.
+
+    Returns:
+        list: Settings, as dictionaries.
+    """
+    return [
+        {"solution": solution, "model": model, "temp": temp, "max_tokens": max_tokens,
+         "structured_output": structured, "text_profile": profile}
+        for (solution, model), temp, max_tokens, structured, profile
+        in itertools.product(model_specs, temps, max_tokens_values, structured_values, text_profiles)
+    ]
+
+def setting_name(setting):
+    """Returns a short name of a setting, e.g. 'bedrock:mistral.mistral-7b-instruct-v0:2 temp=0.2 max_tokens=256'."""
+    name = f"{setting['solution']}:{setting['model']} temp={setting['temp']} max_tokens={setting['max_tokens']}"
+    if setting.get("structured_output"):
+        name += " structured"
+    if setting.get("text_profile", "default") != "default":
+        name += f" {setting['text_profile']}"
+    return name
+
+class MeteredBackend:
+    """Wraps a backend to collect the calls of every evaluated article, and optionally record their responses.
+
+    The recorded responses can be replayed with the 'recorded' backend (see llm_backends.RecordedBackend).
+    """
+
+    def __init__(self, backend, record_path=None):
+        self.backend = backend
+        self.record_path = record_path
+        self.name = backend.name
+        self.prompt_style = backend.prompt_style
+        self.max_concurrency = backend.max_concurrency
+
+    async def acomplete(self, messages, model, temperature, max_tokens, tool=None):
+        response = await self.backend.acomplete(messages, model, temperature, max_tokens, tool)
+
+        calls = CURRENT_CALLS.get()
+        if calls is not None:
+            calls.append(response)
+
+        if self.record_path:
+            record = {"key": recording_key(messages, model, temperature, max_tokens, tool),
+                      "prompt_style": self.prompt_style, "response": response._asdict()}
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        return response
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+def score_field(field, predicted, label, normalise_answer):
+    """Scores the answer to a question against its label.
+
+    Args:
+        field (str): Answer column.
+        predicted (str): Answer of the model.
+        label (str): Expected answer.
+        normalise_answer (function): Normalisation of the answers (see ContentExtractor.normalise_answer).
+
+    Returns:
+        float: 1 if the answer is correct, 0 otherwise, or NaN if the label is unknown.
+    """
+    if pd.isna(label) or normalise_answer(label) == "unknown":
+        return float("nan")
+    predicted = "" if pd.isna(predicted) else str(predicted)
+
+    if field in FLAG_FIELDS:
+        return float(normalise_answer(predicted) == normalise_answer(label))
+
+    if field == "date":
+        month = re.search(r"\d{4}-\d{2}", predicted)
+        return float(month is not None and month.group(0) == str(label)[:7])
+
+    if field in PLACE_FIELDS:
+        places = [fold(place).strip() for place in re.split(r"[,;]", str(label)) if place.strip()]
+        return float(any(place in fold(predicted) for place in places))
+
+    # Free text: at least one word in common
+    def stems(text):
+        return {word[:STEM_LENGTH] for word in re.findall(r"[a-z]{%d,}" % STEM_LENGTH, fold(text))}
+    return float(bool(stems(label) & stems(predicted)))
+
+def evaluation_row(extractor, setting, label, outcome, prices):
+    """Builds the result row of a labelled article processed with a setting.
+
+    Returns:
+        dict: Setting, answers, 'correct_<field>' scores, status ('ok', 'parse_failed' or 'error'), latency,
+            token usage, number of calls and cost in USD.
+    """
+    row = {"setting": setting_name(setting), **setting, "link": label["link"], "label_source": label.get("label_source")}
+
+    if outcome is None or isinstance(outcome, Exception):
+        # Failed calls count as wrong answers
+        row.update({"status": "error", "error": str(outcome)})
+        for field in ANSWER_COLUMNS:
+            row[f"correct_{field}"] = score_field(field, "", label.get(field), extractor.normalise_answer)
+        return row
+
+    content_df, calls = outcome
+    answers = content_df.iloc[0] if not content_df.empty else pd.Series(dtype=object)
+    parsed = extractor.normalise_answer(answers.get("is_happened")) in {"yes", "no"}
+
+    for field in ANSWER_COLUMNS:
+        row[field] = answers.get(field)
+        row[f"correct_{field}"] = score_field(field, answers.get(field), label.get(field), extractor.normalise_answer)
+
+    input_tokens = sum(call.input_tokens or 0 for call in calls)
+    output_tokens = sum(call.output_tokens or 0 for call in calls)
+    input_price, output_price = prices.get(setting["model"], (float("nan"), float("nan")))
+    row.update({
+        "status": "ok" if parsed else "parse_failed",
+        "latency": round(sum(call.latency or 0 for call in calls), 3),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "calls": len(calls),
+        "cost_usd": (input_tokens * input_price + output_tokens * output_price) / 1000,
+    })
+    return row
+
+async def aevaluate_setting(extractor, df, model, max_concurrency, timeout):
+    async def run(content, url, language):
+        # The calls of this article, including the follow-up questions of the structured output
+        calls = []
+        CURRENT_CALLS.set(calls)
+        content_df = await extractor.aextract_single_event_with_model(content, url, language, model)
+        return content_df, calls
+
+    dispatcher = AsyncDispatcher(max_concurrency=max_concurrency, timeout=timeout)
+    try:
+        return await dispatcher.map(run, zip(df["New_Content"], df["link"], df["Language"]))
+    finally:
+        await extractor.backend.aclose()
+
+def evaluate(articles_df, settings, backends, prices=None, max_concurrency=None, timeout=DEFAULT_TIMEOUT, record_path=None):
+    """Runs the labelled articles through every setting.
+
+    The settings are evaluated one after the other, so that the latencies of a setting are not affected by the
+    others; the articles of a setting are dispatched concurrently.
+
+    Args:
+        articles_df (pd.DataFrame): Labelled articles with their content (see attach_content).
+        settings (list): Settings (see settings_grid).
+        backends (dict): Backends by solution.
+        prices (dict, optional): (input price, output price) per 1000 tokens by model. Defaults to the default prices.
+        max_concurrency (int, optional): Maximum number of calls in flight. Defaults to the concurrency of the backend.
+        timeout (float, optional): Maximum duration of an article in seconds. Defaults to 300.
+        record_path (str, optional): File where the responses are recorded, to replay them. Defaults to None.
+
+    Returns:
+        tuple: Results, with one row per article and setting (see evaluation_row), and the wall time of every
+            setting in seconds.
+    """
+    prices = prices if prices is not None else parse_prices([])
+    base_extractor = ContentExtractor(solution="")
+
+    rows, wall_times = [], {}
+    for setting in settings:
+        backend = MeteredBackend(backends[setting["solution"]], record_path)
+
+        # The extractor of the setting, for its prompts, its answer parsing and its structured output
+        extractor = copy.copy(base_extractor)
+        extractor.solution, extractor.backend = setting["solution"], backend
+        extractor.model, extractor.models = setting["model"], [setting["model"]]
+        extractor.temp, extractor.max_tokens = setting["temp"], setting["max_tokens"]
+        extractor.structured_output = setting.get("structured_output", False)
+        extractor.text_profile = setting.get("text_profile", "default")
+
+        df = extractor.compact_content(articles_df)
+        start = time.perf_counter()
+        outcomes = asyncio.run(aevaluate_setting(extractor, df, setting["model"],
+                                                 max_concurrency or backend.max_concurrency, timeout))
+        wall_times[setting_name(setting)] = time.perf_counter() - start
+        logger.info(f"{setting_name(setting)}: {len(outcomes)} articles in {wall_times[setting_name(setting)]:.1f} seconds")
+
+        for (_, label), outcome in zip(articles_df.iterrows(), outcomes):
+            rows.append(evaluation_row(extractor, setting, label, outcome, prices))
+
+    return pd.DataFrame(rows), wall_times
+
+def summarise_evaluation(results_df, wall_times=None, min_accuracy=MIN_ACCURACY):
+    """Summarises the evaluation per setting.
+
+    Args:
+        results_df (pd.DataFrame): Results of evaluate.
+        wall_times (dict, optional): Wall time of every setting in seconds. Defaults to None.
+        min_accuracy (float, optional): Accuracy bar of the settings. Defaults to 0.8.
+
+    Returns:
+        pd.DataFrame: Per setting: number of articles, error and parse failure rates, accuracy of every answer
+            and mean accuracy, latency percentiles of an article (with its follow-up questions), tokens per
+            article, cost per 1000 articles in USD, wall time, and whether the setting meets the accuracy bar.
+    """
+    if results_df.empty:
+        return pd.DataFrame()
+
+    grouped = results_df.groupby("setting", sort=False)
+    summary = pd.DataFrame({
+        "articles": grouped.size(),
+        "error_rate": grouped["status"].apply(lambda s: (s == "error").mean()),
+        "parse_failure_rate": grouped["status"].apply(lambda s: (s == "parse_failed").mean()),
+    })
+
+    accuracy_cols = []
+    for field in ANSWER_COLUMNS:
+        summary[f"accuracy_{field}"] = grouped[f"correct_{field}"].mean()
+        accuracy_cols.append(f"accuracy_{field}")
+    summary["accuracy"] = summary[accuracy_cols].mean(axis=1)
+
+    if "latency" in results_df.columns:
+        summary["latency_p50"] = grouped["latency"].quantile(0.5)
+        summary["latency_p95"] = grouped["latency"].quantile(0.95)
+        summary["tokens_per_article"] = grouped.apply(lambda df: (df["input_tokens"] + df["output_tokens"]).mean())
+        summary["cost_per_1k_articles"] = grouped["cost_usd"].mean() * 1000
+    if wall_times:
+        summary["wall_time_s"] = pd.Series(wall_times).round(1)
+
+    summary["meets_accuracy"] = summary["accuracy"] >= min_accuracy
+    return summary.round(3).reset_index()
+
+def recommend_setting(summary_df):
+    """Returns the fastest setting that meets the accuracy bar, the cheapest one between equally fast settings.
+
+    Args:
+        summary_df (pd.DataFrame): Summary of summarise_evaluation.
+
+    Returns:
+        pd.Series: Summary of the recommended setting, or None if no setting meets the accuracy bar.
+    """
+    if summary_df.empty or "latency_p50" not in summary_df.columns:
+        return None
+    candidates = summary_df[summary_df["meets_accuracy"]]
+    if candidates.empty:
+        return None
+    return candidates.sort_values(["latency_p50", "cost_per_1k_articles", "accuracy"],
+                                  ascending=[True, True, False]).iloc[0]
+
+def read_labels(labels_fns, reference_patterns):
+    """Reads the historical flood events and the reference results as a single labelled set."""
+    frames = []
+    for fn in labels_fns:
+        try:
+            frames.append(hfe_labels(pd.read_csv(fn, encoding='utf-8-sig')))
+        except UnicodeDecodeError:
+            # Older exports are encoded in cp1252 (Windows encoding)
+            frames.append(hfe_labels(pd.read_csv(fn, encoding='cp1252')))
+    for pattern in reference_patterns:
+        for fn in sorted(glob.glob(pattern)):
+            frames.append(reference_labels(pd.read_csv(fn, sep='|'), fn))
+
+    if not frames:
+        raise ValueError("No labelled articles: provide a labelled set or reference results.")
+    # The historical flood events come first, and are kept over the reference results of the same article
+    labels_df = pd.concat(frames, ignore_index=True)
+    return labels_df[~labels_df["link"].map(canonical_url).duplicated()].reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the accuracy, latency, tokens and cost of models and settings on labelled articles")
+    parser.add_argument("--labels", nargs="*", default=[HFE_SAMPLE], help=f"historical flood events files (default: {HFE_SAMPLE})")
+    parser.add_argument("--reference", nargs="*", default=[], help="NLP results used as labels (glob patterns allowed)")
+    parser.add_argument("--content", nargs="*", default=[EXTRACTED_CONTENT, EVALUATION_CONTENT],
+                        help="extracted content files of the labelled articles (glob patterns allowed)")
+    parser.add_argument("--fetch", action="store_true", help=f"extract the content of the labelled articles without content, into {EVALUATION_CONTENT}")
+    parser.add_argument("--models", nargs="+", required=True, help="models to evaluate, optionally prefixed by their solution (e.g. openai:gpt-4o-mini)")
+    parser.add_argument("--solution", default="bedrock", help="solution of the models without prefix (default: bedrock)")
+    parser.add_argument("--temps", nargs="+", type=float, default=[0.8], help="temperatures (default: 0.8)")
+    parser.add_argument("--max-tokens", nargs="+", type=int, default=[512], help="maximum tokens of the responses (default: 512)")
+    parser.add_argument("--structured", nargs="+", default=["false"], help="structured output settings, true and/or false (default: false)")
+    parser.add_argument("--profiles", nargs="+", default=["default"], help="text profiles, default and/or compact (default: default)")
+    parser.add_argument("--config", help="configuration file, for the backend options and the [Pricing] section")
+    parser.add_argument("--recordings", help="recorded responses replayed by the 'recorded' solution")
+    parser.add_argument("--record", help="file where the responses of the models are recorded")
+    parser.add_argument("--min-accuracy", type=float, default=MIN_ACCURACY, help=f"accuracy bar (default: {MIN_ACCURACY})")
+    parser.add_argument("--max-concurrency", type=int, help="maximum calls in flight (default: concurrency of the backend)")
+    parser.add_argument("--out", default="output/evaluation", help="prefix of the output files (default: output/evaluation)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = configparser.ConfigParser()
+    if args.config:
+        config.read(args.config)
+
+    labels_df = read_labels(args.labels, args.reference)
+    content_fns = [fn for pattern in args.content for fn in sorted(glob.glob(pattern))]
+    content_df = pd.concat([pd.read_csv(fn, sep='|') for fn in content_fns], ignore_index=True) if content_fns else \
+        pd.DataFrame(columns=["URL", "New_Content", "Language", "Is_Article"])
+    articles_df, missing_df = attach_content(labels_df, content_df)
+
+    if not missing_df.empty and args.fetch:
+        articles_df, missing_df = attach_content(labels_df, pd.concat([content_df, fetch_content(missing_df)], ignore_index=True))
+    if not missing_df.empty:
+        logger.warning(f"{missing_df.shape[0]} labelled articles have no valid extracted content and are not evaluated"
+                       + ("" if args.fetch else " (use --fetch to extract it)"))
+    if articles_df.empty:
+        raise SystemExit("No labelled article with content to evaluate.")
+
+    model_specs = parse_model_specs(args.models, args.solution)
+    backends = {}
+    for solution, _ in model_specs:
+        if solution not in backends:
+            options = dict(config.items(solution)) if config.has_section(solution) else {}
+            if solution == "recorded" and args.recordings:
+                options["path"] = args.recordings
+            backends[solution] = make_backend(solution, **options)
+
+    settings = settings_grid(model_specs, args.temps, args.max_tokens, [parse_bool(value) for value in args.structured],
+                             args.profiles)
+    prices = parse_prices(config.items('Pricing') if config.has_section('Pricing') else [])
+
+    logger.info(f"Evaluating {len(settings)} settings on {articles_df.shape[0]} labelled articles")
+    results_df, wall_times = evaluate(articles_df, settings, backends, prices, args.max_concurrency, record_path=args.record)
+    summary_df = summarise_evaluation(results_df, wall_times, args.min_accuracy)
+
+    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M')
+    results_df.to_csv(f"{args.out}_results_{timestamp}.csv", index=False, sep='|')
+    summary_df.to_csv(f"{args.out}_summary_{timestamp}.csv", index=False, sep='|')
+    logger.info(f"Evaluation summary:\n{summary_df.to_string(index=False)}")
+
+    best = recommend_setting(summary_df)
+    if best is None:
+        logger.warning(f"No setting reaches an accuracy of {args.min_accuracy}")
+    else:
+        logger.info(f"Fastest setting with an accuracy of at least {args.min_accuracy}: {best['setting']} "
+                    f"(accuracy {best['accuracy']:.2f}, latency p50 {best['latency_p50']:.2f} s, "
+                    f"{best['cost_per_1k_articles']:.4f} USD per 1000 articles)")
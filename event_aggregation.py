@@ -0,0 +1,388 @@
+# event_aggregation.py
+
+import re
+import os
+import json
+import sqlite3
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime
+import pandas as pd
+
+from gazetteer import name_words, ID_SEPARATOR
+from schema import format_timestamps
+
+logger = logging.getLogger(__name__)
+
+# Number of months before and after the month of an article in which its event is looked for
+MONTH_WINDOW = 1
+
+# Default event index database and events file
+EVENT_INDEX = "output/events.db"
+EVENTS_FILENAME = "output/flood_events.csv"
+
+# Number of keys per query to the index
+QUERY_BATCH_SIZE = 500
+
+# Date answers are 'YYYY-MM' or 'YYYY-MM-DD', sometimes after the format itself ('AAA-MM: 2023-07-14')
+MONTH_PATTERN = re.compile(r"((?:19|20)\d{2})-(0[1-9]|1[0-2])")
+
+# Named storms are the same event across places and countries ('Tropical Storm Debby')
+STORM_PATTERN = re.compile(r"\b(?i:tropical storm|storm|hurricane|typhoon|cyclone|tempête tropicale|tempête|ouragan|typhon)"
+                           r"\s+([A-Z][a-zà-ÿ]+)")
+
+# Separators of the places of a location answer, including the brackets of answers written as lists
+PLACE_SEPARATORS = re.compile(r"[,;()\[\]]")
+
+# Answers that name no place or no cause
+UNKNOWN_VALUES = {"", "unknown", "inconnu", "na", "n a", "none", "not specified", "non specifie"}
+
+def answer_flag(answer):
+    """Returns 'yes', 'no' or 'unknown' for a yes/no answer of the model."""
+    answer = str(answer).strip().strip('.!"\' ').lower()
+    if re.match(r"(yes|oui)\b", answer):
+        return "yes"
+    if re.match(r"(no|non)\b", answer):
+        return "no"
+    return "unknown"
+
+def parse_month(date, publish_date=None):
+    """Returns the month of an event as a number of months since year 0.
+
+    The month comes from the date answer, or from the publication date of the article if the answer has no
+    valid month.
+
+    Args:
+        date (str): Date answer of the model.
+        publish_date (str, optional): Publication date of the article. Defaults to None.
+
+    Returns:
+        int: 12 * year + month - 1, or None if neither date has a month.
+    """
+    for value in (date, publish_date):
+        match = MONTH_PATTERN.search(value) if isinstance(value, str) else None
+        if match:
+            return 12 * int(match.group(1)) + int(match.group(2)) - 1
+    return None
+
+def format_month(month):
+    """Formats a month number of parse_month as 'YYYY-MM'."""
+    return f"{month // 12}-{month % 12 + 1:02d}" if month is not None else ""
+
+def split_places(location):
+    """Splits a location answer into the names of its places.
+
+    Args:
+        location (str): Location answer of the model.
+
+    Returns:
+        list: Place names, without the unknown answers.
+    """
+    if not isinstance(location, str):
+        return []
+    places = [place.strip(" '\"") for place in PLACE_SEPARATORS.split(location)]
+    return [place for place in places if " ".join(name_words(place)) not in UNKNOWN_VALUES]
+
+def place_keys(row):
+    """Returns the keys of the places of an article row, without the country-wide answers.
+
+    With the gazetteer columns, the keys are the GeoNames Ids of the places. Otherwise, they are the folded
+    names of the places, in the country of the answer: 'Paris' in France and 'Paris' in the United States
+    are different places.
+
+    Args:
+        row (dict): Article row, with the 'location' and 'country' answers.
+
+    Returns:
+        list: (key, place name) tuples.
+    """
+    country = " ".join(name_words(str(row.get("country", ""))))
+    ids, names = row.get("location_ids"), row.get("location_names")
+    if isinstance(ids, str) and ids:
+        keys = []
+        for place_id, name in zip(ids.split(ID_SEPARATOR), names.split(ID_SEPARATOR)):
+            # 'United States, US': a country is not a place of the event
+            if " ".join(name_words(name.rsplit(",", 1)[0])) != country:
+                keys.append((f"geo:{place_id}", name))
+        return keys
+
+    keys = []
+    for name in split_places(row.get("location")):
+        folded = " ".join(name_words(name))
+        if folded and folded != country:
+            keys.append((f"{country}/{folded}", name))
+    return keys
+
+def storm_key(cause):
+    """Returns the key of the named storm of a flood cause, or None."""
+    match = STORM_PATTERN.search(cause) if isinstance(cause, str) else None
+    return f"storm:{match.group(1).lower()}" if match else None
+
+def flag_summary(counts):
+    """Returns 'Yes' if an article of the event answered yes, else 'No' if one answered no, else 'Unknown'."""
+    if counts.get("yes"):
+        return "Yes"
+    return "No" if counts.get("no") else "Unknown"
+
+class EventIndex:
+    """Persistent spatio-temporal index of the flood events reported by the articles.
+
+    The articles that report a flood are grouped into events: two articles report the same event if they
+    name the same place (or the same named storm) within MONTH_WINDOW months. The index maps every
+    (month, place) cell to its event, so a new article only looks up the cells of its own places and months,
+    and attaches to an existing event without clustering the history again. An article that links several
+    events merges them. The events, their cells and the merged fields are stored in a SQLite database.
+    """
+
+    def __init__(self, path, month_window=MONTH_WINDOW):
+        self.path = path
+        self.month_window = month_window
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS events (event_id INTEGER PRIMARY KEY, state TEXT, updated TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cells (cell TEXT, event_id INTEGER, PRIMARY KEY (cell, event_id)) WITHOUT ROWID")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cells_event ON cells (event_id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS articles (link TEXT PRIMARY KEY, event_id INTEGER) WITHOUT ROWID")
+
+    def _lookup(self, table, column, keys):
+        # Event Ids of the keys, in batches of QUERY_BATCH_SIZE keys
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), QUERY_BATCH_SIZE):
+            batch = keys[start:start + QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            for key, event_id in self.conn.execute(f"SELECT {column}, event_id FROM {table} WHERE {column} IN ({placeholders})", batch):
+                found.setdefault(key, set()).add(event_id)
+        return found
+
+    def _load_states(self, event_ids):
+        states = {}
+        event_ids = list(event_ids)
+        for start in range(0, len(event_ids), QUERY_BATCH_SIZE):
+            batch = event_ids[start:start + QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            for event_id, state in self.conn.execute(f"SELECT event_id, state FROM events WHERE event_id IN ({placeholders})", batch):
+                states[event_id] = json.loads(state)
+        return states
+
+    def cells(self, row):
+        """Returns the cells of an article row: the keys of its places and named storm, in the month of the event.
+
+        Args:
+            row (dict): Article row.
+
+        Returns:
+            tuple: Month of the event (None if unknown), and list of its cells.
+        """
+        month = parse_month(row.get("date"), row.get("published_date"))
+        if month is None:
+            return None, []
+        keys = [key for key, _ in place_keys(row)]
+        storm = storm_key(row.get("flood_cause_en"))
+        if storm:
+            keys.append(storm)
+        return month, [f"{month}|{key}" for key in keys]
+
+    def add(self, events_df):
+        """Adds the article rows that report a flood to the index, and attaches them to their events.
+
+        Rows with a link that is already in the index and rows without flood event are ignored.
+
+        Args:
+            events_df (pd.DataFrame): Article rows of the NLP modes, with the answers and the 'link' column.
+
+        Returns:
+            pd.DataFrame: The added rows, with the 'event_id' of their event.
+        """
+        if events_df.empty or "link" not in events_df.columns:
+            return pd.DataFrame(columns=list(events_df.columns) + ["event_id"])
+
+        flood_df = events_df[events_df["is_happened"].map(answer_flag) == "yes"]
+        flood_df = flood_df[flood_df["link"].notna()].drop_duplicates("link")
+        known = self._lookup("articles", "link", flood_df["link"])
+        flood_df = flood_df[~flood_df["link"].isin(known)]
+        # Publication dates are compared as text, in the format of the alert exports
+        rows = format_timestamps(flood_df).to_dict("records")
+
+        row_cells = [self.cells(row) for row in rows]
+
+        # Cells of the events are only looked up in the months around the month of every article
+        query_cells = set()
+        for month, cells in row_cells:
+            for cell in cells:
+                key = cell.split("|", 1)[1]
+                query_cells.update(f"{month + offset}|{key}" for offset in range(-self.month_window, self.month_window + 1))
+        cell_events = self._lookup("cells", "cell", query_cells)
+
+        states = {}
+        # Events merged into another one during this batch
+        merged_into = {}
+        new_cells = []
+        next_id = (self.conn.execute("SELECT MAX(event_id) FROM events").fetchone()[0] or 0) + 1
+
+        def resolve(event_id):
+            while event_id in merged_into:
+                event_id = merged_into[event_id]
+            return event_id
+
+        event_ids = []
+        for row, (month, cells) in zip(rows, row_cells):
+            candidates = set()
+            for cell in cells:
+                key = cell.split("|", 1)[1]
+                for offset in range(-self.month_window, self.month_window + 1):
+                    candidates.update(resolve(e) for e in cell_events.get(f"{month + offset}|{key}", ()))
+
+            if candidates:
+                # The oldest event keeps its Id, the others are merged into it
+                event_id = min(candidates)
+                missing = [e for e in candidates if e not in states]
+                states.update(self._load_states(missing))
+                for other in sorted(candidates - {event_id}):
+                    self._merge_state(states[event_id], states.pop(other))
+                    merged_into[other] = event_id
+            else:
+                event_id = next_id
+                next_id += 1
+                states[event_id] = self._new_state()
+
+            self._add_to_state(states[event_id], row, month)
+            for cell in cells:
+                cell_events.setdefault(cell, set()).add(event_id)
+                new_cells.append((cell, event_id))
+            event_ids.append(event_id)
+
+        event_ids = [resolve(e) for e in event_ids]
+        now = datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            for other, event_id in merged_into.items():
+                final_id = resolve(event_id)
+                self.conn.execute("INSERT OR IGNORE INTO cells SELECT cell, ? FROM cells WHERE event_id = ?", (final_id, other))
+                self.conn.execute("DELETE FROM cells WHERE event_id = ?", (other,))
+                self.conn.execute("UPDATE articles SET event_id = ? WHERE event_id = ?", (final_id, other))
+                self.conn.execute("DELETE FROM events WHERE event_id = ?", (other,))
+            self.conn.executemany("INSERT OR IGNORE INTO cells VALUES (?, ?)", ((c, resolve(e)) for c, e in new_cells))
+            self.conn.executemany("INSERT INTO articles VALUES (?, ?)", zip(flood_df["link"], event_ids))
+            self.conn.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?)",
+                                  ((event_id, json.dumps(state), now) for event_id, state in states.items()))
+
+        logger.info(f"{len(rows)} articles added to {len(set(event_ids))} events, {len(merged_into)} events merged")
+        flood_df = flood_df.copy()
+        flood_df["event_id"] = event_ids
+        return flood_df
+
+    def _new_state(self):
+        return {"first_month": None, "last_month": None, "causes": {}, "countries": {}, "places": {},
+                "death": {}, "evacuation": {}, "num_articles": 0, "first_published": None, "last_published": None}
+
+    def _add_to_state(self, state, row, month):
+        if month is not None:
+            state["first_month"] = month if state["first_month"] is None else min(state["first_month"], month)
+            state["last_month"] = month if state["last_month"] is None else max(state["last_month"], month)
+
+        cause = row.get("flood_cause_en")
+        if isinstance(cause, str) and " ".join(name_words(cause)) not in UNKNOWN_VALUES:
+            state["causes"][cause.strip()] = state["causes"].get(cause.strip(), 0) + 1
+        country = row.get("country")
+        if isinstance(country, str) and " ".join(name_words(country)) not in UNKNOWN_VALUES:
+            for name in country.split(","):
+                state["countries"][name.strip()] = state["countries"].get(name.strip(), 0) + 1
+        for _, name in place_keys(row):
+            state["places"][name] = state["places"].get(name, 0) + 1
+
+        for column in ("death", "evacuation"):
+            flag = answer_flag(row.get(column))
+            state[column][flag] = state[column].get(flag, 0) + 1
+
+        state["num_articles"] += 1
+        published = row.get("published_date")
+        if isinstance(published, str) and published:
+            state["first_published"] = min(filter(None, [state["first_published"], published]))
+            state["last_published"] = max(filter(None, [state["last_published"], published]))
+
+    def _merge_state(self, state, other):
+        for key, choose in (("first_month", min), ("last_month", max), ("first_published", min), ("last_published", max)):
+            values = [v for v in (state[key], other[key]) if v is not None]
+            state[key] = choose(values) if values else None
+        for key in ("causes", "countries", "places", "death", "evacuation"):
+            # The counts of the smaller event are added to the larger one, in place
+            counts, added = (state[key], other[key]) if len(state[key]) >= len(other[key]) else (other[key], state[key])
+            for value, count in added.items():
+                counts[value] = counts.get(value, 0) + count
+            state[key] = counts
+        state["num_articles"] += other["num_articles"]
+
+    def events(self):
+        """Returns the merged fields of every event.
+
+        The cause and the countries are the most frequent answers of the articles, the locations are all the
+        places named by the articles (the most frequent first), and the deaths and evacuations are 'Yes' if
+        an article reported them.
+
+        Returns:
+            pd.DataFrame: One row per event, with its number of articles and their links.
+        """
+        # The links are kept in the articles table, so that the state of a large event stays small
+        links = dict(self.conn.execute("SELECT event_id, GROUP_CONCAT(link, ' ') FROM articles GROUP BY event_id"))
+
+        rows = []
+        for event_id, state in self.conn.execute("SELECT event_id, state FROM events ORDER BY event_id"):
+            state = json.loads(state)
+            causes = Counter(state["causes"]).most_common(1)
+            rows.append({
+                "event_id": event_id,
+                "start_month": format_month(state["first_month"]),
+                "end_month": format_month(state["last_month"]),
+                "flood_cause_en": causes[0][0] if causes else "Unknown",
+                "location": "; ".join(name for name, _ in Counter(state["places"]).most_common()),
+                "country": ", ".join(name for name, _ in Counter(state["countries"]).most_common()) or "Unknown",
+                "death": flag_summary(state["death"]),
+                "evacuation": flag_summary(state["evacuation"]),
+                "num_articles": state["num_articles"],
+                "links": links.get(event_id, ""),
+                "first_published": state["first_published"],
+                "last_published": state["last_published"],
+            })
+        return pd.DataFrame(rows, columns=["event_id", "start_month", "end_month", "flood_cause_en", "location", "country",
+                                           "death", "evacuation", "num_articles", "links", "first_published", "last_published"])
+
+    def close(self):
+        self.conn.close()
+
+def aggregate_events(events_df, index_path, out_fn):
+    """Adds the article rows of a run to the event index, and saves the merged events.
+
+    Args:
+        events_df (pd.DataFrame): Article rows of the NLP modes.
+        index_path (str): Path of the event index database.
+        out_fn (str): File the events are saved to.
+
+    Returns:
+        pd.DataFrame: Merged events.
+    """
+    index = EventIndex(index_path)
+    try:
+        index.add(events_df)
+        merged_df = index.events()
+    finally:
+        index.close()
+
+    merged_df.to_csv(out_fn, sep='|', index=False, encoding='utf-8')
+    logger.info(f"{merged_df.shape[0]} flood events saved to {out_fn}")
+    return merged_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group the article rows of NLP results files into flood events")
+    parser.add_argument("results", nargs="+", help="NLP results files, in chronological order")
+    parser.add_argument("--index", default=EVENT_INDEX, help=f"event index database (default: {EVENT_INDEX})")
+    parser.add_argument("--out", default=EVENTS_FILENAME, help=f"events file (default: {EVENTS_FILENAME})")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    events_df = pd.concat([pd.read_csv(fn, sep='|') for fn in args.results], ignore_index=True)
+    aggregate_events(events_df, args.index, args.out)
@@ -0,0 +1,329 @@
+# gazetteer.py
+
+import os
+import re
+import csv
+import json
+import shutil
+import argparse
+import logging
+import unicodedata
+from collections import Counter
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Kinds of places, in the order they are preferred when a name is ambiguous ('Georgia', 'Quebec')
+COUNTRY, ADMIN1, CITY = 0, 1, 2
+
+# Maximum number of words of a place name, and so of a match
+MAX_NAME_WORDS = 8
+
+# Separator of the place Ids and names in the output columns
+ID_SEPARATOR = ";"
+
+# Names of the countries not given by GeoNames: French names and common abbreviations, by ISO code
+COUNTRY_ALIASES = {
+    "US": ["USA", "U.S.", "U.S.A.", "United States of America", "America", "États-Unis", "Etats-Unis"],
+    "GB": ["UK", "U.K.", "Britain", "Great Britain", "England", "Scotland", "Wales", "Royaume-Uni", "Angleterre", "Écosse"],
+    "DE": ["Allemagne"], "ES": ["Espagne"], "IT": ["Italie"], "IN": ["Inde"], "CN": ["Chine"], "JP": ["Japon"],
+    "MX": ["Mexique"], "BR": ["Brésil"], "BE": ["Belgique"], "CH": ["Suisse"], "AT": ["Autriche"], "PL": ["Pologne"],
+    "RO": ["Roumanie"], "SI": ["Slovénie"], "HR": ["Croatie"], "NL": ["Pays-Bas"], "IE": ["Irlande"], "GR": ["Grèce"],
+    "TR": ["Turquie"], "AU": ["Australie"], "NZ": ["Nouvelle-Zélande"], "ZA": ["Afrique du Sud"],
+    "KR": ["South Korea", "Corée du Sud"], "KP": ["North Korea", "Corée du Nord"], "ID": ["Indonésie"],
+    "HT": ["Haïti"], "MA": ["Maroc"], "DZ": ["Algérie"], "TN": ["Tunisie"], "EG": ["Égypte"], "NG": ["Nigéria"],
+    "ET": ["Éthiopie"], "SD": ["Soudan"], "SO": ["Somalie"], "LY": ["Libye"], "BD": ["Bangladesh"],
+    "RU": ["Russie"], "UA": ["Ukraine"], "VN": ["Viêt Nam", "Vietnam"], "MM": ["Birmanie"], "PE": ["Pérou"],
+}
+
+# Words of a place name: letters and digits, whatever the script
+WORD_PATTERN = re.compile(r"\w+")
+
+def fold(word):
+    """Lowercases a word and removes its accents, so that 'Montréal' and 'montreal' are the same word."""
+    word = word.lower()
+    if word.isascii():
+        return word
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+
+def name_words(name):
+    """Returns the folded words of a place name."""
+    return tuple(fold(word) for word in WORD_PATTERN.findall(name))
+
+def read_geonames(cities_fn, countries_fn, admin1_fn=None):
+    """Reads the places of GeoNames dumps (https://download.geonames.org/export/dump/).
+
+    Args:
+        cities_fn (str): Cities file, e.g. cities15000.txt.
+        countries_fn (str): countryInfo.txt.
+        admin1_fn (str, optional): admin1CodesASCII.txt, for the provinces and states. Defaults to None.
+
+    Returns:
+        tuple: Places as (place Id, names, country code, kind, population) tuples, and country names by ISO code.
+    """
+    places, countries = [], {}
+
+    with open(countries_fn, encoding="utf-8") as f:
+        for row in csv.reader((line for line in f if not line.startswith("#")), delimiter="\t", quoting=csv.QUOTE_NONE):
+            code, name, population, geonameid = row[0], row[4], int(row[7] or 0), int(row[16])
+            countries[code] = name
+            places.append((geonameid, [name] + COUNTRY_ALIASES.get(code, []), code, COUNTRY, population))
+
+    if admin1_fn is not None:
+        with open(admin1_fn, encoding="utf-8") as f:
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                code = row[0].split(".")[0]
+                if code in countries:
+                    places.append((int(row[3]), [row[1], row[2]], code, ADMIN1, 0))
+
+    with open(cities_fn, encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            # Alternate names include codes and names in other scripts: only the names in Latin script are kept
+            alternate_names = [n for n in row[3].split(",") if len(n) > 3 and not n.isupper() and fold(n).isascii()]
+            places.append((int(row[0]), [row[1], row[2]] + alternate_names, row[8], CITY, int(row[14] or 0)))
+
+    return places, countries
+
+def _save_array(index_dir, name, values, dtype):
+    np.save(os.path.join(index_dir, f"{name}.npy"), np.asarray(values, dtype=dtype))
+
+def build_index(places, countries, index_dir):
+    """Builds the place-name index: a trie of the words of every place name, saved as flat arrays.
+
+    Args:
+        places (list): Places as (place Id, names, country code, kind, population) tuples.
+        countries (dict): Country names by ISO code.
+        index_dir (str): Index folder.
+
+    Returns:
+        str: Index folder.
+    """
+    country_codes = sorted(countries)
+    country_index = {code: i for i, code in enumerate(country_codes)}
+    places = [place for place in places if place[2] in country_index]
+
+    # Vocabulary: every word gets the Id of its rank, so that the edges of a node can be sorted by word Id
+    names_by_place = [{name_words(name) for name in names if name_words(name)} for _, names, _, _, _ in places]
+    vocabulary = sorted({word for names in names_by_place for name in names for word in name})
+    word_ids = {word: i for i, word in enumerate(vocabulary)}
+
+    # Trie of word Ids, with the places of every name that ends at a node
+    children, node_places = [{}], [[]]
+    for place, names in enumerate(names_by_place):
+        for name in names:
+            if len(name) > MAX_NAME_WORDS:
+                continue
+            node = 0
+            for word in name:
+                next_node = children[node].get(word_ids[word])
+                if next_node is None:
+                    next_node = children[node][word_ids[word]] = len(children)
+                    children.append({})
+                    node_places.append([])
+                node = next_node
+            node_places[node].append(place)
+
+    # Flat arrays: the edges of node n are edge_words/edge_nodes[node_start[n]:node_start[n + 1]], sorted by word Id.
+    # The places of a name are sorted by kind (countries first), then by decreasing population
+    node_start, edge_words, edge_nodes, node_entry, entry_start, entry_places = [0], [], [], [], [0], []
+    for node, node_children in enumerate(children):
+        for word_id in sorted(node_children):
+            edge_words.append(word_id)
+            edge_nodes.append(node_children[word_id])
+        node_start.append(len(edge_words))
+
+        if node_places[node]:
+            node_entry.append(len(entry_start) - 1)
+            entry_places.extend(sorted(set(node_places[node]), key=lambda p: (places[p][3], -places[p][4])))
+            entry_start.append(len(entry_places))
+        else:
+            node_entry.append(-1)
+
+    # Build in a temporary folder first, so that an interrupted build never leaves a partial index
+    tmp_dir = f"{index_dir.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    _save_array(tmp_dir, "node_start", node_start, np.int32)
+    _save_array(tmp_dir, "edge_words", edge_words, np.int32)
+    _save_array(tmp_dir, "edge_nodes", edge_nodes, np.int32)
+    _save_array(tmp_dir, "node_entry", node_entry, np.int32)
+    _save_array(tmp_dir, "entry_start", entry_start, np.int32)
+    _save_array(tmp_dir, "entry_places", entry_places, np.int32)
+    _save_array(tmp_dir, "place_ids", [p[0] for p in places], np.int64)
+    _save_array(tmp_dir, "place_countries", [country_index[p[2]] for p in places], np.int16)
+    _save_array(tmp_dir, "place_kinds", [p[3] for p in places], np.int8)
+
+    with open(os.path.join(tmp_dir, "names.json"), "w", encoding="utf-8") as f:
+        json.dump({"vocabulary": vocabulary, "places": [p[1][0] for p in places],
+                   "countries": [[code, countries[code]] for code in country_codes]}, f, ensure_ascii=False)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    logger.info(f"Gazetteer index of {len(places)} places, {len(vocabulary)} words and {len(children)} nodes saved to {index_dir}")
+    return index_dir
+
+class Gazetteer:
+    """Offline place-name index, to normalise the locations answered by the models.
+
+    The trie of the place names is stored as flat arrays that are memory-mapped, so the index is shared by all
+    the processes that load it and only the pages that are used are read. A text is matched in one pass over
+    its words: at every word, the trie gives the longest place name that starts there, and the match resumes
+    after it. An ambiguous name ('Paris', 'London') goes to the place in a country that the same text mentions,
+    or else to the largest place.
+    """
+
+    # Memory-mapped arrays are reloaded by every process instead of being copied
+    _arrays = ("node_start", "edge_words", "edge_nodes", "node_entry", "entry_start", "entry_places",
+               "place_ids", "place_countries", "place_kinds")
+
+    def __init__(self, index_dir):
+        """
+        Args:
+            index_dir (str): Index folder, built by build_index.
+        """
+        if not os.path.isdir(index_dir):
+            raise ValueError(f"Gazetteer index '{index_dir}' not found. Build it with: python gazetteer.py --help")
+
+        self.index_dir = index_dir
+        self._load()
+
+    def _load(self):
+        for name in self._arrays:
+            setattr(self, name, np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode="r"))
+
+        with open(os.path.join(self.index_dir, "names.json"), encoding="utf-8") as f:
+            names = json.load(f)
+        self.word_ids = {word: i for i, word in enumerate(names["vocabulary"])}
+        self.place_names = names["places"]
+        self.countries = [tuple(country) for country in names["countries"]]
+        self.country_names = dict(self.countries)
+
+        # Every match starts at the root: its edges are kept in a dictionary
+        start, end = self.node_start[0], self.node_start[1]
+        self.root_children = dict(zip(self.edge_words[start:end].tolist(), self.edge_nodes[start:end].tolist()))
+
+    def __getstate__(self):
+        return {"index_dir": self.index_dir}
+
+    def __setstate__(self, state):
+        self.index_dir = state["index_dir"]
+        self._load()
+
+    def _child(self, node, word_id):
+        start, end = int(self.node_start[node]), int(self.node_start[node + 1])
+        if start == end:
+            return -1
+        words = self.edge_words[start:end]
+        i = int(np.searchsorted(words, word_id))
+        return int(self.edge_nodes[start + i]) if i < end - start and words[i] == word_id else -1
+
+    def match(self, text, capitalised=False):
+        """Finds the place names of a text, longest first.
+
+        Args:
+            text (str): Text.
+            capitalised (bool, optional): Whether a name must start with a capital letter, to skip common words
+                that are also place names in running text. Defaults to False.
+
+        Returns:
+            list: (start, end, entry) tuples: character span of the name, and index of its candidate places.
+        """
+        text = str(text)
+        words = [(m.start(), m.end(), self.word_ids.get(fold(m.group()), -1)) for m in WORD_PATTERN.finditer(text)]
+        matches = []
+        i = 0
+        while i < len(words):
+            best = None
+            if not capitalised or text[words[i][0]].isupper():
+                node = self.root_children.get(words[i][2], -1)
+                j = i
+                while node >= 0:
+                    entry = int(self.node_entry[node])
+                    if entry >= 0:
+                        best = (j + 1, entry)
+                    j += 1
+                    if j == len(words) or j - i >= MAX_NAME_WORDS or words[j][2] < 0:
+                        break
+                    node = self._child(node, words[j][2])
+
+            if best is None:
+                i += 1
+            else:
+                matches.append((words[i][0], words[best[0] - 1][1], best[1]))
+                i = best[0]
+        return matches
+
+    def _candidates(self, entry):
+        return self.entry_places[self.entry_start[entry]:self.entry_start[entry + 1]].tolist()
+
+    def resolve(self, text, capitalised=False):
+        """Finds the places of a text.
+
+        Args:
+            text (str): Text, e.g. the location answered by a model.
+            capitalised (bool, optional): Whether a name must start with a capital letter. Defaults to False.
+
+        Returns:
+            list: Indexes of the places, in the order of the text, without duplicates.
+        """
+        candidates = [self._candidates(entry) for _, _, entry in self.match(text, capitalised)]
+
+        # Countries named in the text, and countries of the unambiguous names, decide the ambiguous names
+        context = {int(self.place_countries[c[0]]) for c in candidates
+                   if self.place_kinds[c[0]] == COUNTRY or len({int(self.place_countries[p]) for p in c}) == 1}
+
+        places = []
+        for places_of_name in candidates:
+            place = next((p for p in places_of_name if int(self.place_countries[p]) in context), places_of_name[0])
+            if place not in places:
+                places.append(place)
+        return places
+
+    def place_id(self, place):
+        return int(self.place_ids[place])
+
+    def country(self, place):
+        """Returns the ISO code and the name of the country of a place."""
+        return self.countries[int(self.place_countries[place])]
+
+    def normalise_location(self, location):
+        """Normalises a location answer into structured places.
+
+        Args:
+            location (str): Location answered by a model, e.g. 'Jasper, Alberta and Banff'.
+
+        Returns:
+            dict: 'location_ids' (GeoNames Ids), 'location_names' ('<name>, <country code>') and 'country_codes'
+                (ISO codes, in the order of the places), separated by ';'.
+        """
+        places = self.resolve(location)
+        codes = list(dict.fromkeys(self.country(p)[0] for p in places))
+        return {
+            "location_ids": ID_SEPARATOR.join(str(self.place_id(p)) for p in places),
+            "location_names": ID_SEPARATOR.join(f"{self.place_names[p]}, {self.country(p)[0]}" for p in places),
+            "country_codes": ID_SEPARATOR.join(codes),
+        }
+
+    def annotate(self, content):
+        """Finds the countries of the places named in an article, without calling a model.
+
+        Args:
+            content (str): Content of the article.
+
+        Returns:
+            list: (ISO code, country name) tuples, the country with the most places first.
+        """
+        mentions = Counter(self.country(p) for p in self.resolve(content, capitalised=True))
+        return [country for country, _ in mentions.most_common()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the gazetteer index from GeoNames dumps")
+    parser.add_argument("--cities", required=True, help="cities file, e.g. cities15000.txt")
+    parser.add_argument("--countries", required=True, help="countryInfo.txt")
+    parser.add_argument("--admin1", default=None, help="admin1CodesASCII.txt, for the provinces and states")
+    parser.add_argument("--out", default="data/gazetteer", help="index folder (default: data/gazetteer)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_index(*read_geonames(args.cities, args.countries, args.admin1), args.out)
@@ -0,0 +1,209 @@
+# language_id.py
+
+import re
+import logging
+import argparse
+import pandas as pd
+
+from prompts import PROMPT_LANGUAGES
+from schema import apply_schema, ARTICLE_SCHEMA
+from triage import alert_text
+
+logger = logging.getLogger(__name__)
+
+# Frequent function words of the languages written in the Latin alphabet. A word of several languages counts for
+# each of them, divided by their number
+FUNCTION_WORDS = {
+    "en": ["the", "and", "of", "to", "in", "is", "was", "for", "on", "that", "with", "by", "are", "were", "from", "at",
+           "as", "have", "has", "this", "it", "be", "after", "said", "will", "been", "their", "which", "not", "a"],
+    "fr": ["le", "la", "les", "des", "du", "de", "et", "est", "une", "un", "dans", "pour", "par", "sur", "que", "qui",
+           "au", "aux", "sont", "été", "ont", "avec", "pas", "ce", "cette", "plus", "leur", "selon", "ne", "après"],
+    "es": ["el", "la", "los", "las", "del", "de", "y", "en", "que", "es", "por", "con", "para", "una", "un", "se",
+           "su", "sus", "al", "fue", "han", "más", "pero", "como", "este", "esta", "está", "desde", "según", "tras"],
+    "pt": ["o", "os", "a", "as", "do", "da", "dos", "das", "de", "e", "em", "que", "é", "um", "uma", "para", "com",
+           "no", "na", "nos", "não", "por", "mais", "foi", "pelo", "pela", "ao", "são", "seu", "sua"],
+    "it": ["il", "lo", "gli", "la", "le", "di", "del", "della", "dei", "e", "è", "che", "in", "un", "una", "per",
+           "con", "non", "sono", "nel", "nella", "alla", "al", "da", "ha", "anche", "più", "come", "questo", "stato"],
+    "de": ["der", "die", "das", "den", "dem", "des", "und", "ist", "nicht", "ein", "eine", "einen", "mit", "von", "zu",
+           "im", "auf", "für", "sich", "auch", "es", "wurde", "werden", "sind", "bei", "nach", "aus", "hat", "wie", "dass"],
+    "nl": ["de", "het", "een", "en", "van", "is", "niet", "op", "met", "voor", "zijn", "dat", "die", "te", "er", "aan",
+           "werd", "bij", "ook", "naar", "om", "worden", "door", "als", "nog", "maar", "wordt", "heeft", "deze", "uit"],
+}
+
+# Languages of every function word
+WORD_LANGUAGES = {word: [language for language, words in FUNCTION_WORDS.items() if word in words]
+                  for words in FUNCTION_WORDS.values() for word in words}
+
+# Languages recognised from their own script. Japanese mixes kana with Chinese characters, and the Cyrillic
+# script is reported as Russian, its most frequent language in the news
+SCRIPTS = {
+    "ja": re.compile(r"[\u3040-\u30ff]"),
+    "zh": re.compile(r"[\u4e00-\u9fff]"),
+    "ko": re.compile(r"[\uac00-\ud7af]"),
+    "ru": re.compile(r"[\u0400-\u04ff]"),
+    "ar": re.compile(r"[\u0600-\u06ff]"),
+    "el": re.compile(r"[\u0370-\u03ff]"),
+    "he": re.compile(r"[\u0590-\u05ff]"),
+    "hi": re.compile(r"[\u0900-\u097f]"),
+}
+LETTER = re.compile(r"[^\W\d_]")
+WORD = re.compile(r"[^\W\d_]+")
+
+# Only the beginning of a text is read: a few hundred words are enough to recognise its language
+MAX_DETECT_CHARS = 2000
+
+# Minimal share of the letters of a script for a text to be in its language
+SCRIPT_SHARE = 0.5
+
+# Minimal number of function words for a text in the Latin alphabet: shorter texts are not recognised
+MIN_FUNCTION_WORDS = 3
+
+# Default minimal confidence of a detected language before it replaces the language of the alert
+MIN_CONFIDENCE = 0.6
+
+# Routes of the rows: a supported language, confirmed or corrected by the detection, or another language sent
+# to the multilingual prompt or skipped
+SUPPORTED, CORRECTED, MULTILINGUAL, SKIPPED = "supported", "corrected", "multilingual", "skipped"
+
+# Route of the rows in an unsupported language, by the 'unsupported' option of the config file
+UNSUPPORTED_ROUTES = {"skip": SKIPPED, "multilingual": MULTILINGUAL}
+
+# Columns of the saved routes
+ROUTING_COLUMNS = ["Id", "URL", "PublishedDate", "declared_language", "Language", "detected_language", "language_confidence",
+                   "language_route"]
+
+def detect_language(text):
+    """Identifies the language of a text, locally.
+
+    The languages with their own script (Chinese, Japanese, Korean, Russian, Arabic, Greek, Hebrew, Hindi) are
+    recognised from the share of their letters. The languages in the Latin alphabet (English, French, Spanish,
+    Portuguese, Italian, German, Dutch) are recognised from their frequent function words.
+
+    Args:
+        text (str): Text, such as the title and the snippet of an alert, or the content of an article.
+
+    Returns:
+        tuple: Language code, or None if the text is too short to be recognised, and confidence from 0 to 1.
+    """
+    if not isinstance(text, str):
+        return None, 0.0
+    text = text[:MAX_DETECT_CHARS]
+    letters = len(LETTER.findall(text))
+    if not letters:
+        return None, 0.0
+
+    script_counts = {language: len(pattern.findall(text)) for language, pattern in SCRIPTS.items()}
+    if script_counts["ja"]:
+        script_counts["ja"] += script_counts.pop("zh")
+    language = max(script_counts, key=script_counts.get)
+    if script_counts[language] / letters >= SCRIPT_SHARE:
+        return language, round(script_counts[language] / letters, 2)
+
+    scores = dict.fromkeys(FUNCTION_WORDS, 0.0)
+    for word in WORD.findall(text.lower()):
+        languages = WORD_LANGUAGES.get(word)
+        if languages:
+            for language in languages:
+                scores[language] += 1 / len(languages)
+
+    total = sum(scores.values())
+    if total < MIN_FUNCTION_WORDS:
+        return None, 0.0
+    language = max(scores, key=scores.get)
+    return language, round(scores[language] / total, 2)
+
+def route_language(text, declared, unsupported="skip", min_confidence=MIN_CONFIDENCE, supported=PROMPT_LANGUAGES):
+    """Decides the language and the route of a row.
+
+    The detected language replaces the declared one when its confidence is high enough. The rows in a
+    language without its own prompt are skipped or sent to the multilingual prompt.
+
+    Args:
+        text (str): Text of the row.
+        declared (str): Language of the row in the input file.
+        unsupported (str, optional): 'skip' or 'multilingual'. Defaults to 'skip'.
+        min_confidence (float, optional): Minimal confidence of the detected language. Defaults to 0.6.
+        supported (list, optional): Languages with their own prompt. Defaults to 'en' and 'fr'.
+
+    Returns:
+        tuple: Language, detected language (None if not recognised), confidence and route of the row.
+    """
+    detected, confidence = detect_language(text)
+    language = detected if detected is not None and confidence >= min_confidence else declared
+    if language in supported:
+        route = SUPPORTED if language == declared else CORRECTED
+    else:
+        route = UNSUPPORTED_ROUTES[unsupported]
+    return language, detected, confidence, route
+
+def check_unsupported(unsupported):
+    """Checks the route of the rows in an unsupported language ('skip' or 'multilingual')."""
+    if unsupported not in UNSUPPORTED_ROUTES:
+        raise ValueError(f"Unknown value '{unsupported}' for the unsupported languages. Please use one of: {', '.join(UNSUPPORTED_ROUTES)}.")
+
+def routed_rows(df, declared, rows):
+    """Adds the language and the route of every row (see route_language) to the rows.
+
+    Args:
+        df (pd.DataFrame): Alerts or articles.
+        declared (list): Language of every row in the input file.
+        rows (list): Language, detected language, confidence and route of every row.
+
+    Returns:
+        pd.DataFrame: Rows with their language, declared language ('declared_language'), detected language and
+            confidence, and route ('language_route').
+    """
+    languages, detected, confidences, routes = zip(*rows) if rows else ([], [], [], [])
+    routed_df = apply_schema(df.assign(Language=list(languages)), ARTICLE_SCHEMA)
+    routed_df = routed_df.assign(declared_language=list(declared), detected_language=list(detected),
+                                 language_confidence=list(confidences), language_route=list(routes))
+
+    counts = routed_df["language_route"].value_counts()
+    logger.info(f"Languages of {df.shape[0]} rows: {counts.get(SUPPORTED, 0)} supported, {counts.get(CORRECTED, 0)} corrected, "
+                f"{counts.get(MULTILINGUAL, 0)} sent to the multilingual prompt, {counts.get(SKIPPED, 0)} skipped")
+    return routed_df
+
+def route_languages(df, texts, unsupported="skip", min_confidence=MIN_CONFIDENCE, supported=PROMPT_LANGUAGES):
+    """Identifies the language of every row, and routes the rows in an unsupported language.
+
+    Args:
+        df (pd.DataFrame): Alerts or articles, with a 'Language' column.
+        texts (pd.Series): Text of every row: the title and the snippet of the alerts before they are fetched,
+            the extracted content of the articles before they are sent to the models.
+        unsupported (str, optional): 'skip' to leave out the rows in an unsupported language, or 'multilingual'
+            to send them to the multilingual prompt. Defaults to 'skip'.
+        min_confidence (float, optional): Minimal confidence of the detected language. Defaults to 0.6.
+        supported (list, optional): Languages with their own prompt. Defaults to 'en' and 'fr'.
+
+    Returns:
+        tuple: Rows to process, with their corrected language, and all the rows with their declared language
+            ('declared_language'), detected language and confidence, and route ('language_route').
+    """
+    check_unsupported(unsupported)
+    if "Language" not in df.columns:
+        raise ValueError("Column 'Language' not found in the dataframe. Please check the column name.")
+
+    declared = df["Language"].astype(object).where(df["Language"].notna(), None)
+    rows = [route_language(text, language, unsupported, min_confidence, supported)
+            for text, language in zip(texts.tolist(), declared.tolist())]
+    routed_df = routed_rows(df, declared.tolist(), rows)
+
+    kept_df = routed_df[routed_df["language_route"] != SKIPPED][df.columns]
+    return kept_df, routed_df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Identify the language of the alerts or of the extracted articles of a file")
+    parser.add_argument("fn", help="alerts or extracted content file")
+    parser.add_argument("--column", default=None, help="column of the texts (default: New_Content if present, else Title and Content)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    df = pd.read_csv(args.fn, sep='|')
+    if args.column is None and "New_Content" not in df.columns:
+        texts = alert_text(df)
+    else:
+        texts = df[args.column or "New_Content"]
+
+    _, routed_df = route_languages(df, texts)
+    routed_df = routed_df[routed_df["Language"].astype(object) != routed_df["declared_language"]]
+    logger.info(f"Rows whose language differs from the file:\n{routed_df[['declared_language', 'detected_language', 'language_confidence', 'language_route']].to_string()}")
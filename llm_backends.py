@@ -0,0 +1,514 @@
+# llm_backends.py
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import threading
+import logging
+from collections import namedtuple
+from urllib.parse import quote
+
+import httpx
+import boto3
+from botocore.config import Config
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+
+logger = logging.getLogger(__name__)
+
+# Timeouts in seconds
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+
+# Response of a model: generated text, token usage and call latency in seconds. cached_input_tokens is the
+# part of the input tokens read from the prompt cache, when the API reports it. arguments are the parsed
+# arguments of the tool call, when a tool was required (the text is then their JSON)
+LLMResponse = namedtuple("LLMResponse", ["text", "model", "input_tokens", "output_tokens", "latency", "cached_input_tokens",
+                                         "arguments"], defaults=[None, None])
+
+# HTTP status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Registry of the available backends, by the name used in the 'solution' option of the config file
+BACKENDS = {}
+
+def parse_bool(value):
+    """Converts a config file value ('true', 'yes', 'on', '1', ...) to a boolean."""
+    return str(value).strip().lower() in {"1", "true", "yes", "on"}
+
+def message_text(content):
+    """Returns the text of a message content, given as a string or a list of text parts."""
+    return "".join(content) if isinstance(content, list) else content
+
+def recording_key(messages, model, temperature, max_tokens, tool=None):
+    """Returns the key of a call in the recorded responses: the same call gets the same key in every run."""
+    call = {"messages": messages, "model": model, "temperature": temperature, "max_tokens": max_tokens, "tool": tool}
+    return hashlib.sha256(json.dumps(call, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def register_backend(name):
+    """Registers a backend class under the given solution name.
+
+    Args:
+        name (str): Name of the solution in the config file.
+
+    Returns:
+        function: Class decorator.
+    """
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+def make_backend(name, **options):
+    """Creates the backend for the given solution.
+
+    Args:
+        name (str): Name of the solution ('bedrock', 'openai', 'openai_compatible').
+        **options: Backend options. String values (e.g., read from a config file) are converted to the expected types.
+
+    Returns:
+        LLMBackend: Backend instance.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"The solution '{name}' is not recognized. Available solutions: {', '.join(sorted(BACKENDS))}.")
+
+    cls = BACKENDS[name]
+    typed_options = {}
+    for key, value in options.items():
+        if key not in cls.option_types:
+            raise ValueError(f"Unknown option '{key}' for the '{name}' solution.")
+        if isinstance(value, str):
+            value = None if value in {"", "None"} else cls.option_types[key](value)
+        typed_options[key] = value
+
+    return cls(**typed_options)
+
+class LLMBackend:
+    """Base class of the LLM backends.
+
+    A backend receives chat messages as a list of {"role": ..., "content": ...} dictionaries, and returns an
+    LLMResponse. A content is a string, or a list of text parts whose last part is the only one that changes
+    from one call to the next (see prompts.py); backends with explicit prompt caching cache the other parts. It owns its connection pool, limits the number of concurrent calls and
+    the request rate, and offers both a blocking (complete) and an asynchronous (acomplete) call.
+    """
+    name = None
+
+    # Prompt layout expected by the backend: 'system' (system + user messages) or 'user' (a single user message)
+    prompt_style = "user"
+
+    # Default number of concurrent calls
+    default_max_concurrency = 8
+
+    # Types of the options accepted by the constructor
+    option_types = {"max_concurrency": int, "requests_per_minute": float, "timeout": float, "max_retries": int}
+
+    # Clients and locks can't be sent to other processes; they are created lazily in each process
+    _unpicklable = ("_client", "_async_client", "_lock", "_async_lock")
+
+    def __init__(self, max_concurrency=None, requests_per_minute=None, timeout=READ_TIMEOUT, max_retries=3):
+        self.max_concurrency = max_concurrency or self.default_max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self._next_call_time = 0.0
+        for attr in self._unpicklable:
+            setattr(self, attr, None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._unpicklable:
+            state[attr] = None
+        return state
+
+    def check(self, model):
+        """Checks that the model can be used with the configured credentials.
+
+        Args:
+            model (str): NLP Model Name or Id.
+        """
+        print(f"Welcome to {self.name}. The URLs will be processed using {model} model.")
+
+    def complete(self, messages, model, temperature, max_tokens, tool=None):
+        """Sends the messages to the model and waits for the answer.
+
+        Args:
+            messages (list): Chat messages.
+            model (str): NLP Model Name or Id.
+            temperature (float): Temperature of the model.
+            max_tokens (int): Maximum tokens of the model response.
+            tool (dict, optional): Tool the model must call, with 'name', 'description' and 'parameters' (JSON
+                schema of the arguments). Defaults to None, for a text answer.
+
+        Returns:
+            LLMResponse: Model response.
+        """
+        raise NotImplementedError
+
+    async def acomplete(self, messages, model, temperature, max_tokens, tool=None):
+        """Asynchronous version of complete.
+
+        The default implementation runs the blocking call in a thread, so that every backend can be used
+        by the asynchronous dispatcher. Backends with a native asynchronous client override it.
+        """
+        return await asyncio.to_thread(self.complete, messages, model, temperature, max_tokens, tool)
+
+    def close(self):
+        """Closes the blocking client and its connection pool."""
+        if self._client is not None and hasattr(self._client, "close"):
+            self._client.close()
+        self._client = None
+
+    async def aclose(self):
+        """Closes the asynchronous client and its connection pool."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        self._async_client = None
+        self._async_lock = None
+
+    def _throttle(self):
+        # Wait for the next free slot when the request rate is limited
+        if not self.requests_per_minute:
+            return
+        if self._lock is None:
+            self._lock = threading.Lock()
+        with self._lock:
+            wait = self._reserve_slot()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def _athrottle(self):
+        if not self.requests_per_minute:
+            return
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            wait = self._reserve_slot()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _reserve_slot(self):
+        # Returns the number of seconds to wait before the call
+        now = time.monotonic()
+        call_time = max(now, self._next_call_time)
+        self._next_call_time = call_time + 60.0 / self.requests_per_minute
+        return call_time - now
+
+    def _retry_delay(self, attempt):
+        # Exponential backoff: 1, 2, 4, ... seconds
+        return 2 ** attempt
+
+@register_backend("openai_compatible")
+class OpenAICompatibleBackend(LLMBackend):
+    """Backend for any server implementing the OpenAI chat completions API.
+
+    It is used to point the pipeline at a self-hosted inference server (e.g., llama.cpp server, vLLM, Ollama),
+    for instance with base_url = http://localhost:8080/v1. CPU servers process a few requests at a time,
+    so the default concurrency is low.
+    """
+    default_base_url = None
+    default_api_key_env = None
+    default_max_concurrency = 4
+
+    option_types = {**LLMBackend.option_types, "base_url": str, "api_key_env": str, "prompt_style": str}
+
+    def __init__(self, base_url=None, api_key_env=None, prompt_style=None, **options):
+        super().__init__(**options)
+        self.base_url = (base_url or self.default_base_url or "").rstrip("/")
+        self.api_key_env = api_key_env or self.default_api_key_env
+        self.prompt_style = prompt_style or self.prompt_style
+
+        if not self.base_url:
+            raise ValueError(f"The 'base_url' option is required for the '{self.name}' solution.")
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        api_key = os.getenv(self.api_key_env) if self.api_key_env else None
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+
+    def _client_options(self):
+        return {
+            "base_url": self.base_url,
+            "headers": self._headers(),
+            "timeout": httpx.Timeout(self.timeout, connect=CONNECT_TIMEOUT),
+            "limits": httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+        }
+
+    def _payload(self, messages, model, temperature, max_tokens, tool=None):
+        # OpenAI and most inference servers cache the longest common prompt prefix on their own
+        messages = [{"role": m["role"], "content": message_text(m["content"])} for m in messages]
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        if tool is not None:
+            # Function calling with a strict schema: the model must call the tool with valid arguments
+            payload["tools"] = [{"type": "function", "function": {**tool, "strict": True}}]
+            payload["tool_choice"] = {"type": "function", "function": {"name": tool["name"]}}
+        return payload
+
+    def _parse(self, body, model, latency):
+        usage = body.get("usage") or {}
+        message = body["choices"][0]["message"]
+        text, arguments = message.get("content") or "", None
+
+        # Servers without function calling answer with text, which is parsed by the caller
+        tool_calls = message.get("tool_calls") or []
+        if tool_calls:
+            text = tool_calls[0]["function"]["arguments"]
+            try:
+                arguments = json.loads(text)
+            except ValueError:
+                logger.warning(f"{self.name} call to {model} returned invalid tool arguments")
+
+        return LLMResponse(
+            text=text,
+            model=model,
+            input_tokens=usage.get("prompt_tokens"),
+            output_tokens=usage.get("completion_tokens"),
+            latency=latency,
+            cached_input_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+            arguments=arguments)
+
+    def complete(self, messages, model, temperature, max_tokens, tool=None):
+        if self._client is None:
+            self._client = httpx.Client(**self._client_options())
+
+        payload = self._payload(messages, model, temperature, max_tokens, tool)
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            start = time.perf_counter()
+            try:
+                response = self._client.post("/chat/completions", json=payload)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return self._parse(response.json(), model, time.perf_counter() - start)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            logger.warning(f"{self.name} call to {model} failed, retrying (attempt {attempt + 1})")
+            time.sleep(self._retry_delay(attempt))
+
+    async def acomplete(self, messages, model, temperature, max_tokens, tool=None):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_options())
+
+        payload = self._payload(messages, model, temperature, max_tokens, tool)
+        for attempt in range(self.max_retries + 1):
+            await self._athrottle()
+            start = time.perf_counter()
+            try:
+                response = await self._async_client.post("/chat/completions", json=payload)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return self._parse(response.json(), model, time.perf_counter() - start)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            logger.warning(f"{self.name} call to {model} failed, retrying (attempt {attempt + 1})")
+            await asyncio.sleep(self._retry_delay(attempt))
+
+@register_backend("openai")
+class OpenAIBackend(OpenAICompatibleBackend):
+    """Backend for the OpenAI API.
+
+    The free plan allows 3 requests per minute; set requests_per_minute in the [openai] section of the config
+    file to match your plan.
+    """
+    prompt_style = "system"
+    default_base_url = "https://api.openai.com/v1"
+    default_api_key_env = "OPENAI_API_KEY"
+    default_max_concurrency = 8
+
+    def __init__(self, requests_per_minute=3, **options):
+        super().__init__(requests_per_minute=requests_per_minute, **options)
+
+@register_backend("bedrock")
+class BedrockBackend(LLMBackend):
+    """Backend for the AWS Bedrock Converse API.
+
+    Blocking calls use a boto3 client whose connection pool is sized to the concurrency. Asynchronous calls
+    send the same signed requests over a shared httpx connection pool, so that hundreds of calls can be
+    in flight from a single process.
+    """
+    default_max_concurrency = 16
+
+    option_types = {**LLMBackend.option_types, "region": str, "endpoint_url": str, "prompt_caching": parse_bool}
+
+    _unpicklable = LLMBackend._unpicklable + ("_session",)
+
+    def __init__(self, region=None, endpoint_url=None, prompt_caching=False, **options):
+        super().__init__(**options)
+        # Without region, boto3 resolves it (AWS_DEFAULT_REGION, profile, ...), and the endpoint of the region
+        self.region = region or os.getenv('AWS_REGION')
+        self.endpoint_url = endpoint_url
+        # Cache points are rejected by the models without prompt caching, so they are opt-in
+        self.prompt_caching = prompt_caching
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = boto3.Session(
+                region_name=self.region,
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                aws_session_token=os.getenv('AWS_SESSION_TOKEN')
+            )
+        return self._session
+
+    @property
+    def client(self):
+        if self._client is None:
+            config = Config(
+                max_pool_connections=self.max_concurrency,
+                connect_timeout=CONNECT_TIMEOUT,
+                read_timeout=self.timeout,
+                retries={"max_attempts": self.max_retries + 1, "mode": "adaptive"})
+            endpoint = {"endpoint_url": self.endpoint_url} if self.endpoint_url else {}
+            self._client = self.session.client('bedrock-runtime', config=config, **endpoint)
+        return self._client
+
+    def check(self, model):
+        # Delete when the permanenet AWS credentials are received
+        try:
+            self.client.invoke_model(
+                body='{"prompt": "Hello, Bedrock!"}',
+                modelId=model)
+            print(f"Welcome to AWS Bedrock. The URLs will be processed using {model} model.")
+        except boto3.exceptions.Boto3Error as e:
+            # An exception was raised, so the credentials are invalid for Bedrock
+            raise ValueError(f"Error: Invalid AWS credentials for Bedrock: {str(e)}.")
+
+    def _content_blocks(self, content, static=False):
+        # A cache point marks the end of the static prefix: the whole content of a static (system) message,
+        # or all the text parts but the last one
+        parts = content if isinstance(content, list) else [content]
+        blocks = [{"text": part} for part in parts if part]
+        if self.prompt_caching and (static or len(parts) > 1):
+            blocks.insert(len(blocks) if static else len(blocks) - 1, {"cachePoint": {"type": "default"}})
+        return blocks
+
+    def _request(self, messages, temperature, max_tokens, tool=None):
+        # Convert chat messages to the Converse API format: system messages go to a separate field
+        request = {
+            "messages": [
+                {"role": m["role"], "content": self._content_blocks(m["content"])} for m in messages if m["role"] != "system"
+            ],
+            "inferenceConfig": {
+                "temperature": temperature,
+                "maxTokens": max_tokens}
+            }
+        system = [block for m in messages if m["role"] == "system" for block in self._content_blocks(m["content"], static=True)]
+        if system:
+            request["system"] = system
+        if tool is not None:
+            # The model must answer with the tool, whose input is validated against the JSON schema
+            request["toolConfig"] = {
+                "tools": [{"toolSpec": {"name": tool["name"], "description": tool["description"],
+                                        "inputSchema": {"json": tool["parameters"]}}}],
+                "toolChoice": {"tool": {"name": tool["name"]}}}
+        return request
+
+    def _parse(self, body, model, latency):
+        usage = body.get("usage") or {}
+        blocks = body["output"]["message"]["content"]
+        text = next((block["text"] for block in blocks if "text" in block), "")
+        arguments = next((block["toolUse"]["input"] for block in blocks if "toolUse" in block), None)
+        return LLMResponse(
+            text=json.dumps(arguments) if arguments is not None else text,
+            model=model,
+            input_tokens=usage.get("inputTokens"),
+            output_tokens=usage.get("outputTokens"),
+            latency=latency,
+            cached_input_tokens=usage.get("cacheReadInputTokens"),
+            arguments=arguments)
+
+    def complete(self, messages, model, temperature, max_tokens, tool=None):
+        self._throttle()
+        start = time.perf_counter()
+
+        # Retries are handled by botocore
+        response = self.client.converse(modelId=model, **self._request(messages, temperature, max_tokens, tool))
+
+        return self._parse(response, model, time.perf_counter() - start)
+
+    def _signed_headers(self, url, body):
+        credentials = self.session.get_credentials()
+        if credentials is None:
+            raise ValueError("No AWS credentials found for Bedrock. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY, or an AWS profile.")
+        credentials = credentials.get_frozen_credentials()
+        request = AWSRequest(method="POST", url=url, data=body, headers={"Content-Type": "application/json"})
+        SigV4Auth(credentials, "bedrock", self.region or self.session.region_name).add_auth(request)
+        return dict(request.headers.items())
+
+    async def acomplete(self, messages, model, temperature, max_tokens, tool=None):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency))
+
+        # Same endpoint as the boto3 client, configured or resolved from the region
+        url = f"{self.client.meta.endpoint_url}/model/{quote(model, safe='')}/converse"
+        body = json.dumps(self._request(messages, temperature, max_tokens, tool))
+
+        for attempt in range(self.max_retries + 1):
+            await self._athrottle()
+            start = time.perf_counter()
+            try:
+                # Requests are signed on every attempt: signatures include a timestamp
+                response = await self._async_client.post(url, content=body, headers=self._signed_headers(url, body))
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return self._parse(response.json(), model, time.perf_counter() - start)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            logger.warning(f"Bedrock call to {model} failed, retrying (attempt {attempt + 1})")
+            await asyncio.sleep(self._retry_delay(attempt))
+
+@register_backend("recorded")
+class RecordedBackend(LLMBackend):
+    """Backend replaying the responses recorded from another backend (see evaluation.py).
+
+    The recordings are JSON lines with the key of the call (see recording_key), the prompt layout and the
+    response. A call is answered with the recorded response of the same messages, model, temperature and maximum
+    tokens, with its recorded latency and token usage, so that an evaluation can be run again offline.
+    """
+    default_max_concurrency = 64
+
+    option_types = {**LLMBackend.option_types, "path": str, "prompt_style": str}
+
+    def __init__(self, path=None, prompt_style=None, **options):
+        super().__init__(**options)
+        if not path:
+            raise ValueError(f"The 'path' option is required for the '{self.name}' solution.")
+        self.path = path
+
+        self.responses = {}
+        styles = set()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self.responses[record["key"]] = LLMResponse(**record["response"])
+                styles.add(record.get("prompt_style"))
+
+        # The prompts are built with the layout of the recorded backend
+        if prompt_style is None and len(styles) == 1:
+            prompt_style = styles.pop()
+        self.prompt_style = prompt_style or self.prompt_style
+
+    def check(self, model):
+        print(f"Replaying the responses of {model} recorded in {self.path}.")
+
+    def complete(self, messages, model, temperature, max_tokens, tool=None):
+        key = recording_key(messages, model, temperature, max_tokens, tool)
+        if key not in self.responses:
+            raise ValueError(f"No recorded response of {model} for this call in {self.path}.")
+        return self.responses[key]
+
+    async def acomplete(self, messages, model, temperature, max_tokens, tool=None):
+        return self.complete(messages, model, temperature, max_tokens, tool)
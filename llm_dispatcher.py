@@ -0,0 +1,104 @@
+# llm_dispatcher.py
+
+import asyncio
+import logging
+
+from run_control import CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Default maximum duration of a single call, including retries, in seconds
+DEFAULT_TIMEOUT = 300
+
+class AsyncDispatcher:
+    """Runs many network-bound calls concurrently from a single process.
+
+    A fixed number of worker coroutines pull the next arguments from a shared iterator, so the number of
+    pending coroutines stays bounded by the concurrency whatever the number of inputs, and the calls share
+    the connection pool of the backend instead of one process per call.
+    """
+
+    def __init__(self, max_concurrency=16, timeout=DEFAULT_TIMEOUT, control=None):
+        """
+        Args:
+            max_concurrency (int, optional): Maximum number of calls in flight. Defaults to 16.
+            timeout (float, optional): Maximum duration of a single call in seconds. None for no limit. Defaults to 300.
+            control (RunControl, optional): Time budget and stop requests of the run. When the run is stopping,
+                no new call is dispatched, and the calls in flight are cancelled at the end of the grace period.
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+        self.control = control
+        self.cancelled = False
+
+    def cancel(self):
+        """Stops dispatching new calls. The calls in flight are completed."""
+        self.cancelled = True
+
+    async def map(self, func, args_iterable, on_result=None):
+        """Calls the coroutine function with every tuple of arguments.
+
+        Args:
+            func (coroutine function): Function to call.
+            args_iterable (iterable): Tuples of arguments.
+            on_result (function, optional): Called with the index of the arguments and the result of every
+                completed call, as soon as it completes. Defaults to None.
+
+        Returns:
+            list: Results in the input order. A call that failed or timed out gives its exception instead of
+                a result, and a call that was never dispatched because of cancel() gives None.
+        """
+        results = {}
+        iterator = enumerate(args_iterable)
+        workers = [asyncio.create_task(self._worker(func, iterator, results, on_result)) for _ in range(self.max_concurrency)]
+        monitor = asyncio.create_task(self._monitor(workers)) if self.control is not None else None
+
+        try:
+            # Workers cancelled at the end of the grace period leave no result
+            await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            # Cancel the remaining calls if the dispatcher itself is cancelled (e.g., Ctrl+C)
+            for worker in workers:
+                worker.cancel()
+            if monitor is not None:
+                monitor.cancel()
+
+        # Arguments that were never dispatched are still in the iterator
+        total = len(results) + sum(1 for _ in iterator)
+        return [results.get(index) for index in range(total)]
+
+    async def _monitor(self, workers):
+        # Stops dispatching when the run is stopping, and cancels the calls still in flight after the grace period
+        while not self.control.should_stop():
+            await asyncio.sleep(CHECK_INTERVAL)
+        self.cancel()
+
+        await asyncio.sleep(self.control.grace_remaining())
+        in_flight = sum(not worker.done() for worker in workers)
+        if in_flight:
+            logger.error(f"Grace period expired, {in_flight} calls in flight are cancelled")
+        for worker in workers:
+            worker.cancel()
+
+    async def _worker(self, func, iterator, results, on_result=None):
+        # The iterator is shared by all the workers: each one takes the next arguments when it is free
+        while not self.cancelled and not (self.control is not None and self.control.should_stop()):
+            try:
+                index, args = next(iterator)
+            except StopIteration:
+                break
+            # A call cancelled at the end of the grace period keeps None as its result
+            results[index] = None
+            results[index] = await self._call(func, args)
+            if on_result is not None:
+                on_result(index, results[index])
+
+    async def _call(self, func, args):
+        try:
+            return await asyncio.wait_for(func(*args), self.timeout)
+        except asyncio.TimeoutError as e:
+            logger.error(f"Call timed out after {self.timeout} seconds")
+            return e
+        except Exception as e:
+            logger.error(f"An error occurred during the call: {str(e)}")
+            return e
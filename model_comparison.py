@@ -0,0 +1,163 @@
+# model_comparison.py
+
+import time
+import asyncio
+import logging
+from functools import partial
+import pandas as pd
+
+from llm_backends import BACKENDS
+from llm_dispatcher import AsyncDispatcher, DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+def parse_model_specs(models, default_solution):
+    """Parses the list of models to compare.
+
+    Args:
+        models (list): Model Ids, optionally prefixed by their solution, e.g. 'openai:gpt-3.5-turbo'.
+        default_solution (str): Solution of the models without prefix.
+
+    Returns:
+        list: (solution, model) tuples.
+    """
+    specs = []
+    for model in models:
+        solution, sep, model_id = model.partition(':')
+        # Bedrock model Ids contain colons too (e.g. 'mistral.mistral-7b-instruct-v0:2')
+        if sep and solution in BACKENDS:
+            specs.append((solution, model_id))
+        else:
+            specs.append((default_solution, model))
+    return specs
+
+def compare_models(extractor, df, model_specs, backends, max_concurrency=None, timeout=DEFAULT_TIMEOUT, control=None):
+    """Runs every article through every model at the same time.
+
+    Each prompt is built once per prompt layout and sent to all the models. The calls of each model are
+    dispatched with their own concurrency limit, so the comparison takes about as long as the slowest model.
+
+    Args:
+        extractor (ContentExtractor): Content extractor, for the prompts, the temperature and the maximum tokens.
+        df (pd.DataFrame): Dataframe with content and URLs.
+        model_specs (list): (solution, model) tuples.
+        backends (dict): Backends by solution.
+        max_concurrency (int, optional): Maximum number of calls in flight per model. Defaults to the concurrency
+            of the backend shared by its models.
+        timeout (float, optional): Maximum duration of a single call in seconds. Defaults to 300.
+        control (RunControl, optional): Time budget and stop requests of the run. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Long-format results, with one row per article and model, including latency and token usage.
+            If the run is stopped, the calls that were not completed are left out.
+    """
+    # The models see the content compacted with the text profile of the extractor
+    df = extractor.compact_content(df)
+
+    try:
+        responses = asyncio.run(acompare_models(extractor, df, model_specs, backends, max_concurrency, timeout, control))
+    except KeyboardInterrupt:
+        logger.error('Got ^C while comparing the models, no results were collected')
+        return pd.DataFrame()
+
+    # The places of every article are found once, for all the models
+    content_countries = [extractor.annotate_places(content) for content in df['New_Content']]
+
+    rows = []
+    for (solution, model), model_responses in zip(model_specs, responses):
+        for (url, publish_date), countries, response in zip(zip(df['URL'], df['PublishedDate']), content_countries, model_responses):
+            # Calls that were not dispatched or completed before the run stopped
+            if response is None and control is not None and control.stopped:
+                continue
+            rows.append(comparison_row(extractor, solution, model, url, publish_date, response, countries))
+
+    return pd.DataFrame(rows)
+
+async def acompare_models(extractor, df, model_specs, backends, max_concurrency, timeout, control=None):
+    # Build each prompt once per prompt layout
+    styles = {backends[solution].prompt_style for solution, _ in model_specs}
+    prompts = {
+        style: [extractor.prepare_prompt(language, content, prompt_style=style)
+                for content, language in zip(df['New_Content'], df['Language'])]
+        for style in styles
+    }
+
+    models_per_backend = {}
+    for solution, _ in model_specs:
+        models_per_backend[solution] = models_per_backend.get(solution, 0) + 1
+
+    async def call(backend, model, messages):
+        return await backend.acomplete(messages, model, extractor.temp, extractor.max_tokens)
+
+    async def run_model(solution, model):
+        backend = backends[solution]
+        # The models of a backend share its connection pool
+        concurrency = max_concurrency or max(1, backend.max_concurrency // models_per_backend[solution])
+        dispatcher = AsyncDispatcher(max_concurrency=concurrency, timeout=timeout, control=control)
+
+        start = time.perf_counter()
+        responses = await dispatcher.map(partial(call, backend, model), ((m,) for m in prompts[backend.prompt_style]))
+        logger.info(f"{model} processed {len(responses)} articles in {time.perf_counter() - start:.1f} seconds")
+
+        return responses
+
+    try:
+        return await asyncio.gather(*(run_model(solution, model) for solution, model in model_specs))
+    finally:
+        for backend in backends.values():
+            await backend.aclose()
+
+def comparison_row(extractor, solution, model, url, publish_date, response, content_countries=()):
+    """Builds the result row of an article processed by a model.
+
+    With a gazetteer, the location answer is normalised and the country derived (see ContentExtractor.normalise_places).
+
+    Returns:
+        dict: Answers, status ('ok', 'parse_failed' or 'error'), latency and token usage.
+    """
+    row = {"solution": solution, "model": model, "link": url, "published_date": publish_date}
+
+    if response is None or isinstance(response, Exception):
+        row.update({"status": "error", "error": str(response)})
+        return row
+
+    content_df = extractor.normalise_places(extractor.transform_response_to_df(response.text), content_countries)
+    confidence = extractor.score_answer(content_df)
+    parsed = extractor.normalise_answer(content_df["is_happened"].iloc[0]) in {"yes", "no"}
+
+    row.update(content_df.iloc[0].to_dict())
+    row.update({
+        "status": "ok" if parsed else "parse_failed",
+        "confidence": round(confidence, 2),
+        "latency": round(response.latency, 3),
+        "input_tokens": response.input_tokens,
+        "output_tokens": response.output_tokens,
+        "cached_input_tokens": response.cached_input_tokens,
+    })
+    return row
+
+def summarise_comparison(results_df):
+    """Summarises the comparison per model.
+
+    Args:
+        results_df (pd.DataFrame): Long-format results of compare_models.
+
+    Returns:
+        pd.DataFrame: Number of articles, error and parse failure rates, latency percentiles and token usage per model.
+    """
+    if results_df.empty:
+        return pd.DataFrame()
+
+    grouped = results_df.groupby(["solution", "model"], sort=False)
+    summary = pd.DataFrame({
+        "articles": grouped.size(),
+        "error_rate": grouped["status"].apply(lambda s: (s == "error").mean()),
+        "parse_failure_rate": grouped["status"].apply(lambda s: (s == "parse_failed").mean()),
+    })
+    if "latency" in results_df.columns:
+        summary["latency_p50"] = grouped["latency"].quantile(0.5)
+        summary["latency_p95"] = grouped["latency"].quantile(0.95)
+        summary["input_tokens"] = grouped["input_tokens"].sum()
+        summary["output_tokens"] = grouped["output_tokens"].sum()
+
+    return summary.reset_index()
@@ -1,17 +1,59 @@
 # nlp_flex.py
 
+import os
 import configparser
 import argparse
 import logging
 
-from content_extractor import ContentExtractor
+from content_extractor import ContentExtractor, OUTPUT_FOLDER_PATH, CASCADE_MIN_CONFIDENCE
+from distributed import enqueue_data, run_worker, collect_results, BATCH_SIZE
+from work_queue import VISIBILITY_TIMEOUT
+from seen_index import SeenIndex, DEFERRED
+from sharding import shard_output_path, is_shard_done, mark_shard_done, merge_shards, check_shard
+from model_comparison import parse_model_specs, compare_models, summarise_comparison
+from llm_backends import make_backend
+from pipeline import StagedPipeline
+from service import ExtractionService, serve, HOST, PORT, BATCH_SIZE as SERVICE_BATCH_SIZE, BATCH_DELAY, RESULT_TTL
+from priority import prioritise, HIGH_SIGNAL_DOMAINS, RECENCY_HALF_LIFE
+from triage import triage_alerts, load_model, alert_text, FETCH_THRESHOLD, DROP_THRESHOLD, DEFER, DROP
+from language_id import route_languages, route_language, routed_rows, check_unsupported, ROUTING_COLUMNS, MIN_CONFIDENCE, SKIPPED
+from gazetteer import Gazetteer
+from event_aggregation import aggregate_events, EVENT_INDEX, EVENTS_FILENAME
+from result_stats import ResultStats, STATS_STORE
+from utils import configure_logging
+from run_control import RunControl, parse_duration, GRACE_PERIOD
+from cost_estimate import (estimate_run, model_statistics, read_reports, article_sample, parse_prices,
+                           format_duration, RUN_REPORTS, EXTRACTED_REPORTS)
+import pandas as pd
 
-def nlp_flex(config_file_path):
+ROLES = {'standalone', 'coordinator', 'worker', 'collect', 'service', 'merge'}
+
+# Prefix of the output files of every mode, for the output files of the shards when no output file is set
+OUTPUT_PREFIXES = {'extractor': 'extracted_url_content', 'nlp': 'nlp_results', 'all': 'nlp_results',
+                   'compare': 'nlp_models_comparison_long'}
+
+def nlp_flex(config_file_path, role='standalone', queue_uri=None, wait=False, time_budget=None, grace_period=None,
+             dry_run=False, shard=None, num_shards=None):
     """
     Perform URL ontent extraction based on the specified mode in the configuration file.
 
     Parameters:
         config_file_path (str): The path to the configuration file.
+        role (str): 'standalone' to process the input in this process, 'service' to process the alerts submitted
+            to the local HTTP API, 'merge' to combine the outputs of the shards, or the role in the distributed
+            mode: 'coordinator' to add the input to the work queue, 'worker' to process tasks of the work queue,
+            'collect' to save the results of the work queue.
+        queue_uri (str): Work queue URI. Defaults to the 'uri' option of the [Queue] section.
+        wait (bool): Whether workers wait for new tasks when the queue is finished.
+        time_budget (str): Maximum duration of the run, e.g. '3600', '90m' or '2h'. Defaults to the 'time_budget'
+            option of the [General] section, or no limit.
+        grace_period (str): Time left to the work in progress once the run is stopping. Defaults to the
+            'grace_period' option of the [General] section, or 60 seconds.
+        dry_run (bool): Whether to only estimate the calls, tokens, cost and wall time of the run, without
+            calling the models.
+        shard (int): Shard to process, from 0 to num_shards - 1. Defaults to all the shards, one after the other.
+        num_shards (int): Number of shards of the input. Defaults to the 'num_shards' option of the [Sharding]
+            section, or 1 (no sharding).
 
     Returns:
         None
@@ -20,6 +62,53 @@ def nlp_flex(config_file_path):
     config = configparser.ConfigParser()
     config.read(config_file_path)
 
+    # Optional: logs written by a single listener process, as JSON lines, with a sample of the per-URL messages
+    listener = configure_logging(use_queue=config.getboolean('Logging', 'queue', fallback=False),
+                                 json_lines=config.getboolean('Logging', 'json_lines', fallback=False),
+                                 url_sample_rate=config.getfloat('Logging', 'url_sample_rate', fallback=1.0))
+    # Ctrl+C, SIGTERM and the end of the time budget stop dispatching new work, and the completed rows are saved
+    time_budget = parse_duration(time_budget or config.get('General', 'time_budget', fallback=None))
+    grace_period = parse_duration(grace_period or config.get('General', 'grace_period', fallback=None))
+    control = RunControl(time_budget, GRACE_PERIOD if grace_period is None else grace_period)
+    control.install_signal_handlers()
+
+    # Optional sharding: the input is split by canonical URL into shards processed independently
+    num_shards = num_shards or config.getint('Sharding', 'num_shards', fallback=1)
+    if shard is not None:
+        check_shard(shard, num_shards)
+    try:
+        if num_shards > 1 and role == 'standalone' and not dry_run:
+            # A single shard (e.g. one per machine), or all the shards one after the other in this process
+            for current_shard in ([shard] if shard is not None else range(num_shards)):
+                if control.stopped:
+                    break
+                run(config, role=role, control=control, shard=current_shard, num_shards=num_shards)
+        else:
+            run(config, role=role, queue_uri=queue_uri, wait=wait, control=control, dry_run=dry_run, num_shards=num_shards)
+    finally:
+        control.restore_signal_handlers()
+        if listener is not None:
+            listener.stop()
+
+def run(config, role='standalone', queue_uri=None, wait=False, control=None, dry_run=False, shard=None, num_shards=1):
+    """
+    Run the configured mode.
+
+    Parameters:
+        config (configparser.ConfigParser): The configuration.
+        role (str): 'standalone', 'service' or the role in the distributed mode.
+        queue_uri (str): Work queue URI.
+        wait (bool): Whether workers wait for new tasks when the queue is finished.
+        control (RunControl): Time budget and stop requests of the run.
+        dry_run (bool): Whether to only estimate the cost of the run.
+        shard (int): Shard of the input to process. Defaults to None, for the whole input.
+        num_shards (int): Number of shards of the input. Defaults to 1.
+
+    Returns:
+        None
+    """
+    control = control or RunControl()
+
     # Get configuration options
     input_filename = config.get('General', 'input_filename')
     output_filename = config.get('General', 'output_filename')
@@ -28,53 +117,511 @@ def nlp_flex(config_file_path):
     num_processes = config.getint('General', 'num_processes')
     url_col_name = config.get('General', 'url_col_name')
     pub_date_col_name = config.get('General', 'pub_date_col_name')
+    request_timeout = config.getfloat('NLP', 'request_timeout', fallback=300)
+    # Optional: number of URLs per chunk, to extract the content with bounded memory
+    chunk_size = config.getint('General', 'chunk_size', fallback=0)
+
+    # Optional HTTP transport settings of the page downloads (HTTP/2, connection pools, DNS cache, ...)
+    transport_options = dict(config.items('HTTP')) if config.has_section('HTTP') else {}
+
+    # Optional statistics database, updated as the results rows are written
+    stats_store = config.get('Stats', 'store', fallback=STATS_STORE) if config.has_section('Stats') else None
+
+    # Optional language routing: the content keeps the characters of every script until its language is known
+    keep_characters = config.getboolean('Languages', 'enabled', fallback=False)
+
+    if role not in ROLES:
+        logging.error("The provided role is not recognized.")
+        exit(0)
     
-    if mode in {'nlp', 'all'}:
+    # Only the workers of the distributed mode call the models
+    if mode in {'nlp', 'all', 'compare'} and role in {'standalone', 'worker', 'service'}:
         solution = config.get('NLP', 'solution')
         model = config.get('NLP', 'model')
         temp = config.getfloat('NLP', 'temp')
         max_tokens = config.getint('NLP', 'max_tokens') 
+
+        # Optional model cascade: comma-separated models, from the cheapest to the most capable one
+        cascade_models = config.get('NLP', 'cascade_models', fallback='')
+        cascade_models = [m.strip() for m in cascade_models.split(',') if m.strip()]
+        cascade_min_confidence = config.getfloat('NLP', 'cascade_min_confidence', fallback=CASCADE_MIN_CONFIDENCE)
+
+        # Optional structured output: answers as tool calls, and follow-up questions for the invalid answers only
+        structured_output = config.getboolean('NLP', 'structured_output', fallback=False)
+        max_reasks = config.getint('NLP', 'max_reasks', fallback=1)
         
+        # Optional backend settings (concurrency, rate limit, server URL, ...) in the section named after the solution
+        backend_options = dict(config.items(solution)) if config.has_section(solution) else {}
+
+        # Optional gazetteer index: locations normalised offline, and the country derived instead of asked
+        gazetteer_index = config.get('Gazetteer', 'index', fallback=None)
+        gazetteer = Gazetteer(gazetteer_index) if gazetteer_index else None
+        ask_country = config.getboolean('Gazetteer', 'ask_country', fallback=True)
+
+        # Optional text profile of the content sent to the models: 'compact' saves prompt tokens
+        text_profile = config.get('Normalisation', 'profile', fallback='default')
+
+        # Optional language routing: the articles in the other languages can be sent to the multilingual prompt
+        multilingual_prompt = (keep_characters
+                               and config.get('Languages', 'unsupported', fallback='skip') == 'multilingual')
+
         # Initialize ContentExtractor
-        extractor = ContentExtractor(solution, model, temp, max_tokens)
+        if dry_run:
+            # The dry run builds the prompts but doesn't check the credentials: no network call is made
+            extractor = ContentExtractor(solution="", model=model, temp=temp, max_tokens=max_tokens, cascade_models=cascade_models,
+                                         gazetteer=gazetteer, ask_country=ask_country, text_profile=text_profile,
+                                         structured_output=structured_output, max_reasks=max_reasks,
+                                         transport_options=transport_options, multilingual_prompt=multilingual_prompt,
+                                         keep_characters=keep_characters)
+        else:
+            extractor = ContentExtractor(solution, model, temp, max_tokens,
+                                         cascade_models=cascade_models, cascade_min_confidence=cascade_min_confidence,
+                                         backend_options=backend_options, gazetteer=gazetteer, ask_country=ask_country,
+                                         text_profile=text_profile,
+                                         structured_output=structured_output, max_reasks=max_reasks,
+                                         transport_options=transport_options, multilingual_prompt=multilingual_prompt,
+                                         stats_store=stats_store, keep_characters=keep_characters)
     
-    elif mode == 'extractor': extractor = ContentExtractor(solution = "")
+    elif mode in {'extractor', 'nlp', 'all', 'compare'}:
+        extractor = ContentExtractor(solution = "", transport_options=transport_options, keep_characters=keep_characters)
     
     else:
         logging.error("The provided mode is not recognized.")
         exit(0)
+
+    if mode == 'compare' and role != 'standalone':
+        logging.error("The compare mode only supports standalone runs.")
+        exit(0)
+
+    if dry_run and role != 'standalone':
+        logging.error("The dry run is only available for standalone runs.")
+        exit(0)
+
+    if role == 'service':
+        # Service mode: the extractor and the pools stay warm, and the alerts are submitted over a local HTTP API
+        service = ExtractionService(extractor,
+                                    fetch_concurrency=config.getint('Executors', 'fetch_concurrency', fallback=0) or None,
+                                    parse_workers=config.getint('Executors', 'parse_workers', fallback=0) or None,
+                                    llm_concurrency=config.getint('Executors', 'llm_concurrency', fallback=0) or None,
+                                    max_batch_size=config.getint('Service', 'batch_size', fallback=SERVICE_BATCH_SIZE),
+                                    max_delay=config.getfloat('Service', 'batch_delay', fallback=BATCH_DELAY),
+                                    timeout=request_timeout,
+                                    result_ttl=config.getfloat('Service', 'result_ttl', fallback=RESULT_TTL))
+        serve(service, host=config.get('Service', 'host', fallback=HOST), port=config.getint('Service', 'port', fallback=PORT),
+              control=control)
+        return
+
+    if role == 'merge':
+        # The outputs of the shards are combined into the output file of the run, without duplicates
+        merge_shards(output_filename or os.path.join(OUTPUT_FOLDER_PATH, f"{OUTPUT_PREFIXES[mode]}.csv"), num_shards)
+        return
+
+    if role != 'standalone':
+        # Distributed mode: the coordinator and the workers share a durable work queue
+        queue_uri = queue_uri or config.get('Queue', 'uri')
+
+        if role == 'coordinator':
+            data_df = extractor.read_data(input_filename, url_col_name=url_col_name, pub_date_col_name=pub_date_col_name)
+            data_df, _ = triage_data(config, extractor, data_df, mode)
+            data_df, _ = route_data(config, extractor, data_df, mode, 'alerts')
+            # Tasks are leased in the order they are added
+            data_df = prioritise_data(config, data_df)
+            enqueue_data(queue_uri, data_df, source=input_filename,
+                         batch_size=config.getint('Queue', 'batch_size', fallback=BATCH_SIZE))
+
+        elif role == 'worker':
+            run_worker(extractor, queue_uri, mode, num_processes=num_processes, request_timeout=request_timeout,
+                       visibility_timeout=config.getfloat('Queue', 'visibility_timeout', fallback=VISIBILITY_TIMEOUT),
+                       wait=wait, control=control)
+
+        elif role == 'collect':
+            prefix = "extracted_url_content" if mode == 'extractor' else "nlp_results"
+            results_df = collect_results(extractor, queue_uri, out_fn=output_filename, prefix=prefix)
+            if mode in {'nlp', 'all'} and stats_store:
+                # The workers don't write the results rows: they are counted once collected
+                stats = ResultStats(stats_store)
+                try:
+                    stats.add(results_df, model=config.get('NLP', 'model', fallback=None))
+                finally:
+                    stats.close()
+
+        return
     
     # Read data
-    data_df = extractor.read_data(input_filename, url_col_name=url_col_name, pub_date_col_name=pub_date_col_name)
+    incremental = config.getboolean('General', 'incremental', fallback=False)
+    if incremental:
+        # Incremental mode: only the alerts that were not processed by previous runs are read
+        seen_index = SeenIndex(config.get('General', 'seen_index', fallback='output/seen_index.db'))
+    if shard is not None:
+        # Sharded run: only the alerts of the shard are read, and the shard has its own output file
+        output_filename = shard_output_path(output_filename or os.path.join(OUTPUT_FOLDER_PATH, f"{OUTPUT_PREFIXES[mode]}.csv"),
+                                            shard, num_shards)
+        if is_shard_done(output_filename):
+            logging.info(f"Shard {shard} of {num_shards} was completed by a previous run ({output_filename}), skipped.")
+            return
+        data_df = extractor.read_shard(input_filename, shard, num_shards, url_col_name=url_col_name, pub_date_col_name=pub_date_col_name)
+        # Every shard reads all the input files: they are never marked as ingested
+        input_files = []
+        if incremental:
+            data_df = seen_index.filter_new(data_df).reset_index(drop=True)
+        if data_df.empty:
+            logging.info(f"No alerts to process in shard {shard} of {num_shards}.")
+            mark_shard_done(output_filename)
+            return
+    elif incremental:
+        data_df, input_files = extractor.read_new_data(input_filename, seen_index, url_col_name=url_col_name, pub_date_col_name=pub_date_col_name)
+        if data_df.empty:
+            logging.info("No new alerts to process.")
+            return
+    else:
+        data_df = extractor.read_data(input_filename, url_col_name=url_col_name, pub_date_col_name=pub_date_col_name)
+    # Optional triage: the irrelevant alerts are dropped or deferred before any request
+    data_df, triaged_df = triage_data(config, extractor, data_df, mode, save=not dry_run)
+    # Optional language routing: the alerts in an unsupported language are skipped before any request
+    data_df, routed_df = route_data(config, extractor, data_df, mode, 'alerts', save=not dry_run)
+    if data_df.empty and not dry_run:
+        logging.info("No alert to fetch after the triage and the language routing.")
+        if incremental:
+            mark_not_fetched(seen_index, triaged_df, routed_df, input_filename)
+            # Every alert of the files is recorded in the index
+            for fn in input_files:
+                seen_index.mark_file_ingested(fn)
+            seen_index.close()
+        return
+    data_df = prioritise_data(config, data_df)
+
+    if dry_run:
+        if mode == 'extractor':
+            logging.info(f"Dry run: the Extractor mode doesn't call the models, {data_df.shape[0]} URLs would be fetched.")
+        else:
+            estimate(config, extractor, data_df, mode, solution)
+        return
     
-    if mode == 'extractor':
+    if config.has_section('Executors') and mode in {'extractor', 'all'}:
+        # Stages with their own executors: fetch threads, parse processes and LLM calls, connected by queues
+        pipeline = StagedPipeline(extractor,
+                                  fetch_concurrency=config.getint('Executors', 'fetch_concurrency', fallback=0) or None,
+                                  parse_workers=config.getint('Executors', 'parse_workers', fallback=0) or None,
+                                  llm_concurrency=config.getint('Executors', 'llm_concurrency', fallback=0) or None,
+                                  timeout=request_timeout, extract_events=(mode == 'all'))
+        # The events are written to the output file as soon as they are extracted
+        events_fn = extractor.output_path(output_filename, prefix="nlp_results") if mode == 'all' else None
+        # Optional language routing of the articles, between the parse and the LLM stages
+        route_content, content_routes = content_router(config) if mode == 'all' else (None, None)
+        extracted_df, events_df = pipeline.run(data_df, control=control, events_fn=events_fn, route_content=route_content)
+        if content_routes is not None:
+            save_content_routes(config, extractor, data_df, content_routes)
+
+        if mode == 'extractor':
+            extractor.save_results(extracted_df, output_filename, prefix="extracted_url_content")
+            output_urls = extracted_df['URL']
+        else:
+            extractor.save_results(extracted_df, prefix="extracted_url_content")
+            extractor.save_results(events_df, events_fn, prefix="nlp_results")
+            output_urls = events_df.get('link', [])
+
+    elif mode == 'extractor':
         # Mode: Extractor
         # Extract content using ContentExtractor
-        extractor.extract_content(data_df, num_processes=num_processes, out_fn=output_filename)
+        if chunk_size:
+            extracted_fn = extractor.extract_content_chunks(data_df, num_processes=num_processes, out_fn=output_filename,
+                                                            chunk_size=chunk_size, control=control)
+            output_urls = extracted_urls(extracted_fn)
+        else:
+            extracted_df = extractor.extract_content(data_df, num_processes=num_processes, out_fn=output_filename, control=control)
+            output_urls = extracted_df['URL']
 
     elif mode == 'nlp':
         # Mode: NLP
         # Filter valid articles from the data
         filtered_df = extractor.filter_scraped_data(data_df)
+        # Optional language routing: the language of the articles is checked on their content
+        filtered_df, _ = route_data(config, extractor, filtered_df, mode, 'content')
 
         # Extract flood events using OpenAI
-        extractor.extract_events_chatopenai(filtered_df, num_processes=num_processes, out_fn=output_filename)
+        events_df = extractor.extract_events_chatopenai(filtered_df, timeout=request_timeout, out_fn=output_filename, control=control)
+        output_urls = events_df.get('link', [])
 
     elif mode == 'all':
         # Mode: All
         # Extract content, filter valid articles, and extract events
-        extracted_df = extractor.extract_content(data_df, num_processes=num_processes)
-        filtered_df = extractor.filter_scraped_data(extracted_df)
+        if chunk_size:
+            # Only the valid articles are read back from the extracted content file
+            extracted_fn = extractor.extract_content_chunks(data_df, num_processes=num_processes, chunk_size=chunk_size, control=control)
+            filtered_df = extractor.read_valid_articles(extracted_fn, chunk_size=chunk_size)
+        else:
+            extracted_df = extractor.extract_content(data_df, num_processes=num_processes, control=control)
+            filtered_df = extractor.filter_scraped_data(extracted_df)
+        filtered_df, _ = route_data(config, extractor, filtered_df, mode, 'content')
 
         # Extract flood events using OpenAI
-        extractor.extract_events_chatopenai(filtered_df, num_processes=num_processes, out_fn=output_filename)
+        events_df = extractor.extract_events_chatopenai(filtered_df, timeout=request_timeout, out_fn=output_filename, control=control)
+        output_urls = events_df.get('link', [])
+
+    elif mode == 'compare':
+        # Mode: Compare
+        # Run the same articles through several models at the same time
+        filtered_df = extractor.filter_scraped_data(data_df)
+        filtered_df, _ = route_data(config, extractor, filtered_df, mode, 'content')
+        model_specs = parse_model_specs([m.strip() for m in config.get('Compare', 'models').split(',') if m.strip()],
+                                        default_solution=solution)
+
+        # One backend per solution, shared by its models
+        backends = {solution: extractor.backend}
+        for model_solution, _ in model_specs:
+            if model_solution not in backends:
+                options = dict(config.items(model_solution)) if config.has_section(model_solution) else {}
+                backends[model_solution] = make_backend(model_solution, **options)
+
+        max_concurrency = config.getint('Compare', 'max_concurrency', fallback=0) or None
+        results_df = compare_models(extractor, filtered_df, model_specs, backends,
+                                    max_concurrency=max_concurrency, timeout=request_timeout, control=control)
+        extractor.save_results(results_df, out_fn=output_filename, prefix="nlp_models_comparison_long")
+        logging.info(f"Comparison summary:\n{summarise_comparison(results_df).to_string(index=False)}")
+        output_urls = results_df.get('link', [])
+
+    if mode in {'nlp', 'all'} and config.has_section('Events'):
+        # The articles of the run are attached to the flood events of the previous runs
+        aggregate_events(events_df, config.get('Events', 'index', fallback=EVENT_INDEX),
+                         config.get('Events', 'output_filename', fallback=EVENTS_FILENAME))
+
+    if incremental:
+        if control.stopped:
+            # Only the alerts with a row in the output are marked as seen: the next run processes the others
+            seen_index.mark_seen(data_df[data_df['URL'].isin(set(output_urls))], source=input_filename)
+        else:
+            # The alerts are marked as seen once they are processed, so an interrupted run processes them again
+            seen_index.mark_seen(data_df, source=input_filename)
+            # The deferred alerts are recorded with their own status (see mark_not_fetched)
+            for fn in input_files:
+                seen_index.mark_file_ingested(fn)
+        mark_not_fetched(seen_index, triaged_df, routed_df, input_filename)
+        seen_index.close()
+
+    if shard is not None and not control.stopped:
+        # The next runs skip the completed shard
+        mark_shard_done(output_filename)
+
+    if control.stopped:
+        logging.warning(f"The run stopped before the end of its input ({control.stop_reason}), the completed rows were saved.")
+
+def triage_data(config, extractor, data_df, mode, save=True):
+    """
+    Triage the alerts from their title and snippet if the [Triage] section enables it, before any page is fetched.
+
+    Parameters:
+        config (configparser.ConfigParser): The configuration.
+        extractor (ContentExtractor): Content extractor, to save the decisions.
+        data_df (pd.DataFrame): Input data.
+        mode (str): Mode of the run: only the modes that fetch the pages are triaged.
+        save (bool): Whether to save the decisions and the scores of the triage.
+
+    Returns:
+        tuple: Alerts to fetch, and all the alerts with their triage decisions (None without triage).
+    """
+    if not config.getboolean('Triage', 'enabled', fallback=False) or mode not in {'extractor', 'all'}:
+        return data_df, None
+
+    model_fn = config.get('Triage', 'model', fallback=None)
+    fetch_df, triaged_df = triage_alerts(data_df, model=load_model(model_fn) if model_fn else None,
+                                         fetch_threshold=config.getfloat('Triage', 'fetch_threshold', fallback=FETCH_THRESHOLD),
+                                         drop_threshold=config.getfloat('Triage', 'drop_threshold', fallback=DROP_THRESHOLD))
+    if save:
+        extractor.save_results(triaged_df, config.get('Triage', 'decisions_filename', fallback=None), prefix="triage_decisions")
+    return fetch_df, triaged_df
+
+def route_data(config, extractor, data_df, mode, stage, save=True):
+    """
+    Identify the language of the alerts or of the articles if the [Languages] section enables it, and route the rows
+    in a language without its own prompt: they are skipped, or sent to the multilingual prompt.
+
+    Args:
+        config (ConfigParser): Configuration options.
+        extractor (ContentExtractor): Content extractor, to save the routes.
+        data_df (pd.DataFrame): Alerts or articles.
+        mode (str): Mode of the run.
+        stage (str): 'alerts' before the pages are fetched, from the title and the snippet (only the modes that
+            fetch the pages), or 'content' before the articles are sent to the models, from their content.
+        save (bool): Whether to save the route of every row.
+
+    Returns:
+        tuple: Rows to process, and all the rows with their language route (None without routing).
+    """
+    if not config.getboolean('Languages', 'enabled', fallback=False) or data_df.empty:
+        return data_df, None
+    if stage == 'alerts' and mode not in {'extractor', 'all'}:
+        return data_df, None
+
+    texts = alert_text(data_df) if stage == 'alerts' else data_df['New_Content']
+    data_df, routed_df = route_languages(data_df, texts, unsupported=config.get('Languages', 'unsupported', fallback='skip'),
+                                         min_confidence=config.getfloat('Languages', 'min_confidence', fallback=MIN_CONFIDENCE))
+    if stage == 'content':
+        # The characters of the other scripts are only kept for the multilingual prompt
+        data_df = extractor.filter_content(data_df)
+    if save:
+        extractor.save_results(routed_df[[col for col in ROUTING_COLUMNS if col in routed_df.columns]],
+                               config.get('Languages', f'{stage}_filename', fallback=None), prefix=f"language_routing_{stage}")
+    return data_df, routed_df
+
+def content_router(config):
+    """
+    Return the callback that routes the articles of the staged pipeline by the language of their content, between
+    the parse and the LLM stages, if the [Languages] section enables it (see route_data).
+
+    Parameters:
+        config (configparser.ConfigParser): The configuration.
+
+    Returns:
+        tuple: Callback called with the index, the content and the language of every valid article, which returns
+            the language of the article or None to skip it, and the list of the routes it fills, as (index,
+            declared language, route) tuples. (None, None) without routing.
+    """
+    if not config.getboolean('Languages', 'enabled', fallback=False):
+        return None, None
+
+    unsupported = config.get('Languages', 'unsupported', fallback='skip')
+    check_unsupported(unsupported)
+    min_confidence = config.getfloat('Languages', 'min_confidence', fallback=MIN_CONFIDENCE)
+    routes = []
+
+    def route_content(index, content, language):
+        route = route_language(content, language, unsupported, min_confidence)
+        routes.append((index, language, route))
+        return None if route[3] == SKIPPED else route[0]
+
+    return route_content, routes
+
+def save_content_routes(config, extractor, data_df, routes):
+    """
+    Save the routes of the articles of the staged pipeline (see content_router), in the order of the input.
+
+    Parameters:
+        config (configparser.ConfigParser): The configuration.
+        extractor (ContentExtractor): Content extractor, to save the routes.
+        data_df (pd.DataFrame): Input data of the pipeline.
+        routes (list): (index, declared language, route) tuples of the routed articles.
+
+    Returns:
+        pd.DataFrame: Routed articles with their language route.
+    """
+    routes = sorted(routes, key=lambda route: route[0])
+    routed_df = routed_rows(data_df.iloc[[index for index, _, _ in routes]],
+                            [language for _, language, _ in routes], [route for _, _, route in routes])
+    extractor.save_results(routed_df[[col for col in ROUTING_COLUMNS if col in routed_df.columns]],
+                           config.get('Languages', 'content_filename', fallback=None), prefix="language_routing_content")
+    return routed_df
+
+def mark_not_fetched(seen_index, triaged_df, routed_df, source):
+    """Marks as seen the alerts that are never fetched: dropped by the triage, or in a skipped language. The alerts
+    deferred by the triage are recorded as deferred, so that they are not triaged again by every run."""
+    if triaged_df is not None:
+        seen_index.mark_seen(triaged_df[triaged_df['triage_decision'] == DROP], source=source)
+        seen_index.mark_seen(triaged_df[triaged_df['triage_decision'] == DEFER], source=source, status=DEFERRED)
+    if routed_df is not None:
+        seen_index.mark_seen(routed_df[routed_df['language_route'] == SKIPPED], source=source)
+
+def prioritise_data(config, data_df):
+    """
+    Sort the alerts by priority if the [Priority] section enables it, so that the likely flood events come first.
+
+    Parameters:
+        config (configparser.ConfigParser): The configuration.
+        data_df (pd.DataFrame): Input data.
+
+    Returns:
+        pd.DataFrame: Input data, sorted by priority if enabled.
+    """
+    if not config.getboolean('Priority', 'enabled', fallback=False):
+        return data_df
+
+    domains = config.get('Priority', 'domains', fallback=None)
+    domains = tuple(d.strip().lower() for d in domains.split(',') if d.strip()) if domains is not None else HIGH_SIGNAL_DOMAINS
+    return prioritise(data_df, domains=domains,
+                      half_life=config.getfloat('Priority', 'half_life_days', fallback=RECENCY_HALF_LIFE))
+
+def estimate(config, extractor, data_df, mode, solution):
+    """
+    Log the estimated calls, tokens, cost and wall time of every model of the run, without calling the models.
+
+    Parameters:
+        config (configparser.ConfigParser): The configuration.
+        extractor (ContentExtractor): Content extractor, for the prompts.
+        data_df (pd.DataFrame): Input data.
+        mode (str): 'nlp', 'all' or 'compare'.
+        solution (str): Solution of the configured model.
+
+    Returns:
+        pd.DataFrame: Estimate per model.
+    """
+    if mode == 'compare':
+        model_specs = parse_model_specs([m.strip() for m in config.get('Compare', 'models').split(',') if m.strip()],
+                                        default_solution=solution)
+        max_concurrency = config.getint('Compare', 'max_concurrency', fallback=0) or None
+    else:
+        # Every article reaches the next model of a cascade at worst
+        model_specs = [(solution, model) for model in extractor.models]
+        max_concurrency = config.getint('Executors', 'llm_concurrency', fallback=0) or None
+
+    # Backends are only created for their prompt layout, concurrency and rate limit
+    backends = {}
+    for model_solution, _ in model_specs:
+        if model_solution not in backends:
+            options = dict(config.items(model_solution)) if config.has_section(model_solution) else {}
+            backends[model_solution] = make_backend(model_solution, **options)
+
+    if mode == 'all':
+        # The content isn't extracted yet: the prompts and the share of valid articles come from previous runs
+        pattern = config.get('DryRun', 'extracted_reports', fallback=EXTRACTED_REPORTS)
+        articles_df, valid_share = article_sample(read_reports(pattern, ['Language', 'New_Content', 'Is_Article']))
+        if valid_share is None:
+            logging.error(f"No extracted content file matches '{pattern}'. Run the Extractor mode on a sample of the URLs first.")
+            return pd.DataFrame()
+        num_calls = round(data_df.shape[0] * valid_share)
+    else:
+        articles_df = extractor.filter_scraped_data(data_df)
+        num_calls = None
+
+    stats = model_statistics(read_reports(config.get('DryRun', 'reports', fallback=RUN_REPORTS),
+                                          ['model', 'status', 'latency', 'output_tokens']))
+    prices = parse_prices(config.items('Pricing') if config.has_section('Pricing') else [])
+
+    estimate_df = estimate_run(extractor, articles_df, model_specs, backends, num_calls=num_calls, stats=stats,
+                               prices=prices, max_concurrency=max_concurrency)
+    if not estimate_df.empty:
+        logging.info(f"Dry run estimate:\n{estimate_df.to_string(index=False)}")
+        logging.info(f"Estimated cost: {estimate_df['cost_usd'].iloc[-1]:.4f} USD, "
+                     f"wall time: {format_duration(estimate_df['wall_time_s'].iloc[-1])}")
+    return estimate_df
+
+def extracted_urls(fn):
+    """Returns the URLs of an extracted content file, or no URL if the file wasn't created."""
+    try:
+        return pd.read_csv(fn, sep='|', usecols=['URL'])['URL']
+    except FileNotFoundError:
+        return []
          
 if __name__ == "__main__":
     # Define command-line arguments
     parser = argparse.ArgumentParser(description="NLP FLood EXtraction Tool")
     parser.add_argument("--config", required=True, help="the path to the configuration file")
+    parser.add_argument("--role", default="standalone", choices=sorted(ROLES),
+                        help="standalone run, service, or role in the distributed mode (default: standalone)")
+    parser.add_argument("--queue", default=None, help="the work queue URI, e.g. sqlite:///output/queue.db (default: [Queue] uri)")
+    parser.add_argument("--wait", action="store_true", help="workers keep waiting for new tasks when the queue is finished")
+    parser.add_argument("--time-budget", default=None,
+                        help="maximum duration of the run, e.g. 3600, 90m or 2h: the completed rows are saved (default: [General] time_budget)")
+    parser.add_argument("--grace-period", default=None,
+                        help="time left to the work in progress once the run is stopping (default: [General] grace_period or 60s)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="estimate the calls, tokens, cost and wall time of the run per model, without calling the models")
+    parser.add_argument("--shard", type=int, default=None,
+                        help="shard of the input to process, from 0 to the number of shards - 1 (default: all the shards, one after the other)")
+    parser.add_argument("--num-shards", type=int, default=None,
+                        help="number of shards of the input, by canonical URL (default: [Sharding] num_shards or 1)")
     
     # Parse command-line arguments
     args = parser.parse_args()
     
-    nlp_flex(args.config)
+    nlp_flex(args.config, role=args.role, queue_uri=args.queue, wait=args.wait,
+             time_budget=args.time_budget, grace_period=args.grace_period, dry_run=args.dry_run,
+             shard=args.shard, num_shards=args.num_shards)
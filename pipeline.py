@@ -0,0 +1,326 @@
+# pipeline.py
+
+import os
+import math
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+
+from llm_dispatcher import DEFAULT_TIMEOUT
+from utils import worker_initializer, ResultWriter
+from run_control import RunControl, CHECK_INTERVAL
+from schema import apply_schema, ARTICLE_SCHEMA, RESULT_SCHEMA
+from result_stats import ResultStats
+
+logger = logging.getLogger(__name__)
+
+# Default number of pages downloaded at the same time: downloads wait on the network, not on the CPU
+FETCH_CONCURRENCY = 32
+
+# Typical duration of an LLM call in seconds, to derive the number of calls in flight allowed by a rate limit
+LLM_CALL_SECONDS = 10
+
+class FetchedPage:
+    """Downloaded page sent to the parse workers.
+
+    It has the 'content' and 'text' attributes of a requests.Response, without the connection and the headers,
+    and the text is only decoded by the parse worker that needs it.
+    """
+
+    def __init__(self, content, encoding=None):
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+def default_executor_settings(backend=None):
+    """Returns the default parallelism of every stage.
+
+    Args:
+        backend (LLMBackend, optional): Backend of the LLM stage. Defaults to None, without LLM stage.
+
+    Returns:
+        dict: fetch_concurrency (threads downloading pages), parse_workers (processes parsing pages, one per core)
+            and llm_concurrency (calls in flight, within the connection pool and the rate limit of the backend).
+    """
+    settings = {"fetch_concurrency": FETCH_CONCURRENCY, "parse_workers": os.cpu_count() or 1, "llm_concurrency": None}
+
+    if backend is not None:
+        llm_concurrency = backend.max_concurrency
+        if backend.requests_per_minute:
+            # More calls in flight than the rate limit allows would only wait for their turn
+            llm_concurrency = min(llm_concurrency, math.ceil(backend.requests_per_minute / 60 * LLM_CALL_SECONDS))
+        settings["llm_concurrency"] = max(1, llm_concurrency)
+
+    return settings
+
+# Content extractor of a parse worker process, set once when the process starts
+_parse_extractor = None
+
+def _init_parse_worker(extractor, initializer, initargs):
+    global _parse_extractor
+    _parse_extractor = extractor
+    initializer(*initargs)
+
+def _parse_page(url, page, language):
+    return _parse_extractor.parse_response(url, page, language)
+
+def _parse_pages(items):
+    # A batch of pages is parsed in a single task, with a single round trip to the process
+    return [_parse_extractor.parse_response(url, page, language) for url, page, language in items]
+
+def fetch_page(extractor, url):
+    """Downloads a page, in a fetch thread.
+
+    Args:
+        extractor (ContentExtractor): Content extractor, with the transport of the process.
+        url (str): URL of the page.
+
+    Returns:
+        FetchedPage: Downloaded page, or None if the request failed.
+    """
+    try:
+        response = extractor.make_request(url)
+        return FetchedPage(response.content, response.encoding)
+    except Exception as e:
+        logger.error(f"An error occurred during the request: {str(e)}")
+        return None
+
+def make_pools(extractor, fetch_concurrency, parse_workers):
+    """Creates the executors of the fetch and parse stages.
+
+    Args:
+        extractor (ContentExtractor): Content extractor, sent to every parse process.
+        fetch_concurrency (int): Number of fetch threads.
+        parse_workers (int): Number of parse processes.
+
+    Returns:
+        tuple: Thread pool of the downloads, and process pool of the parsing.
+    """
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_concurrency)
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers, initializer=_init_parse_worker,
+                                     initargs=(extractor, *worker_initializer()))
+    return fetch_pool, parse_pool
+
+async def close_pools(fetch_pool, parse_pool, wait=True, backend=None):
+    """Stops the executors of the fetch and parse stages, and closes the connections of the LLM backend.
+
+    Args:
+        fetch_pool (ThreadPoolExecutor): Thread pool of the downloads; the downloads in progress are not waited for.
+        parse_pool (ProcessPoolExecutor): Process pool of the parsing.
+        wait (bool, optional): Whether to wait for the pages being parsed. Defaults to True.
+        backend (LLMBackend, optional): Backend of the LLM stage. Defaults to None, without LLM stage.
+    """
+    fetch_pool.shutdown(wait=False, cancel_futures=True)
+    parse_pool.shutdown(wait=wait, cancel_futures=True)
+    if backend is not None:
+        # Close the connection pool while the event loop is still running
+        await backend.aclose()
+
+class StagedPipeline:
+    """Fetch, parse and LLM stages, each with its own executor, connected by bounded queues.
+
+    Pages are downloaded by a pool of threads, parsed by a pool of processes and the valid articles are sent
+    to the LLM backend from the event loop, so that every stage runs at its own parallelism. The bounded
+    queues between the stages hold back a fast stage when the next one can't keep up.
+    """
+
+    def __init__(self, extractor, fetch_concurrency=None, parse_workers=None, llm_concurrency=None,
+                 timeout=DEFAULT_TIMEOUT, extract_events=True):
+        """
+        Args:
+            extractor (ContentExtractor): Content extractor.
+            fetch_concurrency (int, optional): Number of pages downloaded at the same time. Defaults to 32.
+            parse_workers (int, optional): Number of parse processes. Defaults to the number of cores.
+            llm_concurrency (int, optional): Number of LLM calls in flight. Defaults to the concurrency of the backend,
+                lowered to its rate limit.
+            timeout (float, optional): Maximum duration of the extraction of a single event in seconds. Defaults to 300.
+            extract_events (bool, optional): Whether to run the LLM stage. Defaults to True.
+        """
+        self.extractor = extractor
+        self.extract_events = extract_events and extractor.backend is not None
+        self.timeout = timeout
+
+        defaults = default_executor_settings(extractor.backend if self.extract_events else None)
+        self.fetch_concurrency = fetch_concurrency or defaults["fetch_concurrency"]
+        self.parse_workers = parse_workers or defaults["parse_workers"]
+        self.llm_concurrency = llm_concurrency or defaults["llm_concurrency"]
+
+    def run(self, df, control=None, events_fn=None, route_content=None):
+        """Runs the stages over the dataframe.
+
+        The URLs are fetched in the order of the dataframe, and every article goes to the next stage as soon
+        as it's ready.
+
+        Args:
+            df (pd.DataFrame): Dataframe containing URLs.
+            control (RunControl, optional): Time budget and stop requests of the run. When the run is stopping,
+                no new URL is fetched, and the work in progress has until the end of the grace period to finish.
+            events_fn (str, optional): File the events are written to as soon as they are extracted, in their
+                order of completion. Defaults to None.
+            route_content (function, optional): Called between the parse and the LLM stages with the index, the
+                content and the language of every valid article. Returns the language the article is sent to the
+                models with, or None to leave it out of the LLM stage. Defaults to None.
+
+        Returns:
+            tuple: Dataframe with extracted content, and dataframe with extracted information of the valid articles
+                (empty without LLM stage), both in the order of the input dataframe. If the run is stopped,
+                only the URLs whose processing was completed.
+        """
+        logger.info(f"Stages: {self.fetch_concurrency} fetch threads, {self.parse_workers} parse processes, "
+                    f"{self.llm_concurrency or 0} LLM calls in flight")
+        control = control or RunControl()
+        extracted, events = [None] * df.shape[0], [None] * df.shape[0]
+        # The counts of the statistics database follow the events written to the file
+        stats = ResultStats(self.extractor.stats_store) if events_fn and self.extract_events and self.extractor.stats_store else None
+        try:
+            asyncio.run(self.arun(df, extracted, events, control, ResultWriter(events_fn) if events_fn else None, stats,
+                                  route_content))
+        except KeyboardInterrupt:
+            logger.error('Got ^C while running the stages, only the completed URLs are kept')
+        finally:
+            if stats is not None:
+                stats.close()
+
+        # The pages are downloaded by the threads of this process, over the connections of its transport
+        logger.info(f"Downloads: {self.extractor.transport.stats.summary()}")
+
+        # URLs that were not processed before the run stopped are left out
+        completed = [i for i, result in enumerate(extracted) if result is not None]
+        if len(completed) < df.shape[0]:
+            logger.warning(f"{len(completed)} of {df.shape[0]} URLs processed")
+
+        extracted_df = df.iloc[completed].copy()
+        extracted_df['Summary'], extracted_df['New_Content'], extracted_df['Is_Article'] = \
+            zip(*[extracted[i] for i in completed]) if completed else ([], [], [])
+
+        events = [e for e in events if isinstance(e, pd.DataFrame)]
+        events_df = pd.concat(events, axis=0) if events else pd.DataFrame()
+
+        return apply_schema(extracted_df, ARTICLE_SCHEMA), apply_schema(events_df, RESULT_SCHEMA)
+
+    async def arun(self, df, extracted, events, control, writer=None, stats=None, route_content=None):
+        loop = asyncio.get_running_loop()
+
+        # Bounded queues: a stage waits when the next one is busy, so pages don't pile up in memory
+        fetch_queue = asyncio.Queue(self.fetch_concurrency)
+        parse_queue = asyncio.Queue(2 * self.parse_workers)
+        llm_queue = asyncio.Queue(2 * self.llm_concurrency) if self.extract_events else None
+
+        fetch_pool, parse_pool = make_pools(self.extractor, self.fetch_concurrency, self.parse_workers)
+
+        async def fetch_worker():
+            while True:
+                item = await fetch_queue.get()
+                if item is None:
+                    return
+
+                i, url, language, publish_date = item
+                page = await loop.run_in_executor(fetch_pool, fetch_page, self.extractor, url)
+                if page is None:
+                    extracted[i] = ('', '', -1)
+                else:
+                    await parse_queue.put((i, url, language, publish_date, page))
+
+        async def parse_worker():
+            while True:
+                item = await parse_queue.get()
+                if item is None:
+                    return
+
+                i, url, language, publish_date, page = item
+                try:
+                    extracted[i] = await loop.run_in_executor(parse_pool, _parse_page, url, page, language)
+                except Exception as e:
+                    logger.error(f"An error occurred during content extraction of {url}: {str(e)}")
+                    extracted[i] = ('', '', -1)
+                    continue
+
+                routed = language
+                if llm_queue is not None and extracted[i][2] == 1 and route_content is not None:
+                    # The language of the article is checked on its content, and the skipped ones don't go to the models
+                    routed = route_content(i, extracted[i][1], language)
+
+                # The characters of the other scripts are only kept for the multilingual prompt
+                summary, content, is_valid = extracted[i]
+                if llm_queue is not None:
+                    extracted[i] = (self.extractor.filter_text(summary, routed or language),
+                                    self.extractor.filter_text(content, routed or language), is_valid)
+
+                if llm_queue is not None and is_valid == 1 and routed is not None:
+                    await llm_queue.put((i, url, routed, publish_date))
+
+        async def llm_worker():
+            while True:
+                item = await llm_queue.get()
+                if item is None:
+                    return
+
+                i, url, language, publish_date = item
+                try:
+                    events[i] = await asyncio.wait_for(
+                        self.extractor.aextract_single_event(
+                            self.extractor.compact_text(extracted[i][1], language), url, language, publish_date), self.timeout)
+                except asyncio.TimeoutError:
+                    logger.error(f"Extraction of {url} timed out after {self.timeout} seconds")
+                    continue
+
+                # The event is kept in the results even if it can't be written or counted
+                if writer is not None and isinstance(events[i], pd.DataFrame):
+                    try:
+                        writer.write(events[i])
+                    except OSError as e:
+                        logger.error(f"An error occurred while writing the event of {url}: {str(e)}")
+                if stats is not None and isinstance(events[i], pd.DataFrame):
+                    try:
+                        stats.add(events[i], model=self.extractor.model)
+                    except sqlite3.Error as e:
+                        logger.error(f"An error occurred while counting the event of {url}: {str(e)}")
+
+        async def run_stage(worker, num_workers, next_queue=None, num_next_workers=0):
+            await asyncio.gather(*(worker() for _ in range(num_workers)))
+            # Every worker of the next stage stops at its own end marker
+            for _ in range(num_next_workers):
+                await next_queue.put(None)
+
+        async def feed():
+            rows = zip(df['URL'], df['Language'], df['PublishedDate'] if 'PublishedDate' in df.columns else [None] * df.shape[0])
+            for i, (url, language, publish_date) in enumerate(rows):
+                # No new URL is fetched once the run is stopping
+                if control.should_stop():
+                    break
+                await fetch_queue.put((i, url, language, publish_date))
+            for _ in range(self.fetch_concurrency):
+                await fetch_queue.put(None)
+
+        stages = [
+            feed(),
+            run_stage(fetch_worker, self.fetch_concurrency, parse_queue, self.parse_workers),
+            run_stage(parse_worker, self.parse_workers, llm_queue, self.llm_concurrency if llm_queue is not None else 0),
+        ]
+        if llm_queue is not None:
+            stages.append(run_stage(llm_worker, self.llm_concurrency))
+
+        async def monitor(stages_task):
+            # The stages drain their queues once the feed stops, and are cancelled at the end of the grace period
+            while not control.should_stop():
+                await asyncio.sleep(CHECK_INTERVAL)
+            await asyncio.sleep(control.grace_remaining())
+            logger.error("Grace period expired, the work in progress is abandoned")
+            stages_task.cancel()
+
+        stages_task = asyncio.ensure_future(asyncio.gather(*stages))
+        monitor_task = asyncio.create_task(monitor(stages_task))
+        try:
+            await stages_task
+        except asyncio.CancelledError:
+            if not control.grace_expired():
+                raise
+        finally:
+            monitor_task.cancel()
+            await close_pools(fetch_pool, parse_pool, wait=not control.grace_expired(),
+                              backend=self.extractor.backend if self.extract_events else None)
@@ -0,0 +1,108 @@
+# priority.py
+
+import re
+import html
+import logging
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import numpy as np
+import pandas as pd
+
+from utils import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Words of flood events, in English and French
+FLOOD_TERMS = re.compile(
+    r"\b(?:floods?|flooding|flooded|flood ?waters?|flash[- ]floods?|inondations?|inondée?s?|crues?|débordements?|"
+    r"overflow(?:ed|ing)?|submerged|storm surge|ice jams?|embâcles?|heavy rains?|pluies? (?:diluviennes|torrentielles))\b", re.IGNORECASE)
+
+# Words of the impact of an event: these articles are the most useful for situational awareness
+IMPACT_TERMS = re.compile(
+    r"\b(?:dead|deaths?|kill(?:ed|s|ing)|missing|evacuat\w*|rescued?|emergency|warning|morts?|décès|disparus?|"
+    r"évacu\w*|secours|urgence|alerte)\b", re.IGNORECASE)
+
+# Figurative uses of 'flood' ('a flood of calls') that Google Alerts reports as well, but not 'the flood of 2015'
+FIGURATIVE_TERMS = re.compile(r"\bflood(?:ed|ing|s)? (?:of|with) (?!water|\d)", re.IGNORECASE)
+
+# Outlets whose flood alerts are usually reports of actual events
+HIGH_SIGNAL_DOMAINS = ("cbc.ca", "radio-canada.ca", "ctvnews.ca", "globalnews.ca", "cp24.com", "lapresse.ca",
+                       "ledevoir.com", "tvanouvelles.ca", "theweathernetwork.com", "reuters.com", "apnews.com")
+
+# Weight of every signal in the priority score
+TITLE_WEIGHT = 3
+IMPACT_WEIGHT = 2
+CONTENT_WEIGHT = 1
+RECENCY_WEIGHT = 2
+DOMAIN_WEIGHT = 1
+
+# Age in days after which the recency signal of an article is halved
+RECENCY_HALF_LIFE = 2
+
+def text_column(df, column):
+    """Returns a text column without HTML tags and entities (Google Alerts highlight the search terms), or empty texts."""
+    if column not in df.columns:
+        return pd.Series("", index=df.index)
+    return df[column].fillna("").astype(str).str.replace(r"<[^>]+>", "", regex=True).map(html.unescape)
+
+def matches_domain(url, domains):
+    """Returns True if the host of the URL is one of the domains, or one of their subdomains."""
+    host = urlsplit(canonical_url(url)).netloc
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+def priority_scores(df, domains=HIGH_SIGNAL_DOMAINS, half_life=RECENCY_HALF_LIFE, now=None):
+    """Scores how likely every alert is to report a recent flood event, without fetching it.
+
+    The score only uses the columns of the alert: flood and impact words in the 'Title' and the 'Content'
+    snippet, the age of the 'PublishedDate' and the domain of the 'URL'. Missing columns score 0.
+
+    Args:
+        df (pd.DataFrame): Alerts.
+        domains (tuple, optional): High-signal domains. Defaults to HIGH_SIGNAL_DOMAINS.
+        half_life (float, optional): Age in days after which the recency signal is halved. Defaults to 2.
+        now (datetime, optional): Current time, in UTC. Defaults to the current time.
+
+    Returns:
+        pd.Series: Priority score of every alert, higher first.
+    """
+    title = text_column(df, "Title")
+    snippet = text_column(df, "Content")
+
+    scores = TITLE_WEIGHT * (title.str.contains(FLOOD_TERMS) & ~title.str.contains(FIGURATIVE_TERMS))
+    scores += IMPACT_WEIGHT * (title + " " + snippet).str.contains(IMPACT_TERMS)
+    scores += CONTENT_WEIGHT * snippet.str.contains(FLOOD_TERMS)
+    scores = scores.astype(float)
+
+    if "PublishedDate" in df.columns:
+        # Recent articles first: the signal is halved every half_life days
+        now = pd.Timestamp(now or datetime.now(timezone.utc))
+        published = pd.to_datetime(df["PublishedDate"], utc=True, errors="coerce")
+        age = ((now - published).dt.total_seconds() / 86400).clip(lower=0)
+        scores += (RECENCY_WEIGHT * 0.5 ** (age / half_life)).fillna(0)
+
+    if "URL" in df.columns and domains:
+        scores += DOMAIN_WEIGHT * df["URL"].map(lambda url: matches_domain(url, domains)).astype(float)
+
+    return scores
+
+def prioritise(df, domains=HIGH_SIGNAL_DOMAINS, half_life=RECENCY_HALF_LIFE, now=None):
+    """Sorts the alerts by priority, so that the likely flood events are fetched and sent to the models first.
+
+    Every stage dispatches the rows in the order of the dataframe, so the results of the most relevant
+    alerts come out first. Alerts with the same score keep their order.
+
+    Args:
+        df (pd.DataFrame): Alerts.
+        domains (tuple, optional): High-signal domains. Defaults to HIGH_SIGNAL_DOMAINS.
+        half_life (float, optional): Age in days after which the recency signal is halved. Defaults to 2.
+        now (datetime, optional): Current time, in UTC. Defaults to the current time.
+
+    Returns:
+        pd.DataFrame: Alerts sorted by decreasing priority.
+    """
+    scores = priority_scores(df, domains=domains, half_life=half_life, now=now)
+    order = np.argsort(-scores.to_numpy(), kind="stable")
+
+    if not scores.empty:
+        logger.info(f"{df.shape[0]} alerts sorted by priority, with scores from {scores.max():.2f} to {scores.min():.2f}")
+    return df.iloc[order]
@@ -0,0 +1,139 @@
+# prompts.py
+
+from functools import lru_cache
+
+# Instructions and questions, by language and prompt layout ('system' or 'user')
+PROMPT_TEXTS = {
+    ("en", "system"): {
+        "instructions": "You are a helpful assistant. You answer all the questions. Your responses consist of valid JSON syntax, with no other comments, explanations, reasoning, or dialogue that do not consist of valid JSON. Each key is the question number. You do not include the questions themselves. Each value is the corresponding answer. Each key-value pair should be enclosed in curly braces, and each key and value should be enclosed in double-quotes.",
+        "questions_label": "Questions answering:",
+        "questions": [
+            "1. Did a flood event occur? (Respond with 'Yes' or No' only. If the answer is 'No', mark the following questions as 'NA'.)",
+            "2. If a flood event occurred, what caused the flood event? (Specify the cause or mark as Unknown)",
+            "3. If a flood event occurred, when did it happen? (Specify in YYYY-MM format or mark as Unknown)",
+            "4. If a flood event occurred, where did it happen? (Specify all affected places or mark as Unknown)",
+            "5. Did any casualties occur if a flood event took place? (Yes or No or mark as Unknown)",
+            "6. Did evacuation take place if a flood event occurred? (Yes or No or mark as Unknown)",
+            "7. If the locations of the flood-affected areas are known, specify the country they are in? (or mark as Unknown)",
+        ],
+        "content_label": "Context:",
+    },
+    ("fr", "system"): {
+        "instructions": "Vous êtes un assistant fournissant des réponses utiles. Vous répondez à toutes les questions. Vos réponses consistent en une syntaxe JSON valide, sans autres commentaires, explications, raisonnements ou dialogues qui ne sont pas constitués de syntaxe JSON valide. Chaque clé est le numéro de la question. N'incluez pas les questions elles-mêmes. Chaque valeur est la réponse correspondante. Chaque paire clé-valeur doit être enfermée dans des accolades, et chaque clé et valeur doivent être enfermées entre guillemets.",
+        "questions_label": "Réponses aux questions :",
+        "questions": [
+            "1. Est-ce qu'un événement d'inondation s'est produit ? (Oui ou Non seulement. Si la réponse est 'Non', marquez les questions suivantes comme 'NA'.)",
+            "2. Si un événement d'inondation s'est produit, quelle en était la cause ? (Spécifiez la cause ou marquez comme Inconnu)",
+            "3. Si un événement d'inondation s'est produit, quand s'est-il produit ? (Spécifiez au format AAAA-MM ou marquez comme Inconnu)",
+            "4. Si un événement d'inondation s'est produit, où s'est-il produit ? (Spécifiez tous les endroits affectés ou marquez comme Inconnu)",
+            "5. Y a-t-il eu des victimes en cas d'inondation? (Oui ou Non ou marquer comme Inconnu)",
+            "6. Est-ce qu'une évacuation a eu lieu en cas d'inondation ? (Oui, Non ou marquer comme Inconnu)",
+            "7. Si les emplacements des zones touchées par l'inondation sont connus, spécifiez le pays dans lequel ils se trouvent? (ou marquez comme Inconnu)",
+        ],
+        "content_label": "Contexte :",
+    },
+    ("en", "user"): {
+        "instructions": "You are a helpful assistant. You answer all the questions based on the provided content only. Keep the answer concise.\n"
+                        "Your responses consist of valid JSON syntax, with no other comments, explanations, reasoning, or dialogue that do not consist of valid JSON.\n"
+                        "Each key is the question number. You do not include the questions themselves.\n"
+                        "Each value is the corresponding answer.\n"
+                        "Each key-value pair should be enclosed in curly braces, and each key and value should be enclosed in double-quotes.",
+        "questions_label": "Questions:",
+        "questions": [
+            "1. Did a flood event occur? (Respond with 'Yes' or No' only. If the answer is 'No', mark the following questions as 'NA'.)",
+            "2. If a flood event occurred, what caused the flood event? (Specify the cause or mark as Unknown)",
+            "3. If a flood event occurred, when did it happen? (Specify in YYYY-MM format or mark as Unknown)",
+            "4. If a flood event occurred, where did it happen? (Specify the names all affected places only, separated by commas. or mark as Unknown)",
+            "5. Did any casualties occur if a flood event took place? (Yes or No or mark as Unknown)",
+            "6. Did evacuation take place if a flood event occurred? (Yes or No or mark as Unknown)",
+            "7. If the locations of the flood-affected areas are known, specify the country they are in? (or mark as Unknown)",
+        ],
+        "content_label": "Content:",
+    },
+    ("fr", "user"): {
+        "instructions": "Vous êtes un assistant fournissant des réponses utiles. Vous répondez à toutes les questions. Gardez la réponse concise.\n"
+                        "Vos réponses consistent en une syntaxe JSON valide, sans autres commentaires, explications, raisonnements ou dialogues qui ne sont pas constitués de syntaxe JSON valide.\n"
+                        "Chaque clé est le numéro de la question. N'incluez pas les questions elles-mêmes.\n"
+                        "Chaque valeur est la réponse correspondante.\n"
+                        "Chaque paire clé-valeur doit être enfermée dans des accolades, et chaque clé et valeur doivent être enfermées entre guillemets.",
+        "questions_label": "Questions :",
+        "questions": [
+            "1. Est-ce qu'un événement d'inondation s'est produit ? (Oui ou Non seulement. Si la réponse est 'Non', marquez les questions suivantes comme 'NA'.)",
+            "2. Si un événement d'inondation s'est produit, quelle en était la cause ? (Spécifiez la cause ou marquez comme Inconnu)",
+            "3. Si un événement d'inondation s'est produit, quand s'est-il produit ? (Spécifiez au format AAAA-MM ou marquez comme Inconnu)",
+            "4. Si un événement d'inondation s'est produit, où s'est-il produit ? (Spécifiez tous les endroits affectés ou marquez comme Inconnu)",
+            "5. Y a-t-il eu des victimes en cas d'inondation? (Oui ou Non ou marquer comme Inconnu)",
+            "6. Est-ce qu'une évacuation a eu lieu en cas d'inondation ? (Oui, Non ou marquer comme Inconnu)",
+            "7. Si les emplacements des zones touchées par l'inondation sont connus, spécifiez le pays dans lequel ils se trouvent? (ou marquez comme Inconnu)",
+        ],
+        "content_label": "Le contenu :",
+    },
+}
+
+# Language of the multilingual prompt: the English prompt, for the articles in the other languages. The answers are
+# in English, whatever the language of the article
+MULTILINGUAL_PROMPT = "multi"
+MULTILINGUAL_INSTRUCTION = "The content can be in any language: you answer in English."
+PROMPT_TEXTS.update({
+    (MULTILINGUAL_PROMPT, prompt_style): {**PROMPT_TEXTS[("en", prompt_style)],
+                                          "instructions": PROMPT_TEXTS[("en", prompt_style)]["instructions"] + separator + MULTILINGUAL_INSTRUCTION}
+    for prompt_style, separator in (("system", " "), ("user", "\n"))
+})
+
+# Languages with their own prompt
+PROMPT_LANGUAGES = sorted({language for language, _ in PROMPT_TEXTS} - {MULTILINGUAL_PROMPT})
+
+class PromptTemplate:
+    """Prompt of a language and a prompt layout, compiled once.
+
+    The instructions and the questions form a static prefix that is the same for every article, and
+    the article comes last. Backends with prompt caching reuse the processed prefix across calls:
+    in the 'system' layout the whole system message is the prefix, in the 'user' layout the content
+    of the user message is split into the prefix and the article (a list of text parts).
+
+    The country question (the last one) can be left out when the country is derived from the locations
+    with the gazetteer (see gazetteer.py).
+    """
+
+    def __init__(self, language, prompt_style, ask_country=True):
+        if (language, prompt_style) not in PROMPT_TEXTS:
+            raise ValueError(f"No prompt for the language '{language}' and the prompt layout '{prompt_style}'.")
+
+        texts = PROMPT_TEXTS[(language, prompt_style)]
+        self.language = language
+        self.prompt_style = prompt_style
+        self.ask_country = ask_country
+        self.content_label = texts["content_label"]
+
+        # Questions are numbered lines, not the repr of a Python list
+        self.questions = texts["questions"] if ask_country else texts["questions"][:-1]
+        self.prefix = f"{texts['instructions']}\n\n{texts['questions_label']}\n" + "\n".join(self.questions) + "\n\n"
+
+    def render(self, url_content):
+        """Returns the chat messages for an article.
+
+        Args:
+            url_content (str): Content of the article.
+
+        Returns:
+            list: Chat messages.
+        """
+        article = f"{self.content_label} {url_content}"
+        if self.prompt_style == "system":
+            return [{"role": "system", "content": self.prefix.rstrip()}, {"role": "user", "content": article}]
+
+        return [{"role": "user", "content": [self.prefix, article]}]
+
+@lru_cache(maxsize=None)
+def get_prompt_template(language, prompt_style, ask_country=True):
+    """Returns the compiled prompt of a language and a prompt layout.
+
+    Args:
+        language (str): Language code ('en' or 'fr'), or 'multi' for the multilingual prompt.
+        prompt_style (str): 'system' or 'user'.
+        ask_country (bool, optional): Whether to ask for the country of the locations. Defaults to True.
+
+    Returns:
+        PromptTemplate: Prompt template.
+    """
+    return PromptTemplate(language, prompt_style, ask_country)
@@ -0,0 +1,291 @@
+# result_stats.py
+
+import re
+import os
+import glob
+import string
+import sqlite3
+import logging
+import argparse
+import pandas as pd
+
+from gazetteer import name_words, COUNTRY_ALIASES
+from event_aggregation import answer_flag, parse_month, format_month, UNKNOWN_VALUES
+from utils import canonical_url
+from schema import format_timestamps
+
+logger = logging.getLogger(__name__)
+
+# Default statistics database
+STATS_STORE = "output/result_stats.db"
+
+# Number of results rows read at once when the store is rebuilt
+READ_CHUNK_SIZE = 50000
+
+# Key columns of the statistics, and their value when the answer gives none
+KEY_COLUMNS = ["country", "month", "cause", "model"]
+UNKNOWN = "Unknown"
+
+# Counts of every key: all the articles, the articles that report a flood, and among them, the articles that
+# report casualties or evacuations, or answer that there were none
+COUNT_COLUMNS = ["articles", "floods", "deaths", "no_deaths", "evacuations", "no_evacuations"]
+
+# English names of the countries of the gazetteer aliases, so that 'USA', 'États-Unis' and 'United States'
+# are the same country
+COUNTRY_NAMES = {
+    "US": "United States", "GB": "United Kingdom", "DE": "Germany", "ES": "Spain", "IT": "Italy", "IN": "India",
+    "CN": "China", "JP": "Japan", "MX": "Mexico", "BR": "Brazil", "BE": "Belgium", "CH": "Switzerland",
+    "AT": "Austria", "PL": "Poland", "RO": "Romania", "SI": "Slovenia", "HR": "Croatia", "NL": "Netherlands",
+    "IE": "Ireland", "GR": "Greece", "TR": "Turkey", "AU": "Australia", "NZ": "New Zealand", "ZA": "South Africa",
+    "KR": "South Korea", "KP": "North Korea", "ID": "Indonesia", "HT": "Haiti", "MA": "Morocco", "DZ": "Algeria",
+    "TN": "Tunisia", "EG": "Egypt", "NG": "Nigeria", "ET": "Ethiopia", "SD": "Sudan", "SO": "Somalia", "LY": "Libya",
+    "BD": "Bangladesh", "RU": "Russia", "UA": "Ukraine", "VN": "Vietnam", "MM": "Myanmar", "PE": "Peru",
+}
+
+# Country of every folded alias and English name
+COUNTRY_KEYS = {" ".join(name_words(alias)): COUNTRY_NAMES[code]
+                for code, aliases in COUNTRY_ALIASES.items() for alias in aliases + [COUNTRY_NAMES[code]]}
+
+# Label written by some models before the country answer ('Pays: Canada')
+COUNTRY_LABEL = re.compile(r"^\s*(?i:country|pays)\s*:")
+
+# Separators of the countries of an answer ('Trinidad and Tobago' is a single country)
+COUNTRY_SEPARATORS = re.compile(r"[,;/]")
+
+# Categories of the free-text causes, matched on the folded words of the answer, in this order: the first
+# matching category wins ('Heavy rain from the remnants of Tropical Storm Debby' is a storm)
+CAUSE_CATEGORIES = [
+    ("unknown", re.compile(r"\b(unknown|inconnue?s?|not (specified|mentioned)|non specifiee?s?|pas mentionnee?s?)\b")),
+    ("storm surge", re.compile(r"\b(storm surge|surge|tides?|high tide|marees?|submersion)\b")),
+    ("dam failure", re.compile(r"\b(dams?|levees?|dikes?|digues?|barrages?)\b")),
+    ("ice jam", re.compile(r"\b(ice jams?|ice|embacles?|glaces?)\b")),
+    ("snowmelt", re.compile(r"\b(snowmelt|snow melt|melting snow|fonte)\b")),
+    ("storm", re.compile(r"\b(\w*storms?|hurricanes?|typhoons?|cyclones?|tempetes?|ouragans?|typhons?|depressions?|low pressure)\b")),
+    ("rain", re.compile(r"\b(rains?|rainfall|downpours?|precipitations?|pluies?|averses?|orages?|deluge)\b")),
+    ("river overflow", re.compile(r"\b(rivers?|overflow\w*|debordements?|crues?|cours d eau)\b")),
+]
+
+def country_keys(country):
+    """Returns the countries of a country answer.
+
+    Args:
+        country (str): Country answer of the model, or countries derived by the gazetteer ('Canada, United States').
+
+    Returns:
+        list: English names of the known countries, capitalised folded names of the others, or ['Unknown'].
+    """
+    if not isinstance(country, str):
+        return [UNKNOWN]
+    keys = []
+    for name in COUNTRY_SEPARATORS.split(COUNTRY_LABEL.sub("", country)):
+        folded = " ".join(name_words(name))
+        if folded in UNKNOWN_VALUES:
+            continue
+        key = COUNTRY_KEYS.get(folded, string.capwords(folded))
+        if key not in keys:
+            keys.append(key)
+    return keys or [UNKNOWN]
+
+def cause_category(cause):
+    """Returns the category of a cause answer, e.g. 'rain' for 'Pluies torrentielles'.
+
+    Args:
+        cause (str): Cause answer of the model.
+
+    Returns:
+        str: Category of CAUSE_CATEGORIES, 'other' for the causes of no category, or 'unknown'.
+    """
+    folded = " ".join(name_words(cause)) if isinstance(cause, str) else ""
+    if folded in UNKNOWN_VALUES:
+        return "unknown"
+    for category, pattern in CAUSE_CATEGORIES:
+        if pattern.search(folded):
+            return category
+    return "other"
+
+def model_of_file(fn):
+    """Returns the model in the name of a results file ('nlp_results_mistral-7b_2024-08-10.csv'), or None."""
+    match = re.match(r"nlp_results_(.+?)_\d{4}-\d{2}-\d{2}", os.path.basename(fn))
+    if match is None or re.fullmatch(r"\d{4}-\d{2}-\d{2}", match.group(1)):
+        return None
+    return match.group(1)
+
+class ResultStats:
+    """Materialised counts of the NLP results, by country, month of the event, category of cause and model.
+
+    The counts are updated as the results rows are written, so the rollups (floods per country and month,
+    share of the floods with casualties or evacuations, ...) are read from a small table instead of all the
+    results files. An article reported for several countries is counted for each of them. Every article is
+    counted once per model: rows with a link that is already counted for their model are ignored. The
+    counts are stored in a SQLite database, which can be read while a run adds rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.conn = sqlite3.connect(path)
+        # Readers don't wait for the run that adds rows, and the reverse
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        key_columns = ", ".join(f"{column} TEXT" for column in KEY_COLUMNS)
+        count_columns = ", ".join(f"{column} INTEGER" for column in COUNT_COLUMNS)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS stats ({key_columns}, {count_columns}, "
+                          f"PRIMARY KEY ({', '.join(KEY_COLUMNS)})) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS articles (link TEXT, model TEXT, PRIMARY KEY (link, model)) WITHOUT ROWID")
+
+    def row_counts(self, row, model):
+        """Returns the keys and the counts of a results row.
+
+        Args:
+            row (dict): Results row, with the answers and the 'link' column.
+            model (str): Model of the row.
+
+        Returns:
+            list: (key, counts) tuples, one per country of the row.
+        """
+        is_flood = answer_flag(row.get("is_happened")) == "yes"
+        death, evacuation = answer_flag(row.get("death")), answer_flag(row.get("evacuation"))
+        counts = (1, int(is_flood), int(is_flood and death == "yes"), int(is_flood and death == "no"),
+                  int(is_flood and evacuation == "yes"), int(is_flood and evacuation == "no"))
+
+        month = format_month(parse_month(row.get("date"), row.get("published_date"))) or UNKNOWN
+        cause = cause_category(row.get("flood_cause_en")) if is_flood else "none"
+        return [((country, month, cause, model), counts) for country in country_keys(row.get("country"))]
+
+    def add(self, results_df, model=None):
+        """Adds the counts of new results rows.
+
+        Args:
+            results_df (pd.DataFrame): Results rows of the NLP modes, with the answers and the 'link' column.
+            model (str, optional): Model of the rows without 'model' column. Defaults to None, for 'Unknown'.
+
+        Returns:
+            int: Number of rows added, without the rows already counted.
+        """
+        if results_df.empty or "link" not in results_df.columns:
+            return 0
+
+        deltas = {}
+        added = 0
+        with self.conn:
+            # Publication dates are read as text, in the format of the alert exports
+            for row in format_timestamps(results_df).to_dict("records"):
+                row_model = row.get("model")
+                row_model = row_model if isinstance(row_model, str) and row_model else (model or UNKNOWN)
+                if not isinstance(row.get("link"), str):
+                    continue
+                cursor = self.conn.execute("INSERT OR IGNORE INTO articles VALUES (?, ?)", (canonical_url(row["link"]), row_model))
+                if cursor.rowcount == 0:
+                    continue
+                added += 1
+                for key, counts in self.row_counts(row, row_model):
+                    total = deltas.get(key, (0,) * len(COUNT_COLUMNS))
+                    deltas[key] = tuple(a + b for a, b in zip(total, counts))
+
+            updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in COUNT_COLUMNS)
+            placeholders = ", ".join("?" * (len(KEY_COLUMNS) + len(COUNT_COLUMNS)))
+            self.conn.executemany(f"INSERT INTO stats VALUES ({placeholders}) ON CONFLICT DO UPDATE SET {updates}",
+                                  (key + counts for key, counts in deltas.items()))
+        return added
+
+    def query(self, by=("country", "month"), since=None, until=None, **filters):
+        """Returns the counts and the rates of every group of keys.
+
+        Args:
+            by (list, optional): Key columns of the groups. Defaults to country and month.
+            since (str, optional): First month ('YYYY-MM'). Defaults to None, for all the months.
+            until (str, optional): Last month ('YYYY-MM'). Defaults to None, for all the months.
+            **filters: Value of key columns, e.g. country='Canada' or model='mistral-7b'.
+
+        Returns:
+            pd.DataFrame: One row per group, with the counts, and the share of the floods with reported
+                casualties ('death_rate') and evacuations ('evacuation_rate'). The groups are sorted by key.
+        """
+        by = list(by)
+        unknown = [column for column in by + list(filters) if column not in KEY_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown key columns: {', '.join(unknown)}. Please use: {', '.join(KEY_COLUMNS)}.")
+
+        conditions = [f"{column} = ?" for column in filters]
+        values = list(filters.values())
+        # The months are compared as text, and the unknown months are left out of a range
+        if since is not None:
+            conditions.append("month >= ? AND month != ?")
+            values += [since, UNKNOWN]
+        if until is not None:
+            conditions.append("month <= ? AND month != ?")
+            values += [until, UNKNOWN]
+
+        group = f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}" if by else ""
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        sums = ", ".join(f"SUM({column}) AS {column}" for column in COUNT_COLUMNS)
+        stats_df = pd.read_sql_query(f"SELECT {', '.join(by + [sums])} FROM stats{where}{group}", self.conn, params=values)
+
+        stats_df = stats_df.dropna(subset=["articles"]).astype({column: "int64" for column in COUNT_COLUMNS})
+        floods = stats_df["floods"].where(stats_df["floods"] > 0)
+        stats_df["death_rate"] = (stats_df["deaths"] / floods).round(3)
+        stats_df["evacuation_rate"] = (stats_df["evacuations"] / floods).round(3)
+        return stats_df
+
+    def clear(self):
+        """Removes all the counts and articles."""
+        with self.conn:
+            self.conn.execute("DELETE FROM stats")
+            self.conn.execute("DELETE FROM articles")
+
+    def rebuild(self, files, model=None, chunk_size=READ_CHUNK_SIZE):
+        """Counts the results files again, from an empty store.
+
+        The files are streamed chunk by chunk. A row that is in several files is counted once, from the first
+        file it is in.
+
+        Args:
+            files (list): Results files, in chronological order.
+            model (str, optional): Model of the rows without 'model' column. Defaults to None, for the model in
+                the name of the file (see model_of_file).
+            chunk_size (int, optional): Number of rows read at once. Defaults to 50000.
+
+        Returns:
+            int: Number of rows counted.
+        """
+        self.clear()
+        added = 0
+        for fn in files:
+            try:
+                with pd.read_csv(fn, sep='|', chunksize=chunk_size) as chunks:
+                    for chunk_df in chunks:
+                        added += self.add(chunk_df, model or model_of_file(fn))
+            except pd.errors.EmptyDataError:
+                # A results file without any row
+                continue
+        logger.info(f"{added} results rows of {len(files)} files counted in {self.path}")
+        return added
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or query the counts of the NLP results by country, month, cause and model")
+    parser.add_argument("--store", default=STATS_STORE, help=f"statistics database (default: {STATS_STORE})")
+    parser.add_argument("--rebuild", nargs="+", default=None, help="results files to count again, e.g. output/nlp_results_*.csv")
+    parser.add_argument("--model", default=None, help="model of the rebuilt rows without model column (default: from the file name)")
+    parser.add_argument("--by", nargs="*", default=["country", "month"], help=f"key columns of the groups, among: {', '.join(KEY_COLUMNS)}")
+    parser.add_argument("--since", default=None, help="first month (YYYY-MM)")
+    parser.add_argument("--until", default=None, help="last month (YYYY-MM)")
+    parser.add_argument("--where", nargs="*", default=[], help="value of key columns, e.g. country=Canada model=mistral-7b")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = ResultStats(args.store)
+    try:
+        if args.rebuild is not None:
+            # The shell may leave a pattern unexpanded, e.g. on Windows
+            files = sorted(fn for pattern in args.rebuild for fn in (glob.glob(pattern) or [pattern]))
+            store.rebuild(files, model=args.model)
+        filters = dict(condition.split("=", 1) for condition in args.where)
+        print(store.query(args.by, since=args.since, until=args.until, **filters).to_string(index=False))
+    finally:
+        store.close()
@@ -0,0 +1,100 @@
+# run_control.py
+
+import re
+import time
+import signal
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default number of seconds the work in progress has to finish once the run is stopping
+GRACE_PERIOD = 60
+
+# Seconds between two checks of the stop conditions while waiting for work in progress
+CHECK_INTERVAL = 0.5
+
+def parse_duration(value):
+    """Converts a duration such as '3600', '90s', '45m' or '2h' to seconds.
+
+    Args:
+        value (str): Duration, in seconds without unit.
+
+    Returns:
+        float: Number of seconds, or None for an empty value.
+    """
+    if value is None or str(value).strip() in {"", "None"}:
+        return None
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", str(value))
+    if not match:
+        raise ValueError(f"Invalid duration '{value}'. Use a number of seconds or a number followed by s, m or h.")
+
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+
+class RunControl:
+    """Time budget and stop requests of a run.
+
+    A run stops dispatching new work when it receives SIGINT or SIGTERM, or when its time budget runs out.
+    The work in progress (fetches, LLM calls) then has up to the grace period to finish, and the completed
+    rows are saved. Dispatching stops a grace period before the end of the budget, so that the whole run,
+    including the drain, fits in the budget. A second Ctrl+C stops the run at once.
+    """
+
+    def __init__(self, time_budget=None, grace_period=GRACE_PERIOD):
+        """
+        Args:
+            time_budget (float, optional): Maximum duration of the run in seconds. Defaults to None, for no limit.
+            grace_period (float, optional): Seconds the work in progress has to finish once the run is stopping, up to half
+                of the time budget. Defaults to 60.
+        """
+        self.start_time = time.monotonic()
+        self.time_budget = time_budget
+        # A short budget keeps half of its time to dispatch work, and half to drain it
+        self.grace_period = grace_period if time_budget is None else min(grace_period, time_budget / 2)
+        self.deadline = None if time_budget is None else self.start_time + time_budget - self.grace_period
+
+        self.stop_reason = None
+        self.stop_time = None
+        self._previous_handlers = {}
+
+    @property
+    def stopped(self):
+        """True if the run stopped before the end of its input."""
+        return self.stop_reason is not None
+
+    def request_stop(self, reason):
+        """Stops dispatching new work."""
+        if self.stop_reason is None:
+            self.stop_reason, self.stop_time = reason, time.monotonic()
+            logger.warning(f"{reason}: no new work is dispatched, the work in progress has {self.grace_period:g} seconds to finish")
+
+    def should_stop(self):
+        """Returns True once no new work should be dispatched."""
+        if self.stop_reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.request_stop("Time budget reached")
+        return self.stop_reason is not None
+
+    def grace_remaining(self):
+        """Returns the seconds left to the work in progress, or None if the run isn't stopping."""
+        if not self.should_stop():
+            return None
+        return max(0.0, self.stop_time + self.grace_period - time.monotonic())
+
+    def grace_expired(self):
+        """Returns True once the work in progress should be abandoned."""
+        return self.grace_remaining() == 0.0
+
+    def _handle_signal(self, signum, frame):
+        if self.stop_reason is not None and signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        self.request_stop(f"Got {signal.Signals(signum).name}")
+
+    def install_signal_handlers(self):
+        """Handles SIGINT and SIGTERM as stop requests. Must be called from the main thread."""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+
+    def restore_signal_handlers(self):
+        for signum, previous_handler in self._previous_handlers.items():
+            signal.signal(signum, previous_handler)
+        self._previous_handlers = {}
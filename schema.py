@@ -0,0 +1,145 @@
+# schema.py
+
+import logging
+import argparse
+import importlib.util
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Kinds of columns: low-cardinality enumerations, timestamps, small integer flags and long texts
+CATEGORY = "category"
+TIMESTAMP = "timestamp"
+FLAG = "flag"
+TEXT = "text"
+
+# Long texts are stored in Arrow buffers when pyarrow is installed, as Python strings otherwise
+TEXT_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") is not None else "string"
+
+# Columns of the alerts and of the extracted content, with their kind
+ARTICLE_SCHEMA = {
+    "Language": CATEGORY,
+    "Alert_definition": CATEGORY,
+    "PT": CATEGORY,
+    "PublishedDate": TIMESTAMP,
+    "Is_Article": FLAG,
+    "Summary": TEXT,
+    "New_Content": TEXT,
+}
+
+# Columns of the NLP results, with their kind
+RESULT_SCHEMA = {
+    "is_happened": CATEGORY,
+    "death": CATEGORY,
+    "evacuation": CATEGORY,
+    "country": CATEGORY,
+    "model": CATEGORY,
+    "published_date": TIMESTAMP,
+    "model_tier": FLAG,
+}
+
+# Values of the flags: 1 for a valid article, 0 for a page that isn't an article, -1 for a page that couldn't be
+# extracted (also used for the missing flags). The model tiers of a cascade are small positive numbers
+FLAG_VALUES = {"Is_Article": {-1, 0, 1}}
+
+# Timestamps are written back to the CSV files in the format of the alert exports
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+def apply_schema(df, schema):
+    """Converts the columns of a dataframe to the compact types of a schema, and validates them.
+
+    The columns of the schema that the dataframe doesn't have are ignored, and the other columns are kept as
+    they are. Enumerations become categoricals, timestamps are parsed in UTC, flags become 8-bit integers and
+    long texts become pandas strings (Arrow-backed when pyarrow is installed).
+
+    Args:
+        df (pd.DataFrame): Input data.
+        schema (dict): Kind of every column (see ARTICLE_SCHEMA and RESULT_SCHEMA).
+
+    Returns:
+        pd.DataFrame: Dataframe with typed columns.
+
+    Raises:
+        ValueError: If a flag column has values that aren't numbers or aren't allowed.
+    """
+    columns = {}
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        series = df[col]
+
+        if kind == CATEGORY:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                columns[col] = series.astype("category")
+
+        elif kind == TIMESTAMP:
+            if not isinstance(series.dtype, pd.DatetimeTZDtype):
+                parsed = pd.to_datetime(series, utc=True, errors="coerce", format="ISO8601")
+                invalid = int((parsed.isna() & series.notna()).sum())
+                if invalid:
+                    logger.warning(f"{invalid} values of '{col}' are not valid dates and are left empty")
+                columns[col] = parsed
+
+        elif kind == FLAG:
+            if series.dtype != "int8":
+                numbers = pd.to_numeric(series, errors="coerce")
+                if int((numbers.isna() & series.notna()).sum()):
+                    raise ValueError(f"Column '{col}' must contain integers, found: {series[numbers.isna() & series.notna()].unique()[:5].tolist()}")
+                numbers = numbers.fillna(-1)
+                allowed = FLAG_VALUES.get(col)
+                if allowed is not None and not numbers.isin(allowed).all():
+                    raise ValueError(f"Column '{col}' must contain {sorted(allowed)}, found: {sorted(set(numbers) - allowed)[:5]}")
+                columns[col] = numbers.astype("int8")
+
+        elif kind == TEXT:
+            if not isinstance(series.dtype, pd.StringDtype):
+                # Anything that isn't text (NaN, None) is missing
+                columns[col] = series.where(series.map(lambda value: isinstance(value, str)), None).astype(TEXT_DTYPE)
+
+        else:
+            raise ValueError(f"Unknown kind '{kind}' for the column '{col}'.")
+
+    return df.assign(**columns) if columns else df
+
+def format_timestamps(df):
+    """Returns the dataframe with its timestamps as text in the format of the alert exports, and None if missing."""
+    columns = {col: df[col].dt.strftime(DATE_FORMAT).astype(object).where(df[col].notna(), None)
+               for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])}
+    return df.assign(**columns) if columns else df
+
+def to_records(df):
+    """Returns the rows of a dataframe as JSON-serialisable dictionaries: timestamps as text and None for NaN."""
+    df = format_timestamps(df)
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+def memory_report(df, schema):
+    """Measures the memory of a dataframe before and after applying a schema.
+
+    Args:
+        df (pd.DataFrame): Data as read from a CSV file.
+        schema (dict): Kind of every column.
+
+    Returns:
+        pd.DataFrame: Memory in MB of every column of the schema and of the whole dataframe, before and after.
+    """
+    typed_df = apply_schema(df, schema)
+    before = df.memory_usage(deep=True, index=False) / 1e6
+    after = typed_df.memory_usage(deep=True, index=False) / 1e6
+
+    rows = [{"column": col, "dtype": str(typed_df[col].dtype), "mb_before": before[col], "mb_after": after[col]}
+            for col in schema if col in df.columns]
+    rows.append({"column": "(all)", "dtype": "", "mb_before": before.sum(), "mb_after": after.sum()})
+    report_df = pd.DataFrame(rows)
+    report_df["ratio"] = report_df["mb_before"] / report_df["mb_after"]
+    return report_df.round(3)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the memory saved by the typed schema on an extracted content or NLP results file")
+    parser.add_argument("fn", nargs="?", default="output/extracted_url_content.csv",
+                        help="extracted content or NLP results file (default: output/extracted_url_content.csv)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    df = pd.read_csv(args.fn, sep='|')
+    schema = ARTICLE_SCHEMA if "Is_Article" in df.columns else RESULT_SCHEMA
+    logger.info(f"Memory of {df.shape[0]} rows ({TEXT_DTYPE} texts):\n{memory_report(df, schema).to_string(index=False)}")
@@ -0,0 +1,231 @@
+# seen_index.py
+
+import os
+import math
+import struct
+import hashlib
+import sqlite3
+import logging
+from datetime import datetime
+
+from utils import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Default sizing of the Bloom filter: number of keys and false positive rate
+BLOOM_CAPACITY = 1000000
+BLOOM_ERROR_RATE = 0.001
+
+# Number of keys per query to the exact store
+QUERY_BATCH_SIZE = 500
+
+# Status of the alerts in the index: processed, or deferred by the triage without being fetched
+SEEN, DEFERRED = "seen", "deferred"
+
+class BloomFilter:
+    """Bloom filter of strings.
+
+    A membership test never misses a key that was added, and it gives a false positive with the configured
+    probability. It answers "not seen" for new keys without querying the exact store.
+    """
+    HEADER = struct.Struct("<8sQQQ")
+    MAGIC = b"NLPBLOOM"
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: the k positions are derived from two 64-bit hashes
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def save(self, fn):
+        # Write to a temporary file first, so that an interrupted run never leaves a truncated filter
+        tmp_fn = f"{fn}.tmp"
+        with open(tmp_fn, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.capacity, self.num_hashes, self.count))
+            f.write(struct.pack("<dQ", self.error_rate, self.num_bits))
+            f.write(self.bits)
+        os.replace(tmp_fn, fn)
+
+    @classmethod
+    def load(cls, fn):
+        with open(fn, 'rb') as f:
+            magic, capacity, num_hashes, count = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            if magic != cls.MAGIC:
+                raise ValueError(f"{fn} is not a Bloom filter file.")
+            error_rate, num_bits = struct.unpack("<dQ", f.read(16))
+            bloom = cls.__new__(cls)
+            bloom.capacity, bloom.error_rate, bloom.num_bits, bloom.num_hashes, bloom.count = \
+                capacity, error_rate, num_bits, num_hashes, count
+            bloom.bits = bytearray(f.read())
+        return bloom
+
+class SeenIndex:
+    """Persistent index of the alerts that were already processed.
+
+    Alerts are identified by their Google Alerts Id and by their canonical URL, since consecutive exports
+    overlap and the same article can come with different alert Ids. The keys are stored in a SQLite
+    database (the exact store), and a Bloom filter in front of it answers for the new keys without
+    querying the database. The index also records the input files that were fully ingested, so that
+    unchanged exports are not read again. The alerts deferred by the triage are recorded with their own status,
+    so that they can be fetched later, and are not triaged again by every run.
+    """
+
+    def __init__(self, path, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.path = path
+        self.bloom_path = f"{path}.bloom"
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, source TEXT, first_seen TEXT, "
+                          f"status TEXT NOT NULL DEFAULT '{SEEN}') WITHOUT ROWID")
+        # Indexes created before the status of the alerts was recorded
+        if "status" not in [row[1] for row in self.conn.execute("PRAGMA table_info(seen)")]:
+            self.conn.execute(f"ALTER TABLE seen ADD COLUMN status TEXT NOT NULL DEFAULT '{SEEN}'")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, ingested TEXT)")
+
+        self.bloom = self._load_bloom(capacity, error_rate)
+
+    def _load_bloom(self, capacity, error_rate):
+        count = self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+        if os.path.exists(self.bloom_path):
+            bloom = BloomFilter.load(self.bloom_path)
+            # The filter is rebuilt if it's out of sync with the store (e.g., interrupted run) or too small
+            if bloom.count == count and not bloom.is_full():
+                return bloom
+
+        bloom = BloomFilter(max(capacity, 2 * count), error_rate)
+        for (key,) in self.conn.execute("SELECT key FROM seen"):
+            bloom.add(key)
+        logger.info(f"Bloom filter of {self.path} rebuilt with {count} keys")
+        return bloom
+
+    def keys(self, alert_id, url):
+        """Returns the keys of an alert."""
+        keys = [f"url:{canonical_url(url)}"]
+        if alert_id is not None and alert_id == alert_id and str(alert_id) != "":
+            keys.append(f"id:{alert_id}")
+        return keys
+
+    def contains(self, keys):
+        """Returns the subset of the keys that are in the index.
+
+        Args:
+            keys (iterable): Keys.
+
+        Returns:
+            set: Keys in the index.
+        """
+        # Only the keys that pass the Bloom filter are checked in the exact store
+        candidates = [key for key in set(keys) if key in self.bloom]
+        found = set()
+        for start in range(0, len(candidates), QUERY_BATCH_SIZE):
+            batch = candidates[start:start + QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            found.update(row[0] for row in self.conn.execute(f"SELECT key FROM seen WHERE key IN ({placeholders})", batch))
+        return found
+
+    def filter_new(self, df, id_col_name="Id", url_col_name="URL"):
+        """Keeps the alerts that are not in the index, and the first of the duplicated alerts.
+
+        Args:
+            df (pd.DataFrame): Alerts.
+            id_col_name (str, optional): Name of the column with the alert Ids. Defaults to "Id".
+            url_col_name (str, optional): Name of the column with the URLs. Defaults to "URL".
+
+        Returns:
+            pd.DataFrame: New alerts.
+        """
+        ids = df[id_col_name] if id_col_name in df.columns else [None] * df.shape[0]
+        row_keys = [self.keys(alert_id, url) for alert_id, url in zip(ids, df[url_col_name])]
+        seen = self.contains(key for keys in row_keys for key in keys)
+
+        is_new = []
+        for keys in row_keys:
+            new = not any(key in seen for key in keys)
+            is_new.append(new)
+            # Duplicates within the batch are dropped as well
+            seen.update(keys)
+
+        return df[is_new]
+
+    def mark_seen(self, df, source=None, id_col_name="Id", url_col_name="URL", status=SEEN):
+        """Adds the alerts to the index.
+
+        Args:
+            df (pd.DataFrame): Processed alerts.
+            source (str, optional): Name of the input file. Defaults to None.
+            id_col_name (str, optional): Name of the column with the alert Ids. Defaults to "Id".
+            url_col_name (str, optional): Name of the column with the URLs. Defaults to "URL".
+            status (str, optional): 'seen' for the processed alerts, or 'deferred' for the alerts deferred by the
+                triage. Defaults to 'seen'.
+        """
+        if status not in (SEEN, DEFERRED):
+            raise ValueError(f"Unknown status '{status}'. The statuses are: {SEEN}, {DEFERRED}.")
+        ids = df[id_col_name] if id_col_name in df.columns else [None] * df.shape[0]
+        now = datetime.now().isoformat(timespec='seconds')
+        keys = {key for alert_id, url in zip(ids, df[url_col_name]) for key in self.keys(alert_id, url)}
+        new_keys = keys - self.contains(keys)
+
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?, ?, ?)", ((key, source, now, status) for key in new_keys))
+        for key in new_keys:
+            self.bloom.add(key)
+
+        if self.bloom.is_full():
+            self.bloom = self._load_bloom(2 * self.bloom.capacity, self.bloom.error_rate)
+        self.bloom.save(self.bloom_path)
+
+    def deferred_urls(self, source=None):
+        """Returns the canonical URLs of the alerts deferred by the triage, to fetch them later.
+
+        Args:
+            source (str, optional): Name of the input file of the alerts. Defaults to None, for all the files.
+
+        Returns:
+            list: Canonical URLs, in the order they were deferred.
+        """
+        query = "SELECT key FROM seen WHERE status = ? AND key LIKE 'url:%'"
+        params = [DEFERRED]
+        if source is not None:
+            query += " AND source = ?"
+            params.append(source)
+        return [key[len("url:"):] for (key,) in self.conn.execute(query + " ORDER BY first_seen", params)]
+
+    def is_file_ingested(self, fn):
+        """Returns True if the file was ingested and hasn't changed since."""
+        stat = os.stat(fn)
+        row = self.conn.execute("SELECT size, mtime FROM files WHERE path = ?", (os.path.abspath(fn),)).fetchone()
+        return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def mark_file_ingested(self, fn):
+        """Records that all the alerts of the file are in the index."""
+        stat = os.stat(fn)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                              (os.path.abspath(fn), stat.st_size, stat.st_mtime, datetime.now().isoformat(timespec='seconds')))
+
+    def close(self):
+        self.conn.close()
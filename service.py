@@ -0,0 +1,406 @@
+# service.py
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from llm_dispatcher import DEFAULT_TIMEOUT
+from pipeline import default_executor_settings, fetch_page, make_pools, close_pools, _parse_pages
+from run_control import RunControl, CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Default address of the HTTP API: local connections only
+HOST = "127.0.0.1"
+PORT = 8080
+
+# Default maximum number of requests per batch, and maximum time the first request of a batch waits for others
+BATCH_SIZE = 16
+BATCH_DELAY = 0.05
+
+# Time the results are kept after completion, in seconds
+RESULT_TTL = 3600
+
+# Maximum size of a request body, in bytes
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+class ServiceRequest:
+    """Alert or article submitted to the service, and its result."""
+
+    def __init__(self, url, language='en', published_date=None, content=None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.language = language
+        self.published_date = published_date
+        # Article payloads are not fetched
+        self.content = content
+        self.extracted = None
+        self.events = None
+        self.error = None
+        self.done = threading.Event()
+        self.completed_at = None
+
+    def finish(self, error=None):
+        self.error = error
+        self.completed_at = time.monotonic()
+        self.done.set()
+
+    def to_dict(self, include_content=False):
+        result = {"id": self.id, "url": self.url, "status": "done" if self.done.is_set() else "pending"}
+        if self.error is not None:
+            result["error"] = self.error
+        if self.extracted is not None:
+            result["summary"], result["is_article"] = self.extracted[0], self.extracted[2]
+            if include_content:
+                result["content"] = self.extracted[1]
+        if self.events is not None:
+            # JSON types only: the answers can hold numpy values
+            result["events"] = json.loads(self.events.to_json(orient="records"))
+        return result
+
+class MicroBatcher:
+    """Groups the items submitted one by one into batches.
+
+    A batch is sent as soon as it has max_batch_size items, or max_delay seconds after its first item, so a
+    single item waits at most max_delay. The batches are processed concurrently.
+    """
+
+    def __init__(self, process_batch, max_batch_size=BATCH_SIZE, max_delay=BATCH_DELAY):
+        """
+        Args:
+            process_batch (coroutine function): Called with every batch, as a list of items.
+            max_batch_size (int, optional): Maximum number of items per batch. Defaults to 16.
+            max_delay (float, optional): Maximum wait of the first item of a batch, in seconds. Defaults to 0.05.
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        """Adds an item from the event loop. None stops the batcher once the items before it are processed."""
+        self.queue.put_nowait(item)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        tasks = set()
+        stopping = False
+
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            task = asyncio.create_task(self.process_batch(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+class ExtractionService:
+    """Long-running extraction of single alerts, with a warm content extractor and warm pools.
+
+    The requests are submitted from any thread and processed on an event loop running in a background thread,
+    with the same stages as the batch pipeline: fetch threads, parse processes and LLM calls sharing the
+    connection pool of the backend. The requests are grouped in micro-batches: the pages of a batch are
+    parsed in a single task of the parse pool, and every request completes as soon as its own event is
+    extracted.
+    """
+
+    def __init__(self, extractor, fetch_concurrency=None, parse_workers=None, llm_concurrency=None,
+                 max_batch_size=BATCH_SIZE, max_delay=BATCH_DELAY, timeout=DEFAULT_TIMEOUT, result_ttl=RESULT_TTL):
+        """
+        Args:
+            extractor (ContentExtractor): Content extractor. Without backend, only the content is extracted.
+            fetch_concurrency (int, optional): Number of pages downloaded at the same time. Defaults to 32.
+            parse_workers (int, optional): Number of parse processes. Defaults to the number of cores.
+            llm_concurrency (int, optional): Number of LLM calls in flight. Defaults to the concurrency of the backend,
+                lowered to its rate limit.
+            max_batch_size (int, optional): Maximum number of requests per batch. Defaults to 16.
+            max_delay (float, optional): Maximum wait of a request for the others of its batch, in seconds. Defaults to 0.05.
+            timeout (float, optional): Maximum duration of the extraction of a single event in seconds. Defaults to 300.
+            result_ttl (float, optional): Time the results are kept after completion, in seconds. Defaults to 3600.
+        """
+        self.extractor = extractor
+        self.extract_events = extractor.backend is not None
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        defaults = default_executor_settings(extractor.backend if self.extract_events else None)
+        self.fetch_concurrency = fetch_concurrency or defaults["fetch_concurrency"]
+        self.parse_workers = parse_workers or defaults["parse_workers"]
+        self.llm_concurrency = llm_concurrency or defaults["llm_concurrency"]
+
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.batcher = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    def start(self):
+        """Starts the event loop and the pools in a background thread."""
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.serve()), name="extraction-service", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        logger.info(f"Service started: {self.fetch_concurrency} fetch threads, {self.parse_workers} parse processes, "
+                    f"{self.llm_concurrency or 0} LLM calls in flight, batches of {self.max_batch_size} requests")
+
+    def stop(self, timeout=None):
+        """Stops accepting requests, and waits for the submitted ones.
+
+        Args:
+            timeout (float, optional): Maximum wait for the submitted requests, in seconds. Defaults to no limit.
+        """
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.batcher.put, None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.error(f"{self.pending()} requests were still in progress when the service stopped")
+        self.thread = None
+
+    def submit(self, url, language='en', published_date=None, content=None):
+        """Submits an alert, or an article if its content is given.
+
+        Args:
+            url (str): URL of the alert.
+            language (str, optional): Language of the content ('en' for English, 'fr' for French). Defaults to 'en'.
+            published_date (str, optional): Date of the article publication. Defaults to None.
+            content (str, optional): Content of the article, to skip the download. Defaults to None.
+
+        Returns:
+            ServiceRequest: Submitted request, completed in the background.
+        """
+        if not isinstance(url, str) or not url:
+            raise ValueError("Every request needs a 'url'.")
+        if content is not None and not isinstance(content, str):
+            raise ValueError("The 'content' of an article must be a string.")
+        if self.thread is None:
+            raise ValueError("The service is not running.")
+
+        request = ServiceRequest(url, language or 'en', published_date, content)
+        with self.lock:
+            self._prune()
+            self.requests[request.id] = request
+        self.loop.call_soon_threadsafe(self.batcher.put, request)
+        return request
+
+    def get(self, request_id):
+        """Returns the request with the given Id, or None if it's unknown or expired."""
+        with self.lock:
+            return self.requests.get(request_id)
+
+    def pending(self):
+        """Returns the number of requests in progress."""
+        with self.lock:
+            return sum(not request.done.is_set() for request in self.requests.values())
+
+    def _prune(self):
+        # The completed requests are forgotten after result_ttl seconds
+        expiry = time.monotonic() - self.result_ttl
+        for request_id in [i for i, r in self.requests.items() if r.completed_at is not None and r.completed_at < expiry]:
+            del self.requests[request_id]
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.fetch_pool, self.parse_pool = make_pools(self.extractor, self.fetch_concurrency, self.parse_workers)
+        self.llm_slots = asyncio.Semaphore(self.llm_concurrency) if self.extract_events else None
+        self.batcher = MicroBatcher(self.process_batch, self.max_batch_size, self.max_delay)
+        self.ready.set()
+
+        try:
+            await self.batcher.run()
+        finally:
+            await close_pools(self.fetch_pool, self.parse_pool, backend=self.extractor.backend if self.extract_events else None)
+
+    async def process_batch(self, batch):
+        """Fetches, parses and extracts the events of a batch of requests."""
+        try:
+            fetched = [r for r in batch if r.content is None]
+            pages = await asyncio.gather(*(self.loop.run_in_executor(self.fetch_pool, fetch_page, self.extractor, r.url) for r in fetched))
+
+            parsed = []
+            for request, page in zip(fetched, pages):
+                if page is None:
+                    request.extracted = ('', '', -1)
+                else:
+                    parsed.append((request, page))
+
+            for request in batch:
+                if request.content is not None:
+                    content = self.extractor.clean_text(request.content)
+                    request.extracted = ('', content, 1 if self.extractor.is_valid_body(content) else 0)
+
+            # The pages are split between the parse processes, one task per process
+            size = -(-len(parsed) // self.parse_workers) if parsed else 1
+            chunks = [parsed[start:start + size] for start in range(0, len(parsed), size)]
+            results = await asyncio.gather(*(
+                self.loop.run_in_executor(self.parse_pool, _parse_pages, [(r.url, page, r.language) for r, page in chunk])
+                for chunk in chunks), return_exceptions=True)
+            for chunk, chunk_results in zip(chunks, results):
+                if isinstance(chunk_results, Exception):
+                    logger.error(f"An error occurred during content extraction: {str(chunk_results)}")
+                    chunk_results = [('', '', -1)] * len(chunk)
+                for (request, _), extracted in zip(chunk, chunk_results):
+                    request.extracted = extracted
+
+            await asyncio.gather(*(self.extract_event(r) for r in batch))
+        except Exception as e:
+            logger.error(f"An error occurred while processing a batch: {str(e)}")
+            for request in batch:
+                if not request.done.is_set():
+                    request.finish(error=str(e))
+
+    async def extract_event(self, request):
+        # Requests without a valid article, or without LLM stage, are complete once parsed
+        if not self.extract_events or request.extracted[2] != 1:
+            request.finish()
+            return
+
+        async with self.llm_slots:
+            try:
+                # The characters of the other scripts are only kept for the multilingual prompt
+                content = self.extractor.filter_text(request.extracted[1], request.language)
+                content = self.extractor.compact_text(content, request.language)
+                request.events = await asyncio.wait_for(self.extractor.aextract_single_event(
+                    content, request.url, request.language, request.published_date), self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Extraction of {request.url} timed out after {self.timeout} seconds")
+                request.finish(error=f"Timed out after {self.timeout} seconds")
+                return
+        request.finish()
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP API of the service.
+
+    POST /alerts         Submits an alert ({"url", "language", "published_date"}), an article (with its "content")
+                         or a list of them. Returns their Ids, or their results with ?wait=<seconds>.
+    GET  /alerts/<id>    Returns the result of a request, after waiting up to ?wait=<seconds> for it.
+    GET  /health         Returns the number of requests in progress.
+    """
+    service = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def wait_time(self, query):
+        try:
+            return max(0.0, float(query.get("wait", ["0"])[0]))
+        except ValueError:
+            raise ValueError("The 'wait' parameter must be a number of seconds.")
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == "/health":
+            return self.send_json(200, {"status": "ok", "pending": self.service.pending()})
+
+        if not parts.path.startswith("/alerts/"):
+            return self.send_json(404, {"error": f"Unknown path {parts.path}"})
+        request = self.service.get(parts.path[len("/alerts/"):])
+        if request is None:
+            return self.send_json(404, {"error": "Unknown or expired request Id"})
+
+        try:
+            request.done.wait(self.wait_time(query))
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+        self.send_json(200 if request.done.is_set() else 202, request.to_dict(not self.service.extract_events))
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        if parts.path != "/alerts":
+            return self.send_json(404, {"error": f"Unknown path {parts.path}"})
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_BODY_SIZE:
+                raise ValueError(f"The request body is larger than {MAX_BODY_SIZE} bytes.")
+            payload = json.loads(self.rfile.read(length) or b"null")
+            items = payload if isinstance(payload, list) else [payload]
+            if not items or not all(isinstance(item, dict) for item in items):
+                raise ValueError("The body must be an alert object or a list of alert objects.")
+            wait = self.wait_time(parse_qs(parts.query))
+            requests = [self.service.submit(item.get("url"), item.get("language"), item.get("published_date"),
+                                            item.get("content")) for item in items]
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+
+        # The wait is shared by all the requests of the body
+        deadline = time.monotonic() + wait
+        for request in requests:
+            request.done.wait(max(0, deadline - time.monotonic()))
+
+        results = [request.to_dict(not self.service.extract_events) for request in requests]
+        status = 200 if all(request.done.is_set() for request in requests) else 202
+        self.send_json(status, results if isinstance(payload, list) else results[0])
+
+def make_server(service, host=HOST, port=PORT):
+    """Creates the HTTP server of the service.
+
+    Args:
+        service (ExtractionService): Started service.
+        host (str, optional): Listening address. Defaults to 127.0.0.1.
+        port (int, optional): Listening port, 0 for any free port. Defaults to 8080.
+
+    Returns:
+        ThreadingHTTPServer: HTTP server, one thread per connection.
+    """
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+def serve(service, host=HOST, port=PORT, control=None):
+    """Runs the service and its HTTP API until the run is stopped (Ctrl+C, SIGTERM or end of the time budget).
+
+    Args:
+        service (ExtractionService): Service, not started.
+        host (str, optional): Listening address. Defaults to 127.0.0.1.
+        port (int, optional): Listening port. Defaults to 8080.
+        control (RunControl, optional): Time budget and stop requests of the run. The requests in progress have
+            until the end of the grace period to finish.
+    """
+    control = control or RunControl()
+    service.start()
+    server = make_server(service, host, port)
+    server_thread = threading.Thread(target=server.serve_forever, name="service-http", daemon=True)
+    server_thread.start()
+    logger.info(f"Service listening on http://{host}:{server.server_address[1]}")
+
+    try:
+        while not control.should_stop():
+            time.sleep(CHECK_INTERVAL)
+    except KeyboardInterrupt:
+        logger.error('Got ^C, stopping the service')
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop(timeout=control.grace_remaining())
@@ -0,0 +1,135 @@
+# sharding.py
+
+import os
+import glob
+import hashlib
+import logging
+import pandas as pd
+
+from utils import canonical_url, ResultWriter
+
+logger = logging.getLogger(__name__)
+
+# Number of input rows read at once: the input files are streamed, and only the rows of the shard are kept
+READ_CHUNK_SIZE = 50000
+
+# Suffix of the marker written next to the output of a completed shard
+DONE_SUFFIX = ".done"
+
+def shard_of(url, num_shards):
+    """Returns the shard of a URL.
+
+    The shard is a stable hash of the canonical URL, so the same article goes to the same shard in every export
+    and on every machine (unlike Python's hash, which changes with every process).
+
+    Args:
+        url (str): URL.
+        num_shards (int): Number of shards.
+
+    Returns:
+        int: Shard, from 0 to num_shards - 1.
+    """
+    digest = hashlib.md5(canonical_url(url).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_shards
+
+def check_shard(shard, num_shards):
+    """Checks that a shard is between 0 and num_shards - 1."""
+    if num_shards < 1:
+        raise ValueError(f"The number of shards must be at least 1, got {num_shards}.")
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"The shard must be between 0 and {num_shards - 1}, got {shard}.")
+
+def filter_shard(df, shard, num_shards, url_col_name="URL"):
+    """Keeps the rows of a shard.
+
+    Args:
+        df (pd.DataFrame): Rows with URLs.
+        shard (int): Shard to keep.
+        num_shards (int): Number of shards.
+        url_col_name (str, optional): Name of the column with URLs. Defaults to "URL".
+
+    Returns:
+        pd.DataFrame: Rows of the shard.
+    """
+    return df[df[url_col_name].map(lambda url: shard_of(url, num_shards)) == shard]
+
+def shard_output_path(out_fn, shard, num_shards):
+    """Returns the output file of a shard, e.g. output/nlp_results.shard-003-of-016.csv for output/nlp_results.csv.
+
+    Args:
+        out_fn (str): Output file name of the whole run.
+        shard (int): Shard.
+        num_shards (int): Number of shards.
+
+    Returns:
+        str: Output file name of the shard.
+    """
+    root, ext = os.path.splitext(out_fn)
+    return f"{root}.shard-{shard:03d}-of-{num_shards:03d}{ext or '.csv'}"
+
+def is_shard_done(shard_fn):
+    """Returns whether the shard with this output file was completed by a previous run."""
+    return os.path.exists(shard_fn + DONE_SUFFIX)
+
+def mark_shard_done(shard_fn):
+    """Marks the shard with this output file as completed, so the next runs skip it."""
+    with open(shard_fn + DONE_SUFFIX, 'w') as f:
+        f.write(f"{shard_fn}\n")
+
+def shard_files(out_fn, num_shards):
+    """Returns the output files of the shards of a run (see shard_output_path), in the order of the shards."""
+    root, ext = os.path.splitext(out_fn)
+    return sorted(glob.glob(f"{glob.escape(root)}.shard-*-of-{num_shards:03d}{ext or '.csv'}"))
+
+def dedupe_keys(df, url_col_name):
+    """Returns the key of every result row: its canonical URL, and its model in the compare mode."""
+    keys = df[url_col_name].map(canonical_url)
+    if "solution" in df.columns and "model" in df.columns:
+        keys = keys + "|" + df["solution"].astype(str) + ":" + df["model"].astype(str)
+    return keys
+
+def merge_shards(out_fn, num_shards, chunk_size=READ_CHUNK_SIZE):
+    """Combines the outputs of the shards into one output file, without duplicates.
+
+    The shard outputs are streamed chunk by chunk: only the keys of the rows already written are kept in memory.
+    The shards that were not completed are merged as well, with a warning.
+
+    Args:
+        out_fn (str): Output file name of the whole run.
+        num_shards (int): Number of shards.
+        chunk_size (int, optional): Number of rows read at once. Defaults to 50000.
+
+    Returns:
+        int: Number of merged rows.
+    """
+    files = shard_files(out_fn, num_shards)
+    if not files:
+        raise ValueError(f"No shard output matches '{shard_output_path(out_fn, 0, num_shards)}'. Please check the output file name and the number of shards.")
+
+    missing = [shard for shard in range(num_shards) if shard_output_path(out_fn, shard, num_shards) not in files]
+    if missing:
+        logger.warning(f"{len(missing)} shards have no output and are not merged: {missing}")
+    incomplete = [fn for fn in files if not is_shard_done(fn)]
+    if incomplete:
+        logger.warning(f"{len(incomplete)} shards are not completed, their rows so far are merged: {incomplete}")
+
+    writer = ResultWriter(out_fn)
+    seen, duplicates = set(), 0
+    for fn in files:
+        try:
+            with pd.read_csv(fn, sep='|', chunksize=chunk_size) as chunks:
+                for chunk_df in chunks:
+                    url_col_name = "link" if "link" in chunk_df.columns else "URL"
+                    keys = dedupe_keys(chunk_df, url_col_name)
+                    # Rows already written, or repeated within the chunk
+                    is_new = ~keys.isin(seen) & ~keys.duplicated()
+                    duplicates += int((~is_new).sum())
+                    seen.update(keys[is_new])
+                    if is_new.any():
+                        writer.write(chunk_df[is_new])
+        except pd.errors.EmptyDataError:
+            # A shard without any row
+            continue
+
+    logger.info(f"{writer.num_rows} rows of {len(files)} shards merged into {out_fn}, {duplicates} duplicates dropped")
+    return writer.num_rows
@@ -0,0 +1,229 @@
+# structured_output.py
+
+import re
+import json
+
+from utils import check_brackets_balance, correct_brackets
+from prompts import MULTILINGUAL_PROMPT
+
+# Name of the tool the models call with their answers, and its description by language
+TOOL_NAME = "record_answers"
+TOOL_DESCRIPTIONS = {
+    "en": "Records the answers to the numbered questions about the article.",
+    "fr": "Enregistre les réponses aux questions numérotées sur l'article.",
+}
+# The multilingual prompt is in English
+TOOL_DESCRIPTIONS[MULTILINGUAL_PROMPT] = TOOL_DESCRIPTIONS["en"]
+
+# Kind of answer of every question, by question number
+FIELD_KINDS = {"1": "flag", "2": "text", "3": "month", "4": "text", "5": "ternary", "6": "ternary", "7": "text"}
+
+# Allowed answers of the questions with a fixed set of answers. The answers in French are accepted as well
+# from the servers that don't enforce the schema
+ENUMS = {"flag": ["Yes", "No"], "ternary": ["Yes", "No", "Unknown", "NA"]}
+FLAG_PATTERN = re.compile(r"(?:yes|oui|no|non)\b", re.IGNORECASE)
+TERNARY_PATTERN = re.compile(r"(?:yes|oui|no|non|unknown|inconnue?|n/?a)\b", re.IGNORECASE)
+NO_PATTERN = re.compile(r"(?:no|non)\b", re.IGNORECASE)
+
+# Dates in YYYY-MM format; a full date is truncated to its month rather than asked again
+MONTH_PATTERN = re.compile(r"(\d{4}-(?:0[1-9]|1[0-2]))(?:-\d{2})?$")
+UNKNOWN_PATTERN = re.compile(r"(?:unknown|inconnue?|n/?a)$", re.IGNORECASE)
+
+# Maximum tokens of the answer to a follow-up question: a few short answers
+REASK_MAX_TOKENS = 128
+
+# Default number of follow-up questions per article and model
+MAX_REASKS = 1
+
+# Words of the sentences that can answer a missing question, by question number. The follow-up question only
+# includes these sentences of the article, not the whole article
+FIELD_CUES = {
+    "2": re.compile(r"\b(?:rain\w*|storms?|hurricanes?|typhoons?|cyclones?|snow ?melt|dams?|levees?|tides?|surges?|"
+                    r"pluies?|orages?|tempêtes?|ouragans?|fonte|barrages?|digues?|crues?|caus\w*)\b", re.IGNORECASE),
+    "3": re.compile(r"\b(?:\d{4}|jan\w*|feb\w*|march|april|may|june|july|august|sept\w*|oct\w*|nov\w*|dec\w*|"
+                    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|yesterday|"
+                    r"janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre|"
+                    r"lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche|hier)\b", re.IGNORECASE),
+    "4": re.compile(r"\b(?:in|at|near|across|à|au|aux|dans|près de)\s+[A-ZÉÎ]"),
+    "5": re.compile(r"\b(?:kill\w*|dead|deaths?|died|drown\w*|bod(?:y|ies)|victims?|missing|injur\w*|casualt\w*|"
+                    r"morts?|décès|décédée?s?|noyée?s?|victimes?|disparue?s?|blessée?s?)\b", re.IGNORECASE),
+    "6": re.compile(r"\b(?:evacuat\w*|shelters?|rescued|displaced|évacu\w*|sinistrée?s?|hébergée?s?|relogée?s?)\b",
+                    re.IGNORECASE),
+    "7": re.compile(r"\b(?:in|at|near|across|à|au|aux|dans|près de)\s+[A-ZÉÎ]"),
+}
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Sentences per missing question, and maximum length of the excerpt of the follow-up question
+EXCERPT_SENTENCES = 2
+MAX_EXCERPT_CHARS = 800
+
+# Texts of the follow-up question, by language
+REASK_TEXTS = {
+    "en": {
+        "instructions": "Some of your answers to the questions about the article are missing or invalid. "
+                        "Answer only the questions below.",
+        "answers_label": "Your other answers:",
+        "missing": "no answer",
+        "invalid": "invalid answer: {value}",
+        "excerpt_label": "Excerpt of the article:",
+    },
+    "fr": {
+        "instructions": "Certaines de vos réponses aux questions sur l'article sont manquantes ou invalides. "
+                        "Répondez seulement aux questions ci-dessous.",
+        "answers_label": "Vos autres réponses :",
+        "missing": "pas de réponse",
+        "invalid": "réponse invalide : {value}",
+        "excerpt_label": "Extrait de l'article :",
+    },
+}
+REASK_TEXTS[MULTILINGUAL_PROMPT] = REASK_TEXTS["en"]
+
+def question_keys(template):
+    """Returns the numbers of the questions of a prompt template ('1' to '7')."""
+    return [question.split('.', 1)[0] for question in template.questions]
+
+def answer_tool(template, keys=None):
+    """Returns the tool the model calls with its answers, with a strict schema of the questions.
+
+    Args:
+        template (PromptTemplate): Prompt template, for the language and the questions.
+        keys (list, optional): Numbers of the questions to answer. Defaults to all the questions of the template.
+
+    Returns:
+        dict: Tool with 'name', 'description' and 'parameters' (JSON schema of the answers).
+    """
+    questions = dict(zip(question_keys(template), template.questions))
+    keys = keys or list(questions)
+
+    properties = {}
+    for key in keys:
+        properties[key] = {"type": "string", "description": questions[key]}
+        if FIELD_KINDS[key] in ENUMS:
+            properties[key]["enum"] = ENUMS[FIELD_KINDS[key]]
+
+    return {
+        "name": TOOL_NAME,
+        "description": TOOL_DESCRIPTIONS[template.language],
+        "parameters": {"type": "object", "properties": properties, "required": keys, "additionalProperties": False},
+    }
+
+def parse_answers(response):
+    """Returns the answers of a model response, from its tool call or its JSON text.
+
+    Args:
+        response (LLMResponse): Model response.
+
+    Returns:
+        dict: Answers by question number, or None if the response has no JSON object.
+    """
+    if isinstance(response.arguments, dict):
+        return response.arguments
+
+    # Models and servers without tool calls answer in text
+    text = ''.join(char for char in response.text or '' if char.isprintable())
+    is_balanced, _ = check_brackets_balance(text)
+    if not is_balanced:
+        text = correct_brackets(text)
+    try:
+        answers = json.loads(text)
+    except ValueError:
+        return None
+    return answers if isinstance(answers, dict) else None
+
+def validate_answers(answers, keys):
+    """Checks every answer against the kind of its question.
+
+    Without flood event, the other answers are not checked, and the missing ones are 'NA'.
+
+    Args:
+        answers (dict): Answers by question number (see parse_answers), or None.
+        keys (list): Numbers of the questions.
+
+    Returns:
+        tuple: Valid answers by question number (full dates truncated to their month), and the errors by
+            question number: 'missing', or the invalid answer.
+    """
+    answers = answers or {}
+    valid, errors = {}, {}
+
+    flag = answers.get("1")
+    no_flood = isinstance(flag, str) and bool(NO_PATTERN.match(flag.strip()))
+
+    for key in keys:
+        value = answers.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str) or not value.strip():
+            if no_flood:
+                valid[key] = "NA"
+            else:
+                errors[key] = "missing"
+            continue
+
+        value = value.strip()
+        kind = FIELD_KINDS[key]
+        if no_flood and key != "1":
+            valid[key] = value
+        elif kind == "flag" and FLAG_PATTERN.match(value):
+            valid[key] = value
+        elif kind == "ternary" and TERNARY_PATTERN.match(value):
+            valid[key] = value
+        elif kind == "month" and MONTH_PATTERN.match(value):
+            valid[key] = MONTH_PATTERN.match(value).group(1)
+        elif kind == "month" and UNKNOWN_PATTERN.match(value):
+            valid[key] = value
+        elif kind == "text":
+            valid[key] = value
+        else:
+            errors[key] = value
+
+    return valid, errors
+
+def excerpt(url_content, keys):
+    """Returns the sentences of the article that can answer the missing questions.
+
+    Args:
+        url_content (str): Content of the article.
+        keys (list): Numbers of the missing questions.
+
+    Returns:
+        str: The first sentences matching the cues of every question, in the order of the article.
+    """
+    sentences = SENTENCE_END.split(url_content or '')
+    selected = set()
+    for key in keys:
+        matching = [i for i, sentence in enumerate(sentences) if key in FIELD_CUES and FIELD_CUES[key].search(sentence)]
+        selected.update(matching[:EXCERPT_SENTENCES])
+
+    text = ' '.join(sentences[i] for i in sorted(selected))
+    return text[:MAX_EXCERPT_CHARS]
+
+def reask_messages(template, answers, errors, url_content):
+    """Builds the follow-up question for the missing and invalid answers only.
+
+    The invalid answers are asked again with the answer to correct. For the missing answers, only the sentences
+    of the article that can answer them are included, not the whole article.
+
+    Args:
+        template (PromptTemplate): Prompt template of the first call.
+        answers (dict): Valid answers by question number.
+        errors (dict): Errors by question number (see validate_answers).
+        url_content (str): Content of the article.
+
+    Returns:
+        list: Chat messages.
+    """
+    texts = REASK_TEXTS[template.language]
+    questions = dict(zip(question_keys(template), template.questions))
+
+    lines = [texts["instructions"], "", f"{texts['answers_label']} {json.dumps(answers, ensure_ascii=False)}", ""]
+    for key in sorted(errors, key=int):
+        reason = texts["missing"] if errors[key] == "missing" else texts["invalid"].format(value=errors[key])
+        lines.append(f"{questions[key]} ({reason})")
+
+    missing = [key for key in errors if errors[key] == "missing"]
+    context = excerpt(url_content, missing) if missing else ''
+    if context:
+        lines += ["", f"{texts['excerpt_label']} {context}"]
+
+    return [{"role": "user", "content": "\n".join(lines)}]
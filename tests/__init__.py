@@ -0,0 +1,11 @@
+# tests/__init__.py
+
+import os
+import atexit
+import shutil
+import tempfile
+
+# The tests write their log files to a temporary folder, not to the logs folder of the repository
+LOG_DIR = tempfile.mkdtemp(prefix="nlp_flex_logs_")
+os.environ.setdefault("NLP_FLEX_LOG_DIR", LOG_DIR)
+atexit.register(shutil.rmtree, LOG_DIR, ignore_errors=True)
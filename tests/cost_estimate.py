@@ -0,0 +1,82 @@
+# tests/cost_estimate.py
+
+import unittest
+import sys
+import os
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from cost_estimate.py
+from cost_estimate import estimate_tokens, prompt_tokens, parse_prices, model_statistics, estimate_run, format_duration
+from content_extractor import ContentExtractor
+from llm_backends import make_backend
+
+class TestCostEstimate(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="", max_tokens=500)
+        self.articles_df = pd.DataFrame({
+            'New_Content': ["Heavy rain flooded the streets of Montreal. " * 20, "La rivière a débordé. " * 10, "Text"],
+            'Language': ['en', 'fr', 'de']})
+
+    def test_prompt_tokens(self):
+        self.assertEqual(estimate_tokens("a" * 9), 3)
+        self.assertEqual(estimate_tokens(""), 0)
+
+        # The static prefix and the article of the 'user' layout are both counted
+        messages = self.content_extractor.prepare_prompt('en', "x" * 400, prompt_style="user")
+        self.assertGreater(prompt_tokens(messages), 100 + estimate_tokens(messages[0]["content"][0]))
+
+    def test_parse_prices(self):
+        prices = parse_prices([("my-model", "0.001, 0.002")])
+        self.assertEqual(prices["my-model"], (0.001, 0.002))
+        self.assertIn("gpt-3.5-turbo", prices)
+        with self.assertRaises(ValueError):
+            parse_prices([("my-model", "free")])
+
+    def test_estimate_run(self):
+        backends = {"openai": make_backend("openai", requests_per_minute=6, max_concurrency=4)}
+        model_specs = [("openai", "gpt-3.5-turbo"), ("openai", "my-model")]
+        reports_df = pd.DataFrame({"model": ["gpt-3.5-turbo"] * 3, "status": ["ok", "ok", "error"],
+                                   "latency": [1.0, 3.0, 60.0], "output_tokens": [40, 60, 0]})
+
+        estimate_df = estimate_run(self.content_extractor, self.articles_df, model_specs, backends,
+                                   stats=model_statistics(reports_df))
+        measured, unmeasured, total = (row for _, row in estimate_df.iterrows())
+
+        # The article in an unsupported language is not sent to the models
+        self.assertEqual(measured["calls"], 2)
+        self.assertEqual(measured["input_tokens"], unmeasured["input_tokens"])
+        self.assertEqual(measured["output_tokens"], 100)
+        self.assertEqual(unmeasured["output_tokens"], 1000)
+
+        # Two models share a rate limit of 6 requests per minute: 2 calls take 40 seconds
+        self.assertEqual(measured["wall_time_s"], 40)
+        self.assertEqual(total["wall_time_s"], 80)
+
+        # Without a price for a model, the total cost is unknown
+        self.assertAlmostEqual(measured["cost_usd"], round((measured["input_tokens"] * 0.0005 + 100 * 0.0015) / 1000, 4))
+        self.assertTrue(pd.isna(unmeasured["cost_usd"]))
+        self.assertTrue(pd.isna(total["cost_usd"]))
+
+    def test_zero_latency(self):
+        # Without a measured duration of the calls (recorded or cached responses), the default duration is used
+        backends = {"openai_compatible": make_backend("openai_compatible", base_url="http://localhost:8080/v1", max_concurrency=4)}
+        model_specs = [("openai_compatible", "gpt-3.5-turbo"), ("openai_compatible", "my-model")]
+        reports_df = pd.DataFrame({"model": ["gpt-3.5-turbo"] * 2, "status": ["ok", "ok"],
+                                   "latency": [0.0, 0.0], "output_tokens": [40, 60]})
+
+        estimate_df = estimate_run(self.content_extractor, self.articles_df, model_specs, backends,
+                                   stats=model_statistics(reports_df))
+        measured, unmeasured, _ = (row for _, row in estimate_df.iterrows())
+        self.assertTrue(measured["measured"])
+        self.assertGreater(measured["wall_time_s"], 0)
+        self.assertEqual(measured["wall_time_s"], unmeasured["wall_time_s"])
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(7510), "2h 05m 10s")
+        self.assertEqual(format_duration(59.6), "1m 00s")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+# tests/evaluation.py
+
+import unittest
+import sys
+import os
+import tempfile
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from evaluation.py
+from evaluation import hfe_labels, attach_content, settings_grid, score_field, evaluate, summarise_evaluation, recommend_setting
+from llm_backends import LLMResponse, make_backend
+from content_extractor import ContentExtractor
+
+ANSWERS = {
+    "mistral.mistral-7b-instruct-v0:2": '{"1": "Yes", "2": "Rain", "3": "2023-04", "4": "Montréal", "5": "No", "6": "Yes", "7": "Canada"}',
+    "mistral.mistral-large-2402-v1:0": '{"1": "Yes", "2": "Heavy rainfall", "3": "2023-05", "4": "Montreal, Laval", "5": "No", "6": "Yes", "7": "Canada"}',
+}
+
+class FakeBackend:
+    # Backend answering every call of a model with the same answer and latency
+    name = "bedrock"
+    prompt_style = "system"
+    max_concurrency = 4
+
+    def __init__(self):
+        self.calls = 0
+
+    async def acomplete(self, messages, model, temperature, max_tokens, tool=None):
+        self.calls += 1
+        latency = 0.5 if "7b" in model else 2.0
+        return LLMResponse(ANSWERS[model], model, 1000, 50, latency)
+
+    async def aclose(self):
+        pass
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.hfe_df = pd.DataFrame({
+            "start_date": ["2023-05-01", "2023-05-01"],
+            "locality": ["Montréal", "Laval"],
+            "flood_cause": ["Heavy rain", "Heavy rain"],
+            "death": ["no", "no"],
+            "evacuation": ["yes", "yes"],
+            "link_1_en": ["https://news.example.com/flood?utm_source=x", "https://news.example.com/flood"],
+            "link_1_fr": ["https://nouvelles.example.com/crue", None],
+        })
+        self.content_df = pd.DataFrame({
+            "URL": ["https://news.example.com/flood", "https://nouvelles.example.com/crue"],
+            "New_Content": ["Heavy rain flooded Montreal and Laval in May 2023.", "La pluie a inondé Montréal."],
+            "Language": ["en", "fr"],
+            "Is_Article": [1, 1],
+        })
+        self.models = list(ANSWERS)
+
+    def test_hfe_labels(self):
+        labels_df = hfe_labels(self.hfe_df)
+        # The article shared by two localities is labelled once, with both localities
+        self.assertEqual(labels_df.shape[0], 2)
+        self.assertEqual(labels_df.loc[0, "location"], "Montréal, Laval")
+        self.assertEqual(labels_df["Language"].tolist(), ["en", "fr"])
+        self.assertEqual(labels_df.loc[0, "date"], "2023-05")
+
+        # Tracking parameters don't prevent finding the content
+        articles_df, missing_df = attach_content(labels_df, self.content_df)
+        self.assertEqual(articles_df.shape[0], 2)
+        self.assertTrue(missing_df.empty)
+
+    def test_score_field(self):
+        normalise = ContentExtractor(solution="").normalise_answer
+        self.assertEqual(score_field("death", "No", "no", normalise), 1.0)
+        self.assertEqual(score_field("evacuation", "Unknown", "yes", normalise), 0.0)
+        self.assertEqual(score_field("date", "2023-05-02", "2023-05", normalise), 1.0)
+        self.assertEqual(score_field("location", "Montreal", "Montréal, Laval", normalise), 1.0)
+        self.assertEqual(score_field("flood_cause_en", "Heavy rainfall", "rain", normalise), 1.0)
+        # Unknown labels are not scored
+        self.assertTrue(pd.isna(score_field("death", "No", "unknown", normalise)))
+
+    def test_evaluate_and_replay(self):
+        articles_df, _ = attach_content(hfe_labels(self.hfe_df), self.content_df)
+        settings = settings_grid([("bedrock", model) for model in self.models], [0.2], [256])
+        prices = {model: (0.001, 0.002) for model in self.models}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            record_path = os.path.join(tmp, "recordings.jsonl")
+            backend = FakeBackend()
+            results_df, wall_times = evaluate(articles_df, settings, {"bedrock": backend}, prices, record_path=record_path)
+            self.assertEqual(backend.calls, 4)
+
+            summary_df = summarise_evaluation(results_df, wall_times, min_accuracy=0.9).set_index("setting")
+            small, large = summary_df.index
+            self.assertEqual(summary_df.loc[small, "accuracy_date"], 0.0)
+            self.assertEqual(summary_df.loc[large, "accuracy"], 1.0)
+            self.assertEqual(summary_df.loc[large, "latency_p50"], 2.0)
+            self.assertEqual(summary_df.loc[large, "tokens_per_article"], 1050)
+            self.assertAlmostEqual(summary_df.loc[large, "cost_per_1k_articles"], 1.1)
+            self.assertEqual(summary_df.loc[large, "parse_failure_rate"], 0.0)
+
+            # The fastest setting misses the accuracy bar
+            self.assertEqual(recommend_setting(summary_df.reset_index())["setting"], large)
+            self.assertIsNone(recommend_setting(summarise_evaluation(results_df, min_accuracy=1.1)))
+
+            # The recorded responses are replayed offline, with the same results
+            with open(record_path, encoding="utf-8") as f:
+                self.assertEqual(len(f.readlines()), 4)
+            replay = make_backend("recorded", path=record_path)
+            self.assertEqual(replay.prompt_style, "system")
+            replay_settings = [{**setting, "solution": "recorded"} for setting in settings]
+            replay_df, _ = evaluate(articles_df, replay_settings, {"recorded": replay}, prices)
+            self.assertEqual(replay_df["latency"].tolist(), results_df["latency"].tolist())
+            self.assertEqual(replay_df["correct_date"].tolist(), results_df["correct_date"].tolist())
+
+            # A call that was not recorded is an error
+            unrecorded = [{**replay_settings[0], "temp": 0.5}]
+            errors_df, _ = evaluate(articles_df, unrecorded, {"recorded": replay}, prices)
+            self.assertEqual(errors_df["status"].unique().tolist(), ["error"])
+            self.assertEqual(summarise_evaluation(errors_df).loc[0, "error_rate"], 1.0)
+
+    def test_parse_failure(self):
+        articles_df, _ = attach_content(hfe_labels(self.hfe_df), self.content_df)
+        backend = FakeBackend()
+        ANSWERS["broken"] = "I cannot answer these questions."
+        try:
+            results_df, _ = evaluate(articles_df, settings_grid([("bedrock", "broken")], [0.2], [256]), {"bedrock": backend})
+        finally:
+            del ANSWERS["broken"]
+        self.assertEqual(summarise_evaluation(results_df).loc[0, "parse_failure_rate"], 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# tests/event_aggregation.py
+
+import unittest
+import sys
+import os
+import tempfile
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from event_aggregation.py
+from event_aggregation import EventIndex, aggregate_events, parse_month, format_month, split_places
+
+def article(link, location, date="2024-08", country="United States", cause="Heavy rain", is_happened="Yes",
+            death="Unknown", evacuation="No", published_date="2024-08-10T07:00:00Z", **columns):
+    return {"is_happened": is_happened, "flood_cause_en": cause, "date": date, "location": location, "death": death,
+            "evacuation": evacuation, "country": country, "link": link, "published_date": published_date, **columns}
+
+class TestEventAggregation(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "events.db")
+        self.index = EventIndex(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def test_parse_month(self):
+        self.assertEqual(format_month(parse_month("2024-08-09")), "2024-08")
+        self.assertEqual(format_month(parse_month("AAA-MM: 2023-07-14")), "2023-07")
+        # Without a month in the answer, the month of publication is used
+        self.assertEqual(format_month(parse_month("Inconnu", "2024-08-10T07:31:37Z")), "2024-08")
+        self.assertIsNone(parse_month("Unknown", None))
+
+    def test_split_places(self):
+        self.assertEqual(split_places("['Gatineau', 'Central Experimental Farm (Ottawa)']"),
+                         ["Gatineau", "Central Experimental Farm", "Ottawa"])
+        self.assertEqual(split_places("Inconnu"), [])
+
+    def test_same_place_and_month(self):
+        added_df = self.index.add(pd.DataFrame([
+            article("https://a.com/1", "Jasper, Woodhull", date="2024-08-09"),
+            article("https://b.com/2", "Woodhull, Addison", date="2024-08", death="Yes (two deaths)"),
+            # Same place name in another country, and same place two years later: other events
+            article("https://c.com/3", "Jasper", country="Canada"),
+            article("https://d.com/4", "Woodhull", date="2022-08"),
+            # No flood event: not added
+            article("https://e.com/5", "Jasper", is_happened="No"),
+        ]))
+
+        self.assertEqual(added_df.shape[0], 4)
+        event_ids = added_df.set_index("link")["event_id"]
+        self.assertEqual(event_ids["https://a.com/1"], event_ids["https://b.com/2"])
+        self.assertEqual(len(set(event_ids)), 3)
+
+        events_df = self.index.events().set_index("event_id")
+        event = events_df.loc[event_ids["https://a.com/1"]]
+        self.assertEqual(event["num_articles"], 2)
+        self.assertEqual(event["location"], "Woodhull; Jasper; Addison")
+        self.assertEqual(event["death"], "Yes")
+        self.assertEqual(event["evacuation"], "No")
+        self.assertEqual(event["links"], "https://a.com/1 https://b.com/2")
+
+    def test_named_storm(self):
+        # The storm links the articles about different places, the month before or after
+        added_df = self.index.add(pd.DataFrame([
+            article("https://a.com/1", "Savannah", country="United States", cause="Tropical Storm Debby", date="2024-08"),
+            article("https://b.com/2", "Trois-Rivières", country="Canada", cause="Remnants of tropical storm Debby", date="2024-09"),
+        ]))
+        self.assertEqual(added_df["event_id"].nunique(), 1)
+        event = self.index.events().iloc[0]
+        self.assertEqual((event["start_month"], event["end_month"]), ("2024-08", "2024-09"))
+        self.assertEqual(event["country"], "United States, Canada")
+
+    def test_incremental(self):
+        self.index.add(pd.DataFrame([article("https://a.com/1", "Jasper"), article("https://b.com/2", "Addison")]))
+        self.index.close()
+
+        # A later run attaches its articles to the events of the previous runs, and merges the events it links
+        self.index = EventIndex(self.path)
+        added_df = self.index.add(pd.DataFrame([
+            article("https://a.com/1", "Jasper"),
+            article("https://c.com/3", "Addison, Jasper", date="2024-09"),
+        ]))
+
+        self.assertEqual(added_df["link"].tolist(), ["https://c.com/3"])
+        events_df = self.index.events()
+        self.assertEqual(events_df.shape[0], 1)
+        self.assertEqual(events_df["event_id"].iloc[0], 1)
+        self.assertEqual(events_df["num_articles"].iloc[0], 3)
+        self.assertEqual(sorted(events_df["links"].iloc[0].split()), ["https://a.com/1", "https://b.com/2", "https://c.com/3"])
+
+        # The cells of the merged event find it again
+        added_df = self.index.add(pd.DataFrame([article("https://d.com/4", "Addison", date="2024-10")]))
+        self.assertEqual(added_df["event_id"].tolist(), [1])
+
+    def test_gazetteer_places(self):
+        # With the gazetteer columns, the places are matched by GeoNames Id, without the country itself
+        added_df = self.index.add(pd.DataFrame([
+            article("https://a.com/1", "Paris, Texas", location_ids="4717560;4736286", location_names="Paris, US;Texas, US"),
+            article("https://b.com/2", "Paris (TX)", location_ids="4717560", location_names="Paris, US"),
+            article("https://c.com/3", "US", location_ids="6252001", location_names="United States, US"),
+        ]))
+        event_ids = added_df["event_id"].tolist()
+        self.assertEqual(event_ids[0], event_ids[1])
+        self.assertNotEqual(event_ids[0], event_ids[2])
+
+    def test_aggregate_events(self):
+        out_fn = os.path.join(self.tmp_dir.name, "flood_events.csv")
+        aggregate_events(pd.DataFrame([article("https://a.com/1", "Jasper")]), self.path, out_fn)
+        events_df = pd.read_csv(out_fn, sep='|')
+        self.assertEqual(events_df["location"].tolist(), ["Jasper"])
+
+        # Without results, the events of the previous runs are saved
+        aggregate_events(pd.DataFrame(), self.path, out_fn)
+        self.assertEqual(pd.read_csv(out_fn, sep='|').shape[0], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# tests/gazetteer.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import json
+import pickle
+import tempfile
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from gazetteer.py
+from gazetteer import read_geonames, build_index, Gazetteer
+from content_extractor import ContentExtractor
+from llm_backends import LLMResponse, make_backend
+
+# Extracts of the GeoNames dumps: countryInfo.txt, admin1CodesASCII.txt and cities15000.txt
+COUNTRIES = [
+    ["CA", "CAN", "124", "CA", "Canada", "Ottawa", "9984670", "37058856", "NA", ".ca", "CAD", "Dollar", "1", "", "", "en-CA,fr-CA", "6251999", "US", ""],
+    ["FR", "FRA", "250", "FR", "France", "Paris", "547030", "66987244", "EU", ".fr", "EUR", "Euro", "33", "", "", "fr-FR", "3017382", "", ""],
+    ["US", "USA", "840", "US", "United States", "Washington", "9629091", "327167434", "NA", ".us", "USD", "Dollar", "1", "", "", "en-US", "6252001", "CA", ""],
+]
+ADMIN1 = [["CA.01", "Alberta", "Alberta", "5883102"], ["CA.10", "Quebec", "Quebec", "6115047"], ["US.TX", "Texas", "Texas", "4736286"]]
+CITIES = [
+    (6077243, "Montréal", "Montreal", "Montreal,Montréal,MTL", "CA", 1600000),
+    (2988507, "Paris", "Paris", "Paname", "FR", 2138551),
+    (4717560, "Paris", "Paris", "", "US", 24782),
+    (5985538, "Jasper", "Jasper", "", "CA", 4590),
+    (4069458, "Jasper", "Jasper", "", "US", 14000),
+    (5892532, "Banff", "Banff", "", "CA", 7851),
+]
+
+class TestGazetteer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        fns = [os.path.join(self.tmp_dir.name, fn) for fn in ("cities.txt", "countryInfo.txt", "admin1CodesASCII.txt")]
+
+        with open(fns[0], "w", encoding="utf-8") as f:
+            for geonameid, name, ascii_name, alternate_names, country, population in CITIES:
+                f.write("\t".join([str(geonameid), name, ascii_name, alternate_names, "0", "0", "P", "PPL", country, "", "",
+                                   "", "", "", str(population), "", "", "", "2024-01-01"]) + "\n")
+        with open(fns[1], "w", encoding="utf-8") as f:
+            f.write("#ISO\tISO3\tISO-Numeric\tfips\tCountry\n")
+            f.writelines("\t".join(row) + "\n" for row in COUNTRIES)
+        with open(fns[2], "w", encoding="utf-8") as f:
+            f.writelines("\t".join(row) + "\n" for row in ADMIN1)
+
+        self.index_dir = build_index(*read_geonames(*fns), os.path.join(self.tmp_dir.name, "index"))
+        self.gazetteer = Gazetteer(self.index_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_normalise_location(self):
+        places = self.gazetteer.normalise_location("Montreal (Québec) and Banff")
+        self.assertEqual(places["location_ids"], "6077243;6115047;5892532")
+        self.assertEqual(places["location_names"], "Montréal, CA;Quebec, CA;Banff, CA")
+        self.assertEqual(places["country_codes"], "CA")
+
+        # French names of the countries are known
+        self.assertEqual(self.gazetteer.normalise_location("États-Unis")["location_ids"], "6252001")
+        self.assertEqual(self.gazetteer.normalise_location("Unknown")["location_ids"], "")
+
+    def test_ambiguous_names(self):
+        # The largest place, unless the text names the country or the state of another one
+        self.assertEqual(self.gazetteer.normalise_location("Paris")["country_codes"], "FR")
+        self.assertEqual(self.gazetteer.normalise_location("Paris, Texas")["location_ids"], "4717560;4736286")
+        self.assertEqual(self.gazetteer.normalise_location("Jasper")["country_codes"], "US")
+        self.assertEqual(self.gazetteer.normalise_location("Jasper, Alberta")["country_codes"], "CA")
+
+    def test_annotate(self):
+        # In running text, only the capitalised names are places
+        content = "Heavy rain flooded Montréal and Banff on Monday, while paris officials in France watched."
+        self.assertEqual(self.gazetteer.annotate(content), [("CA", "Canada"), ("FR", "France")])
+
+    def test_pickle_reloads_index(self):
+        # Worker processes load the memory-mapped index instead of receiving a copy
+        self.assertLess(len(pickle.dumps(self.gazetteer)), 500)
+        self.assertEqual(pickle.loads(pickle.dumps(self.gazetteer)).normalise_location("Banff")["location_ids"], "5892532")
+
+    def test_country_derived_without_question(self):
+        content_extractor = ContentExtractor(solution="", gazetteer=self.gazetteer, ask_country=False)
+        content_extractor.solution = "openai_compatible"
+        content_extractor.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+
+        # The country question is left out of the prompt
+        messages = content_extractor.prepare_prompt("en", "Sample content")
+        self.assertNotIn("7.", messages[0]["content"][0])
+
+        answers = {"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Unknown", "5": "No", "6": "Yes"}
+        response = LLMResponse(json.dumps(answers), "model", 0, 0, 0.0)
+        with mock.patch.object(content_extractor, "make_llm_call", return_value=response):
+            result_df = content_extractor.extract_single_event_chatopenai(
+                "Rivers overflowed in Jasper, Alberta.", "https://example.com", "en", "2024-08-10T07:31:37Z")
+
+        # Without location answer, the country comes from the places of the article
+        self.assertEqual(result_df["country"].iloc[0], "Canada")
+        self.assertEqual(result_df["location_ids"].iloc[0], "")
+
+if __name__ == "__main__":
+    unittest.main()
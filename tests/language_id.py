@@ -0,0 +1,200 @@
+# tests/language_id.py
+
+import unittest
+import sys
+import os
+import tempfile
+import types
+import configparser
+from unittest import mock
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from language_id.py
+from language_id import detect_language, route_languages, SUPPORTED, CORRECTED, MULTILINGUAL, SKIPPED
+from prompts import get_prompt_template, MULTILINGUAL_INSTRUCTION
+from structured_output import answer_tool
+from content_extractor import ContentExtractor
+from nlp_flex import run
+
+CONTENTS = {
+    "en": "Heavy rain flooded the streets of Montreal on Saturday and the river is rising after the storm.",
+    "fr": "De fortes pluies ont inondé les rues de Laval samedi et la rivière est en crue après la tempête.",
+    "es": "Las lluvias torrenciales inundaron las calles de la ciudad y el río se desbordó tras la tormenta.",
+    "ru": "Сильные дожди затопили улицы города, река вышла из берегов.",
+}
+
+def extract_events(extractor, df, timeout=None, out_fn=None, save=True, control=None):
+    # Answers of the model, without calling it
+    return pd.DataFrame({"is_happened": "Yes", "link": df["URL"].values, "published_date": df["PublishedDate"].values})
+
+def fake_make_request(self, url):
+    return types.SimpleNamespace(content=url.encode(), encoding="utf-8")
+
+def fake_parse_response(self, url, response, language='en'):
+    # Runs in a parse process: the content of every article is in the language at the end of its URL
+    return "", CONTENTS[url.rsplit("-", 1)[1]], 1
+
+async def fake_extract_single_event(self, url_content, url, language, publish_date):
+    return pd.DataFrame({"is_happened": ["Yes"], "link": [url], "language": [language]})
+
+def fake_make_page(self, url):
+    return types.SimpleNamespace(content=f"<p>{CONTENTS[url.rsplit('-', 1)[1]]}</p>".encode(), encoding="utf-8")
+
+def fake_extract_article(self, response, language):
+    # The text of the page, as extracted by the newspaper library
+    return types.SimpleNamespace(summary="", text=response.text, is_valid_body=lambda: True)
+
+async def fake_extract_content_event(self, url_content, url, language, publish_date):
+    return pd.DataFrame({"is_happened": ["Yes"], "link": [url], "language": [language], "content": [url_content]})
+
+class TestLanguageId(unittest.TestCase):
+    def setUp(self):
+        # The second article is in French but declared in English
+        self.df = pd.DataFrame({
+            "URL": [f"https://news.example.com/{i}" for i in range(5)],
+            "Language": ["en", "en", "en", "fr", "fr"],
+            "New_Content": [CONTENTS["en"], CONTENTS["fr"], CONTENTS["es"], CONTENTS["ru"], "Inondations à Laval"],
+            "Is_Article": 1,
+            "PublishedDate": "2024-08-10T07:31:37Z",
+        })
+
+    def test_detect_language(self):
+        for language, text in CONTENTS.items():
+            detected, confidence = detect_language(text)
+            self.assertEqual(detected, language)
+            self.assertGreaterEqual(confidence, 0.6)
+        self.assertEqual(detect_language("大雨で市内の道路が冠水した")[0], "ja")
+
+        # Too short to be recognised
+        self.assertEqual(detect_language("Flooding in Montreal"), (None, 0.0))
+        self.assertEqual(detect_language(float("nan")), (None, 0.0))
+
+    def test_route_languages(self):
+        kept_df, routed_df = route_languages(self.df, self.df["New_Content"])
+        self.assertEqual(routed_df["language_route"].tolist(), [SUPPORTED, CORRECTED, SKIPPED, SKIPPED, SUPPORTED])
+        self.assertEqual(routed_df["detected_language"].tolist(), ["en", "fr", "es", "ru", None])
+        self.assertEqual(routed_df["declared_language"].tolist(), self.df["Language"].tolist())
+        self.assertEqual(kept_df["Language"].tolist(), ["en", "fr", "fr"])
+        self.assertEqual(list(kept_df.columns), list(self.df.columns))
+
+        kept_df, routed_df = route_languages(self.df, self.df["New_Content"], unsupported="multilingual")
+        self.assertEqual(routed_df["language_route"].tolist(), [SUPPORTED, CORRECTED, MULTILINGUAL, MULTILINGUAL, SUPPORTED])
+        self.assertEqual(kept_df["Language"].tolist(), ["en", "fr", "es", "ru", "fr"])
+
+        with self.assertRaises(ValueError):
+            route_languages(self.df, self.df["New_Content"], unsupported="translate")
+
+    def test_multilingual_prompt(self):
+        messages = ContentExtractor(solution="", multilingual_prompt=True).prepare_prompt("es", CONTENTS["es"], prompt_style="user")
+        self.assertIn(MULTILINGUAL_INSTRUCTION, messages[0]["content"][0])
+        self.assertTrue(messages[0]["content"][1].endswith(CONTENTS["es"]))
+        self.assertEqual(answer_tool(get_prompt_template("multi", "system"))["name"], "record_answers")
+
+        # Without the multilingual prompt, the other languages are not supported
+        with self.assertRaises(ValueError):
+            ContentExtractor(solution="").prepare_prompt("es", CONTENTS["es"], prompt_style="user")
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_fn = os.path.join(tmp, "extracted.csv")
+            self.df.to_csv(input_fn, index=False, sep='|')
+            routes_fn = os.path.join(tmp, "routes.csv")
+            config = configparser.ConfigParser()
+            config.read_dict({
+                "General": {"input_filename": input_fn, "output_filename": os.path.join(tmp, "results.csv"), "mode": "nlp",
+                            "num_processes": "1", "url_col_name": "URL", "pub_date_col_name": "PublishedDate"},
+                "NLP": {"solution": "openai_compatible", "model": "llama3", "temp": "0.2", "max_tokens": "256"},
+                "openai_compatible": {"base_url": "http://localhost:8080/v1"},
+                "Languages": {"enabled": "true", "unsupported": "skip", "content_filename": routes_fn},
+            })
+
+            with mock.patch.object(ContentExtractor, "extract_events_chatopenai", autospec=True, side_effect=extract_events) as extract:
+                run(config)
+            # The articles in an unsupported language are not sent to the models
+            articles_df = extract.call_args[0][1]
+            self.assertEqual(articles_df["URL"].tolist(), self.df["URL"][[0, 1, 4]].tolist())
+            self.assertEqual(articles_df["Language"].tolist(), ["en", "fr", "fr"])
+
+            # Every article has its route in the output
+            routes_df = pd.read_csv(routes_fn, sep='|')
+            self.assertEqual(routes_df["language_route"].tolist(), [SUPPORTED, CORRECTED, SKIPPED, SKIPPED, SUPPORTED])
+            self.assertNotIn("New_Content", routes_df.columns)
+
+    @mock.patch.object(ContentExtractor, "parse_response", fake_parse_response)
+    @mock.patch.object(ContentExtractor, "make_request", fake_make_request)
+    @mock.patch.object(ContentExtractor, "aextract_single_event", fake_extract_single_event)
+    def test_run_executors(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # The titles are too short to be recognised: the language of the articles is known from their content
+            alerts_df = pd.DataFrame({
+                "Id": range(4),
+                "URL": [f"https://news.example.com/article-{language}" for language in ["en", "fr", "es", "ru"]],
+                "Title": "Flooding", "Content": "", "Language": "en", "PublishedDate": "2024-08-10T07:31:37Z"})
+            input_fn = os.path.join(tmp, "alerts.csv")
+            alerts_df.to_csv(input_fn, index=False, sep='|')
+            output_fn, routes_fn = os.path.join(tmp, "results.csv"), os.path.join(tmp, "routes.csv")
+            config = configparser.ConfigParser()
+            config.read_dict({
+                "General": {"input_filename": input_fn, "output_filename": output_fn, "mode": "all",
+                            "num_processes": "1", "url_col_name": "URL", "pub_date_col_name": "PublishedDate"},
+                "NLP": {"solution": "openai_compatible", "model": "llama3", "temp": "0.2", "max_tokens": "256"},
+                "openai_compatible": {"base_url": "http://localhost:8080/v1"},
+                "Executors": {"fetch_concurrency": "2", "parse_workers": "1", "llm_concurrency": "2"},
+                "Languages": {"enabled": "true", "unsupported": "skip", "content_filename": routes_fn,
+                              "alerts_filename": os.path.join(tmp, "alert_routes.csv")},
+            })
+
+            # The extracted content is saved to a file with a timestamp in the output folder
+            with mock.patch("content_extractor.OUTPUT_FOLDER_PATH", tmp):
+                run(config)
+
+            # Only the articles in a supported language go to the models, with the language of their content
+            events_df = pd.read_csv(output_fn, sep='|')
+            self.assertEqual(sorted(zip(events_df["link"], events_df["language"])),
+                             [(alerts_df["URL"][0], "en"), (alerts_df["URL"][1], "fr")])
+
+            routes_df = pd.read_csv(routes_fn, sep='|')
+            self.assertEqual(routes_df["URL"].tolist(), alerts_df["URL"].tolist())
+            self.assertEqual(routes_df["language_route"].tolist(), [SUPPORTED, CORRECTED, SKIPPED, SKIPPED])
+
+    @mock.patch.object(ContentExtractor, "extract_article", fake_extract_article)
+    @mock.patch.object(ContentExtractor, "make_request", fake_make_page)
+    @mock.patch.object(ContentExtractor, "aextract_single_event", fake_extract_content_event)
+    def test_run_executors_multilingual(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            alerts_df = pd.DataFrame({
+                "Id": range(3),
+                "URL": [f"https://news.example.com/article-{language}" for language in ["fr", "es", "ru"]],
+                "Title": "Flooding", "Content": "", "Language": "fr", "PublishedDate": "2024-08-10T07:31:37Z"})
+            input_fn = os.path.join(tmp, "alerts.csv")
+            alerts_df.to_csv(input_fn, index=False, sep='|')
+            output_fn, routes_fn = os.path.join(tmp, "results.csv"), os.path.join(tmp, "routes.csv")
+            config = configparser.ConfigParser()
+            config.read_dict({
+                "General": {"input_filename": input_fn, "output_filename": output_fn, "mode": "all",
+                            "num_processes": "1", "url_col_name": "URL", "pub_date_col_name": "PublishedDate"},
+                "NLP": {"solution": "openai_compatible", "model": "llama3", "temp": "0.2", "max_tokens": "256"},
+                "openai_compatible": {"base_url": "http://localhost:8080/v1"},
+                "Executors": {"fetch_concurrency": "2", "parse_workers": "1", "llm_concurrency": "2"},
+                "Languages": {"enabled": "true", "unsupported": "multilingual", "content_filename": routes_fn,
+                              "alerts_filename": os.path.join(tmp, "alert_routes.csv")},
+            })
+
+            with mock.patch("content_extractor.OUTPUT_FOLDER_PATH", tmp):
+                run(config)
+
+            # The language is detected on the content of the page before its characters are filtered, and the
+            # articles sent to the multilingual prompt keep all their characters
+            routes_df = pd.read_csv(routes_fn, sep='|')
+            self.assertEqual(routes_df["detected_language"].tolist(), ["fr", "es", "ru"])
+            self.assertEqual(routes_df["language_route"].tolist(), [SUPPORTED, MULTILINGUAL, MULTILINGUAL])
+
+            events_df = pd.read_csv(output_fn, sep='|').sort_values("link")
+            self.assertEqual(events_df["language"].tolist(), ["es", "fr", "ru"])
+            self.assertEqual(events_df["content"].tolist(), [CONTENTS["es"], CONTENTS["fr"], CONTENTS["ru"]])
+
+if __name__ == "__main__":
+    unittest.main()
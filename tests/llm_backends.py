@@ -0,0 +1,186 @@
+# tests/llm_backends.py
+
+import unittest
+import sys
+import os
+import json
+import pickle
+import asyncio
+import tempfile
+import httpx
+from unittest import mock
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from llm_backends.py
+from llm_backends import make_backend, recording_key, LLMResponse, BedrockBackend, OpenAIBackend, OpenAICompatibleBackend
+from prompts import get_prompt_template
+
+ANSWER = '{"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Montreal", "5": "No", "6": "Yes", "7": "Canada"}'
+
+def chat_completion(request):
+    # Minimal OpenAI-compatible server answering every request with the same answer
+    payload = json.loads(request.content)
+    body = {
+        "model": payload["model"],
+        "choices": [{"message": {"role": "assistant", "content": ANSWER}}],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 40}
+    }
+    return httpx.Response(200, json=body)
+
+class TestLLMBackends(unittest.TestCase):
+    def setUp(self):
+        self.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1", max_concurrency="2")
+        self.messages = [{"role": "user", "content": "Sample content"}]
+
+    def test_make_backend(self):
+        # Options read from a config file are converted to the expected types
+        self.assertIsInstance(self.backend, OpenAICompatibleBackend)
+        self.assertEqual(self.backend.max_concurrency, 2)
+        self.assertIsInstance(make_backend("openai"), OpenAIBackend)
+
+    def test_make_backend_unknown(self):
+        with self.assertRaises(ValueError):
+            make_backend("unknown")
+        with self.assertRaises(ValueError):
+            make_backend("openai_compatible", base_url="http://localhost:8080/v1", unknown_option="1")
+
+    def test_make_backend_missing_base_url(self):
+        with self.assertRaises(ValueError):
+            make_backend("openai_compatible")
+
+    def test_complete(self):
+        self.backend._client = httpx.Client(base_url=self.backend.base_url, transport=httpx.MockTransport(chat_completion))
+        response = self.backend.complete(self.messages, "llama3", 0.8, 512)
+
+        self.assertEqual(response.text, ANSWER)
+        self.assertEqual(response.model, "llama3")
+        self.assertEqual(response.input_tokens, 120)
+        self.assertEqual(response.output_tokens, 40)
+
+    def test_acomplete(self):
+        async def run():
+            self.backend._async_client = httpx.AsyncClient(base_url=self.backend.base_url, transport=httpx.MockTransport(chat_completion))
+            try:
+                return await self.backend.acomplete(self.messages, "llama3", 0.8, 512)
+            finally:
+                await self.backend.aclose()
+
+        response = asyncio.run(run())
+        self.assertEqual(response.text, ANSWER)
+
+    def test_tool_call(self):
+        def tool_completion(request):
+            payload = json.loads(request.content)
+            self.assertEqual(payload["tool_choice"], {"type": "function", "function": {"name": "record_answers"}})
+            self.assertTrue(payload["tools"][0]["function"]["strict"])
+            message = {"role": "assistant", "content": None,
+                       "tool_calls": [{"type": "function", "function": {"name": "record_answers", "arguments": ANSWER}}]}
+            return httpx.Response(200, json={"choices": [{"message": message}], "usage": {}})
+
+        tool = {"name": "record_answers", "description": "Records the answers.", "parameters": {"type": "object"}}
+        self.backend._client = httpx.Client(base_url=self.backend.base_url, transport=httpx.MockTransport(tool_completion))
+        response = self.backend.complete(self.messages, "llama3", 0.8, 512, tool=tool)
+        self.assertEqual(response.arguments, json.loads(ANSWER))
+        self.assertEqual(response.text, ANSWER)
+
+    def test_bedrock_tool_call(self):
+        backend = BedrockBackend(region="ca-central-1")
+        tool = {"name": "record_answers", "description": "Records the answers.", "parameters": {"type": "object"}}
+        request = backend._request(self.messages, 0.8, 512, tool)
+        self.assertEqual(request["toolConfig"]["toolChoice"], {"tool": {"name": "record_answers"}})
+        self.assertEqual(request["toolConfig"]["tools"][0]["toolSpec"]["inputSchema"], {"json": {"type": "object"}})
+
+        body = {"output": {"message": {"content": [{"toolUse": {"toolUseId": "1", "name": "record_answers",
+                                                                 "input": json.loads(ANSWER)}}]}},
+                "usage": {"inputTokens": 100, "outputTokens": 30}}
+        response = backend._parse(body, "mistral", 0.5)
+        self.assertEqual(response.arguments["4"], "Montreal")
+        self.assertEqual(json.loads(response.text), json.loads(ANSWER))
+
+    def test_pickle(self):
+        # Backends are sent to worker processes without their clients
+        self.backend._client = httpx.Client()
+        backend = pickle.loads(pickle.dumps(self.backend))
+        self.assertIsNone(backend._client)
+        self.assertEqual(backend.base_url, self.backend.base_url)
+
+    def test_recorded_backend(self):
+        # Recorded responses are replayed for the same call only
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "recordings.jsonl")
+            response = LLMResponse(ANSWER, "llama3", 120, 40, 1.5)
+            with open(path, "w", encoding="utf-8") as f:
+                record = {"key": recording_key(self.messages, "llama3", 0.8, 512), "prompt_style": "system",
+                          "response": response._asdict()}
+                f.write(json.dumps(record) + "\n")
+
+            backend = make_backend("recorded", path=path)
+            self.assertEqual(backend.prompt_style, "system")
+            self.assertEqual(asyncio.run(backend.acomplete(self.messages, "llama3", 0.8, 512)), response)
+            with self.assertRaises(ValueError):
+                backend.complete(self.messages, "llama3", 0.2, 512)
+
+        with self.assertRaises(ValueError):
+            make_backend("recorded")
+
+    def test_bedrock_region(self):
+        # The region can come from AWS_DEFAULT_REGION or a profile, as resolved by boto3
+        with mock.patch.dict(os.environ, {"AWS_DEFAULT_REGION": "us-west-2", "AWS_ACCESS_KEY_ID": "AKIDEXAMPLE",
+                                          "AWS_SECRET_ACCESS_KEY": "secret"}):
+            for name in ("AWS_REGION", "AWS_PROFILE", "AWS_SESSION_TOKEN"):
+                os.environ.pop(name, None)
+            backend = BedrockBackend()
+            self.assertEqual(backend.client.meta.endpoint_url, "https://bedrock-runtime.us-west-2.amazonaws.com")
+            headers = backend._signed_headers(f"{backend.client.meta.endpoint_url}/model/mistral/converse", "{}")
+            self.assertIn("/us-west-2/bedrock/aws4_request", headers["Authorization"])
+
+        backend = BedrockBackend(region="ca-central-1", endpoint_url="https://vpce-123.bedrock-runtime.ca-central-1.vpce.amazonaws.com")
+        self.assertEqual(backend.client.meta.endpoint_url, "https://vpce-123.bedrock-runtime.ca-central-1.vpce.amazonaws.com")
+
+    def test_bedrock_no_credentials(self):
+        # Without credentials, the asynchronous calls fail with a clear error before any request
+        backend = BedrockBackend(region="ca-central-1")
+        backend._session = mock.Mock(get_credentials=mock.Mock(return_value=None))
+        with self.assertRaises(ValueError):
+            backend._signed_headers("https://bedrock-runtime.ca-central-1.amazonaws.com/model/mistral/converse", "{}")
+
+    def test_bedrock_request(self):
+        # System messages go to the separate 'system' field of the Converse API
+        backend = BedrockBackend(region="ca-central-1")
+        messages = [{"role": "system", "content": "Answer in JSON."}, {"role": "user", "content": "Sample content"}]
+        request = backend._request(messages, 0.8, 512)
+
+        self.assertEqual(request["system"], [{"text": "Answer in JSON."}])
+        self.assertEqual(request["messages"], [{"role": "user", "content": [{"text": "Sample content"}]}])
+        self.assertEqual(request["inferenceConfig"], {"temperature": 0.8, "maxTokens": 512})
+
+    def test_bedrock_prompt_caching(self):
+        # The cache point is placed after the static prefix of the prompt
+        backend = make_backend("bedrock", region="ca-central-1", prompt_caching="true")
+        messages = get_prompt_template("en", "user").render("Sample content")
+        request = backend._request(messages, 0.8, 512)
+
+        content = request["messages"][0]["content"]
+        self.assertEqual(len(content), 3)
+        self.assertIn("Questions:", content[0]["text"])
+        self.assertEqual(content[1], {"cachePoint": {"type": "default"}})
+        self.assertEqual(content[2], {"text": "Content: Sample content"})
+
+        request = backend._request(get_prompt_template("en", "system").render("Sample content"), 0.8, 512)
+        self.assertEqual(request["system"][-1], {"cachePoint": {"type": "default"}})
+
+    def test_prompt_template(self):
+        # The prompt is compiled once, and the article comes after the questions
+        self.assertIs(get_prompt_template("fr", "system"), get_prompt_template("fr", "system"))
+        system_msg, user_msg = get_prompt_template("fr", "system").render("Contenu")
+        self.assertTrue(system_msg["content"].endswith("(ou marquez comme Inconnu)"))
+        self.assertNotIn("[", system_msg["content"])
+        self.assertEqual(user_msg["content"], "Contexte : Contenu")
+
+        with self.assertRaises(ValueError):
+            get_prompt_template("de", "system")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+# tests/llm_dispatcher.py
+
+import unittest
+import sys
+import os
+import json
+import random
+import asyncio
+import tempfile
+from unittest import mock
+import httpx
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from llm_dispatcher.py
+from llm_dispatcher import AsyncDispatcher
+from content_extractor import ContentExtractor
+from llm_backends import make_backend
+
+class TestAsyncDispatcher(unittest.TestCase):
+    def test_map_keeps_input_order(self):
+        in_flight = {"now": 0, "max": 0}
+
+        async def call(value):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(random.uniform(0, 0.01))
+            in_flight["now"] -= 1
+            return value * 2
+
+        dispatcher = AsyncDispatcher(max_concurrency=5)
+        results = asyncio.run(dispatcher.map(call, ((i,) for i in range(50))))
+
+        self.assertEqual(results, [i * 2 for i in range(50)])
+        self.assertLessEqual(in_flight["max"], 5)
+
+    def test_map_timeout(self):
+        async def call(delay):
+            await asyncio.sleep(delay)
+            return delay
+
+        dispatcher = AsyncDispatcher(max_concurrency=2, timeout=0.05)
+        results = asyncio.run(dispatcher.map(call, [(0,), (1,)]))
+
+        self.assertEqual(results[0], 0)
+        self.assertIsInstance(results[1], asyncio.TimeoutError)
+
+    def test_map_errors(self):
+        async def call(value):
+            if value == 1:
+                raise ValueError("Invalid value")
+            return value
+
+        results = asyncio.run(AsyncDispatcher(max_concurrency=2).map(call, [(0,), (1,), (2,)]))
+
+        self.assertEqual(results[0], 0)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 2)
+
+    def test_map_on_result(self):
+        async def call(delay):
+            await asyncio.sleep(delay)
+            return delay
+
+        # Results are reported as soon as they complete, not in the input order
+        completed = []
+        dispatcher = AsyncDispatcher(max_concurrency=3)
+        results = asyncio.run(dispatcher.map(call, [(0.2,), (0.01,), (0.1,)], on_result=lambda i, r: completed.append(i)))
+        self.assertEqual(results, [0.2, 0.01, 0.1])
+        self.assertEqual(completed, [1, 2, 0])
+
+    def test_cancel(self):
+        dispatcher = AsyncDispatcher(max_concurrency=1)
+
+        async def call(value):
+            if value == 2:
+                dispatcher.cancel()
+            return value
+
+        results = asyncio.run(dispatcher.map(call, [(i,) for i in range(5)]))
+
+        # The call in flight is completed, the others are never dispatched
+        self.assertEqual(results, [0, 1, 2, None, None])
+
+class TestExtractEvents(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="")
+        self.content_extractor.solution = "openai_compatible"
+        self.content_extractor.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+
+    def test_extract_events_chatopenai(self):
+        def chat_completion(request):
+            # Answer with the content of the article as the flood cause
+            content = json.loads(request.content)["messages"][-1]["content"]
+            cause = "Heavy rain" if "rain" in content else "Snowmelt"
+            answer = {"1": "Yes", "2": cause, "3": "2024-08", "4": "Montreal", "5": "No", "6": "No", "7": "Canada"}
+            return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(answer)}}]})
+
+        self.content_extractor.backend._async_client = httpx.AsyncClient(
+            base_url="http://localhost:8080/v1", transport=httpx.MockTransport(chat_completion))
+
+        sample_df = pd.DataFrame({
+            'URL': ['https://example.com', 'https://example.org'],
+            'New_Content': ['Heavy rain flooded the streets', 'Snowmelt flooded the river banks'],
+            'Language': ['en', 'en'],
+            'PublishedDate': ['2024-08-10T07:31:37Z', '2024-08-10T07:23:12Z']})
+
+        result_df = self.content_extractor.extract_events_chatopenai(sample_df, out_fn=os.devnull)
+
+        self.assertEqual(list(result_df['link']), list(sample_df['URL']))
+        self.assertEqual(list(result_df['flood_cause_en']), ['Heavy rain', 'Snowmelt'])
+
+    def test_extract_events_first_error(self):
+        def chat_completion(request):
+            # The first article fails, the second one is answered
+            content = json.loads(request.content)["messages"][-1]["content"]
+            if "streets" in content:
+                return httpx.Response(400, json={"error": "bad request"})
+            answer = {"1": "Yes", "2": "Snowmelt", "3": "2024-04", "4": "Montreal", "5": "No", "6": "No", "7": "Canada"}
+            return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(answer)}}]})
+
+        self.content_extractor.backend._async_client = httpx.AsyncClient(
+            base_url="http://localhost:8080/v1", transport=httpx.MockTransport(chat_completion))
+
+        sample_df = pd.DataFrame({
+            'URL': ['https://example.com', 'https://example.org'],
+            'New_Content': ['Heavy rain flooded the streets', 'Snowmelt flooded the river banks'],
+            'Language': ['en', 'en'],
+            'PublishedDate': ['2024-08-10T07:31:37Z', '2024-08-10T07:23:12Z']})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out_fn = os.path.join(tmp, "results.csv")
+            writes = []
+            # The rows written as they complete, before the final rewrite of the file
+            with mock.patch.object(ContentExtractor, "save_results", lambda extractor, df, out_fn, prefix: writes.append(out_fn)):
+                self.content_extractor.extract_events_chatopenai(sample_df, max_concurrency=1, out_fn=out_fn)
+
+            self.assertEqual(writes, [out_fn])
+            written_df = pd.read_csv(out_fn, sep='|')
+            self.assertEqual(list(written_df['link']), ['https://example.org'])
+            self.assertEqual(list(written_df['flood_cause_en']), ['Snowmelt'])
+
+    def test_extract_events_interrupted(self):
+        async def interrupted_map(dispatcher, func, args_iterable, on_result=None):
+            # The second article completes, then the run gets a second ^C
+            on_result(1, pd.DataFrame({"is_happened": ["Yes"], "link": ["https://example.org"]}))
+            raise KeyboardInterrupt
+
+        sample_df = pd.DataFrame({
+            'URL': ['https://example.com', 'https://example.org'],
+            'New_Content': ['Heavy rain flooded the streets', 'Snowmelt flooded the river banks'],
+            'Language': ['en', 'en'],
+            'PublishedDate': ['2024-08-10T07:31:37Z', '2024-08-10T07:23:12Z']})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out_fn = os.path.join(tmp, "results.csv")
+            with mock.patch.object(AsyncDispatcher, "map", interrupted_map):
+                result_df = self.content_extractor.extract_events_chatopenai(sample_df, out_fn=out_fn)
+
+            # The completed extraction is kept in the output file
+            self.assertEqual(list(result_df['link']), ['https://example.org'])
+            self.assertEqual(list(pd.read_csv(out_fn, sep='|')['link']), ['https://example.org'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# tests/log_listener.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import json
+import logging
+import tempfile
+import multiprocessing
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from utils.py
+from utils import configure_logging, worker_initializer, LOGGING_CONFIG, URL
+
+def log_from_worker(i):
+    logging.getLogger("worker").info(f"Task {i} done")
+    logging.getLogger("worker").log(URL, f"https://example.com/{i}: content extracted")
+    return i
+
+class TestLogListener(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_fn = os.path.join(self.tmp_dir.name, "nlp_flex.log")
+
+        # The handlers of the test process are restored at the end
+        root = logging.getLogger()
+        self.root_handlers, self.root_level = root.handlers[:], root.level
+
+    def tearDown(self):
+        root = logging.getLogger()
+        for log_handler in root.handlers[:]:
+            root.removeHandler(log_handler)
+        for log_handler in self.root_handlers:
+            root.addHandler(log_handler)
+        root.setLevel(self.root_level)
+        self.tmp_dir.cleanup()
+
+    def test_queue_logging(self):
+        with mock.patch.dict(LOGGING_CONFIG["handlers"]["file_handler"], {"filename": self.log_fn}), \
+             mock.patch("utils._log_queue", None):
+            listener = configure_logging(use_queue=True, json_lines=True, url_sample_rate=0)
+
+            initializer, initargs = worker_initializer()
+            with multiprocessing.Pool(processes=2, initializer=initializer, initargs=initargs) as pool:
+                self.assertEqual(sorted(pool.map(log_from_worker, range(10))), list(range(10)))
+            logging.getLogger("main").error("Run finished")
+            listener.stop()
+
+        with open(self.log_fn, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+
+        # Every record of every process is a complete line, and the per-URL messages are sampled out
+        messages = [entry["message"] for entry in entries]
+        self.assertEqual(sorted(m for m in messages if m.startswith("Task")), sorted(f"Task {i} done" for i in range(10)))
+        self.assertIn("Run finished", messages)
+        self.assertFalse(any("content extracted" in m for m in messages))
+        self.assertEqual({entry["level"] for entry in entries}, {"INFO", "ERROR"})
+
+if __name__ == "__main__":
+    unittest.main()
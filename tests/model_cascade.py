@@ -0,0 +1,74 @@
+# tests/model_cascade.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import json
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from content_extractor.py
+from content_extractor import ContentExtractor
+from llm_backends import LLMResponse, make_backend
+
+CHEAP_MODEL = "mistral.mistral-7b-instruct-v0:2"
+LARGE_MODEL = "mistral.mistral-large-2402-v1:0"
+
+class TestModelCascade(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="", cascade_models=[CHEAP_MODEL, LARGE_MODEL])
+        self.content_extractor.solution = "openai_compatible"
+        self.content_extractor.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+
+    def answer_df(self, answers):
+        return self.content_extractor.transform_response_to_df(json.dumps(answers))
+
+    def test_score_answer_complete(self):
+        # A flood with all answers known is fully confident
+        answers = {"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Montreal", "5": "No", "6": "Yes", "7": "Canada"}
+        self.assertEqual(self.content_extractor.score_answer(self.answer_df(answers)), 1.0)
+
+    def test_score_answer_unknown_fields(self):
+        # Unknown cause, date and country lower the confidence
+        answers = {"1": "Yes", "2": "Unknown", "3": "Unknown", "4": "Montreal", "5": "Unknown", "6": "Unknown", "7": "Unknown"}
+        self.assertLess(self.content_extractor.score_answer(self.answer_df(answers)), 0.7)
+
+    def test_score_answer_inconsistent(self):
+        # No flood, but a location is given
+        answers = {"1": "No", "2": "NA", "3": "NA", "4": "Montreal", "5": "NA", "6": "NA", "7": "Canada"}
+        self.assertLess(self.content_extractor.score_answer(self.answer_df(answers)), 1.0)
+
+    def test_score_answer_parse_failure(self):
+        # The raw answer ends up in 'is_happened' when it cannot be parsed
+        content_df = self.content_extractor.transform_response_to_df("Sorry, I cannot answer.")
+        self.assertEqual(self.content_extractor.score_answer(content_df), 0.0)
+
+    def test_cascade_escalates_on_parse_failure(self):
+        answers = {"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Montreal", "5": "No", "6": "Yes", "7": "Canada"}
+        responses = {CHEAP_MODEL: "Sorry, I cannot answer.", LARGE_MODEL: json.dumps(answers)}
+
+        with mock.patch.object(self.content_extractor, "make_llm_call",
+                               side_effect=lambda messages, model=None: LLMResponse(responses[model], model, 0, 0, 0.0)) as llm_call:
+            result_df = self.content_extractor.extract_single_event_chatopenai(
+                "Sample content", "https://example.com", "en", "2024-08-10T07:31:37Z")
+
+        self.assertEqual(llm_call.call_count, 2)
+        self.assertEqual(result_df["model"].iloc[0], LARGE_MODEL)
+        self.assertEqual(result_df["model_tier"].iloc[0], 2)
+        self.assertEqual(result_df["is_happened"].iloc[0], "Yes")
+
+    def test_cascade_stops_on_confident_answer(self):
+        answers = {"1": "No", "2": "NA", "3": "NA", "4": "NA", "5": "NA", "6": "NA", "7": "NA"}
+
+        with mock.patch.object(self.content_extractor, "make_llm_call",
+                               return_value=LLMResponse(json.dumps(answers), CHEAP_MODEL, 0, 0, 0.0)) as llm_call:
+            result_df = self.content_extractor.extract_single_event_chatopenai(
+                "Sample content", "https://example.com", "en", "2024-08-10T07:31:37Z")
+
+        llm_call.assert_called_once()
+        self.assertEqual(result_df["model_tier"].iloc[0], 1)
+
+if __name__ == "__main__":
+    unittest.main()
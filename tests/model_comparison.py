@@ -0,0 +1,67 @@
+# tests/model_comparison.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import json
+import httpx
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from model_comparison.py
+from model_comparison import parse_model_specs, compare_models, summarise_comparison
+from content_extractor import ContentExtractor
+from llm_backends import make_backend
+
+class TestModelComparison(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="")
+        self.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+
+        def chat_completion(request):
+            model = json.loads(request.content)["model"]
+            if model == "broken-model":
+                return httpx.Response(200, json={"choices": [{"message": {"content": "I can't answer."}}]})
+            answer = {"1": "Yes", "2": f"Rain ({model})", "3": "2024-08", "4": "Montreal", "5": "No", "6": "No", "7": "Canada"}
+            return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(answer)}}],
+                                             "usage": {"prompt_tokens": 100, "completion_tokens": 20}})
+
+        self.backend._async_client = httpx.AsyncClient(
+            base_url="http://localhost:8080/v1", transport=httpx.MockTransport(chat_completion))
+
+        self.sample_df = pd.DataFrame({
+            'URL': ['https://example.com', 'https://example.org'],
+            'New_Content': ['Heavy rain flooded the streets', 'The river overflowed'],
+            'Language': ['en', 'en'],
+            'PublishedDate': ['2024-08-10T07:31:37Z', '2024-08-10T07:23:12Z']})
+
+    def test_parse_model_specs(self):
+        specs = parse_model_specs(["mistral.mistral-7b-instruct-v0:2", "openai:gpt-3.5-turbo"], default_solution="bedrock")
+        self.assertEqual(specs, [("bedrock", "mistral.mistral-7b-instruct-v0:2"), ("openai", "gpt-3.5-turbo")])
+
+    def test_compare_models(self):
+        model_specs = [("openai_compatible", "small-model"), ("openai_compatible", "broken-model")]
+
+        with mock.patch.object(self.content_extractor, "prepare_prompt", wraps=self.content_extractor.prepare_prompt) as prepare_prompt:
+            results_df = compare_models(self.content_extractor, self.sample_df, model_specs, {"openai_compatible": self.backend})
+
+        # The prompts are built once and shared by the models
+        self.assertEqual(prepare_prompt.call_count, 2)
+
+        # One row per article and model
+        self.assertEqual(results_df.shape[0], 4)
+        small_df = results_df[results_df['model'] == "small-model"]
+        self.assertEqual(list(small_df['link']), list(self.sample_df['URL']))
+        self.assertEqual(list(small_df['flood_cause_en']), ["Rain (small-model)"] * 2)
+        self.assertEqual(list(small_df['input_tokens']), [100, 100])
+        self.assertEqual(list(results_df[results_df['model'] == "broken-model"]['status']), ["parse_failed"] * 2)
+
+        summary_df = summarise_comparison(results_df)
+        self.assertEqual(list(summary_df['parse_failure_rate']), [0.0, 1.0])
+        self.assertEqual(list(summary_df['output_tokens']), [40, 0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# tests/pipeline.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import json
+import types
+import tempfile
+import httpx
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from pipeline.py
+from pipeline import StagedPipeline, default_executor_settings
+from content_extractor import ContentExtractor
+from llm_backends import make_backend
+from utils import ResultWriter
+
+def fake_make_request(self, url):
+    if url.endswith("unreachable"):
+        raise ConnectionError(f"Access to {url} refused")
+    return types.SimpleNamespace(content=f"<p>{url}</p>".encode(), encoding="utf-8")
+
+def fake_parse_response(self, url, response, language='en'):
+    # Runs in a parse process: pages of even articles are valid articles
+    number = int(url.rsplit('-', 1)[1])
+    return f"Summary {number}", response.text, 1 - number % 2
+
+class TestStagedPipeline(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="")
+        self.sample_df = pd.DataFrame({
+            'URL': [f"https://example.com/article-{i}" for i in range(10)] + ["https://example.com/unreachable"],
+            'Language': 'en',
+            'PublishedDate': '2024-08-10T07:31:37Z'})
+
+    def test_default_executor_settings(self):
+        backend = make_backend("openai", requests_per_minute=3)
+        settings = default_executor_settings(backend)
+        self.assertEqual(settings["llm_concurrency"], 1)
+        self.assertEqual(settings["parse_workers"], os.cpu_count())
+
+        backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1", max_concurrency=6)
+        self.assertEqual(default_executor_settings(backend)["llm_concurrency"], 6)
+
+    @mock.patch.object(ContentExtractor, 'parse_response', fake_parse_response)
+    @mock.patch.object(ContentExtractor, 'make_request', fake_make_request)
+    def test_extractor_stages(self):
+        pipeline = StagedPipeline(self.content_extractor, fetch_concurrency=4, parse_workers=2)
+        extracted_df, events_df = pipeline.run(self.sample_df)
+
+        # The results keep the order of the input, and failed requests are marked with -1
+        self.assertEqual(list(extracted_df['URL']), list(self.sample_df['URL']))
+        self.assertEqual(list(extracted_df['Is_Article']), [1, 0] * 5 + [-1])
+        self.assertEqual(extracted_df['New_Content'].iloc[3], "<p>https://example.com/article-3</p>")
+        self.assertTrue(events_df.empty)
+
+    def set_backend(self):
+        def chat_completion(request):
+            answer = {"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Montreal", "5": "No", "6": "No", "7": "Canada"}
+            return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(answer)}}]})
+
+        self.content_extractor.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+        self.content_extractor.backend._async_client = httpx.AsyncClient(
+            base_url="http://localhost:8080/v1", transport=httpx.MockTransport(chat_completion))
+
+    @mock.patch.object(ContentExtractor, 'parse_response', fake_parse_response)
+    @mock.patch.object(ContentExtractor, 'make_request', fake_make_request)
+    def test_all_stages(self):
+        self.set_backend()
+        pipeline = StagedPipeline(self.content_extractor, fetch_concurrency=4, parse_workers=2, llm_concurrency=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            events_fn = os.path.join(tmp_dir, "events.csv")
+            extracted_df, events_df = pipeline.run(self.sample_df, events_fn=events_fn)
+
+            # Every event was written to the file as soon as it was extracted
+            written_df = pd.read_csv(events_fn, sep='|')
+            self.assertEqual(sorted(written_df['link']), sorted(events_df['link']))
+
+        # Only the valid articles are sent to the model
+        self.assertEqual(list(events_df['link']), [f"https://example.com/article-{i}" for i in range(0, 10, 2)])
+        self.assertEqual(list(events_df['flood_cause_en']), ["Heavy rain"] * 5)
+
+    @mock.patch.object(ContentExtractor, 'parse_response', fake_parse_response)
+    @mock.patch.object(ContentExtractor, 'make_request', fake_make_request)
+    @mock.patch.object(ResultWriter, 'write', side_effect=OSError("No space left on device"))
+    def test_write_error(self, write):
+        self.set_backend()
+        pipeline = StagedPipeline(self.content_extractor, fetch_concurrency=4, parse_workers=2, llm_concurrency=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _, events_df = pipeline.run(self.sample_df, events_fn=os.path.join(tmp_dir, "events.csv"))
+
+        # The events that can't be written are still in the results
+        self.assertEqual(write.call_count, 5)
+        self.assertEqual(events_df.shape[0], 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# tests/priority.py
+
+import unittest
+import sys
+import os
+from datetime import datetime, timezone
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from priority.py
+from priority import priority_scores, prioritise, matches_domain
+
+class TestPriority(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2024, 8, 10, 12, tzinfo=timezone.utc)
+        self.sample_df = pd.DataFrame({
+            'Title': ["Local team wins the final",
+                      "City hall flooded with calls about parking",
+                      "Flash <b>floods</b> leave 3 dead in Quebec",
+                      "Inondations : l&#39;évacuation se poursuit",
+                      "Flash <b>floods</b> leave 3 dead in Quebec"],
+            'Content': ["The <b>flood</b> of fans ...", "", "Heavy rains ...", "Les crues ...", "Heavy rains ..."],
+            'PublishedDate': ['2024-08-10T07:31:37Z', '2024-08-10T07:31:37Z', '2024-08-01T07:31:37Z',
+                              '2024-08-10T07:31:37Z', '2024-08-10T07:31:37Z'],
+            'URL': ["https://example.com/1", "https://example.com/2", "https://example.com/3",
+                    "https://www.google.com/url?rct=j&sa=t&url=https://ici.radio-canada.ca/4", "https://example.com/5"]})
+
+    def test_matches_domain(self):
+        self.assertTrue(matches_domain("https://www.cbc.ca/news/1", ("cbc.ca",)))
+        self.assertTrue(matches_domain("https://ici.radio-canada.ca/1", ("radio-canada.ca",)))
+        self.assertFalse(matches_domain("https://notcbc.ca/1", ("cbc.ca",)))
+
+    def test_priority_scores(self):
+        scores = priority_scores(self.sample_df, now=self.now)
+
+        # Figurative uses of 'flood' don't count as a flood in the title
+        self.assertLess(scores[1], 3)
+        # The same alert scores higher when it's recent
+        self.assertGreater(scores[4], scores[2])
+        # A French title with an impact, from a high-signal outlet, comes first
+        self.assertEqual(scores.idxmax(), 3)
+
+    def test_prioritise(self):
+        sorted_df = prioritise(self.sample_df, now=self.now)
+        self.assertEqual(list(sorted_df.index), [3, 4, 2, 0, 1])
+
+        # Alerts with the same score keep their order, and missing columns score 0
+        no_signal_df = pd.DataFrame({'URL': [f"https://example.com/{i}" for i in range(5)]})
+        self.assertEqual(list(prioritise(no_signal_df).index), list(range(5)))
+
+if __name__ == "__main__":
+    unittest.main()
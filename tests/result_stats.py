@@ -0,0 +1,124 @@
+# tests/result_stats.py
+
+import unittest
+import sys
+import os
+import json
+import tempfile
+import httpx
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from result_stats.py
+from result_stats import ResultStats, country_keys, cause_category, model_of_file
+from content_extractor import ContentExtractor
+from llm_backends import make_backend
+
+def result(link, country="Canada", date="2024-08", cause="Heavy rain", is_happened="Yes", death="No",
+           evacuation="Yes", published_date="2024-08-10T07:00:00Z", **columns):
+    return {"is_happened": is_happened, "flood_cause_en": cause, "date": date, "location": "Montreal", "death": death,
+            "evacuation": evacuation, "country": country, "link": link, "published_date": published_date, **columns}
+
+class TestResultStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "stats.db")
+        self.stats = ResultStats(self.path)
+
+    def tearDown(self):
+        self.stats.close()
+        self.tmp_dir.cleanup()
+
+    def test_keys(self):
+        self.assertEqual(country_keys("Pays: Canada"), ["Canada"])
+        self.assertEqual(country_keys("USA, États-Unis; Canada"), ["United States", "Canada"])
+        self.assertEqual(country_keys("Trinidad and Tobago"), ["Trinidad And Tobago"])
+        self.assertEqual(country_keys("NA"), ["Unknown"])
+        self.assertEqual(country_keys(float("nan")), ["Unknown"])
+
+        self.assertEqual(cause_category("Pluies torrentielles"), "rain")
+        self.assertEqual(cause_category("Heavy rain from the remnants of Tropical Storm Debby"), "storm")
+        self.assertEqual(cause_category("Rupture de la digue"), "dam failure")
+        self.assertEqual(cause_category("Causes non spécifiées dans le texte"), "unknown")
+        self.assertEqual(cause_category("Inconnu"), "unknown")
+        self.assertEqual(cause_category("Water main break"), "other")
+
+        self.assertEqual(model_of_file("output/nlp_results_mistral-7b_2024-08-10.csv"), "mistral-7b")
+        self.assertIsNone(model_of_file("output/nlp_results_2024-08-10_101010.csv"))
+
+    def test_add_and_query(self):
+        results_df = pd.DataFrame([
+            result("https://news.example.com/1", death="Yes (at least two deaths)"),
+            result("https://news.example.com/2", date="Unknown", published_date="2024-09-01T07:00:00Z", evacuation="Unknown"),
+            result("https://news.example.com/3", country="Canada, United States", cause="Tropical Storm Debby"),
+            result("https://news.example.com/4", is_happened="No", country="NA", cause="NA", death="NA", evacuation="NA"),
+        ])
+        self.assertEqual(self.stats.add(results_df, model="mistral-7b"), 4)
+
+        stats_df = self.stats.query(["country", "month"])
+        self.assertEqual(stats_df[["country", "month"]].values.tolist(),
+                         [["Canada", "2024-08"], ["Canada", "2024-09"], ["United States", "2024-08"], ["Unknown", "2024-08"]])
+        canada = stats_df.iloc[0]
+        self.assertEqual((canada["articles"], canada["floods"], canada["deaths"], canada["evacuations"]), (2, 2, 1, 2))
+        self.assertEqual((canada["death_rate"], canada["evacuation_rate"]), (0.5, 1.0))
+        # Without flood, no rate
+        self.assertTrue(pd.isna(stats_df.iloc[3]["death_rate"]))
+
+        # The same articles, even with tracking parameters, are counted once per model
+        self.assertEqual(self.stats.add(results_df.assign(link=results_df["link"] + "?utm_source=rss"), model="mistral-7b"), 0)
+        cascade_df = pd.DataFrame([result("https://news.example.com/1", model="mistral-large")])
+        self.assertEqual(self.stats.add(cascade_df, model="mistral-7b"), 1)
+
+        by_model = self.stats.query(["model"], country="Canada")
+        self.assertEqual(by_model[["model", "floods"]].values.tolist(), [["mistral-7b", 3], ["mistral-large", 1]])
+        by_cause = self.stats.query(["cause"], model="mistral-7b")
+        self.assertEqual(by_cause["cause"].tolist(), ["none", "rain", "storm"])
+        self.assertEqual(self.stats.query([], since="2024-09")["articles"].tolist(), [1])
+        self.assertEqual(self.stats.query([], until="2024-07").shape[0], 0)
+
+        with self.assertRaises(ValueError):
+            self.stats.query(["location"])
+
+    def test_rebuild(self):
+        files = []
+        for model, links in (("mistral-7b", [1, 2]), ("openai-gpt35", [1])):
+            fn = os.path.join(self.tmp_dir.name, f"nlp_results_{model}_2024-08-10.csv")
+            pd.DataFrame([result(f"https://news.example.com/{i}") for i in links]).to_csv(fn, sep='|', index=False)
+            files.append(fn)
+
+        self.stats.add(pd.DataFrame([result("https://news.example.com/9")]))
+        self.assertEqual(self.stats.rebuild(files, chunk_size=1), 3)
+        stats_df = self.stats.query(["model"])
+        self.assertEqual(stats_df[["model", "articles"]].values.tolist(), [["mistral-7b", 2], ["openai-gpt35", 1]])
+
+        # The counts are read by other connections, e.g. a dashboard
+        reader = ResultStats(self.path)
+        self.assertEqual(reader.query(["country"])["floods"].tolist(), [3])
+        reader.close()
+
+    def test_extract_events(self):
+        def chat_completion(request):
+            answer = {"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Montreal", "5": "No", "6": "Yes", "7": "Canada"}
+            return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(answer)}}]})
+
+        extractor = ContentExtractor(solution="", model="llama3", stats_store=self.path)
+        extractor.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+        extractor.backend._async_client = httpx.AsyncClient(
+            base_url="http://localhost:8080/v1", transport=httpx.MockTransport(chat_completion))
+        sample_df = pd.DataFrame({
+            'URL': ['https://example.com', 'https://example.org'],
+            'New_Content': ['Heavy rain flooded the streets', 'Heavy rain flooded the river banks'],
+            'Language': ['en', 'en'],
+            'PublishedDate': ['2024-08-10T07:31:37Z', '2024-08-10T07:23:12Z']})
+
+        extractor.extract_events_chatopenai(sample_df, out_fn=os.path.join(self.tmp_dir.name, "results.csv"))
+
+        # Every written row is counted
+        stats_df = self.stats.query(["country", "month", "cause", "model"])
+        self.assertEqual(stats_df.drop(columns=["death_rate", "evacuation_rate"]).values.tolist(),
+                         [["Canada", "2024-08", "rain", "llama3", 2, 2, 0, 2, 2, 0]])
+
+if __name__ == "__main__":
+    unittest.main()
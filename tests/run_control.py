@@ -0,0 +1,73 @@
+# tests/run_control.py
+
+import unittest
+import sys
+import os
+import time
+import signal
+import asyncio
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from run_control.py
+from run_control import RunControl, parse_duration
+from llm_dispatcher import AsyncDispatcher
+
+class TestRunControl(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("3600"), 3600)
+        self.assertEqual(parse_duration("90m"), 5400)
+        self.assertEqual(parse_duration("1.5h"), 5400)
+        self.assertIsNone(parse_duration(""))
+        with self.assertRaises(ValueError):
+            parse_duration("tomorrow")
+
+    def test_time_budget(self):
+        # Dispatching stops a grace period before the end of the budget
+        control = RunControl(time_budget=0.3, grace_period=0.2)
+        self.assertFalse(control.should_stop())
+        time.sleep(0.15)
+        self.assertTrue(control.should_stop())
+        self.assertEqual(control.stop_reason, "Time budget reached")
+        self.assertFalse(control.grace_expired())
+        time.sleep(0.25)
+        self.assertTrue(control.grace_expired())
+
+    def test_short_time_budget(self):
+        # The grace period is capped at half of a short budget, so that some work is dispatched
+        control = RunControl(time_budget=0.4)
+        self.assertEqual(control.grace_period, 0.2)
+        self.assertFalse(control.should_stop())
+        time.sleep(0.25)
+        self.assertTrue(control.should_stop())
+
+    def test_signal_stops_run(self):
+        control = RunControl()
+        control.install_signal_handlers()
+        try:
+            os.kill(os.getpid(), signal.SIGTERM)
+            self.assertTrue(control.should_stop())
+
+            # A second Ctrl+C stops the run at once
+            with self.assertRaises(KeyboardInterrupt):
+                os.kill(os.getpid(), signal.SIGINT)
+        finally:
+            control.restore_signal_handlers()
+
+    def test_dispatcher_drain(self):
+        control = RunControl(grace_period=0.5)
+
+        async def call(delay):
+            if delay == 0.1:
+                control.request_stop("Got SIGTERM")
+            await asyncio.sleep(delay)
+            return delay
+
+        # The call in flight that finishes within the grace period is kept, the slow one is abandoned
+        dispatcher = AsyncDispatcher(max_concurrency=2, timeout=None, control=control)
+        results = asyncio.run(dispatcher.map(call, [(0.1,), (5,), (0.1,), (0.1,)]))
+        self.assertEqual(results, [0.1, None, None, None])
+
+if __name__ == "__main__":
+    unittest.main()
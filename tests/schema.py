@@ -0,0 +1,94 @@
+# tests/schema.py
+
+import unittest
+import sys
+import os
+import json
+import tempfile
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from schema.py
+from schema import apply_schema, to_records, memory_report, ARTICLE_SCHEMA, RESULT_SCHEMA
+from content_extractor import ContentExtractor
+from event_aggregation import EventIndex
+
+class TestSchema(unittest.TestCase):
+    def setUp(self):
+        self.articles_df = pd.DataFrame({
+            "PublishedDate": ["2024-08-10T07:31:37Z", "2024-08-11T10:00:00Z", "not a date"],
+            "Language": ["en", "fr", "en"],
+            "URL": ["https://a.example.com/1", "https://b.example.com/2", "https://c.example.com/3"],
+            "Summary": ["Flood", None, float("nan")],
+            "New_Content": ["Heavy rain flooded Montreal.", "La pluie a inondé Laval.", float("nan")],
+            "Is_Article": [1, 0, float("nan")],
+        })
+
+    def test_article_schema(self):
+        with self.assertLogs("schema", level="WARNING"):
+            df = apply_schema(self.articles_df, ARTICLE_SCHEMA)
+
+        self.assertIsInstance(df["Language"].dtype, pd.CategoricalDtype)
+        self.assertEqual(str(df["PublishedDate"].dtype), "datetime64[ns, UTC]")
+        self.assertTrue(pd.isna(df.loc[2, "PublishedDate"]))
+        # Missing flags are pages that couldn't be extracted
+        self.assertEqual(df["Is_Article"].tolist(), [1, 0, -1])
+        self.assertEqual(str(df["Is_Article"].dtype), "int8")
+        self.assertIsInstance(df["New_Content"].dtype, pd.StringDtype)
+        self.assertTrue(pd.isna(df.loc[2, "New_Content"]))
+        # The columns outside the schema are untouched, and the schema can be applied twice
+        self.assertEqual(df["URL"].dtype, object)
+        self.assertIs(apply_schema(df, ARTICLE_SCHEMA), df)
+
+        filtered_df = ContentExtractor(solution="").filter_scraped_data(df)
+        self.assertEqual(filtered_df["URL"].tolist(), ["https://a.example.com/1"])
+
+    def test_invalid_flags(self):
+        with self.assertRaises(ValueError):
+            apply_schema(self.articles_df.assign(Is_Article=[1, 2, 0]), ARTICLE_SCHEMA)
+        with self.assertRaises(ValueError):
+            apply_schema(self.articles_df.assign(Is_Article=["1", "yes", "0"]), ARTICLE_SCHEMA)
+
+    def test_csv_and_records(self):
+        df = apply_schema(self.articles_df.head(2), ARTICLE_SCHEMA)
+
+        # Dates are written back in the format of the alert exports
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = ContentExtractor(solution="").save_results(df, os.path.join(tmp, "extracted.csv"))
+            saved_df = pd.read_csv(fn, sep='|')
+        self.assertEqual(saved_df["PublishedDate"].tolist(), ["2024-08-10T07:31:37Z", "2024-08-11T10:00:00Z"])
+
+        records = to_records(df)
+        self.assertEqual(records[0]["PublishedDate"], "2024-08-10T07:31:37Z")
+        self.assertIsNone(records[1]["Summary"])
+        json.dumps(records)
+
+    def test_results(self):
+        results_df = apply_schema(pd.DataFrame({
+            "is_happened": ["Yes", "Yes"], "flood_cause_en": ["Heavy rain", "Heavy rain"], "date": ["2024-08", "2024-08"],
+            "location": ["Montreal", "Montreal"], "death": ["No", "No"], "evacuation": ["Yes", "Unknown"],
+            "country": ["Canada", "Canada"], "link": ["https://a.example.com/1", "https://b.example.com/2"],
+            "published_date": ["2024-08-10T07:31:37Z", "2024-08-11T10:00:00Z"],
+        }), RESULT_SCHEMA)
+        self.assertIsInstance(results_df["country"].dtype, pd.CategoricalDtype)
+
+        # The flood events are aggregated from the typed results
+        with tempfile.TemporaryDirectory() as tmp:
+            index = EventIndex(os.path.join(tmp, "events.db"))
+            added_df = index.add(results_df)
+            self.assertEqual(added_df["event_id"].nunique(), 1)
+            events_df = index.events()
+            index.close()
+        self.assertEqual(events_df.loc[0, "last_published"], "2024-08-11T10:00:00Z")
+
+    def test_memory_report(self):
+        df = pd.concat([self.articles_df] * 100, ignore_index=True)
+        with self.assertLogs("schema", level="WARNING"):
+            report_df = memory_report(df, ARTICLE_SCHEMA).set_index("column")
+        self.assertGreater(report_df.loc["Language", "ratio"], 5)
+        self.assertGreater(report_df.loc["(all)", "ratio"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# tests/seen_index.py
+
+import unittest
+import sys
+import os
+import sqlite3
+import tempfile
+import configparser
+from unittest import mock
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from seen_index.py
+from seen_index import BloomFilter, SeenIndex
+from content_extractor import ContentExtractor
+from nlp_flex import run
+
+HEADER = "PublishedDate|Language|Alert_definition|PT|Title|Content|Id|LinkURI\n"
+
+def alert(i, url=None, title=None, content=None):
+    url = url or f"https://example.com/article-{i}"
+    title, content = title or f"Title {i}", content or f"Content {i}"
+    return f"2024-08-10T07:31:37Z|en|flood|all|{title}|{content}|tag:google.com,2013:googlealerts/feed:{i}|{url}\n"
+
+def extract_content(extractor, df, num_processes=None, out_fn=None, save=True, control=None):
+    # Content of the pages, without fetching them
+    return df.assign(Summary="", New_Content="Heavy rain flooded the streets", Is_Article=1)
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        keys = [f"key-{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f"other-{i}" in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_save_load(self):
+        bloom = BloomFilter(capacity=100)
+        bloom.add("key")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fn = os.path.join(tmp_dir, "bloom")
+            bloom.save(fn)
+            loaded = BloomFilter.load(fn)
+
+        self.assertIn("key", loaded)
+        self.assertEqual(loaded.count, 1)
+
+class TestIncrementalIngestion(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.tmp_dir.name, "data")
+        os.makedirs(self.data_dir)
+        self.index_path = os.path.join(self.tmp_dir.name, "seen_index.db")
+        self.content_extractor = ContentExtractor(solution="")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_export(self, name, lines):
+        with open(os.path.join(self.data_dir, name), "w", encoding="utf-8") as f:
+            f.write(HEADER + "".join(lines))
+
+    def test_overlapping_exports(self):
+        self.write_export("collection_articles_2024-08-09.csv", [alert(i) for i in range(3)])
+        index = SeenIndex(self.index_path)
+
+        # First run: all alerts are new
+        new_df, files = self.content_extractor.read_new_data(self.data_dir, index)
+        self.assertEqual(new_df.shape[0], 3)
+        index.mark_seen(new_df)
+        for fn in files:
+            index.mark_file_ingested(fn)
+
+        # Second run: the new export overlaps with the first one, and has the same article with another alert Id
+        self.write_export("collection_articles_2024-08-10.csv",
+                          [alert(i) for i in range(2, 5)] + [alert(9, url="https://www.example.com/article-0/?utm_source=alerts")])
+        new_df, files = self.content_extractor.read_new_data(self.data_dir, index)
+
+        self.assertEqual(list(new_df["URL"]), ["https://example.com/article-3", "https://example.com/article-4"])
+        self.assertEqual(len(files), 1)
+        index.close()
+
+    def test_index_persistence(self):
+        df = pd.DataFrame({"Id": ["a", "b"], "URL": ["https://example.com/1", "https://example.com/2"]})
+        index = SeenIndex(self.index_path)
+        index.mark_seen(df)
+        index.close()
+
+        # The Bloom filter and the exact store are reloaded from disk
+        index = SeenIndex(self.index_path)
+        new_df = index.filter_new(pd.DataFrame({"Id": ["b", "c"], "URL": ["https://example.com/2", "https://example.com/3"]}))
+        self.assertEqual(list(new_df["Id"]), ["c"])
+        index.close()
+
+    def test_deferred_alerts(self):
+        # Index created before the status of the alerts was recorded
+        conn = sqlite3.connect(self.index_path)
+        conn.execute("CREATE TABLE seen (key TEXT PRIMARY KEY, source TEXT, first_seen TEXT) WITHOUT ROWID")
+        conn.execute("INSERT INTO seen VALUES ('url:https://example.com/1', 'old.csv', '2024-08-09T10:00:00')")
+        conn.commit()
+        conn.close()
+
+        index = SeenIndex(self.index_path)
+        index.mark_seen(pd.DataFrame({"Id": ["b"], "URL": ["https://www.example.com/2?utm_source=alerts"]}), status="deferred")
+        self.assertEqual(index.deferred_urls(), ["https://example.com/2"])
+        self.assertEqual(index.filter_new(pd.DataFrame({"Id": ["a", "b", "c"], "URL": [
+            "https://example.com/1", "https://example.com/2", "https://example.com/3"]}))["Id"].tolist(), ["c"])
+        with self.assertRaises(ValueError):
+            index.mark_seen(pd.DataFrame({"Id": ["c"], "URL": ["https://example.com/3"]}), status="dropped")
+        index.close()
+
+    @mock.patch.object(ContentExtractor, "extract_content", extract_content)
+    def test_incremental_triage(self):
+        self.write_export("collection_articles_2024-08-10.csv", [
+            alert(0, title="Flash <b>floods</b> kill at least 14 in northeastern India"),
+            alert(1, title="Hockey: les Chevaliers remportent leur duel face aux Albatros",
+                  content="La ligue a reporté le match en raison des <b>inondations</b>"),
+            alert(2, title="Customer service lines <b>flooded with</b> calls after outage", content=""),
+        ])
+        config = configparser.ConfigParser()
+        config.read_dict({
+            "General": {"input_filename": self.data_dir, "output_filename": os.path.join(self.tmp_dir.name, "content.csv"),
+                        "mode": "extractor", "num_processes": "1", "url_col_name": "LinkURI",
+                        "pub_date_col_name": "PublishedDate", "incremental": "true", "seen_index": self.index_path},
+            "Triage": {"enabled": "true", "decisions_filename": os.path.join(self.tmp_dir.name, "triage.csv")},
+        })
+        run(config)
+
+        # The deferred alert is recorded with its own status, and the file is not read again by the next runs
+        index = SeenIndex(self.index_path)
+        self.assertEqual(index.deferred_urls(), ["https://example.com/article-1"])
+        new_df, files = self.content_extractor.read_new_data(self.data_dir, index)
+        self.assertEqual((new_df.shape[0], files), (0, []))
+        index.close()
+
+if __name__ == "__main__":
+    unittest.main()
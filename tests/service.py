@@ -0,0 +1,129 @@
+# tests/service.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+import urllib.error
+import urllib.request
+import httpx
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from service.py
+from service import MicroBatcher, ExtractionService, make_server
+from content_extractor import ContentExtractor
+from llm_backends import make_backend
+# Fakes of the downloads and of the parsing, shared with the tests of the staged pipeline
+from tests.pipeline import fake_make_request, fake_parse_response
+
+def chat_completion(request):
+    answer = {"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Montreal", "5": "No", "6": "No", "7": "Canada"}
+    return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(answer)}}]})
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_batches(self):
+        batches = []
+
+        async def process_batch(batch):
+            batches.append(batch)
+
+        async def run():
+            batcher = MicroBatcher(process_batch, max_batch_size=3, max_delay=0.05)
+            task = asyncio.create_task(batcher.run())
+            # Five items at once: a full batch, then the rest after the delay
+            for i in range(5):
+                batcher.put(i)
+            await asyncio.sleep(0.2)
+            batcher.put(5)
+            batcher.put(None)
+            await task
+
+        asyncio.run(run())
+        self.assertEqual(batches, [[0, 1, 2], [3, 4], [5]])
+
+@mock.patch.object(ContentExtractor, 'parse_response', fake_parse_response)
+@mock.patch.object(ContentExtractor, 'make_request', fake_make_request)
+class TestExtractionService(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="")
+        self.servers = []
+
+    def tearDown(self):
+        for server, service in self.servers:
+            server.shutdown()
+            server.server_close()
+            service.stop()
+
+    def start(self, **options):
+        service = ExtractionService(self.content_extractor, fetch_concurrency=4, parse_workers=2, **options)
+        service.start()
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append((server, service))
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def call(self, url, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_extract_content(self):
+        base_url = self.start()
+        alerts = [{"url": f"https://example.com/article-{i}"} for i in range(4)] + [{"url": "https://example.com/unreachable"}]
+        status, results = self.call(f"{base_url}/alerts?wait=10", alerts)
+
+        self.assertEqual(status, 200)
+        self.assertEqual([r["is_article"] for r in results], [1, 0, 1, 0, -1])
+        self.assertEqual(results[2]["content"], "<p>https://example.com/article-2</p>")
+
+        # The results stay available by request Id
+        status, result = self.call(f"{base_url}/alerts/{results[0]['id']}")
+        self.assertEqual((status, result["status"], result["summary"]), (200, "done", "Summary 0"))
+
+    def test_extract_events(self):
+        self.content_extractor.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+        self.content_extractor.backend._async_client = httpx.AsyncClient(
+            base_url="http://localhost:8080/v1", transport=httpx.MockTransport(chat_completion))
+        base_url = self.start(llm_concurrency=2, max_delay=0.01)
+
+        # A single alert is answered after one fetch and one model call
+        start = time.monotonic()
+        status, result = self.call(f"{base_url}/alerts?wait=10",
+                                   {"url": "https://example.com/article-2", "published_date": "2024-08-10T07:31:37Z"})
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(status, 200)
+        self.assertEqual(result["events"][0]["location"], "Montreal")
+        self.assertEqual(result["events"][0]["link"], "https://example.com/article-2")
+        self.assertNotIn("content", result)
+
+        # An article payload is not fetched, and an invalid article is not sent to the model
+        status, results = self.call(f"{base_url}/alerts?wait=10", [
+            {"url": "https://example.com/payload-1", "content": "Flooding in Montreal. " * 20, "language": "en"},
+            {"url": "https://example.com/article-1"}])
+        self.assertEqual([r["is_article"] for r in results], [1, 0])
+        self.assertEqual(results[0]["events"][0]["is_happened"], "Yes")
+        self.assertNotIn("events", results[1])
+
+    def test_pending_and_errors(self):
+        base_url = self.start()
+        status, result = self.call(f"{base_url}/alerts", {"url": "https://example.com/article-0"})
+        self.assertIn(status, (200, 202))
+        status, result = self.call(f"{base_url}/alerts/{result['id']}?wait=10")
+        self.assertEqual((status, result["status"]), (200, "done"))
+
+        self.assertEqual(self.call(f"{base_url}/alerts", {"language": "en"})[0], 400)
+        self.assertEqual(self.call(f"{base_url}/alerts/unknown")[0], 404)
+        self.assertEqual(self.call(f"{base_url}/health"), (200, {"status": "ok", "pending": 0}))
+
+if __name__ == "__main__":
+    unittest.main()
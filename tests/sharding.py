@@ -0,0 +1,104 @@
+# tests/sharding.py
+
+import unittest
+import sys
+import os
+import tempfile
+import configparser
+from unittest import mock
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from sharding.py
+from sharding import shard_of, shard_output_path, shard_files, is_shard_done, merge_shards
+from content_extractor import ContentExtractor
+from nlp_flex import run
+
+def extract_events(extractor, df, timeout=None, out_fn=None, save=True, control=None):
+    # Answers of the model, without calling it
+    events_df = pd.DataFrame({"is_happened": "Yes", "link": df["URL"].values, "published_date": df["PublishedDate"].values})
+    if save:
+        extractor.save_results(events_df, out_fn)
+    return events_df
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.extractor = ContentExtractor(solution="")
+
+        # Two daily exports of extracted content; the second one repeats an article with a tracking parameter
+        urls = [f"https://news{i % 7}.example.com/flood-{i}" for i in range(40)]
+        for day, rows in (("2024-08-10", slice(0, 25)), ("2024-08-11", slice(20, 40))):
+            df = pd.DataFrame({"PublishedDate": f"{day}T07:31:37Z", "Language": "en", "URL": urls[rows],
+                               "New_Content": "Heavy rain flooded the town.", "Is_Article": 1})
+            df.to_csv(os.path.join(self.tmp_dir.name, f"extracted_{day}.csv"), index=False, sep='|')
+        pd.DataFrame({"PublishedDate": ["2024-08-12T07:31:37Z"], "Language": ["en"],
+                      "URL": [urls[3] + "?utm_source=alerts"], "New_Content": ["Flood"], "Is_Article": [1]}) \
+            .to_csv(os.path.join(self.tmp_dir.name, "extracted_2024-08-12.csv"), index=False, sep='|')
+        self.pattern = os.path.join(self.tmp_dir.name, "extracted_*.csv")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_shard_of(self):
+        # The same article goes to the same shard, whatever its tracking parameters
+        self.assertEqual(shard_of("https://www.example.com/a?utm_source=x", 8), shard_of("https://example.com/a", 8))
+        shards = {shard_of(f"https://example.com/{i}", 4) for i in range(100)}
+        self.assertEqual(shards, {0, 1, 2, 3})
+        self.assertEqual(shard_output_path("output/nlp_results.csv", 3, 16), "output/nlp_results.shard-003-of-016.csv")
+
+    def test_read_shards(self):
+        # The shards partition the input files, read in chunks
+        all_df = self.extractor.read_data(self.pattern, url_col_name="URL")
+        shards = [self.extractor.read_shard(self.pattern, shard, 3, url_col_name="URL", chunk_size=4) for shard in range(3)]
+        self.assertEqual(sum(df.shape[0] for df in shards), all_df.shape[0])
+        self.assertEqual(sorted(url for df in shards for url in df["URL"]), sorted(all_df["URL"]))
+        self.assertEqual(str(shards[0]["Is_Article"].dtype), "int8")
+
+        with self.assertRaises(ValueError):
+            self.extractor.read_shard(self.pattern, 3, 3, url_col_name="URL")
+        with self.assertRaises(ValueError):
+            self.extractor.read_shard(self.pattern, 0, 3, url_col_name="LinkURI")
+
+    def test_run_and_merge(self):
+        out_fn = os.path.join(self.tmp_dir.name, "nlp_results.csv")
+        config = configparser.ConfigParser()
+        config.read_dict({
+            "General": {"input_filename": self.pattern, "output_filename": out_fn, "mode": "nlp", "num_processes": "1",
+                        "url_col_name": "URL", "pub_date_col_name": "PublishedDate"},
+            "NLP": {"solution": "openai_compatible", "model": "llama3", "temp": "0.2", "max_tokens": "256"},
+            "openai_compatible": {"base_url": "http://localhost:8080/v1"},
+        })
+
+        with mock.patch.object(ContentExtractor, "extract_events_chatopenai", autospec=True, side_effect=extract_events) as extract:
+            for shard in range(3):
+                run(config, shard=shard, num_shards=3)
+            self.assertEqual(extract.call_count, 3)
+            self.assertTrue(all(is_shard_done(fn) for fn in shard_files(out_fn, 3)))
+
+            # The completed shards are skipped by the next runs
+            run(config, shard=1, num_shards=3)
+            self.assertEqual(extract.call_count, 3)
+
+        # Every article once, although it is in several exports
+        run(config, role="merge", num_shards=3)
+        merged_df = pd.read_csv(out_fn, sep='|')
+        self.assertEqual(merged_df.shape[0], 40)
+        self.assertEqual(merged_df["published_date"].iloc[0][-1], "Z")
+
+    def test_merge_incomplete(self):
+        out_fn = os.path.join(self.tmp_dir.name, "nlp_results.csv")
+        pd.DataFrame({"link": ["https://a.example.com/1", "https://www.a.example.com/1/"], "is_happened": ["Yes", "Yes"]}) \
+            .to_csv(shard_output_path(out_fn, 0, 2), index=False, sep='|')
+
+        with self.assertLogs("sharding", level="WARNING") as logs:
+            self.assertEqual(merge_shards(out_fn, 2), 1)
+        self.assertEqual(len(logs.records), 2)
+
+        with self.assertRaises(ValueError):
+            merge_shards(out_fn, 4)
+
+if __name__ == "__main__":
+    unittest.main()
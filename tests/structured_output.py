@@ -0,0 +1,141 @@
+# tests/structured_output.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import json
+import asyncio
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from structured_output.py
+from structured_output import answer_tool, parse_answers, validate_answers, reask_messages, question_keys
+from content_extractor import ContentExtractor
+from llm_backends import LLMResponse, make_backend
+from prompts import get_prompt_template
+
+ARTICLE = ("Heavy rain hit the region on Tuesday. The river overflowed in Jasper and Woodhull. "
+           "Two people died in the flood. The mayor thanked the volunteers.")
+
+class TestStructuredOutput(unittest.TestCase):
+    def setUp(self):
+        self.template = get_prompt_template("en", "user")
+        self.keys = question_keys(self.template)
+
+    def test_answer_tool(self):
+        tool = answer_tool(self.template)
+        schema = tool["parameters"]
+        self.assertEqual(schema["required"], ["1", "2", "3", "4", "5", "6", "7"])
+        self.assertFalse(schema["additionalProperties"])
+        self.assertEqual(schema["properties"]["1"]["enum"], ["Yes", "No"])
+        self.assertIn("YYYY-MM", schema["properties"]["3"]["description"])
+
+        # Without the country question, and for a follow-up question
+        self.assertEqual(answer_tool(get_prompt_template("fr", "user", False))["parameters"]["required"][-1], "6")
+        self.assertEqual(list(answer_tool(self.template, ["3", "7"])["parameters"]["properties"]), ["3", "7"])
+
+    def test_parse_answers(self):
+        self.assertEqual(parse_answers(LLMResponse("", "m", 0, 0, 0.0, arguments={"1": "No"})), {"1": "No"})
+        # Text answers, even with an unbalanced bracket
+        self.assertEqual(parse_answers(LLMResponse('{"1": "Yes", "2": "Rain"', "m", 0, 0, 0.0)), {"1": "Yes", "2": "Rain"})
+        self.assertIsNone(parse_answers(LLMResponse("Sorry, I cannot answer.", "m", 0, 0, 0.0)))
+
+    def test_validate_answers(self):
+        answers, errors = validate_answers(
+            {"1": "Yes", "2": "Heavy rain", "3": "2024-08-09", "4": "", "5": "Yes (two deaths)", "6": "Maybe",
+             "7": "Canada"}, self.keys)
+        # Full dates are truncated, the enums accept details after the answer
+        self.assertEqual(answers["3"], "2024-08")
+        self.assertEqual(answers["5"], "Yes (two deaths)")
+        self.assertEqual(errors, {"4": "missing", "6": "Maybe"})
+
+        answers, errors = validate_answers({"1": "Yes", "3": "August 2024"}, self.keys)
+        self.assertEqual(errors["3"], "August 2024")
+
+        # Without flood event, the details are not needed
+        answers, errors = validate_answers({"1": "Non"}, self.keys)
+        self.assertEqual(errors, {})
+        self.assertEqual(answers["4"], "NA")
+
+        self.assertEqual(validate_answers(None, self.keys)[1]["1"], "missing")
+
+    def test_reask_messages(self):
+        answers = {"1": "Yes", "2": "Heavy rain", "4": "Jasper"}
+        messages = reask_messages(self.template, answers, {"3": "Tuesday", "5": "missing"}, ARTICLE * 20)
+        content = messages[0]["content"]
+
+        self.assertIn("3. If a flood event occurred, when did it happen?", content)
+        self.assertIn("invalid answer: Tuesday", content)
+        self.assertIn('"4": "Jasper"', content)
+        # Only the sentences that can answer the missing question are included
+        self.assertIn("Two people died in the flood.", content)
+        self.assertNotIn("mayor", content)
+        self.assertLess(len(content), len(ARTICLE * 20))
+
+class TestStructuredExtraction(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="", structured_output=True)
+        self.content_extractor.solution = "openai_compatible"
+        self.content_extractor.backend = make_backend("openai_compatible", base_url="http://localhost:8080/v1")
+
+    def extract(self, responses):
+        with mock.patch.object(self.content_extractor, "make_llm_call", side_effect=responses) as llm_call:
+            result_df = self.content_extractor.extract_single_event_chatopenai(ARTICLE, "https://example.com", "en",
+                                                                             "2024-08-10T07:31:37Z")
+        return result_df, llm_call
+
+    def test_reask_invalid_fields(self):
+        first = {"1": "Yes", "2": "Heavy rain", "3": "Tuesday", "4": "Jasper, Woodhull", "5": "Yes", "6": "Unknown"}
+        result_df, llm_call = self.extract([
+            LLMResponse(json.dumps(first), "m", 900, 40, 1.0, arguments=first),
+            LLMResponse("", "m", 150, 10, 0.2, arguments={"3": "2024-08", "7": "United States", "1": "No"}),
+        ])
+
+        self.assertEqual(llm_call.call_count, 2)
+        # The follow-up question only asks for the invalid and missing answers, without the article
+        args, kwargs = llm_call.call_args_list[1]
+        self.assertEqual(list(kwargs["tool"]["parameters"]["properties"]), ["3", "7"])
+        self.assertNotIn(ARTICLE, args[0][0]["content"])
+
+        row = result_df.iloc[0]
+        self.assertEqual((row["is_happened"], row["date"], row["country"]), ("Yes", "2024-08", "United States"))
+        self.assertEqual(row["reasked_fields"], "date, country")
+        self.assertEqual(row["reask_tokens"], 160)
+
+    def test_unknown_after_reask(self):
+        first = {"1": "Yes", "2": "Heavy rain", "3": "2024-08", "4": "Jasper", "5": "Yes", "6": "Unknown", "7": "Canada?"}
+        self.content_extractor.max_reasks = 0
+        result_df, llm_call = self.extract([LLMResponse(json.dumps(first), "m", 900, 40, 1.0, arguments=first)])
+
+        llm_call.assert_called_once()
+        self.assertEqual(result_df["country"].iloc[0], "Canada?")
+        self.assertEqual(result_df["reask_tokens"].iloc[0], 0)
+
+        first["3"] = "last week"
+        result_df, _ = self.extract([LLMResponse(json.dumps(first), "m", 900, 40, 1.0, arguments=first)])
+        self.assertEqual(result_df["date"].iloc[0], "Unknown")
+
+    def test_parse_failure(self):
+        # Without a first answer, the article is not asked again and the row is kept as before
+        result_df, llm_call = self.extract([LLMResponse("Sorry, I cannot answer.", "m", 900, 10, 1.0)])
+        llm_call.assert_called_once()
+        self.assertEqual(result_df["is_happened"].iloc[0], "Sorry, I cannot answer.")
+
+    def test_async_extraction(self):
+        first = {"1": "Yes", "2": "Heavy rain", "3": "2024", "4": "Jasper", "5": "Yes", "6": "No", "7": "Canada"}
+
+        async def amake_llm_call(messages, model=None, tool=None, max_tokens=None):
+            if max_tokens is None:
+                return LLMResponse(json.dumps(first), model, 900, 40, 1.0, arguments=first)
+            return LLMResponse('{"3": "2024-08"}', model, 100, 8, 0.2)
+
+        with mock.patch.object(self.content_extractor, "amake_llm_call", side_effect=amake_llm_call):
+            result_df = asyncio.run(self.content_extractor.aextract_single_event(
+                ARTICLE, "https://example.com", "en", "2024-08-10T07:31:37Z"))
+        self.assertEqual(result_df["date"].iloc[0], "2024-08")
+        self.assertEqual(result_df["reasked_fields"].iloc[0], "date")
+
+if __name__ == "__main__":
+    unittest.main()
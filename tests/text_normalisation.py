@@ -0,0 +1,91 @@
+# tests/text_normalisation.py
+
+import unittest
+import re
+import sys
+import os
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from text_normalisation.py
+from text_normalisation import normalise_text, normalise_column, benchmark
+from content_extractor import ContentExtractor
+
+def legacy_clean_text(text):
+    # Cleaning of the content before the normalisation engine
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r"""[^a-zA-Z0-9éàèùçâêîôûëïü.,!-:;()"'\s]""", '', text)
+    return ' '.join(text.split())
+
+class TestTextNormalisation(unittest.TestCase):
+    def setUp(self):
+        self.texts = pd.Series([
+            "<p>Flash floods kill 14 in   India.</p>\n<b>Rescue</b> teams@work ~ [more]",
+            "L’eau a débordé à Montréal&nbsp;: É€�tat d’urgence. Publicité Les pompiers sont sur place.",
+            "The river rose. Advertisement 2 Story continues below This advertisement has not loaded yet, but your "
+            "article continues below. It was not the first flood. Get local news to your inbox. Sign up for NBC DFW "
+            "newsletters. Share this article Share Residents of The Pas were evacuated.",
+            None,
+        ], index=[3, 5, 7, 9])
+        self.languages = pd.Series(["en", "fr", "en", "en"], index=self.texts.index)
+
+    def test_default_profile(self):
+        # The default profile cleans the content exactly as before
+        for text in self.texts.fillna(''):
+            self.assertEqual(normalise_text(text), legacy_clean_text(text))
+
+        cleaned = normalise_column(self.texts)
+        self.assertEqual(cleaned.index.tolist(), [3, 5, 7, 9])
+        self.assertEqual(cleaned.tolist(), [legacy_clean_text(text) for text in self.texts.fillna('')])
+
+    def test_compact_profile(self):
+        cleaned = normalise_column(self.texts, "compact", self.languages)
+
+        # Entities, typographic and replacement characters are normalised, upper case accents are kept
+        self.assertEqual(cleaned[5], "L'eau débordé à Montréal : État d'urgence. Les pompiers sur place.")
+        # Boilerplate and stopwords are removed, negations and capitalised place names are kept
+        self.assertEqual(cleaned[7], "The river rose. It not first flood. Residents of The Pas evacuated.")
+        self.assertEqual(cleaned[9], "")
+
+        # Without language, the stopwords are kept
+        self.assertEqual(normalise_text("It was the flood", "compact"), "It was the flood")
+
+    def test_keep_characters(self):
+        # The content of the articles in the other languages keeps its characters for the multilingual prompt
+        text = "<p>Inundaciones en España:  el río  Ебро</p>"
+        self.assertEqual(normalise_text(text), "Inundaciones en Espaa: el ro")
+        self.assertEqual(normalise_text(text, keep_characters=True), "Inundaciones en España: el río Ебро")
+        self.assertEqual(normalise_text(text, "compact", "es", keep_characters=True), "Inundaciones en España: el río Ебро")
+
+    def test_string_storage_and_errors(self):
+        cleaned = normalise_column(self.texts.astype("string"), "compact", self.languages)
+        self.assertEqual(str(cleaned.dtype), "string")
+
+        with self.assertRaises(ValueError):
+            normalise_column(self.texts, "aggressive")
+
+    def test_benchmark(self):
+        results_df = benchmark(self.texts, self.languages, repeat=1).set_index("profile")
+        self.assertEqual(results_df.index.tolist(), ["default", "compact"])
+        self.assertGreater(results_df.loc["compact", "tokens_saved"], results_df.loc["default", "tokens_saved"])
+        self.assertTrue((results_df["mb_per_second"] > 0).all())
+
+    def test_extractor_profile(self):
+        articles_df = pd.DataFrame({'New_Content': self.texts.fillna(''), 'Language': self.languages})
+
+        # The default profile sends the content as extracted
+        extractor = ContentExtractor(solution="")
+        self.assertIs(extractor.compact_content(articles_df), articles_df)
+
+        extractor = ContentExtractor(solution="", text_profile="compact")
+        compacted_df = extractor.compact_content(articles_df)
+        self.assertEqual(compacted_df['New_Content'].tolist(), normalise_column(self.texts, "compact", self.languages).tolist())
+        self.assertEqual(extractor.compact_text(self.texts[7], "en"), compacted_df['New_Content'][7])
+
+        with self.assertRaises(ValueError):
+            ContentExtractor(solution="", text_profile="aggressive")
+
+if __name__ == "__main__":
+    unittest.main()
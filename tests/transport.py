@@ -0,0 +1,165 @@
+# tests/transport.py
+
+import unittest
+import sys
+import os
+import gzip
+import pickle
+import socket
+import threading
+import httpx
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from transport.py
+from transport import make_transport, total_stats, http_transport, DNSCache, TransportStats, HTTP2_AVAILABLE
+from content_extractor import ContentExtractor
+
+PAGE = ("<html><body>" + "<p>Heavy rain flooded the streets of Montreal on Saturday.</p>" * 200 + "</body></html>").encode("utf-8")
+
+class PageHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, and gzip-compressed pages for the clients that accept them
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes: without it, the delayed ACK of the client slows down every reused connection
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == "/moved":
+            self.send_response(301)
+            self.send_header("Location", "/article")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = PAGE
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(PAGE)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        # The DNS cache of a transport must not change the resolution of the other clients of the process
+        getaddrinfo = socket.getaddrinfo
+        self.addCleanup(setattr, socket, "getaddrinfo", getaddrinfo)
+        self.addCleanup(self.assertIs, socket.getaddrinfo, getaddrinfo)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive_and_compression(self):
+        transport = make_transport(pool_size="2", dns_ttl="60")
+        for i in range(5):
+            response = transport.get(f"{self.base_url}/article?i={i}")
+            self.assertEqual(response.content, PAGE)
+        transport.close()
+
+        # One connection for the five pages, and compressed pages on the wire
+        stats = transport.stats
+        self.assertEqual((stats.requests, stats.connections, stats.errors), (5, 1, 0))
+        self.assertAlmostEqual(stats.reuse_ratio, 0.8)
+        self.assertEqual(stats.content_bytes, 5 * len(PAGE))
+        self.assertLess(stats.wire_bytes, stats.content_bytes / 5)
+
+    def test_redirect_and_error(self):
+        transport = make_transport()
+        response = transport.get(f"{self.base_url}/moved")
+        self.assertEqual(response.url, f"{self.base_url}/article")
+        self.assertEqual(transport.stats.requests, 2)
+
+        extractor = ContentExtractor(solution="")
+        extractor.transport = transport
+        with self.assertRaises(Exception):
+            extractor.make_request("http://127.0.0.1:1/article")
+        self.assertEqual(transport.stats.errors, 1)
+        transport.close()
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            make_transport(pool_connections="10")
+
+        transport = make_transport(user_agent="FloodBot/1.0", read_timeout="")
+        self.assertEqual(transport.headers["User-Agent"], "FloodBot/1.0")
+        self.assertEqual(transport.read_timeout, 60)
+
+        if not HTTP2_AVAILABLE:
+            # Without the h2 package, the pages are downloaded over HTTP/1.1
+            with self.assertLogs("transport", level="WARNING"):
+                self.assertFalse(make_transport(http2="true").http2)
+
+    def test_pickle(self):
+        # Transports are sent to worker processes without their connections and statistics
+        transport = make_transport()
+        transport.get(f"{self.base_url}/article")
+        copy = pickle.loads(pickle.dumps(transport))
+        self.assertIsNone(copy._session)
+        self.assertEqual(copy.stats.requests, 0)
+        self.assertEqual(copy.get(f"{self.base_url}/article").content, PAGE)
+        transport.close()
+        copy.close()
+
+        total = total_stats([TransportStats(requests=10, connections=2), TransportStats(requests=10, connections=3)])
+        self.assertEqual(total.as_dict()["reuse_ratio"], 0.75)
+
+    def test_dns_cache(self):
+        lookups = []
+        def resolve(host, port, *args):
+            lookups.append(host)
+            return [("address", host, port)]
+
+        cache = DNSCache(ttl=60, resolve=resolve, max_size=2)
+        for host in ["a.example.com", "a.example.com", "b.example.com", "a.example.com"]:
+            cache.getaddrinfo(host, 443)
+        self.assertEqual(lookups, ["a.example.com", "b.example.com"])
+        self.assertEqual((cache.hits, cache.lookups), (2, 2))
+
+        # A full cache is emptied of its expired addresses, or cleared
+        cache.getaddrinfo("c.example.com", 443)
+        cache.getaddrinfo("a.example.com", 443)
+        self.assertEqual(lookups[-1], "a.example.com")
+
+        # Expired addresses are resolved again
+        cache = DNSCache(ttl=0, resolve=resolve)
+        cache.getaddrinfo("a.example.com", 443)
+        cache.getaddrinfo("a.example.com", 443)
+        self.assertEqual(cache.lookups, 2)
+
+    def test_transport_dns_cache(self):
+        lookups = []
+        def resolve(host, port, *args):
+            lookups.append(host)
+            return socket.getaddrinfo("127.0.0.1", port, *args)
+
+        # The host names are only known to the DNS cache of the transport
+        transport = make_transport()
+        transport._dns_cache = DNSCache(resolve=resolve)
+        url = f"http://flood.test:{self.server.server_port}/article"
+        self.assertEqual(transport.get(url).content, PAGE)
+        transport.close()
+        self.assertEqual(transport.get(url).content, PAGE)
+        transport.close()
+        self.assertEqual(lookups, ["flood.test"])
+        self.assertEqual((transport.stats.dns_hits, transport.stats.dns_lookups), (1, 1))
+
+        with httpx.Client(transport=http_transport(DNSCache(resolve=resolve))) as client:
+            self.assertEqual(client.get(url).content, PAGE)
+        self.assertEqual(lookups, ["flood.test"] * 2)
+
+        with self.assertRaises(Exception):
+            make_transport().get(f"http://flood.test:{self.server.server_port}/article")
+
+if __name__ == "__main__":
+    unittest.main()
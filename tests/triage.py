@@ -0,0 +1,91 @@
+# tests/triage.py
+
+import unittest
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from triage.py
+from triage import rule_scores, triage, triage_alerts, training_data, FETCH, DEFER, DROP
+
+try:
+    import sklearn
+except ImportError:
+    sklearn = None
+
+class KeywordModel:
+    """Stands for a trained model: the alerts about rivers are flood events."""
+
+    def predict_proba(self, texts):
+        probabilities = np.array([0.9 if "river" in text.lower() else 0.1 for text in texts])
+        return np.column_stack([1 - probabilities, probabilities])
+
+class TestTriage(unittest.TestCase):
+    def setUp(self):
+        self.alerts_df = pd.DataFrame({
+            'URL': [f"https://example.com/{i}" for i in range(6)],
+            'Title': [
+                "Flash <b>floods</b> kill at least 14 in northeastern India",
+                "Icy floodwaters burst through major dam, killing at least 31 people",
+                "Eight years since the historic <b>flood</b> of 2015",
+                "Hockey: les Chevaliers remportent leur duel face aux Albatros",
+                "Customer service lines <b>flooded with</b> calls after outage",
+                "New <b>flood</b> insurance rules for homeowners",
+            ],
+            'Content': [
+                "Rescue workers were searching for more than 100 people after flash <b>floods</b>&nbsp;...",
+                "",
+                "Residents remember the river rising",
+                "La ligue a reporté le match en raison des <b>inondations</b>&nbsp;...",
+                "",
+                "Premiums for <b>flood</b> zones will rise next year",
+            ],
+        })
+
+    def test_rule_decisions(self):
+        decisions = triage(self.alerts_df)["triage_decision"].tolist()
+        self.assertEqual(decisions, [FETCH, FETCH, FETCH, DEFER, DROP, DEFER])
+
+    def test_thresholds_and_model(self):
+        # The model moves the alerts it is confident about across the thresholds
+        triaged_df = triage(self.alerts_df, model=KeywordModel())
+        self.assertEqual(triaged_df["triage_decision"].iloc[3], DROP)
+        self.assertEqual(triaged_df["triage_model_score"].iloc[2], 0.9)
+        self.assertGreater(triaged_df["triage_score"].iloc[2], rule_scores(self.alerts_df).iloc[2])
+
+        with self.assertRaises(ValueError):
+            triage(self.alerts_df, fetch_threshold=1, drop_threshold=2)
+
+    def test_triage_alerts(self):
+        fetch_df, triaged_df = triage_alerts(self.alerts_df)
+        self.assertEqual(fetch_df["URL"].tolist(), self.alerts_df["URL"].iloc[:3].tolist())
+        # The decisions and the scores of every alert are recorded
+        self.assertEqual(triaged_df.shape[0], 6)
+        self.assertTrue({"triage_score", "triage_model_score", "triage_decision"}.issubset(triaged_df.columns))
+
+        # Without title nor snippet, every alert is fetched
+        fetch_df, triaged_df = triage_alerts(self.alerts_df[["URL"]])
+        self.assertEqual(fetch_df.shape[0], 6)
+        self.assertTrue((triaged_df["triage_decision"] == FETCH).all())
+
+    def test_training_data(self):
+        results_df = pd.DataFrame({'link': ["https://www.example.com/0", "https://example.com/3"], 'is_happened': ["Yes", "No"]})
+        texts, labels = training_data(self.alerts_df, results_df)
+        self.assertEqual(labels, [1, 0])
+        self.assertTrue(texts[0].startswith("Flash floods kill"))
+
+    @unittest.skipIf(sklearn is None, "scikit-learn is not installed")
+    def test_train_model(self):
+        from triage import train_model
+        texts = ["river floods town, residents evacuated", "floods kill dozens along the river"] * 5 + \
+                ["flood of calls to the help line", "hockey game tonight"] * 5
+        model = train_model(texts, [1, 1] * 5 + [0, 0] * 5)
+        triaged_df = triage(self.alerts_df, model=model)
+        self.assertEqual(triaged_df["triage_decision"].iloc[0], FETCH)
+
+if __name__ == "__main__":
+    unittest.main()
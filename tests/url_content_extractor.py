@@ -1,8 +1,10 @@
 # # tests/url_content_extractor.py
 
 import unittest
+from unittest import mock
 import sys
 import os
+import tempfile
 import pandas as pd
 
 # Add the path to the parent directory to sys.path
@@ -86,5 +88,34 @@ class TestContentExtractor(unittest.TestCase):
         # Clean up any resources after each test if needed
         pass
 
+def fake_extract_url_content(self, url, language='en'):
+    # Odd article numbers are valid articles
+    number = int(url.rsplit('-', 1)[1])
+    return f"Summary {number}", f"Content {number}", number % 2
+
+class TestChunkedContentExtraction(unittest.TestCase):
+    def setUp(self):
+        self.content_extractor = ContentExtractor(solution="")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_extract_content_chunks(self):
+        sample_df = pd.DataFrame({'URL': [f"https://example.com/article-{i}" for i in range(23)], 'Language': 'en'})
+        out_fn = os.path.join(self.tmp_dir.name, "extracted.csv")
+
+        # The worker processes are forked after the patch
+        with mock.patch.object(ContentExtractor, 'extract_url_content', fake_extract_url_content):
+            result_fn = self.content_extractor.extract_content_chunks(sample_df, num_processes=2, out_fn=out_fn, chunk_size=5)
+
+        # Every URL is written once, with a single header, in any order
+        extracted_df = pd.read_csv(result_fn, sep='|')
+        self.assertEqual(sorted(extracted_df['URL']), sorted(sample_df['URL']))
+        self.assertEqual(list(extracted_df.columns), ['URL', 'Language', 'Summary', 'New_Content', 'Is_Article'])
+
+        filtered_df = self.content_extractor.read_valid_articles(result_fn, chunk_size=4)
+        self.assertEqual(filtered_df.shape[0], 11)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,104 @@
+# tests/work_queue.py
+
+import unittest
+from unittest import mock
+import sys
+import os
+import time
+import tempfile
+import pandas as pd
+
+# Add the path to the parent directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Now you can import functions from work_queue.py
+from work_queue import open_queue
+from distributed import enqueue_data, run_worker, collect_results
+
+class TestSQLiteWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue_uri = f"sqlite:///{os.path.join(self.tmp_dir.name, 'queue.db')}"
+        self.queue = open_queue(self.queue_uri, max_attempts=2)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp_dir.cleanup()
+
+    def test_put_tasks_idempotent(self):
+        self.assertEqual(self.queue.put_tasks([("a", 1), ("b", 2)]), 2)
+        self.assertEqual(self.queue.put_tasks([("a", 1), ("c", 3)]), 1)
+        self.assertEqual(self.queue.counts()["pending"], 3)
+
+    def test_lease_is_exclusive(self):
+        self.queue.put_tasks([("a", 1), ("b", 2)])
+        other = open_queue(self.queue_uri)
+
+        first = self.queue.lease("worker-1")
+        second = other.lease("worker-2")
+        other.close()
+
+        self.assertEqual(first[1], 1)
+        self.assertEqual(second[1], 2)
+        self.assertIsNone(self.queue.lease("worker-1"))
+
+    def test_expired_lease_is_reissued(self):
+        # The task of a crashed worker is leased again after its visibility timeout
+        self.queue.put_tasks([("a", 1)])
+        task_id, _ = self.queue.lease("worker-1", visibility_timeout=0.01)
+        time.sleep(0.02)
+
+        self.assertEqual(self.queue.lease("worker-2")[0], task_id)
+        self.assertTrue(self.queue.complete(task_id, "worker-2", "result"))
+
+        # The late result of the first worker is ignored
+        self.assertFalse(self.queue.complete(task_id, "worker-1", "late result"))
+        self.assertEqual(list(self.queue.results()), ["result"])
+        self.assertTrue(self.queue.is_finished())
+
+    def test_fail_until_max_attempts(self):
+        self.queue.put_tasks([("a", 1)])
+        for _ in range(2):
+            task_id, _ = self.queue.lease("worker-1")
+            self.queue.fail(task_id, "worker-1", "Error")
+
+        self.assertIsNone(self.queue.lease("worker-1"))
+        self.assertEqual(self.queue.counts()["failed"], 1)
+
+    def test_release_does_not_count_attempt(self):
+        # A task given back by a stopping worker is leased again with all its attempts
+        self.queue.put_tasks([("a", 1)])
+        for _ in range(3):
+            task_id, _ = self.queue.lease("worker-1")
+            self.queue.release(task_id, "worker-1")
+
+        self.assertEqual(self.queue.counts()["pending"], 1)
+        self.assertEqual(self.queue.lease("worker-2")[0], task_id)
+
+class TestDistributedMode(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue_uri = f"sqlite:///{os.path.join(self.tmp_dir.name, 'queue.db')}"
+
+        # Fetching is replaced by a flag on the URL, the NLP stage is not used
+        self.extractor = mock.Mock()
+        self.extractor.extract_content.side_effect = lambda df, **kwargs: df.assign(Is_Article=df['URL'].str.len() % 2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_coordinator_and_workers(self):
+        df = pd.DataFrame({'URL': [f"https://example.com/{i}" for i in range(25)], 'Language': 'en'})
+
+        self.assertEqual(enqueue_data(self.queue_uri, df, source="input.csv", batch_size=10), 3)
+        self.assertEqual(enqueue_data(self.queue_uri, df, source="input.csv", batch_size=10), 0)
+
+        processed = [run_worker(self.extractor, self.queue_uri, 'extractor', worker_id=f"worker-{i}") for i in range(2)]
+        self.assertEqual(sum(processed), 3)
+
+        results_df = collect_results(self.extractor, self.queue_uri, out_fn=os.path.join(self.tmp_dir.name, "out.csv"))
+        self.assertEqual(list(results_df['URL']), list(df['URL']))
+        self.assertIn('Is_Article', results_df.columns)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+# text_normalisation.py
+
+import re
+import html
+import time
+import logging
+import argparse
+import unicodedata
+import pandas as pd
+
+from cost_estimate import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Profiles: 'default' cleans the extracted content as it has always been cleaned, 'compact' also removes what
+# doesn't help the model to answer the questions, to send fewer prompt tokens
+DEFAULT_PROFILE = "default"
+COMPACT_PROFILE = "compact"
+PROFILES = (DEFAULT_PROFILE, COMPACT_PROFILE)
+
+# HTML tags left in the content
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# Characters removed from the content: everything but alphanumeric characters, the punctuation and the French
+# letters with accents (the '!-:' range keeps the ASCII punctuation from '!' to ':')
+SPECIAL_CHARACTERS = re.compile(r"""[^a-zA-Z0-9éàèùçâêîôûëïü.,!-:;()"'\s]""")
+
+# The compact profile also keeps the upper case French letters, which start many place names (Île, École, État)
+COMPACT_SPECIAL_CHARACTERS = re.compile(r"""[^a-zA-Z0-9éàèùçâêîôûëïüœÉÀÈÙÇÂÊÎÔÛËÏÜŒ.,!-:;()"'\s]""")
+
+# Typographic characters replaced by their ASCII equivalent rather than removed: "l’eau" stays "l'eau" instead of
+# "leau", and the U+FFFD replacement characters of badly decoded pages are dropped
+TYPOGRAPHIC_CHARACTERS = [
+    ("‘", "'"), ("’", "'"), ("ʼ", "'"), ("“", '"'), ("”", '"'), ("«", '"'), ("»", '"'),
+    ("–", "-"), ("—", "-"), ("…", "..."), ("\ufffd", ""),
+]
+
+# Newsletter, advertisement, paywall and sharing blocks of the news sites, flattened to a single line by the
+# content extraction. Every pattern is only searched in the texts that contain its marker, which is much faster
+# than a single alternation of all the patterns
+BOILERPLATE_PATTERNS = [
+    ("THIS CONTENT IS RESERVED", r"THIS CONTENT IS RESERVED FOR SUBSCRIBERS.{0,3000}?Article content"),
+    ("Story continues below",
+     r"Story continues below(?: This advertisement has not loaded yet, but your article continues below\.)?"),
+    ("This advertisement", r"This advertisement has not loaded yet, but your article continues below\."),
+    ("Advertisement", r"\bAdvertisement(?: \d+)?\b"),
+    ("Article content", r"\bArticle content\b"),
+    ("Publicité", r"\bPublicité\b"),
+    ("Sign up", r"(?:Get [^.]{0,120} to your inbox\. |Headlines Delivered to Your Inbox )?"
+                r"Sign up (?:for|to receive) [^.]{0,120}newsletters?[^.]{0,80}\."),
+    ("Share this", r"Share this (?:article|story)(?: in your social network)?(?: Share\b)?"),
+    ("Click here", r"Click here to view the video"),
+    ("Subscribe now", r"Subscribe now to read the latest news in your city and across Canada\."),
+    ("widget Twitter", r"Début du widget Twitter\.? Passer le widget Fin du widget Twitter\.? Retourner au début du widget"),
+    ("Lire aussi", r"Lire aussi ?: ?\S+"),
+    ("Related Stories", r"\bRelated Stories\b"),
+]
+BOILERPLATE = [(marker, re.compile(pattern, re.DOTALL)) for marker, pattern in BOILERPLATE_PATTERNS]
+
+# Function words stripped by the compact profile, per language. Prepositions, conjunctions and negations are
+# kept: they carry the places, the dates and the answers ("not", "no", "pas", "de", "à").
+# Only the lower case words are stripped, so that the articles of place names ("La Prairie", "The Pas") are kept,
+# and hyphenated or elided words ("Sainte-Anne-de-la-Pérade", "l'eau") are never split.
+STOPWORDS = {
+    "en": frozenset([
+        "a", "an", "the", "is", "are", "was", "were", "be", "been", "being", "am", "has", "have", "had",
+        "having", "do", "does", "did", "it", "its", "it's", "he", "she", "they", "them", "their", "his", "her",
+        "him", "we", "us", "our", "you", "your", "i", "me", "my", "this", "that", "these", "those", "which",
+        "who", "whom", "whose", "there", "here", "also", "just", "very", "so", "such", "can", "could", "would",
+        "should", "will", "shall", "may", "might", "must", "said", "says"]),
+    "fr": frozenset([
+        "le", "la", "les", "un", "une", "est", "sont", "était", "étaient", "été", "être", "avoir", "ont",
+        "avait", "avaient", "il", "elle", "ils", "elles", "on", "nous", "vous", "je", "ce", "cet", "cette",
+        "ces", "se", "sa", "son", "ses", "leur", "leurs", "qui", "que", "dont", "très", "aussi", "ainsi",
+        "donc", "cela", "ça", "y", "a"]),
+}
+
+def normalise_text(text, profile=DEFAULT_PROFILE, language=None, keep_characters=False):
+    """Cleans the text of an article with the precompiled patterns of a profile.
+
+    Args:
+        text (str): Input text.
+        profile (str, optional): 'default' removes the HTML tags, the special characters and the extra whitespaces;
+            'compact' also normalises the HTML entities and the Unicode characters, and removes the boilerplate and
+            the stopwords. Defaults to 'default'.
+        language (str, optional): Language of the text ('en' or 'fr'), for the stopwords of the compact profile.
+            Defaults to None, to keep the stopwords.
+        keep_characters (bool, optional): Whether to keep the characters of every script, for the languages
+            without their own prompt. Defaults to False, to keep only the Latin and the French characters.
+
+    Returns:
+        str: Cleaned text.
+    """
+    if profile == DEFAULT_PROFILE:
+        # Most of the extracted content has no tag left
+        if '<' in text:
+            text = TAG_PATTERN.sub('', text)
+        if keep_characters:
+            return ' '.join(text.split())
+        return ' '.join(SPECIAL_CHARACTERS.sub('', text).split())
+
+    if profile != COMPACT_PROFILE:
+        raise ValueError(f"Unknown text profile '{profile}'. The supported profiles are: {', '.join(PROFILES)}.")
+
+    # Entities like &nbsp; and &#39;, then the compatibility characters (non-breaking spaces, ligatures)
+    if '&' in text:
+        text = html.unescape(text)
+    text = unicodedata.normalize('NFKC', text)
+    for character, replacement in TYPOGRAPHIC_CHARACTERS:
+        if character in text:
+            text = text.replace(character, replacement)
+    if '<' in text:
+        text = TAG_PATTERN.sub('', text)
+    for marker, pattern in BOILERPLATE:
+        if marker in text:
+            text = pattern.sub(' ', text)
+    if not keep_characters:
+        text = COMPACT_SPECIAL_CHARACTERS.sub('', text)
+
+    # The stopwords are dropped while the extra whitespaces are removed
+    stopwords = STOPWORDS.get(language)
+    if stopwords is None:
+        return ' '.join(text.split())
+    return ' '.join(word for word in text.split() if word not in stopwords)
+
+def normalise_column(series, profile=DEFAULT_PROFILE, languages=None, keep_characters=False):
+    """Cleans a whole column of texts.
+
+    Every text is cleaned in a single pass over the precompiled patterns of the profile. The column can use any
+    pandas string storage ('object', 'string' or 'string[pyarrow]'), which is kept. Missing texts become empty texts.
+
+    Args:
+        series (pd.Series): Texts.
+        profile (str, optional): 'default' or 'compact' (see normalise_text). Defaults to 'default'.
+        languages (pd.Series, optional): Language of every text, for the stopwords of the compact profile.
+            Defaults to None, to keep the stopwords.
+        keep_characters (bool, optional): Whether to keep the characters of every script (see normalise_text).
+            Defaults to False.
+
+    Returns:
+        pd.Series: Cleaned texts, with the index of the input column.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown text profile '{profile}'. The supported profiles are: {', '.join(PROFILES)}.")
+
+    texts = series.fillna('').astype(str).tolist()
+    if languages is None or profile == DEFAULT_PROFILE:
+        cleaned = [normalise_text(text, profile, keep_characters=keep_characters) for text in texts]
+    else:
+        cleaned = [normalise_text(text, profile, language, keep_characters) for text, language in zip(texts, languages.tolist())]
+
+    dtype = series.dtype if isinstance(series.dtype, pd.StringDtype) else object
+    return pd.Series(cleaned, index=series.index, dtype=dtype)
+
+def benchmark(texts, languages, profiles=PROFILES, repeat=3):
+    """Measures the throughput and the token savings of every profile.
+
+    Args:
+        texts (pd.Series): Texts, as stored in the extracted content files.
+        languages (pd.Series): Language of every text.
+        profiles (tuple, optional): Profiles to measure. Defaults to all the profiles.
+        repeat (int, optional): Number of runs per profile; the fastest one is kept. Defaults to 3.
+
+    Returns:
+        pd.DataFrame: One row per profile with the throughput in MB per second, the characters and the estimated
+            tokens of the cleaned texts, and the share of tokens saved compared to the input.
+    """
+    texts = texts.fillna('').astype(str)
+    size = texts.str.encode('utf-8').str.len().sum() / 1e6
+    input_tokens = sum(estimate_tokens(text) for text in texts)
+
+    rows = []
+    for profile in profiles:
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cleaned = normalise_column(texts, profile, languages)
+            durations.append(time.perf_counter() - start)
+        tokens = sum(estimate_tokens(text) for text in cleaned)
+        rows.append({
+            "profile": profile,
+            "mb_per_second": round(size / min(durations), 1),
+            "characters": int(cleaned.str.len().sum()),
+            "tokens": tokens,
+            "tokens_saved": round(1 - tokens / input_tokens, 3) if input_tokens else 0.0,
+        })
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the text normalisation profiles on extracted content")
+    parser.add_argument("fn", nargs="?", default="output/extracted_url_content.csv",
+                        help="extracted content file (default: output/extracted_url_content.csv)")
+    parser.add_argument("--column", default="New_Content", help="column of the texts (default: New_Content)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per profile (default: 3)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    df = pd.read_csv(args.fn, sep='|')
+    languages = df["Language"] if "Language" in df.columns else None
+    results_df = benchmark(df[args.column], languages, repeat=args.repeat)
+    logger.info(f"Normalisation of {df.shape[0]} texts:\n{results_df.to_string(index=False)}")
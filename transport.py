@@ -0,0 +1,413 @@
+# transport.py
+
+import ssl
+import time
+import socket
+import threading
+import logging
+import importlib.util
+
+import httpx
+import httpcore
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError
+
+from llm_backends import parse_bool
+
+logger = logging.getLogger(__name__)
+
+# Timeouts in seconds
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60 # 120
+
+# User agent for HTTP requests
+USER_AGENT = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
+
+# Content encodings accepted from the servers: gzip and deflate, and Brotli (and zstd) when their decoder is installed
+ACCEPT_ENCODING = urllib3.util.make_headers(accept_encoding=True)["accept-encoding"]
+
+# HTTP/2 needs the h2 package; without it, the pages are downloaded over HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Number of publishers whose connections are kept open; the least recently used publisher is closed first
+POOL_HOSTS = 100
+
+# Number of connections kept open per publisher
+POOL_SIZE = 10
+
+# Seconds a resolved address is kept in the DNS cache of a transport
+DNS_TTL = 300
+
+# Maximal number of addresses in the DNS cache, before the expired ones are dropped
+DNS_CACHE_SIZE = 10000
+
+# Errors of a request, whatever the HTTP client: timeouts first, as they are also connection errors for httpx
+TIMEOUT_ERRORS = (requests.exceptions.Timeout, httpx.TimeoutException)
+CONNECTION_ERRORS = (requests.exceptions.ConnectionError, httpx.TransportError)
+
+class DNSCache:
+    """In-process cache of the resolved addresses, with a time to live.
+
+    The articles of a batch come from a few hundred publishers, so most lookups are for a host resolved a few
+    seconds before. The failed lookups are not cached.
+    """
+
+    def __init__(self, ttl=DNS_TTL, resolve=socket.getaddrinfo, max_size=DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.resolve = resolve
+        self.max_size = max_size
+        self.hits = 0
+        self.lookups = 0
+        self._addresses = {}
+        self._lock = threading.Lock()
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """Same as socket.getaddrinfo, from the cache when the address was resolved less than ttl seconds ago."""
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._addresses.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+
+        addresses = self.resolve(host, port, family, type, proto, flags)
+
+        with self._lock:
+            self.lookups += 1
+            if len(self._addresses) >= self.max_size:
+                self._addresses = {k: v for k, v in self._addresses.items() if v[0] > now}
+                if len(self._addresses) >= self.max_size:
+                    self._addresses.clear()
+            self._addresses[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def connect(self, host, port, open_connection, errors=(OSError,)):
+        """Opens a connection to the first reachable address of a host, resolved through the cache.
+
+        Args:
+            host (str): Host name.
+            port (int): Port.
+            open_connection (function): Opens a connection to an IP address.
+            errors (tuple, optional): Errors of open_connection after which the next address is tried.
+
+        Returns:
+            Connection returned by open_connection.
+        """
+        error = OSError(f"No address found for {host}")
+        for _, _, _, _, sockaddr in self.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            try:
+                return open_connection(sockaddr[0])
+            except errors as e:
+                error = e
+        raise error
+
+class _CachedResolution:
+    """Connection of urllib3 (requests) that resolves its host through the DNS cache of its transport.
+
+    The socket is opened to the resolved address, while the TLS handshake and the Host header use the host name.
+    """
+    dns_cache = None
+
+    def _new_conn(self):
+        dns_host = self._dns_host
+
+        def open_connection(address):
+            self._dns_host = address
+            try:
+                return super(_CachedResolution, self)._new_conn()
+            finally:
+                self._dns_host = dns_host
+
+        try:
+            # NewConnectionError is a ConnectTimeoutError
+            return self.dns_cache.connect(dns_host, self.port, open_connection, errors=(ConnectTimeoutError,))
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+
+class DNSCacheAdapter(HTTPAdapter):
+    """Adapter of requests whose new connections resolve the hosts through a DNS cache."""
+
+    def __init__(self, dns_cache, **kwargs):
+        # The pool manager is created by the constructor of HTTPAdapter
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = {}
+        for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items():
+            connection_cls = type(pool_cls.ConnectionCls.__name__, (_CachedResolution, pool_cls.ConnectionCls),
+                                  {"dns_cache": self.dns_cache})
+            pool_classes[scheme] = type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": connection_cls})
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+class _CachedNetworkBackend(httpcore.SyncBackend):
+    """Network backend of httpx whose new connections resolve the hosts through a DNS cache."""
+
+    def __init__(self, dns_cache):
+        self.dns_cache = dns_cache
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        def open_connection(address):
+            return super(_CachedNetworkBackend, self).connect_tcp(address, port, timeout, local_address, socket_options)
+
+        try:
+            return self.dns_cache.connect(host, port, open_connection, errors=(httpcore.ConnectError, httpcore.ConnectTimeout))
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+
+def http_transport(dns_cache, **options):
+    """Creates a transport of httpx whose new connections resolve the hosts through a DNS cache.
+
+    Args:
+        dns_cache (DNSCache): DNS cache.
+        **options: Options of httpx.HTTPTransport.
+
+    Returns:
+        httpx.HTTPTransport: Transport of httpx.
+    """
+    transport = httpx.HTTPTransport(**options)
+    # httpx has no option for the network backend of its connection pool
+    transport._pool._network_backend = _CachedNetworkBackend(dns_cache)
+    return transport
+
+# Lock of the creation of the connections, when the first requests of a process are sent by several threads
+_setup_lock = threading.Lock()
+
+class TransportStats:
+    """Download statistics of a transport.
+
+    Statistics of several processes are added with '+'. The wire bytes are the bytes of the response bodies
+    as received, before decompression; the content bytes are the decoded pages.
+    """
+    fields = ("requests", "errors", "connections", "http2_requests", "wire_bytes", "content_bytes", "dns_hits", "dns_lookups")
+
+    def __init__(self, **counts):
+        for field in self.fields:
+            setattr(self, field, counts.get(field, 0))
+
+    def __add__(self, other):
+        return TransportStats(**{field: getattr(self, field) + getattr(other, field) for field in self.fields})
+
+    @property
+    def reuse_ratio(self):
+        """Share of the requests sent on a connection that was already open."""
+        return max(0.0, 1 - self.connections / self.requests) if self.requests else 0.0
+
+    @property
+    def compression_ratio(self):
+        """Decoded bytes per byte on the wire."""
+        return self.content_bytes / self.wire_bytes if self.wire_bytes else 0.0
+
+    @property
+    def dns_hit_ratio(self):
+        """Share of the DNS lookups answered by the cache."""
+        total = self.dns_hits + self.dns_lookups
+        return self.dns_hits / total if total else 0.0
+
+    def as_dict(self):
+        stats = {field: getattr(self, field) for field in self.fields}
+        stats.update(reuse_ratio=round(self.reuse_ratio, 3), compression_ratio=round(self.compression_ratio, 2),
+                     dns_hit_ratio=round(self.dns_hit_ratio, 3))
+        return stats
+
+    def summary(self):
+        return (f"{self.requests} requests ({self.errors} failed, {self.http2_requests} over HTTP/2) on "
+                f"{self.connections} new connections, connection reuse ratio {self.reuse_ratio:.0%}; "
+                f"{self.wire_bytes / 1e6:.1f} MB on the wire for {self.content_bytes / 1e6:.1f} MB of pages "
+                f"(compression ratio {self.compression_ratio:.1f}); DNS cache hit ratio {self.dns_hit_ratio:.0%}")
+
+def total_stats(stats):
+    """Adds up the statistics of several transports (e.g., of the worker processes)."""
+    return sum(stats, TransportStats())
+
+def make_transport(**options):
+    """Creates a transport.
+
+    Args:
+        **options: Transport options (see Transport). String values (e.g., read from a config file) are
+            converted to the expected types.
+
+    Returns:
+        Transport: Transport instance.
+    """
+    typed_options = {}
+    for key, value in options.items():
+        if key not in Transport.option_types:
+            raise ValueError(f"Unknown option '{key}' in the HTTP section. Available options: {', '.join(Transport.option_types)}.")
+        if isinstance(value, str):
+            value = None if value in {"", "None"} else Transport.option_types[key](value)
+        if value is not None:
+            typed_options[key] = value
+
+    return Transport(**typed_options)
+
+def _is_ssl_error(error):
+    # httpx reports certificate errors as connection errors caused by an ssl.SSLError
+    while error is not None:
+        if isinstance(error, (ssl.SSLError, requests.exceptions.SSLError)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class Transport:
+    """Downloads the pages of the articles, with connections kept open per publisher.
+
+    The connections are kept open and reused (keep-alive), so the articles of the same publisher skip the TCP
+    connection and the TLS handshake. New connections resolve the hosts through the DNS cache of the transport,
+    without changing the resolution of the other clients of the process (socket.getaddrinfo is left as is).
+    The pages are requested compressed (gzip, deflate, and Brotli when installed). With http2 and the h2
+    package installed, the pages are downloaded with httpx, and the requests to the same publisher share one
+    HTTP/2 connection when the server supports it; the other servers are reached over HTTP/1.1.
+
+    A transport is shared by the threads of a process. It can be sent to other processes: every process opens
+    its own connections, and counts its own statistics.
+    """
+
+    # Types of the options accepted by the constructor
+    option_types = {"http2": parse_bool, "pool_hosts": int, "pool_size": int, "dns_ttl": float,
+                    "connect_timeout": float, "read_timeout": float, "user_agent": str}
+
+    # Connections and locks can't be sent to other processes; they are created lazily in each process
+    _unpicklable = ("_session", "_client", "_insecure_client", "_lock", "_dns_cache")
+
+    def __init__(self, http2=False, pool_hosts=POOL_HOSTS, pool_size=POOL_SIZE, dns_ttl=DNS_TTL,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, user_agent=None):
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 needs the h2 package (pip install h2), the pages are downloaded over HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self.dns_ttl = dns_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.headers = {**USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING}
+        if user_agent:
+            self.headers['User-Agent'] = user_agent
+
+        self.stats = TransportStats()
+        for attr in self._unpicklable:
+            setattr(self, attr, None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._unpicklable:
+            state[attr] = None
+        # Every process counts its own statistics
+        state["stats"] = TransportStats()
+        return state
+
+    def _setup(self):
+        # Connections of the process, created by the first request
+        self._lock = threading.Lock()
+        if self._dns_cache is None:
+            self._dns_cache = DNSCache(self.dns_ttl)
+
+        if self.http2:
+            self._client = self._make_client(verify=True)
+        else:
+            # One pool of keep-alive connections per publisher
+            session = requests.Session()
+            adapter = DNSCacheAdapter(self._dns_cache, pool_connections=self.pool_hosts, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(self.headers)
+            session.hooks["response"].append(self._count_connection)
+            self._session = session
+
+    def _make_client(self, verify):
+        transport = http_transport(self._dns_cache, http2=True, verify=verify,
+                                   limits=httpx.Limits(max_connections=None,
+                                                       max_keepalive_connections=self.pool_hosts * self.pool_size))
+        return httpx.Client(transport=transport, headers=self.headers, follow_redirects=True,
+                            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout))
+
+    def _count_connection(self, response, *args, **kwargs):
+        # Called for every response, redirects included, while its connection is still attached to it:
+        # a connection without any previous request is a new one
+        connection = getattr(response.raw, "connection", None)
+        if connection is None:
+            return
+        num_requests = getattr(connection, "num_flood_requests", 0)
+        connection.num_flood_requests = num_requests + 1
+        if num_requests == 0:
+            with self._lock:
+                self.stats.connections += 1
+
+    def _trace(self, event_name, info):
+        # httpcore trace of the httpx requests: a TCP connection was opened
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.stats.connections += 1
+
+    def get(self, url):
+        """Downloads a page.
+
+        Pages of servers with an invalid certificate are downloaded again without checking the certificate.
+
+        Args:
+            url (str): URL of the page.
+
+        Returns:
+            requests.Response or httpx.Response: Response, with its content read.
+        """
+        if self._session is None and self._client is None:
+            with _setup_lock:
+                if self._session is None and self._client is None:
+                    self._setup()
+
+        try:
+            try:
+                response = self._get(url, verify=True)
+            except Exception as e:
+                if not _is_ssl_error(e):
+                    raise
+                response = self._get(url, verify=False)
+        except Exception:
+            with self._lock:
+                self.stats.requests += 1
+                self.stats.errors += 1
+            raise
+
+        self._record(response)
+        return response
+
+    def _get(self, url, verify):
+        if self._session is not None:
+            return self._session.get(url, verify=verify, timeout=(self.connect_timeout, self.read_timeout))
+
+        client = self._client
+        if not verify:
+            if self._insecure_client is None:
+                self._insecure_client = self._make_client(verify=False)
+            client = self._insecure_client
+        return client.get(url, extensions={"trace": self._trace})
+
+    def _record(self, response):
+        # Redirects are requests too, with their own (small) bodies
+        hops = list(response.history) + [response]
+        if self._session is not None:
+            # Bytes read from the socket by urllib3, before decompression
+            wire_bytes = sum(hop.raw.tell() for hop in hops)
+            http2_requests = 0
+        else:
+            wire_bytes = sum(hop.num_bytes_downloaded for hop in hops)
+            http2_requests = sum(hop.http_version == "HTTP/2" for hop in hops)
+
+        with self._lock:
+            self.stats.requests += len(hops)
+            self.stats.http2_requests += http2_requests
+            self.stats.wire_bytes += wire_bytes
+            self.stats.content_bytes += len(response.content)
+            self.stats.dns_hits, self.stats.dns_lookups = self._dns_cache.hits, self._dns_cache.lookups
+
+    def close(self):
+        """Closes the open connections of the process."""
+        for attr in ("_session", "_client", "_insecure_client"):
+            client = getattr(self, attr)
+            if client is not None:
+                client.close()
+                setattr(self, attr, None)
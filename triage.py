@@ -0,0 +1,208 @@
+# triage.py
+
+import re
+import glob
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+from priority import text_column, FLOOD_TERMS, IMPACT_TERMS, FIGURATIVE_TERMS
+from utils import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Flood words used for risk, insurance and planning topics rather than for an event
+NON_EVENT_TERMS = re.compile(
+    r"\b(?:flood ?(?:insurance|zones?|maps?|mapping|plains?|mitigation|funding|preparedness|awareness|defences?|barriers?|"
+    r"lights?|lit)|floodplains?|floodlights?|floodlit|floodgates|assurance inondation|zones? inondables?|cartographie)\b",
+    re.IGNORECASE)
+
+# Severe weather words: a title about the storm or the rain of an article that mentions floods is promising
+WEATHER_TERMS = re.compile(
+    r"\b(?:storms?|tropical|hurricanes?|typhoons?|cyclones?|rain(?:fall|s|storms?)?|downpours?|tempêtes?|ouragans?|"
+    r"typhons?|pluies?|pluvieu\w*|précipitations|intempéries|orages?|déborde\w*|ruisseaux?|rivières?|rivers?)\b", re.IGNORECASE)
+
+# Weight of every signal in the relevance score
+TITLE_WEIGHT = 3
+WEATHER_WEIGHT = 1
+CONTENT_WEIGHT = 1
+IMPACT_WEIGHT = 2
+FIGURATIVE_WEIGHT = 3
+NON_EVENT_WEIGHT = 3
+# The probability of the model adds from -MODEL_WEIGHT (0) to +MODEL_WEIGHT (1)
+MODEL_WEIGHT = 3
+
+# Default thresholds: alerts scoring at least FETCH_THRESHOLD are fetched, alerts below DROP_THRESHOLD are dropped,
+# and the others are deferred
+FETCH_THRESHOLD = 2
+DROP_THRESHOLD = 1
+
+# Decisions of the triage
+FETCH, DEFER, DROP = "fetch", "defer", "drop"
+
+def alert_text(df):
+    """Returns the title and the snippet of every alert, without HTML tags, as a single text."""
+    return text_column(df, "Title") + " " + text_column(df, "Content")
+
+def rule_scores(df):
+    """Scores how likely every alert is to report a flood event, from the words of its title and its snippet.
+
+    Args:
+        df (pd.DataFrame): Alerts, with 'Title' and 'Content' columns.
+
+    Returns:
+        pd.Series: Relevance score of every alert.
+    """
+    title = text_column(df, "Title")
+    snippet = text_column(df, "Content")
+    text = title + " " + snippet
+
+    figurative = title.str.contains(FIGURATIVE_TERMS)
+    impact = text.str.contains(IMPACT_TERMS)
+
+    title_flood = title.str.contains(FLOOD_TERMS) & ~figurative
+
+    scores = TITLE_WEIGHT * title_flood
+    scores += WEATHER_WEIGHT * (title.str.contains(WEATHER_TERMS) & ~title_flood)
+    scores += CONTENT_WEIGHT * snippet.str.contains(FLOOD_TERMS)
+    scores += IMPACT_WEIGHT * impact
+    scores -= FIGURATIVE_WEIGHT * figurative
+    # Insurance and planning topics, unless the alert also reports victims or evacuations
+    scores -= NON_EVENT_WEIGHT * (text.str.contains(NON_EVENT_TERMS) & ~impact)
+    return scores.astype(float)
+
+def load_model(fn):
+    """Loads a triage model saved by train_model.
+
+    Args:
+        fn (str): Model file.
+
+    Returns:
+        object: Model with a predict_proba method taking a list of texts.
+    """
+    try:
+        import joblib
+    except ImportError:
+        raise ImportError("The triage model needs joblib and scikit-learn (see environment.yml).")
+    return joblib.load(fn)
+
+def model_scores(model, df):
+    """Returns the probability that every alert reports a flood event, according to the model."""
+    if df.empty:
+        return pd.Series(dtype=float, index=df.index)
+    return pd.Series(model.predict_proba(alert_text(df).tolist())[:, 1], index=df.index)
+
+def triage(df, model=None, fetch_threshold=FETCH_THRESHOLD, drop_threshold=DROP_THRESHOLD):
+    """Decides which alerts are fetched from their title and snippet, before any network request.
+
+    Args:
+        df (pd.DataFrame): Alerts.
+        model (object, optional): Triage model (see load_model). Defaults to None, for the keyword rules only.
+        fetch_threshold (float, optional): Minimal score of the fetched alerts. Defaults to 2.
+        drop_threshold (float, optional): Alerts scoring below it are dropped. Defaults to 1.
+
+    Returns:
+        pd.DataFrame: 'triage_score', 'triage_model_score' (NaN without model) and 'triage_decision'
+            ('fetch', 'defer' or 'drop') of every alert, with the index of the alerts.
+    """
+    if drop_threshold > fetch_threshold:
+        raise ValueError(f"The drop threshold ({drop_threshold}) can't be above the fetch threshold ({fetch_threshold}).")
+
+    scores = rule_scores(df)
+    probabilities = pd.Series(np.nan, index=df.index)
+    if model is not None:
+        probabilities = model_scores(model, df)
+        scores += MODEL_WEIGHT * (2 * probabilities - 1)
+
+    decisions = np.where(scores >= fetch_threshold, FETCH, np.where(scores < drop_threshold, DROP, DEFER))
+    return pd.DataFrame({"triage_score": scores.round(2), "triage_model_score": probabilities.round(3),
+                         "triage_decision": decisions}, index=df.index)
+
+def triage_alerts(df, model=None, fetch_threshold=FETCH_THRESHOLD, drop_threshold=DROP_THRESHOLD):
+    """Splits the alerts into the alerts to fetch, to defer and to drop.
+
+    Alerts without 'Title' and 'Content' columns can't be triaged, and are all fetched.
+
+    Args:
+        df (pd.DataFrame): Alerts.
+        model (object, optional): Triage model (see load_model). Defaults to None.
+        fetch_threshold (float, optional): Minimal score of the fetched alerts. Defaults to 2.
+        drop_threshold (float, optional): Alerts scoring below it are dropped. Defaults to 1.
+
+    Returns:
+        tuple: Alerts to fetch, and all the alerts with their triage columns.
+    """
+    if "Title" not in df.columns and "Content" not in df.columns:
+        logger.warning("The alerts have no 'Title' nor 'Content' column: all the alerts are fetched")
+        return df, df.assign(triage_score=np.nan, triage_model_score=np.nan, triage_decision=FETCH)
+
+    triaged_df = pd.concat([df, triage(df, model, fetch_threshold, drop_threshold)], axis=1)
+    counts = triaged_df["triage_decision"].value_counts()
+    logger.info(f"Triage of {df.shape[0]} alerts: {counts.get(FETCH, 0)} fetched, {counts.get(DEFER, 0)} deferred, "
+                f"{counts.get(DROP, 0)} dropped")
+
+    return df[triaged_df["triage_decision"] == FETCH], triaged_df
+
+def training_data(alerts_df, results_df):
+    """Labels the alerts with the answers of previous NLP results.
+
+    Args:
+        alerts_df (pd.DataFrame): Alerts, with 'URL', 'Title' and 'Content' columns.
+        results_df (pd.DataFrame): NLP results, with 'link' and 'is_happened' columns.
+
+    Returns:
+        tuple: Texts of the alerts that have a result, and their labels (1 for a flood event).
+    """
+    labels = dict(zip(results_df["link"].map(canonical_url),
+                      results_df["is_happened"].astype(str).str.match(r"\s*(?:yes|oui)\b", case=False).astype(int)))
+    keys = alerts_df["URL"].map(canonical_url)
+    labelled = keys.isin(labels)
+    return alert_text(alerts_df[labelled]).tolist(), keys[labelled].map(labels).tolist()
+
+def train_model(texts, labels):
+    """Trains a small text classifier (TF-IDF and logistic regression) on labelled alerts.
+
+    Args:
+        texts (list): Titles and snippets of the alerts.
+        labels (list): 1 if the alert reported a flood event, 0 otherwise.
+
+    Returns:
+        sklearn.pipeline.Pipeline: Trained model.
+    """
+    from sklearn.pipeline import make_pipeline
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    if len(set(labels)) < 2:
+        raise ValueError("The training alerts need both flood events and other alerts.")
+
+    model = make_pipeline(TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True, strip_accents="unicode"),
+                          LogisticRegression(class_weight="balanced", max_iter=1000))
+    return model.fit(texts, labels)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the triage model on the alerts and the NLP results of previous runs")
+    parser.add_argument("--alerts", nargs="+", required=True, help="alert files, with Title, Content and the URL column")
+    parser.add_argument("--results", nargs="+", required=True, help="NLP results files (glob patterns allowed)")
+    parser.add_argument("--url-col-name", default="LinkURI", help="name of the URL column of the alert files (default: LinkURI)")
+    parser.add_argument("--out", default="data/triage_model.joblib", help="model file (default: data/triage_model.joblib)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    frames = []
+    for fn in args.alerts:
+        try:
+            frames.append(pd.read_csv(fn, sep='|', encoding='utf-8'))
+        except UnicodeDecodeError:
+            # Older exports are encoded in cp1252 (Windows encoding)
+            frames.append(pd.read_csv(fn, sep='|', encoding='cp1252'))
+    alerts_df = pd.concat(frames, ignore_index=True).rename(columns={args.url_col_name: "URL"})
+    results_df = pd.concat([pd.read_csv(fn, sep='|') for pattern in args.results for fn in sorted(glob.glob(pattern))],
+                           ignore_index=True)
+
+    texts, labels = training_data(alerts_df, results_df)
+    logger.info(f"Training the triage model on {len(texts)} alerts, {sum(labels)} flood events")
+    import joblib
+    joblib.dump(train_model(texts, labels), args.out)
+    logger.info(f"Triage model saved to {args.out}")
@@ -4,20 +4,33 @@ import logging.config
 import logging.handlers
 import sys
 import os
-from signal import signal, SIGINT
+import glob
+import json
+import time
+import queue
+import random
+import multiprocessing
+from signal import signal, SIGINT, SIG_IGN
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
-LOG_FILE_PATH='logs'
+from schema import DATE_FORMAT
+
+# Folder of the log files, which can be moved with the NLP_FLEX_LOG_DIR environment variable (e.g. by the tests)
+LOG_FILE_PATH=os.getenv('NLP_FLEX_LOG_DIR', 'logs')
 LOG_NAME=f"nlp_flex_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.log"
 
 # Check if the log path exists, and create the directory if it doesn't
 if not os.path.exists(LOG_FILE_PATH):
     os.makedirs(LOG_FILE_PATH)
 
-def handler(signalnum, frame):
-    signame = SIGINT.name
-    print(f'Signal handler called with signal {signame} ({signalnum})')
-    raise TypeError
+# Log level of the messages logged for every URL, between DEBUG and INFO, so that they can be sampled
+URL = 15
+logging.addLevelName(URL, "URL")
+
+# Log records written to the file at once by the log listener, and maximum delay before they are written
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL = 1.0
 
 LOGGING_CONFIG = {
     "version": 1,
@@ -29,6 +42,8 @@ LOGGING_CONFIG = {
             "maxBytes": 10485760,  # 10 MB
             "backupCount": 5,
             "formatter": "verbose",
+            # The log file is only created once a message is logged
+            "delay": True,
         },
         # "error_file_handler": {
         #     "class": "logging.handlers.RotatingFileHandler",
@@ -46,14 +61,6 @@ LOGGING_CONFIG = {
         #     "level": "WARNING",
         #     "formatter": "verbose",
         # },
-        "info_file_handler": {
-            "class": "logging.handlers.RotatingFileHandler",
-            "filename": f"{LOG_FILE_PATH}/{LOG_NAME}",
-            "maxBytes": 10485760,  # 10 MB
-            "backupCount": 5,
-            "level": "INFO",
-            "formatter": "verbose",
-        },
         "console_handler": {
             "class": "logging.StreamHandler",
             "level": "DEBUG", # "INFO", # "WARNING", # "ERROR", # "CRITICAL", 
@@ -69,10 +76,190 @@ LOGGING_CONFIG = {
     },
     "root": {
         "handlers": ["file_handler", "console_handler"],
-        "level": "INFO",
+        "level": "URL",
     },
 }
 
+class JsonFormatter(logging.Formatter):
+    """Formats log records as JSON lines, with the time, level, module and message of the record."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "module": record.module,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class UrlSamplingFilter(logging.Filter):
+    """Keeps a random sample of the messages logged at the URL level, and all the other messages."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno != URL or self.rate >= 1 or random.random() < self.rate
+
+# Queue of the log records of all the processes, when the logs are written by a log listener
+_log_queue = None
+_url_sample_rate = 1.0
+
+def _make_formatter(json_lines):
+    if json_lines:
+        return JsonFormatter()
+    return logging.Formatter(LOGGING_CONFIG["formatters"]["verbose"]["format"], style="{")
+
+def _run_log_listener(log_queue, filename, json_lines):
+    # Runs in the log listener process: the only process that writes and rotates the log file
+    formatter = _make_formatter(json_lines)
+    file_handler = logging.handlers.RotatingFileHandler(filename, maxBytes=10485760, backupCount=5, encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+
+    # The records are written by batches, and at once for errors
+    handlers = [logging.handlers.MemoryHandler(LOG_BATCH_SIZE, flushLevel=logging.ERROR, target=file_handler), console_handler]
+
+    last_flush = time.monotonic()
+    while True:
+        try:
+            record = log_queue.get(timeout=LOG_FLUSH_INTERVAL)
+        except queue.Empty:
+            record = False
+        except (EOFError, OSError):
+            break
+        if record is None:
+            break
+
+        if record:
+            for log_handler in handlers:
+                log_handler.handle(record)
+        if time.monotonic() - last_flush >= LOG_FLUSH_INTERVAL:
+            handlers[0].flush()
+            last_flush = time.monotonic()
+
+    for log_handler in handlers:
+        log_handler.close()
+    file_handler.close()
+
+class LogListener:
+    """Process writing the log records sent by all the processes through a queue."""
+
+    def __init__(self, log_queue, filename, json_lines=False):
+        self.log_queue = log_queue
+        self.process = multiprocessing.Process(target=_run_log_listener, args=(log_queue, filename, json_lines),
+                                               name="LogListener", daemon=True)
+        self.process.start()
+
+    def stop(self):
+        """Writes the remaining records and stops the listener."""
+        self.log_queue.put(None)
+        self.process.join(timeout=10)
+
+def init_worker_logging(log_queue, url_sample_rate=1.0):
+    """Sends the log records of the current process to the log listener.
+
+    It is the initializer of the worker processes. Records are formatted in the worker and sent through the queue,
+    so logging never writes to the file from the worker.
+
+    Args:
+        log_queue (multiprocessing.Queue): Queue of the log listener.
+        url_sample_rate (float, optional): Share of the messages of the URL level that are kept. Defaults to 1.0.
+    """
+    global _log_queue, _url_sample_rate
+    _log_queue, _url_sample_rate = log_queue, url_sample_rate
+
+    root = logging.getLogger()
+    for log_handler in root.handlers[:]:
+        root.removeHandler(log_handler)
+        log_handler.close()
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(UrlSamplingFilter(url_sample_rate))
+    root.addHandler(queue_handler)
+    root.setLevel(URL)
+
+def init_worker_process(log_queue=None, url_sample_rate=1.0):
+    """Initializer of the worker processes.
+
+    Workers ignore Ctrl+C: the main process stops dispatching and lets the work in progress finish.
+    Their logs are sent to the log listener, if any.
+
+    Args:
+        log_queue (multiprocessing.Queue, optional): Queue of the log listener. Defaults to None.
+        url_sample_rate (float, optional): Share of the messages of the URL level that are kept. Defaults to 1.0.
+    """
+    signal(SIGINT, SIG_IGN)
+    if log_queue is not None:
+        init_worker_logging(log_queue, url_sample_rate)
+
+def worker_initializer():
+    """Returns the initializer of the worker processes and its arguments.
+
+    Returns:
+        tuple: (initializer, initargs) to pass to a process pool.
+    """
+    return init_worker_process, (_log_queue, _url_sample_rate)
+
+def configure_logging(use_queue=False, json_lines=False, url_sample_rate=1.0):
+    """Configures the logs of the run.
+
+    By default, every process writes to the log file with its own handlers. With use_queue, the processes send their
+    records through a queue to a single listener process, which writes them by batches and rotates the log file.
+
+    Args:
+        use_queue (bool, optional): Whether to write the logs from a log listener process. Defaults to False.
+        json_lines (bool, optional): Whether to write the logs as JSON lines. Defaults to False.
+        url_sample_rate (float, optional): Share of the messages of the URL level (one per URL) that are kept. Defaults to 1.0.
+
+    Returns:
+        LogListener: Log listener to stop at the end of the run, or None without use_queue.
+    """
+    filename = LOGGING_CONFIG["handlers"]["file_handler"]["filename"]
+    root = logging.getLogger()
+
+    if not use_queue:
+        for log_handler in root.handlers:
+            log_handler.setFormatter(_make_formatter(json_lines))
+            log_handler.addFilter(UrlSamplingFilter(url_sample_rate))
+        return None
+
+    # The listener opens the log file once the handlers of this process have released it
+    for log_handler in root.handlers[:]:
+        root.removeHandler(log_handler)
+        log_handler.close()
+
+    log_queue = multiprocessing.Queue(-1)
+    listener = LogListener(log_queue, filename, json_lines)
+    init_worker_logging(log_queue, url_sample_rate)
+    return listener
+
+class ResultWriter:
+    """Writes result rows to a CSV file as soon as they are ready.
+
+    The first rows replace the content of the file, and the next ones are appended. The file is opened for
+    every write, so the rows written so far can be read while the run goes on, and survive an interruption.
+    """
+
+    def __init__(self, out_fn):
+        self.out_fn = out_fn
+        self.num_rows = 0
+        self._header = True
+
+    def write(self, df):
+        # Failed extractions give an empty frame: the header is written with the first rows
+        if df.empty:
+            return
+        df.to_csv(self.out_fn, mode='w' if self._header else 'a', header=self._header, index=False, sep='|',
+                  date_format=DATE_FORMAT)
+        self._header = False
+        self.num_rows += df.shape[0]
+
 def check_brackets_balance(s):
     # Dictionary to hold matching brackets
     brackets = {'(': ')', '{': '}', '[': ']'}
@@ -112,3 +299,56 @@ def correct_brackets(s):
             corrected += ']'
     
     return corrected
+
+def expand_input_files(path):
+    """Expands an input path into the list of input files.
+
+    Args:
+        path (str): A file, a directory (all its CSV files) or a glob pattern (e.g. data/collection_articles_*.csv).
+
+    Returns:
+        list: Sorted file names. Daily exports named with their date are sorted chronologically.
+    """
+    if os.path.isdir(path):
+        files = glob.glob(os.path.join(path, '*.csv'))
+    elif glob.has_magic(path):
+        files = glob.glob(path)
+    else:
+        files = [path]
+
+    if not files:
+        raise ValueError(f"No input file matches '{path}'. Please check the input file name.")
+
+    return sorted(files)
+
+# Query parameters that only track the origin of a visit
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ocid', 'cmpid')
+
+def canonical_url(url):
+    """Canonicalises a URL so that the same article gets the same URL in every export.
+
+    Unwraps Google redirect links, lowercases the scheme and the host, removes the 'www.' prefix, the fragment,
+    the tracking query parameters and the trailing slash.
+
+    Args:
+        url (str): URL.
+
+    Returns:
+        str: Canonical URL.
+    """
+    parts = urlsplit(str(url).strip())
+
+    # Google Alerts links may point to a redirect: https://www.google.com/url?rct=j&sa=t&url=<article URL>&...
+    if parts.netloc.endswith('google.com') and parts.path == '/url':
+        target = dict(parse_qsl(parts.query)).get('url')
+        if target:
+            parts = urlsplit(target)
+
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.lower().startswith(TRACKING_PARAMS)]
+    path = parts.path.rstrip('/') or '/'
+
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ''))
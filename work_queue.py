@@ -0,0 +1,246 @@
+# work_queue.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default number of seconds a leased task stays invisible to the other workers
+VISIBILITY_TIMEOUT = 900
+
+# Default number of leases of a task before it is marked as failed
+MAX_ATTEMPTS = 3
+
+# Registry of the available queue implementations, by URI scheme
+QUEUES = {}
+
+def register_queue(scheme):
+    """Registers a queue class under the given URI scheme.
+
+    Args:
+        scheme (str): URI scheme, e.g. 'sqlite'.
+
+    Returns:
+        function: Class decorator.
+    """
+    def decorator(cls):
+        QUEUES[scheme] = cls
+        return cls
+    return decorator
+
+def open_queue(uri, **options):
+    """Opens the work queue at the given URI.
+
+    Args:
+        uri (str): Queue URI, e.g. 'sqlite:///output/queue.db' for a relative path or 'sqlite:////data/queue.db'
+            for an absolute path. A plain path is read as a SQLite file.
+        **options: Options of the queue implementation.
+
+    Returns:
+        WorkQueue: Work queue.
+    """
+    scheme, sep, location = uri.partition("://")
+    if not sep:
+        scheme, location = "sqlite", uri
+    elif location.startswith("/"):
+        location = location[1:]
+    if scheme not in QUEUES:
+        raise ValueError(f"The queue '{uri}' is not supported. Available schemes: {', '.join(sorted(QUEUES))}.")
+
+    return QUEUES[scheme](location, **options)
+
+class WorkQueue:
+    """Durable queue of tasks shared by a coordinator and any number of workers.
+
+    The coordinator adds tasks. Workers lease them: a leased task is invisible to the other workers until
+    its visibility timeout expires, so the task of a crashed worker is leased again by another worker.
+    A worker completes a task by storing its result, which the coordinator collects at the end.
+    """
+
+    def put_tasks(self, tasks):
+        """Adds tasks to the queue. Tasks whose key is already in the queue are ignored, so adding the same
+        input twice is safe.
+
+        Args:
+            tasks (iterable): (key, payload) tuples, where payload is a JSON-serialisable object.
+
+        Returns:
+            int: Number of added tasks.
+        """
+        raise NotImplementedError
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        """Leases the next available task.
+
+        Args:
+            worker_id (str): Identifier of the worker.
+            visibility_timeout (float, optional): Seconds before the task is leased again if not completed.
+
+        Returns:
+            tuple: (task_id, payload), or None if no task is available.
+        """
+        raise NotImplementedError
+
+    def extend_lease(self, task_id, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        """Extends the lease of a task that is still being processed.
+
+        Returns:
+            bool: False if the task isn't leased by the worker anymore.
+        """
+        raise NotImplementedError
+
+    def complete(self, task_id, worker_id, result):
+        """Stores the result of a task.
+
+        Args:
+            task_id (int): Task identifier.
+            worker_id (str): Identifier of the worker.
+            result (object): JSON-serialisable result.
+
+        Returns:
+            bool: False if the task was already completed by another worker.
+        """
+        raise NotImplementedError
+
+    def fail(self, task_id, worker_id, error):
+        """Releases a task after an error, so that it's leased again until its maximum number of attempts."""
+        raise NotImplementedError
+
+    def release(self, task_id, worker_id):
+        """Gives back a task that the worker stopped processing, without counting the attempt."""
+        raise NotImplementedError
+
+    def results(self):
+        """Iterates over the results of the completed tasks, in the order the tasks were added."""
+        raise NotImplementedError
+
+    def counts(self):
+        """Returns the number of tasks by status: pending, leased, done and failed."""
+        raise NotImplementedError
+
+    def is_finished(self):
+        """Returns True when no task is pending or leased."""
+        counts = self.counts()
+        return counts.get("pending", 0) == 0 and counts.get("leased", 0) == 0
+
+@register_queue("sqlite")
+class SQLiteWorkQueue(WorkQueue):
+    """Work queue stored in a SQLite database.
+
+    Suitable for workers on one machine or on machines sharing a file system with reliable locking.
+    """
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until)")
+
+    def put_tasks(self, tasks):
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (key, payload) VALUES (?, ?)",
+                ((key, json.dumps(payload)) for key, payload in tasks))
+            return self.conn.total_changes - before
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        now = time.time()
+        with self._transaction():
+            # Tasks whose lease expired were leased by a crashed or stuck worker
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'Maximum number of attempts reached' "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?", (now, self.max_attempts))
+            row = self.conn.execute(
+                "SELECT id, payload FROM tasks "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+
+            task_id, payload = row
+            self.conn.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + visibility_timeout, task_id))
+
+        return task_id, json.loads(payload)
+
+    def extend_lease(self, task_id, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        cursor = self.conn.execute(
+            "UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + visibility_timeout, task_id, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id, result):
+        # A slow worker may complete a task that was leased again after its lease expired: the first result wins
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = 'done', worker = ?, result = ?, lease_until = NULL "
+            "WHERE id = ? AND status != 'done'",
+            (worker_id, json.dumps(result), task_id))
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, worker_id, error):
+        self.conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_until = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, str(error), task_id, worker_id))
+
+    def release(self, task_id, worker_id):
+        self.conn.execute(
+            "UPDATE tasks SET status = 'pending', attempts = MAX(attempts - 1, 0), lease_until = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased'", (task_id, worker_id))
+
+    def results(self):
+        cursor = self.conn.execute("SELECT result FROM tasks WHERE status = 'done' ORDER BY id")
+        for (result,) in cursor:
+            yield json.loads(result)
+
+    def counts(self):
+        now = time.time()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        rows = self.conn.execute(
+            "SELECT CASE WHEN status = 'leased' AND lease_until < ? THEN 'pending' ELSE status END, COUNT(*) "
+            "FROM tasks GROUP BY 1", (now,))
+        for status, count in rows:
+            counts[status] += count
+        return counts
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock at once, so two workers never lease the same task
+        return _Transaction(self.conn)
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False